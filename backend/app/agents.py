@@ -0,0 +1,118 @@
+"""
+Two-agent (crewai) RAG: a retriever extracts the relevant passages and a
+formatter turns them into a markdown answer.
+
+crewai takes several seconds to import, and /semantic-search/ does not use
+this path, so nothing imports this module at startup. Import it where
+run_dual_agent_rag is needed; the agents are built on the first call.
+"""
+from functools import lru_cache
+
+from crewai import Agent, Crew, Task
+from crewai.tools import BaseTool
+from sqlalchemy.orm import scoped_session
+
+from db import SearchSessionLocal
+from models import UnifiedIndex
+from retrieval import use_local_dense
+from utils import generate_embedding, get_chat_llm
+
+# The tool may be called several times in one crew run: each thread keeps one
+# session on the search pool (the replica, if configured) for the whole run.
+# Closing it after every call hands the connection back to the pool while the
+# agents wait on the LLM; the session itself is dropped when the run ends.
+search_sessions = scoped_session(SearchSessionLocal)
+
+class PgVectorSearchTool(BaseTool):
+    name: str = "pgvector_search"
+    description: str = "Searches pgvector for semantically similar contract records."
+
+    def _run(self, query: str) -> str:
+        db = search_sessions()
+        try:
+            embedding = generate_embedding(query)
+            if use_local_dense():
+                from vector_index import get_vector_index
+
+                # Nearest ids from the local index; only their text comes from Postgres
+                ids = [row_id for row_id, _ in get_vector_index().nearest(embedding, 5)]
+                texts = dict(db.query(UnifiedIndex.id, UnifiedIndex.source_text).filter(UnifiedIndex.id.in_(ids)).all())
+                return "\n\n".join([texts[row_id] for row_id in ids if row_id in texts])
+
+            results = db.query(UnifiedIndex).order_by(
+                UnifiedIndex.embedding.cosine_distance(embedding)
+            ).limit(5).all()
+
+            return "\n\n".join([r.source_text for r in results])
+        except Exception as e:
+            return f"Search error: {str(e)}"
+        finally:
+            db.close()
+
+
+@lru_cache(maxsize=1)
+def get_agents():
+    """Build the retrieval and formatter agents once; returns (retrieval_agent, formatter_agent)."""
+    retrieval_agent = Agent(
+        role="Context-Aware Retriever",
+        goal="Precisely extract all passages from the provided context that are highly relevant to the user's query.",
+        backstory="You are highly skilled at searching structured and unstructured data to identify directly related information, avoiding irrelevant filler or vague references.",
+        tools=[PgVectorSearchTool()],
+        llm=get_chat_llm(),
+        verbose=True
+    )
+
+    formatter_agent = Agent(
+        role="Response Structurer",
+        goal="Format extracted content into a clear and well-structured answer that is easy to read and directly informative.",
+        backstory="You format important data for business analysts. You never ask for more info—use only what is given to create helpful, markdown-formatted outputs.",
+        llm=get_chat_llm(),
+        verbose=True
+    )
+    return retrieval_agent, formatter_agent
+
+
+def run_dual_agent_rag(query: str, retrieved_context: str):
+    if len(retrieved_context) > 10000:
+        retrieved_context = retrieved_context[:10000]
+
+    retrieval_agent, formatter_agent = get_agents()
+
+    extract_task = Task(
+        description=(
+            "Extract all key parts from the context that are relevant to the query. Do NOT include generic or unrelated content. "
+            "Avoid repeating the query. Be comprehensive but precise. Extract at least 3 concrete facts or excerpts. Do not ask for clarification."
+        ),
+        input=f"Query: {query}\n\nContext:\n{retrieved_context}",
+        expected_output="Extracted text that directly answers the query, without extra commentary.",
+        agent=retrieval_agent
+    )
+
+    format_task = Task(
+        description=(
+            "Take the extracted relevant information and format it into a structured, human-friendly output. "
+            "Use markdown formatting (tables or lists) where applicable. Do not ask follow-up questions. Never say 'please provide'."
+        ),
+        expected_output=(
+            "A clean, structured summary or table using the extracted content. No vague responses. "
+            "If nothing is relevant, return: 'No relevant information found in the context.'"
+        ),
+        agent=formatter_agent,
+        input_from=extract_task
+    )
+
+    crew = Crew(
+        agents=[retrieval_agent, formatter_agent],
+        tasks=[extract_task, format_task],
+        verbose=True,
+        process="sequential"
+    )
+
+    try:
+        result = crew.kickoff()
+    finally:
+        search_sessions.remove()
+    if not hasattr(result, "output") or not result.output.strip():
+        return "⚠️ Retrieval agent returned no useful output."
+
+    return result.output
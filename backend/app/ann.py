@@ -0,0 +1,299 @@
+"""
+Approximate nearest neighbour (ANN) index management for unified_index.embedding.
+
+Settings come from the environment:
+
+    ANN_INDEX_TYPE             hnsw (default) or ivfflat
+    ANN_HNSW_M                 graph degree (build time)
+    ANN_HNSW_EF_CONSTRUCTION   candidate list size (build time)
+    ANN_HNSW_EF_SEARCH         candidate list size (query time, per session)
+    ANN_IVFFLAT_LISTS          number of lists, 0 = derive from the row count
+    ANN_IVFFLAT_PROBES         lists scanned per query (query time, per session)
+    ANN_ITERATIVE_SCAN         off, relaxed_order or strict_order (pgvector >= 0.8)
+    ANN_PARTIAL_TAGS           comma-separated source_tags that get their own partial index
+    ANN_QUANTIZATION           none (default), halfvec, reduced or binary (pgvector >= 0.7)
+    ANN_REDUCED_DIMS           leading dimensions indexed by the reduced mode
+    ANN_RERANK_CANDIDATES      rows per source_tag taken from a quantized index for reranking
+
+Run after bulk loads (IVFFlat centroids are only computed at build time):
+
+    python ann.py reindex
+    python ann.py rebuild --type hnsw
+
+Quantization
+------------
+
+The full float32 embedding (1536 dims, ~6 KB per row) stays in the table and
+is always what results are finally ordered by. With ANN_QUANTIZATION set, the
+index is built on a compact expression of it instead, and the dense leg runs in
+two stages: the index returns ANN_RERANK_CANDIDATES rows per source_tag, and
+those are reranked by exact cosine distance on the full vector.
+
+- halfvec: float16 copy, half the index size, near-identical ranking
+- reduced: the first ANN_REDUCED_DIMS dimensions. text-embedding-3 models are
+  trained so that a truncated embedding is what the API returns for the
+  `dimensions` parameter (after normalization, which cosine distance ignores),
+  so existing rows do not need to be embedded again
+- binary: one bit per dimension (binary_quantize), Hamming distance, 1/32 of
+  the size; needs the most rerank candidates
+
+The indexes are expressions over the existing column, so switching modes is an
+index rebuild, with no table rewrite or re-embedding:
+
+    python ann.py rebuild --quantization halfvec
+
+Search must run with the same ANN_QUANTIZATION as the index, or the planner
+cannot use it. HNSW returns at most hnsw.ef_search rows per scan, so keep
+ANN_HNSW_EF_SEARCH >= ANN_RERANK_CANDIDATES (or enable ANN_ITERATIVE_SCAN).
+"""
+import math
+import os
+from dataclasses import dataclass, field
+
+from sqlalchemy import event, text
+
+INDEX_PREFIX = "unified_idx_embedding"
+# New indexes are built under their name plus this, then renamed
+BUILD_SUFFIX = "_rebuild"
+EMBEDDING_DIM = 1536
+QUANTIZATION_MODES = ("none", "halfvec", "reduced", "binary")
+
+
+def _env_list(name: str) -> list:
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+
+@dataclass
+class AnnConfig:
+    index_type: str = os.getenv("ANN_INDEX_TYPE", "hnsw")
+    m: int = int(os.getenv("ANN_HNSW_M", 16))
+    ef_construction: int = int(os.getenv("ANN_HNSW_EF_CONSTRUCTION", 64))
+    ef_search: int = int(os.getenv("ANN_HNSW_EF_SEARCH", 100))
+    lists: int = int(os.getenv("ANN_IVFFLAT_LISTS", 0))
+    probes: int = int(os.getenv("ANN_IVFFLAT_PROBES", 10))
+    iterative_scan: str = os.getenv("ANN_ITERATIVE_SCAN", "off")
+    partial_tags: list = field(default_factory=lambda: _env_list("ANN_PARTIAL_TAGS"))
+    quantization: str = os.getenv("ANN_QUANTIZATION", "none")
+    reduced_dims: int = int(os.getenv("ANN_REDUCED_DIMS", 512))
+    rerank_candidates: int = int(os.getenv("ANN_RERANK_CANDIDATES", 80))
+
+    def __post_init__(self):
+        if self.index_type not in ("hnsw", "ivfflat"):
+            raise ValueError(f"Unsupported ANN index type: {self.index_type}")
+        if self.iterative_scan not in ("off", "relaxed_order", "strict_order"):
+            raise ValueError(f"Unsupported iterative scan mode: {self.iterative_scan}")
+        if self.quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported quantization mode: {self.quantization}")
+        if not 0 < int(self.reduced_dims) <= EMBEDDING_DIM:
+            raise ValueError(f"ANN_REDUCED_DIMS must be between 1 and {EMBEDDING_DIM}")
+
+    def index_expression(self):
+        """(indexed expression, operator class) for the quantization mode."""
+        dims = int(self.reduced_dims)
+        return {
+            "none": ("embedding", "vector_cosine_ops"),
+            "halfvec": (f"(embedding::halfvec({EMBEDDING_DIM}))", "halfvec_cosine_ops"),
+            "reduced": (f"(subvector(embedding, 1, {dims})::vector({dims}))", "vector_cosine_ops"),
+            "binary": (f"(binary_quantize(embedding)::bit({EMBEDDING_DIM}))", "bit_hamming_ops"),
+        }[self.quantization]
+
+    def index_distance(self, query: str) -> str:
+        """
+        SQL distance between the indexed expression and query, a vector expression.
+
+        The left-hand side repeats index_expression() so the planner matches it
+        to the index.
+        """
+        expression, _ = self.index_expression()
+        dims = int(self.reduced_dims)
+        return {
+            "none": f"{expression} <=> {query}",
+            "halfvec": f"{expression} <=> CAST({query} AS halfvec({EMBEDDING_DIM}))",
+            "reduced": f"{expression} <=> subvector({query}, 1, {dims})",
+            "binary": f"{expression} <~> binary_quantize({query})",
+        }[self.quantization]
+
+    def ivfflat_lists(self, row_count: int) -> int:
+        # pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond
+        if self.lists:
+            return self.lists
+        if row_count <= 1_000_000:
+            return max(1, row_count // 1000)
+        return int(math.sqrt(row_count))
+
+
+ann_config = AnnConfig()
+
+
+def session_settings(config: AnnConfig = None) -> list:
+    """SET statements that tune the query-time side of the ANN index."""
+    config = config or ann_config
+    statements = [
+        f"SET hnsw.ef_search = {int(config.ef_search)}",
+        f"SET ivfflat.probes = {int(config.probes)}",
+    ]
+    if config.iterative_scan != "off":
+        statements.append(f"SET hnsw.iterative_scan = {config.iterative_scan}")
+        statements.append(f"SET ivfflat.iterative_scan = {config.iterative_scan}")
+    return statements
+
+
+def apply_session_settings(connection, config: AnnConfig = None):
+    for statement in session_settings(config):
+        connection.execute(text(statement))
+
+
+def install_session_settings(engine, config: AnnConfig = None):
+    """Apply the ANN session settings to every new pooled connection."""
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in session_settings(config):
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+        dbapi_connection.commit()
+
+
+def index_definitions(config: AnnConfig = None, row_count: int = 0, suffix: str = "") -> dict:
+    """
+    Return {index_name: CREATE INDEX statement} for the configured index layout.
+    With suffix, the statements build each index under index_name + suffix.
+    """
+    config = config or ann_config
+    if config.index_type == "hnsw":
+        method = "hnsw"
+        options = f"m = {int(config.m)}, ef_construction = {int(config.ef_construction)}"
+    else:
+        method = "ivfflat"
+        options = f"lists = {config.ivfflat_lists(row_count)}"
+
+    expression, opclass = config.index_expression()
+    definitions = {
+        INDEX_PREFIX: (
+            f"CREATE INDEX CONCURRENTLY {INDEX_PREFIX}{suffix} ON unified_index "
+            f"USING {method} ({expression} {opclass}) WITH ({options})"
+        )
+    }
+    for tag in config.partial_tags:
+        if not tag.replace("_", "").isalnum():
+            raise ValueError(f"Invalid source_tag for partial index: {tag}")
+        name = f"{INDEX_PREFIX}_{tag}"
+        definitions[name] = (
+            f"CREATE INDEX CONCURRENTLY {name}{suffix} ON unified_index "
+            f"USING {method} ({expression} {opclass}) WITH ({options}) "
+            f"WHERE source_tag = '{tag}'"
+        )
+    return definitions
+
+
+def existing_indexes(connection) -> list:
+    rows = connection.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = 'unified_index' AND indexname LIKE :prefix"),
+        {"prefix": f"{INDEX_PREFIX}%"}
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def rebuild_indexes(engine, config: AnnConfig = None) -> list:
+    """
+    Replace the embedding indexes with the ones for the given configuration.
+
+    The new indexes are built with CONCURRENTLY under temporary names while the
+    old ones keep serving searches. Only then are the old ones dropped and the
+    new ones renamed, so searches never run without an ANN index. Both sets
+    exist during the build, which needs the disk space for both. If a build
+    fails, the new indexes are dropped and the old ones stay. Returns the names
+    of the indexes that now exist.
+    """
+    config = config or ann_config
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        row_count = connection.execute(text("SELECT count(*) FROM unified_index")).scalar()
+        # Leftovers of an interrupted rebuild, possibly INVALID
+        old = []
+        for name in existing_indexes(connection):
+            if name.endswith(BUILD_SUFFIX):
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            else:
+                old.append(name)
+
+        definitions = index_definitions(config, row_count, suffix=BUILD_SUFFIX)
+        try:
+            for name, ddl in definitions.items():
+                print(f"[ANN] Building {name}: {ddl}")
+                connection.execute(text(ddl))
+        except Exception:
+            for name in definitions:
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}{BUILD_SUFFIX}"))
+            raise
+
+        for name in old:
+            print(f"[ANN] Dropping {name}")
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        for name in definitions:
+            connection.execute(text(f"ALTER INDEX {name}{BUILD_SUFFIX} RENAME TO {name}"))
+        connection.execute(text("ANALYZE unified_index"))
+        return existing_indexes(connection)
+
+
+def reindex(engine) -> list:
+    """Rebuild the existing embedding indexes in place, e.g. after a bulk load."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        names = existing_indexes(connection)
+        for name in names:
+            print(f"[ANN] Reindexing {name}")
+            connection.execute(text(f"REINDEX INDEX CONCURRENTLY {name}"))
+        connection.execute(text("ANALYZE unified_index"))
+        return names
+
+
+def index_sizes(connection) -> dict:
+    """Bytes used by the table (heap and TOAST) and by each embedding index."""
+    sizes = {"table": connection.execute(text("SELECT pg_table_size('unified_index')")).scalar()}
+    for name in existing_indexes(connection):
+        sizes[name] = connection.execute(text("SELECT pg_relation_size(CAST(:name AS regclass))"), {"name": name}).scalar()
+    return sizes
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the unified_index ANN indexes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_cmd = sub.add_parser("rebuild", help="replace the indexes with ones built from the current settings")
+    rebuild_cmd.add_argument("--type", choices=["hnsw", "ivfflat"])
+    rebuild_cmd.add_argument("--partial-tags", help="comma-separated source_tags for partial indexes")
+    rebuild_cmd.add_argument("--quantization", choices=QUANTIZATION_MODES)
+    rebuild_cmd.add_argument("--reduced-dims", type=int)
+    sub.add_parser("reindex", help="REINDEX the existing embedding indexes")
+    sub.add_parser("show", help="print the current settings and index DDL")
+    sub.add_parser("sizes", help="print the table and embedding index sizes")
+    args = parser.parse_args()
+
+    from db import engine
+
+    config = ann_config
+    if args.command == "rebuild":
+        config = AnnConfig(
+            index_type=args.type or ann_config.index_type,
+            partial_tags=args.partial_tags.split(",") if args.partial_tags else ann_config.partial_tags,
+            quantization=args.quantization or ann_config.quantization,
+            reduced_dims=args.reduced_dims or ann_config.reduced_dims,
+        )
+        print(rebuild_indexes(engine, config))
+        if config.quantization != ann_config.quantization:
+            print(f"[ANN] Set ANN_QUANTIZATION={config.quantization} for the API so searches use the new index")
+    elif args.command == "reindex":
+        print(reindex(engine))
+    elif args.command == "sizes":
+        with engine.connect() as connection:
+            for name, size in index_sizes(connection).items():
+                print(f"{name:40}{size / 1e6:>12,.1f} MB")
+    else:
+        print(config)
+        for statement in session_settings(config):
+            print(statement)
+        for ddl in index_definitions(config).values():
+            print(ddl)
@@ -0,0 +1,285 @@
+"""
+Bulk loader for unified_index using PostgreSQL binary COPY.
+
+Rows are streamed with `COPY ... FROM STDIN WITH (FORMAT binary)`, so each
+embedding travels as 1536 packed float32 values (pgvector's binary format)
+instead of a ~20 KB text literal per INSERT. Ids are reserved from the table's
+sequence up front, which lets a single COPY both load the batch and report
+the inserted ids.
+
+Every row also stores content_hash, the sha256 of its stored text. It may also
+store a row_key taken from the upload, so re-ingesting a file can tell new,
+changed and unchanged rows apart (see find_existing, update_rows and
+delete_rows_except).
+
+Rows loaded with records also store their metadata (metadata.py): the raw row
+as JSONB and the promoted columns. Rows loaded before that can get it later
+with fill_metadata.
+"""
+import hashlib
+import io
+import json
+import os
+import struct
+from datetime import date
+
+import numpy as np
+from sqlalchemy import text
+
+from metadata import DATE_COLUMNS, PROMOTED_COLUMNS
+
+COPY_BATCH_ROWS = int(os.getenv("COPY_BATCH_ROWS", 5000))
+
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+COPY_COLUMNS = ("id", "source_tag", "source_text", "embedding", "row_key", "content_hash")
+STAGING_COLUMNS = ("id", "source_text", "embedding", "content_hash")
+METADATA_COLUMNS = ("raw",) + PROMOTED_COLUMNS
+PG_EPOCH = date(2000, 1, 1)
+
+
+def encode_vector(vec) -> bytes:
+    # pgvector binary format: int16 dim, int16 unused, dim big-endian float32 values
+    arr = np.asarray(vec, dtype=">f4")
+    return struct.pack(">HH", arr.shape[0], 0) + arr.tobytes()
+
+
+def encode_text(value: str) -> bytes:
+    # PostgreSQL text cannot hold NUL bytes
+    return value.replace("\x00", "").encode("utf-8")
+
+
+def encode_jsonb(value) -> bytes:
+    # jsonb binary format: a version byte, then the JSON text
+    return b"\x01" + json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_date(value: date) -> bytes:
+    return struct.pack(">i", (value - PG_EPOCH).days)
+
+
+def encode_metadata(record: dict) -> tuple:
+    """Encoded METADATA_COLUMNS values of a metadata.row_record (None for NULL)."""
+    fields = [encode_jsonb(record["raw"])]
+    for name in PROMOTED_COLUMNS:
+        value = record.get(name)
+        if value is None:
+            fields.append(None)
+        elif name in DATE_COLUMNS:
+            fields.append(encode_date(value))
+        else:
+            fields.append(encode_text(value))
+    return tuple(fields)
+
+
+def content_hash(value: str) -> bytes:
+    # Hash of the text exactly as stored, so it matches sha256(convert_to(source_text, 'UTF8')) in SQL
+    return hashlib.sha256(encode_text(value)).digest()
+
+
+def encode_copy_tuples(rows) -> io.BytesIO:
+    """Build a binary COPY payload from rows of already encoded field values (None for NULL)."""
+    buf = io.BytesIO()
+    buf.write(COPY_HEADER)
+    for fields in rows:
+        buf.write(struct.pack(">h", len(fields)))
+        for value in fields:
+            if value is None:
+                buf.write(struct.pack(">i", -1))
+            else:
+                buf.write(struct.pack(">i", len(value)))
+                buf.write(value)
+    buf.write(COPY_TRAILER)
+    buf.seek(0)
+    return buf
+
+
+def copy_columns(records=None) -> tuple:
+    return COPY_COLUMNS + METADATA_COLUMNS if records is not None else COPY_COLUMNS
+
+
+def encode_copy_rows(ids, source_tag: str, texts, embeddings, keys=None, records=None) -> io.BytesIO:
+    """Build a binary COPY payload for unified_index rows (see copy_columns)."""
+    tag = encode_text(source_tag)
+    keys = keys if keys is not None else [None] * len(texts)
+    metadata = [encode_metadata(record) for record in records] if records is not None else [()] * len(texts)
+    return encode_copy_tuples(
+        (
+            struct.pack(">i", row_id),
+            tag,
+            encode_text(text_value),
+            encode_vector(vec),
+            None if key is None else encode_text(key),
+            content_hash(text_value),
+            *fields,
+        )
+        for row_id, text_value, vec, key, fields in zip(ids, texts, embeddings, keys, metadata)
+    )
+
+
+def reserve_ids(cursor, count: int) -> list:
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence('unified_index', 'id')) FROM generate_series(1, %s)",
+        (count,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def copy_rows(db, source_tag: str, texts, embeddings, batch_size: int = None, keys=None, records=None,
+              commit: bool = True) -> list:
+    """
+    Insert rows into unified_index with binary COPY, committing after every batch.
+
+    With commit=False nothing is committed, so the caller can make all batches
+    part of one transaction. texts and embeddings (and keys and records, if
+    given) must be the same length. Returns the inserted ids in input order.
+    """
+    batch_size = batch_size or COPY_BATCH_ROWS
+    inserted_ids = []
+
+    for start in range(0, len(texts), batch_size):
+        batch_texts = texts[start:start + batch_size]
+        batch_embeddings = embeddings[start:start + batch_size]
+        batch_keys = keys[start:start + batch_size] if keys is not None else None
+        batch_records = records[start:start + batch_size] if records is not None else None
+
+        # Raw DBAPI (psycopg2) connection behind the session's transaction
+        cursor = db.connection().connection.cursor()
+        try:
+            ids = reserve_ids(cursor, len(batch_texts))
+            payload = encode_copy_rows(ids, source_tag, batch_texts, batch_embeddings, batch_keys, batch_records)
+            cursor.copy_expert(
+                f"COPY unified_index ({', '.join(copy_columns(batch_records))}) FROM STDIN WITH (FORMAT binary)",
+                payload
+            )
+        finally:
+            cursor.close()
+
+        if commit:
+            db.commit()
+        inserted_ids.extend(ids)
+
+    return inserted_ids
+
+
+def find_existing(db, source_tag: str, keys=None, hashes=None, unkeyed: bool = False) -> dict:
+    """
+    Look up rows of source_tag that are already stored.
+
+    With keys, returns {row_key: (id, content_hash)}. Otherwise rows are
+    identified by content, and the result is {content_hash: (id, content_hash)}
+    for the oldest row with each of the given hashes; unkeyed=True only
+    considers rows stored without a row_key.
+    """
+    if keys is not None:
+        rows = db.execute(
+            text("SELECT row_key, id, content_hash FROM unified_index "
+                 "WHERE source_tag = :tag AND row_key = ANY(:keys)"),
+            {"tag": source_tag, "keys": list(keys)}
+        ).fetchall()
+    else:
+        rows = db.execute(
+            text("SELECT content_hash, min(id), content_hash FROM unified_index "
+                 "WHERE source_tag = :tag AND content_hash = ANY(:hashes)"
+                 f"{' AND row_key IS NULL' if unkeyed else ''} GROUP BY content_hash"),
+            {"tag": source_tag, "hashes": list(hashes)}
+        ).fetchall()
+    return {bytes(row[0]) if keys is None else row[0]: (row[1], bytes(row[2])) for row in rows}
+
+
+def set_row_keys(db, ids, keys, commit: bool = True) -> int:
+    """Give existing rows a row_key (rows stored before their file was keyed); returns the count."""
+    if not ids:
+        return 0
+    result = db.execute(
+        text("UPDATE unified_index u SET row_key = k.row_key "
+             "FROM unnest(CAST(:ids AS integer[]), CAST(:keys AS text[])) AS k(id, row_key) WHERE u.id = k.id"),
+        {"ids": list(ids), "keys": list(keys)}
+    )
+    if commit:
+        db.commit()
+    return result.rowcount
+
+
+def copy_to_staging(cursor, columns: tuple, rows):
+    """COPY encoded rows into the session's staging table, which has every column an update can set."""
+    cursor.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS unified_index_staging "
+        "(id integer, source_text text, embedding vector, content_hash bytea, raw jsonb, state text, naics text, "
+        "agency text, uei text, cage text, posted_date date, response_deadline date) ON COMMIT DELETE ROWS"
+    )
+    # Empty even when an earlier update of the same transaction has not committed yet
+    cursor.execute("TRUNCATE unified_index_staging")
+    cursor.copy_expert(
+        f"COPY unified_index_staging ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)",
+        encode_copy_tuples(rows)
+    )
+
+
+def update_rows(db, ids, texts, embeddings, records=None, commit: bool = True) -> int:
+    """
+    Replace the text, embedding and content_hash of existing rows (and their
+    metadata, when records are given) through a binary COPY into a staging table.
+    Commits unless commit=False.
+    """
+    if not ids:
+        return 0
+    columns = STAGING_COLUMNS + (METADATA_COLUMNS if records is not None else ())
+    metadata = [encode_metadata(record) for record in records] if records is not None else [()] * len(ids)
+    cursor = db.connection().connection.cursor()
+    try:
+        copy_to_staging(cursor, columns, (
+            (struct.pack(">i", row_id), encode_text(text_value), encode_vector(vec), content_hash(text_value), *fields)
+            for row_id, text_value, vec, fields in zip(ids, texts, embeddings, metadata)
+        ))
+        assignments = ", ".join(f"{name} = s.{name}" for name in columns[1:])
+        cursor.execute(f"UPDATE unified_index u SET {assignments} FROM unified_index_staging s WHERE u.id = s.id")
+        updated = cursor.rowcount
+    finally:
+        cursor.close()
+    if commit:
+        db.commit()
+    return updated
+
+
+def fill_metadata(db, ids, records, commit: bool = True) -> int:
+    """Store metadata on existing rows that have none yet (rows loaded before metadata.py); returns the count."""
+    if not ids:
+        return 0
+    cursor = db.connection().connection.cursor()
+    try:
+        copy_to_staging(cursor, ("id",) + METADATA_COLUMNS, (
+            (struct.pack(">i", row_id), *encode_metadata(record)) for row_id, record in zip(ids, records)
+        ))
+        assignments = ", ".join(f"{name} = s.{name}" for name in METADATA_COLUMNS)
+        cursor.execute(
+            f"UPDATE unified_index u SET {assignments} FROM unified_index_staging s "
+            "WHERE u.id = s.id AND u.raw IS NULL"
+        )
+        filled = cursor.rowcount
+    finally:
+        cursor.close()
+    if commit:
+        db.commit()
+    return filled
+
+
+def delete_rows_except(db, source_tag: str, keep_ids) -> int:
+    """Delete every row of source_tag whose id is not in keep_ids; returns the number deleted."""
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute("CREATE TEMP TABLE unified_index_keep (id integer PRIMARY KEY) ON COMMIT DROP")
+        cursor.copy_expert(
+            "COPY unified_index_keep (id) FROM STDIN",
+            io.StringIO("".join(f"{row_id}\n" for row_id in keep_ids))
+        )
+        cursor.execute(
+            "DELETE FROM unified_index u WHERE u.source_tag = %s "
+            "AND NOT EXISTS (SELECT 1 FROM unified_index_keep k WHERE k.id = u.id)",
+            (source_tag,)
+        )
+        deleted = cursor.rowcount
+    finally:
+        cursor.close()
+    db.commit()
+    return deleted
@@ -1,18 +1,135 @@
 import redis
 import os
 import json
+import zlib
+
+# Optional codecs, used only when installed and selected
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
 redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
-QUERY_SET_KEY = "cached_queries"
+# Binary client for encoded cache entries and embedding vectors
+redis_bytes_client = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=1)
 
 CACHE_TTL = 3600  # Time to live: 1 hour
 
+# Result cache encoding: every entry starts with MAGIC, the format version and
+# one byte naming its codec and compression, so entries written in an older
+# format (or the plain JSON strings stored before) read back as misses.
+CACHE_FORMAT_VERSION = 2
+CACHE_MAGIC = b"RC"
+CACHE_CODEC = os.getenv("CACHE_CODEC", "json")  # json or msgpack
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "zlib")  # none, zlib or zstd
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", 1024))
+
+CODEC_IDS = {"json": 0, "msgpack": 1}
+COMPRESSION_IDS = {"none": 0, "zlib": 1, "zstd": 2}
+
+
+def _pack(result, codec: str) -> bytes:
+    if codec == "msgpack":
+        return msgpack.packb(result, use_bin_type=True)
+    return json.dumps(result, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _unpack(payload: bytes, codec_id: int):
+    if codec_id == CODEC_IDS["msgpack"]:
+        if msgpack is None:
+            return None
+        return msgpack.unpackb(payload, raw=False)
+    return json.loads(payload)
+
+
+def _compress(payload: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(payload)
+    if compression == "zlib":
+        return zlib.compress(payload, 6)
+    return payload
+
+
+def _decompress(payload: bytes, compression_id: int):
+    if compression_id == COMPRESSION_IDS["zstd"]:
+        if zstandard is None:
+            return None
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if compression_id == COMPRESSION_IDS["zlib"]:
+        return zlib.decompress(payload)
+    return payload
+
+
+def encode_result(result, codec: str = None, compression: str = None, min_bytes: int = None) -> bytes:
+    codec = codec or CACHE_CODEC
+    compression = compression or CACHE_COMPRESSION
+    min_bytes = CACHE_COMPRESS_MIN_BYTES if min_bytes is None else min_bytes
+
+    # Fall back to what is available rather than failing the request
+    if codec == "msgpack" and msgpack is None:
+        codec = "json"
+    if compression == "zstd" and zstandard is None:
+        compression = "zlib"
+
+    payload = _pack(result, codec)
+    if len(payload) < min_bytes:
+        compression = "none"
+    payload = _compress(payload, compression)
+
+    flags = (CODEC_IDS[codec] << 4) | COMPRESSION_IDS[compression]
+    return CACHE_MAGIC + bytes([CACHE_FORMAT_VERSION, flags]) + payload
+
+
+def _decode_errors() -> tuple:
+    # The optional codecs raise their own exception types for corrupt input
+    errors = (ValueError, zlib.error)
+    if zstandard is not None:
+        errors += (zstandard.ZstdError,)
+    if msgpack is not None:
+        errors += (msgpack.exceptions.UnpackException,)
+    return errors
+
+
+def decode_result(raw: bytes):
+    """Decode an entry written by encode_result; None for unknown formats or versions."""
+    if not raw or raw[:2] != CACHE_MAGIC or len(raw) < 4 or raw[2] != CACHE_FORMAT_VERSION:
+        return None
+    flags = raw[3]
+    try:
+        payload = _decompress(raw[4:], flags & 0x0F)
+        if payload is None:
+            return None
+        return _unpack(payload, flags >> 4)
+    except _decode_errors() as e:
+        print(f"⚠️ Dropping undecodable cache entry: {e}")
+        return None
+
+
 def get_cached_result(query: str):
     key = f"query:{query}"
-    return redis_client.get(key)
+    return decode_result(redis_bytes_client.get(key))
 
-def set_cached_result(query: str, result: list):
+def set_cached_result(query: str, result: dict):
+    # Suggestions are recorded separately (suggestions.py)
     key = f"query:{query}"
-    redis_client.setex(key, CACHE_TTL, json.dumps(result))
-    redis_client.sadd(QUERY_SET_KEY, query)  # Track the query
\ No newline at end of file
+    redis_bytes_client.setex(key, CACHE_TTL, encode_result(result))
+
+def get_cached_results(queries: list) -> list:
+    """get_cached_result for many queries in one round trip."""
+    if not queries:
+        return []
+    return [decode_result(raw) for raw in redis_bytes_client.mget([f"query:{query}" for query in queries])]
+
+def set_cached_results(items: list):
+    """set_cached_result for many (query, result) pairs in one round trip."""
+    if not items:
+        return
+    pipe = redis_bytes_client.pipeline(transaction=False)
+    for query, result in items:
+        pipe.setex(f"query:{query}", CACHE_TTL, encode_result(result))
+    pipe.execute()
@@ -0,0 +1,90 @@
+"""
+Prompt context for the search LLM calls: the best-ranked retrieved rows that
+fit a token budget.
+
+Rows are stored as the space-joined values of their cells (up to 10,000
+characters each), so five of them could reach ~12k prompt tokens. Rows are
+taken in rank order. Each one is capped at CONTEXT_CHUNK_TOKENS, so a single
+long row cannot crowd out the others, and the total is capped at
+CONTEXT_TOKEN_BUDGET.
+
+Before counting, boilerplate is removed. Stored rows no longer have column
+names, so boilerplate columns cannot be dropped by name. Instead this looks for
+their content: prose sentences that a better-ranked row already contains are
+dropped, e.g. the solicitation instructions repeated in most contract
+opportunities. The first copy is kept.
+
+Tokens are counted with the embedding model's encoding (cl100k_base). For the
+row text here, the chat model's o200k_base counts are within a few percent.
+"""
+import os
+import re
+
+from utils import get_encoder, encode_texts
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+CONTEXT_CHUNK_TOKENS = int(os.getenv("CONTEXT_CHUNK_TOKENS", 1200))
+# A row cut below this many tokens is not worth including
+CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", 40))
+BOILERPLATE_MIN_CHARS = 40
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def is_prose(sentence: str) -> bool:
+    # Template text is mostly lowercase words; names, addresses and codes are not
+    letters = [char for char in sentence if char.isalpha()]
+    return len(letters) >= BOILERPLATE_MIN_CHARS // 2 and sum(char.islower() for char in letters) * 2 > len(letters)
+
+
+def strip_boilerplate(texts: list) -> list:
+    """Drop prose sentences of BOILERPLATE_MIN_CHARS+ that an earlier text already contains."""
+    seen = set()
+    stripped = []
+    for text in texts:
+        kept = []
+        for sentence in SENTENCE_END.split(text):
+            if len(sentence) >= BOILERPLATE_MIN_CHARS and is_prose(sentence):
+                key = sentence.lower()
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(sentence)
+        stripped.append(" ".join(kept))
+    return stripped
+
+
+def build_context(results, token_budget: int = None, chunk_tokens: int = None):
+    """
+    Return (context, sources, info) for retrieval results in rank order.
+
+    context numbers each row with its source ("[1] ...") the way the prompts
+    expect; sources lists the source tags that made it in, by first appearance.
+    info has the rows used, the rows truncated and the context's token count.
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    chunk_tokens = CONTEXT_CHUNK_TOKENS if chunk_tokens is None else chunk_tokens
+
+    enc = get_encoder()
+    texts = strip_boilerplate([doc.source_text for doc in results])
+    remaining = token_budget
+    source_index = {}
+    numbered_chunks = []
+    info = {"chunks": 0, "truncated": 0, "tokens": 0}
+
+    for doc, text, tokens in zip(results, texts, encode_texts(enc, texts)):
+        allowed = min(chunk_tokens, remaining)
+        if allowed < min(len(tokens), CONTEXT_MIN_CHUNK_TOKENS):
+            continue  # a shorter, lower-ranked row may still fit
+        if len(tokens) > allowed:
+            text = enc.decode(tokens[:allowed]).rstrip() + " …"
+            tokens = tokens[:allowed]
+            info["truncated"] += 1
+        remaining -= len(tokens)
+
+        source_num = source_index.setdefault(doc.source_tag, len(source_index) + 1)
+        numbered_chunks.append(f"[{source_num}] {text}")
+        info["chunks"] += 1
+        info["tokens"] += len(tokens)
+
+    return "\n\n".join(numbered_chunks), list(source_index), info
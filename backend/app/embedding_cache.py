@@ -0,0 +1,139 @@
+"""
+Content-addressed cache for embeddings.
+
+Vectors are keyed by sha256(model, normalized text) and kept in two tiers: an
+in-process LRU and Redis, where they are stored as raw float32 bytes (6 KB per
+1536-dim vector instead of ~30 KB of JSON). Redis errors never fail an
+embedding call; the Redis tier is simply skipped for a while.
+"""
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+import redis
+
+from cache import redis_bytes_client
+from metrics import register_collector
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 10000))
+EMBED_CACHE_TTL = int(os.getenv("EMBED_CACHE_TTL", 0))  # seconds, 0 = never expire
+EMBED_CACHE_RETRY_SECONDS = 30
+KEY_PREFIX = "emb:"
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+    return KEY_PREFIX + digest
+
+
+class EmbeddingCache:
+    def __init__(self, max_size=EMBED_CACHE_SIZE, ttl=EMBED_CACHE_TTL, client=redis_bytes_client):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.client = client
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self.redis_down_until = 0.0
+        self.counters = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def _remember(self, key, vec):
+        with self.lock:
+            self.local[key] = vec
+            self.local.move_to_end(key)
+            while len(self.local) > self.max_size:
+                self.local.popitem(last=False)
+
+    def _redis_available(self):
+        return self.client is not None and time.monotonic() >= self.redis_down_until
+
+    def _redis_failed(self, err):
+        print(f"⚠️ Embedding cache Redis tier disabled for {EMBED_CACHE_RETRY_SECONDS}s: {err}")
+        self.redis_down_until = time.monotonic() + EMBED_CACHE_RETRY_SECONDS
+
+    def get_many(self, keys: list) -> list:
+        """Return a vector or None for each key, checking the LRU first and then Redis."""
+        found = [None] * len(keys)
+        remote = []
+        with self.lock:
+            for i, key in enumerate(keys):
+                vec = self.local.get(key)
+                if vec is not None:
+                    self.local.move_to_end(key)
+                    found[i] = vec
+                    self.counters["local_hits"] += 1
+                else:
+                    remote.append(i)
+
+        if remote and self._redis_available():
+            try:
+                values = self.client.mget([keys[i] for i in remote])
+            except redis.RedisError as err:
+                self._redis_failed(err)
+                values = [None] * len(remote)
+            for i, raw in zip(remote, values):
+                if raw is not None:
+                    vec = np.frombuffer(raw, dtype=np.float32)
+                    found[i] = vec
+                    self._remember(keys[i], vec)
+                    with self.lock:
+                        self.counters["redis_hits"] += 1
+
+        with self.lock:
+            self.counters["misses"] += sum(1 for vec in found if vec is None)
+        return found
+
+    def set_many(self, keys: list, vectors) -> None:
+        vectors = [np.array(vec, dtype=np.float32) for vec in vectors]
+        for key, vec in zip(keys, vectors):
+            self._remember(key, vec)
+
+        if not keys or not self._redis_available():
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, vec in zip(keys, vectors):
+                if self.ttl:
+                    pipe.setex(key, self.ttl, vec.tobytes())
+                else:
+                    pipe.set(key, vec.tobytes())
+            pipe.execute()
+        except redis.RedisError as err:
+            self._redis_failed(err)
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats["local_size"] = len(self.local)
+        lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["local_hits"] + stats["redis_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.local.clear()
+            for name in self.counters:
+                self.counters[name] = 0
+
+
+embedding_cache = EmbeddingCache()
+
+
+@register_collector
+def embedding_cache_metrics():
+    stats = embedding_cache.stats()
+    return [
+        ("embedding_cache_lookups_total", "counter", "Embedding cache lookups by outcome.", [
+            ({"result": "local_hit"}, stats["local_hits"]),
+            ({"result": "redis_hit"}, stats["redis_hits"]),
+            ({"result": "miss"}, stats["misses"]),
+        ]),
+        ("embedding_cache_local_entries", "gauge", "Vectors held in the in-process LRU.", [({}, stats["local_size"])]),
+    ]
@@ -0,0 +1,448 @@
+import codecs
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from bulk_loader import (
+    content_hash, copy_rows, delete_rows_except, fill_metadata, find_existing, set_row_keys, update_rows
+)
+from db import SessionLocal
+from metadata import promoted_sources, row_record
+from metrics import stage
+from utils import generate_embeddings
+
+# Rows parsed, embedded and committed together; bounds peak memory during ingestion
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", 500))
+SPOOL_BLOCK_SIZE = 1 << 20  # 1 MiB
+MAX_STORED_CHARS = 10000  # source_text is truncated to this length
+# append adds every row; incremental skips unchanged rows and updates changed
+# ones; replace does the same and then deletes rows missing from the file
+INGEST_MODES = ("append", "incremental", "replace")
+# Uploads are spooled here for the ingestion workers; must be shared with them
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR") or None
+
+
+_strip_str = np.frompyfunc(str.strip, 1, 1)
+_strip_any = np.frompyfunc(lambda val: str(val).strip(), 1, 1)
+
+
+def row_values(df):
+    """Return (values, present): the cell values iterrows() would yield, as a 2D object array, and their notna mask."""
+    # df.values is what iterrows() reads its rows from, after the same dtype upcasting
+    values = df.to_numpy()
+    if values.dtype != object:
+        # Box the values the way iterating a row Series does
+        values = pd.DataFrame(values).astype(object).to_numpy()
+    return values, pd.notna(values)
+
+
+def unique_rows(values, present, seen: set):
+    """
+    Mask of the rows that dropna(how="all").drop_duplicates() would keep.
+    Rows already in seen are also dropped. Each kept row's hash is added to
+    seen, so duplicates are caught across chunks while memory stays bounded.
+    """
+    keep = present.any(axis=1)
+    # Nulls compare equal in drop_duplicates(); NaN does not in a tuple, None does
+    keys = np.where(present, values, None)
+    for i, row in enumerate(keys.tolist()):
+        if keep[i]:
+            key = hash(tuple(row))
+            if key in seen:
+                keep[i] = False
+            else:
+                seen.add(key)
+    return keep
+
+
+def stripped_cells(values, present):
+    # str(val).strip() over the whole array at once; None where the value is missing
+    flat = values[present]
+    cells = np.full(values.shape, None, dtype=object)
+    if pd.api.types.infer_dtype(flat, skipna=False) == "string":
+        cells[present] = _strip_str(flat)
+    else:
+        cells[present] = _strip_any(flat)
+    return cells
+
+
+def texts_from_cells(cells, positions: list = None) -> list:
+    # Only the join runs per row. positions, if given, receives the row index
+    # behind each returned text
+    texts = []
+    for i, row in enumerate(cells.tolist()):
+        combined = " ".join([cell for cell in row if cell is not None]).strip()
+        if not combined or combined.lower() == "nan":
+            continue
+        texts.append(combined)
+        if positions is not None:
+            positions.append(i)
+    return texts
+
+
+def texts_from_values(values, present) -> list:
+    return texts_from_cells(stripped_cells(values, present))
+
+
+def serialize_rows(df, seen: set = None) -> list:
+    """
+    Flatten each row that clean_rows(df, seen) would keep into one
+    space-joined string of its non-null values, skipping empty rows.
+
+    The output is identical to running str(val).strip() over the non-null
+    values of every df.iterrows() row of the cleaned frame, without building
+    a Series per row, and cleaning and serialization share one pass.
+    """
+    values, present = row_values(df)
+    keep = unique_rows(values, present, set() if seen is None else seen)
+    return texts_from_values(values[keep], present[keep])
+
+
+def serialize_records(df, seen: set = None, key_column: str = None):
+    """
+    serialize_rows that also returns each text's metadata record (see
+    metadata.row_record) and, with key_column, the stripped value of that
+    column in each text's row (None when empty): (keys, texts, records).
+    keys is None without key_column.
+    """
+    if key_column is not None and key_column not in df.columns:
+        raise ValueError(f"Key column {key_column!r} is not in the file")
+    values, present = row_values(df)
+    keep = unique_rows(values, present, set() if seen is None else seen)
+    cells = stripped_cells(values[keep], present[keep])
+    positions = []
+    texts = texts_from_cells(cells, positions)
+
+    columns = [str(name) for name in df.columns]
+    sources = promoted_sources(columns)
+    rows = cells[positions].tolist() if positions else []
+    records = [
+        row_record({name: cell for name, cell in zip(columns, row) if cell}, sources)
+        for row in rows
+    ]
+    keys = None
+    if key_column is not None:
+        column = df.columns.get_loc(key_column)
+        keys = [row[column] or None for row in rows]
+    return keys, texts, records
+
+
+async def spool_upload(file) -> str:
+    """Copy an UploadFile to a temporary file on disk block by block and return its path."""
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, prefix="ingest_", dir=INGEST_SPOOL_DIR) as out:
+        while True:
+            block = await file.read(SPOOL_BLOCK_SIZE)
+            if not block:
+                break
+            out.write(block)
+        return out.name
+
+
+def detect_encoding(path: str) -> str:
+    # Stream the file through an incremental decoder instead of decoding it in one piece
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(SPOOL_BLOCK_SIZE)
+                if not block:
+                    decoder.decode(b"", final=True)
+                    break
+                decoder.decode(block)
+    except UnicodeDecodeError:
+        return "cp1252"
+    return "utf-8"
+
+
+def iter_csv_chunks(path: str, chunksize: int):
+    # Values are read as strings so a row's text never depends on which chunk it landed in
+    reader = pd.read_csv(path, chunksize=chunksize, dtype=str, encoding=detect_encoding(path))
+    with reader:
+        for chunk in reader:
+            yield chunk
+
+
+def iter_xlsx_chunks(path: str, chunksize: int):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [f"Unnamed: {i}" if name is None else str(name) for i, name in enumerate(header)]
+
+        # Cells become strings as they are read, like the CSV reader's dtype=str: with inferred
+        # dtypes an int column holding a blank turns float in that chunk only, and 1 becomes "1.0"
+        batch = []
+        for row in rows:
+            batch.append([None if value is None else str(value) for value in row])
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=columns, dtype=object)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, dtype=object)
+    finally:
+        workbook.close()
+
+
+def iter_row_chunks(path: str, filename: str, chunksize: int = None):
+    """Yield the rows of a spooled CSV/Excel upload as DataFrames of at most chunksize rows."""
+    chunksize = chunksize or INGEST_CHUNK_ROWS
+    filename = filename.lower()
+    if filename.endswith(".csv"):
+        yield from iter_csv_chunks(path, chunksize)
+    elif filename.endswith(".xlsx"):
+        yield from iter_xlsx_chunks(path, chunksize)
+    else:
+        # Legacy .xls has no streaming reader; it is loaded whole
+        df = pd.read_excel(path, dtype=str)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+
+def clean_rows(df, seen: set = None):
+    # dropna(how="all") + drop_duplicates(); duplicates are tracked across chunks when seen is given
+    values, present = row_values(df)
+    return df[unique_rows(values, present, set() if seen is None else seen)]
+
+
+def ingest_texts(db, texts: list, source_tag: str, stats: dict = None, records: list = None) -> int:
+    # Leaves the rows uncommitted; the caller commits the chunk as one transaction
+    if not texts:
+        return 0
+
+    with stage("ingest", "embed"):
+        embeddings = generate_embeddings(texts, stats=stats)
+    with stage("ingest", "write"):
+        ids = copy_rows(db, source_tag, [combined[:MAX_STORED_CHARS] for combined in texts], embeddings,
+                        records=records, commit=False)
+    return len(ids)
+
+
+def adopt_unkeyed(db, source_tag: str, positions: list, keys: list, hashes: list, claimed: set) -> dict:
+    """
+    Match the rows at positions on content against stored rows without a key
+    and give each matched row its key. A stored row is matched at most once:
+    matched ids are added to claimed, and ids already in it are skipped.
+    Returns {key: (id, content_hash)}.
+    """
+    if not positions:
+        return {}
+    unkeyed = find_existing(db, source_tag, hashes=[hashes[i] for i in positions], unkeyed=True)
+    adopted = {}
+    for i in positions:
+        match = unkeyed.get(hashes[i])
+        if match is not None and match[0] not in claimed:
+            claimed.add(match[0])
+            adopted[keys[i]] = match
+    if adopted:
+        set_row_keys(db, [match[0] for match in adopted.values()], list(adopted), commit=False)
+    return adopted
+
+
+def ingest_changed_texts(db, texts: list, source_tag: str, keys: list = None, stats: dict = None,
+                         identities: set = None, keep_ids: set = None, records: list = None) -> dict:
+    """
+    Insert new rows, re-embed and update changed rows, and skip unchanged ones.
+    With records, new and changed rows store them, and unchanged rows that have
+    no metadata yet get it without being re-embedded.
+
+    A row is identified by its key when keys are given (rows without a key
+    fall back to their content hash), otherwise by the hash of its stored text.
+    With keys, a key that no stored row has yet is matched on content against
+    the rows stored without a key (by append mode, /upload-file/ or before
+    migration 003), and the matched row takes the key. A row like that whose
+    content has also changed can't be matched and is inserted again.
+    identities collects what this run has already handled, so later repeats are
+    skipped. keep_ids collects the ids of every row the file still contains.
+    Nothing is committed; the caller commits. Returns {"inserted", "updated",
+    "unchanged"} counts.
+    """
+    identities = set() if identities is None else identities
+    keep_ids = set() if keep_ids is None else keep_ids
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    stored = [combined[:MAX_STORED_CHARS] for combined in texts]
+    hashes = [content_hash(value) for value in stored]
+    if keys is not None:
+        keys = [key or f"sha256:{digest.hex()}" for key, digest in zip(keys, hashes)]
+    row_ids = keys if keys is not None else hashes
+
+    rows = []
+    for i, identity in enumerate(row_ids):
+        if identity not in identities:
+            identities.add(identity)
+            rows.append(i)
+    if not rows:
+        return counts
+
+    with stage("ingest", "lookup"):
+        if keys is not None:
+            existing = find_existing(db, source_tag, keys=[keys[i] for i in rows])
+            adopted = adopt_unkeyed(db, source_tag, [i for i in rows if keys[i] not in existing], keys, hashes,
+                                    keep_ids)
+            existing.update(adopted)
+        else:
+            existing = find_existing(db, source_tag, hashes=[hashes[i] for i in rows])
+
+    new, changed, changed_ids, unchanged, unchanged_ids = [], [], [], [], []
+    for i in rows:
+        match = existing.get(row_ids[i])
+        if match is None:
+            new.append(i)
+        elif match[1] == hashes[i]:
+            counts["unchanged"] += 1
+            keep_ids.add(match[0])
+            unchanged.append(i)
+            unchanged_ids.append(match[0])
+        else:
+            changed.append(i)
+            changed_ids.append(match[0])
+
+    def select(positions):
+        return [records[i] for i in positions] if records is not None else None
+
+    if records is not None and unchanged:
+        with stage("ingest", "write"):
+            fill_metadata(db, unchanged_ids, select(unchanged), commit=False)
+
+    if new or changed:
+        with stage("ingest", "embed"):
+            embeddings = generate_embeddings([texts[i] for i in new + changed], stats=stats)
+        with stage("ingest", "write"):
+            inserted_ids = copy_rows(
+                db, source_tag, [stored[i] for i in new], embeddings[:len(new)],
+                keys=[keys[i] for i in new] if keys is not None else None, records=select(new), commit=False
+            )
+            counts["updated"] = update_rows(db, changed_ids, [stored[i] for i in changed], embeddings[len(new):],
+                                            records=select(changed), commit=False)
+        counts["inserted"] = len(inserted_ids)
+        keep_ids.update(inserted_ids)
+        keep_ids.update(changed_ids)
+    return counts
+
+
+def timed_chunks(chunks):
+    # Parsing happens while the reader is advanced, so time each step of it
+    chunks = iter(chunks)
+    while True:
+        with stage("ingest", "read"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def ingest_file_stream(path: str, filename: str, source_tag: str, on_progress=None, chunksize: int = None,
+                       progress: dict = None, should_stop=None, mode: str = "append", key_column: str = None,
+                       is_owner=None):
+    """
+    Parse, clean, embed and commit a spooled upload one chunk at a time.
+
+    Peak memory is bounded by the chunk size, not the file size. Each chunk is
+    written in one transaction, so a chunk is either fully stored or not at all
+    and progress["rows_read"] always matches what is committed. on_progress, if
+    given, is called after every committed chunk with the running totals,
+    including how many embeddings were served from the embedding cache.
+
+    mode is one of INGEST_MODES. In the incremental modes only new and changed
+    rows are embedded, matched on key_column when given, else on content.
+    replace then deletes the source's rows that are not in the file, but only
+    if the whole file was read.
+
+    To resume, pass the totals of the earlier run as progress: the first
+    progress["rows_read"] rows are skipped (only hashed, so duplicates of them
+    are still dropped) and counting continues from there. A replace run always
+    starts over, as deleting needs every row of the file; rows committed by the
+    earlier run then count as unchanged. should_stop is checked before each
+    chunk; when it returns True the run ends early. is_owner, if given, is
+    checked right before each commit; when it returns False the chunk is rolled
+    back and the run ends, because another worker has taken the job over.
+
+    Returns (progress, stopped): the final totals, and whether the run ended
+    before the end of the file.
+    """
+    if mode not in INGEST_MODES:
+        raise ValueError(f"Unknown ingest mode: {mode}")
+    incremental = mode != "append"
+    if mode == "replace":
+        progress = None
+
+    progress = {
+        "chunks": 0, "rows_read": 0, "rows_processed": 0, "embedded": 0, "inserted": 0, "updated": 0,
+        "unchanged": 0, "deleted": 0, "cached_embeddings": 0,
+        **(progress or {}),
+    }
+    embed_stats = {"cached": progress["cached_embeddings"], "embedded": progress["embedded"]}
+    skip = progress["rows_read"]
+    position = 0
+    seen = set()
+    identities, keep_ids = set(), set()
+    stopped = False
+
+    for chunk in timed_chunks(iter_row_chunks(path, filename, chunksize)):
+        if position + len(chunk) <= skip:
+            position += len(chunk)
+            clean_rows(chunk, seen)
+            continue
+        already_read = max(skip - position, 0)
+        position += len(chunk)
+        if already_read:
+            clean_rows(chunk.iloc[:already_read], seen)
+            chunk = chunk.iloc[already_read:]
+
+        if should_stop and should_stop():
+            stopped = True
+            break
+
+        with stage("ingest", "serialize"):
+            keys, texts, records = serialize_records(chunk, seen, key_column if incremental else None)
+
+        db = SessionLocal()
+        try:
+            if incremental:
+                counts = ingest_changed_texts(db, texts, source_tag, keys=keys, stats=embed_stats,
+                                              identities=identities, keep_ids=keep_ids, records=records)
+            else:
+                counts = {"inserted": ingest_texts(db, texts, source_tag, stats=embed_stats, records=records)}
+            if is_owner and not is_owner():
+                db.rollback()
+                stopped = True
+                break
+            with stage("ingest", "commit"):
+                db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        for name, count in counts.items():
+            progress[name] += count
+        progress["rows_read"] += len(chunk)
+        progress["chunks"] += 1
+        progress["rows_processed"] += len(texts)
+        progress["embedded"] = embed_stats["embedded"]
+        progress["cached_embeddings"] = embed_stats["cached"]
+        if on_progress:
+            on_progress(dict(progress))
+
+    if mode == "replace" and not stopped:
+        db = SessionLocal()
+        try:
+            with stage("ingest", "delete"):
+                progress["deleted"] = delete_rows_except(db, source_tag, keep_ids)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        if on_progress:
+            on_progress(dict(progress))
+
+    return progress, stopped
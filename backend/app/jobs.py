@@ -0,0 +1,180 @@
+"""
+Durable ingestion jobs, stored in Redis.
+
+Each upload is a hash `job:{upload_id}` holding its status, the spooled file,
+and running counters that the worker updates after every committed chunk.
+Queued job ids wait in the list `ingest:queue`. A worker claims one by moving
+it atomically to `ingest:processing`. While a job runs, its worker refreshes
+`updated_at` every INGEST_JOB_HEARTBEAT_SECONDS from a background thread, so
+a slow chunk does not look like a dead worker. If a worker dies, its job stops
+sending heartbeats and is put back on the queue by the next worker that
+notices. The job then resumes from the last committed row, because
+`rows_read` is only advanced after a chunk is committed.
+
+Each run of a job gets an owner token. Requeueing clears it, and the worker's
+heartbeats and job updates only apply while its token is still the job's
+owner, so a worker that was wrongly presumed dead stops instead of processing
+the file alongside the next one.
+
+Jobs are run by worker.py, not by the API process.
+"""
+import os
+import time
+from uuid import uuid4
+
+from cache import redis_client
+
+JOB_KEY_PREFIX = "job:"
+QUEUE_KEY = "ingest:queue"
+PROCESSING_KEY = "ingest:processing"
+JOB_TTL = int(os.getenv("INGEST_JOB_TTL", 7 * 24 * 3600))
+JOB_STALE_SECONDS = int(os.getenv("INGEST_JOB_STALE_SECONDS", 300))
+JOB_HEARTBEAT_SECONDS = int(os.getenv("INGEST_JOB_HEARTBEAT_SECONDS", 30))
+
+STATUS_PENDING = "file upload pending"
+STATUS_PROCESSING = "processing"
+STATUS_COMPLETED = "completed"
+STATUS_CANCELLED = "cancelled"
+FAILED_PREFIX = "failed: "
+
+# rows_read doubles as the resume offset: raw rows consumed up to the last committed chunk
+COUNTER_FIELDS = (
+    "chunks", "rows_read", "rows_processed", "embedded", "cached_embeddings", "inserted", "updated", "unchanged",
+    "deleted",
+)
+INT_FIELDS = COUNTER_FIELDS + ("cancel_requested", "attempts")
+FLOAT_FIELDS = ("created_at", "updated_at")
+
+
+# HSET ARGV[3:] and refresh the TTL, but only while ARGV[1] owns the job
+UPDATE_OWNED_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'owner') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+def is_resumable(status: str) -> bool:
+    return status == STATUS_CANCELLED or status.startswith(FAILED_PREFIX)
+
+
+class JobStore:
+    def __init__(self, client=redis_client, ttl=JOB_TTL, stale_seconds=JOB_STALE_SECONDS):
+        self.client = client
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+
+    def _key(self, job_id: str) -> str:
+        return JOB_KEY_PREFIX + job_id
+
+    def create(self, path: str, filename: str, source_tag: str, mode: str = "append", key_column: str = None) -> str:
+        """Record a spooled upload and queue it; returns the upload_id."""
+        job_id = str(uuid4())
+        now = time.time()
+        job = {
+            "upload_id": job_id, "status": STATUS_PENDING, "path": path, "filename": filename,
+            "source_tag": source_tag, "mode": mode, "key_column": key_column or "", "created_at": now, "updated_at": now,
+            "cancel_requested": 0, "attempts": 0, "owner": "", "error": "",
+            **{name: 0 for name in COUNTER_FIELDS},
+        }
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(job_id), mapping=job)
+        pipe.expire(self._key(job_id), self.ttl)
+        pipe.rpush(QUEUE_KEY, job_id)
+        pipe.execute()
+        return job_id
+
+    def get(self, job_id: str):
+        raw = self.client.hgetall(self._key(job_id))
+        if not raw:
+            return None
+        job = dict(raw)
+        for name in INT_FIELDS:
+            if name in job:
+                job[name] = int(job[name])
+        for name in FLOAT_FIELDS:
+            if name in job:
+                job[name] = float(job[name])
+        return job
+
+    def update(self, job_id: str, **fields):
+        """Set fields and refresh updated_at, which also serves as the worker heartbeat."""
+        fields["updated_at"] = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(job_id), mapping=fields)
+        pipe.expire(self._key(job_id), self.ttl)
+        pipe.execute()
+
+    def start(self, job_id: str, attempts: int) -> str:
+        """Mark a claimed job as processing under a new owner token and return the token."""
+        owner = uuid4().hex
+        self.update(job_id, status=STATUS_PROCESSING, attempts=attempts, owner=owner)
+        return owner
+
+    def update_owned(self, job_id: str, owner: str, **fields) -> bool:
+        """update(), applied only while owner still owns the job; returns whether it was applied."""
+        fields["updated_at"] = time.time()
+        args = [value for item in fields.items() for value in item]
+        return bool(self.client.eval(UPDATE_OWNED_SCRIPT, 1, self._key(job_id), owner, self.ttl, *args))
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        return self.update_owned(job_id, owner)
+
+    def owns(self, job_id: str, owner: str) -> bool:
+        return self.client.hget(self._key(job_id), "owner") == owner
+
+    def claim(self, timeout: int = 5):
+        """Block up to timeout seconds for a queued job id and mark it as being processed."""
+        return self.client.blmove(QUEUE_KEY, PROCESSING_KEY, timeout, "LEFT", "RIGHT")
+
+    def release(self, job_id: str):
+        self.client.lrem(PROCESSING_KEY, 0, job_id)
+
+    def request_cancel(self, job_id: str):
+        """
+        Ask for a job to stop. A queued job is cancelled at once. A running job
+        stops after its current chunk, and that chunk stays committed.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job["status"] == STATUS_PENDING:
+            self.client.lrem(QUEUE_KEY, 0, job_id)
+            self.update(job_id, status=STATUS_CANCELLED, cancel_requested=1)
+        elif job["status"] == STATUS_PROCESSING:
+            self.update(job_id, cancel_requested=1)
+        return self.get(job_id)
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        return self.client.hget(self._key(job_id), "cancel_requested") == "1"
+
+    def resume(self, job_id: str):
+        """Re-queue a cancelled or failed job; it continues after the last committed row."""
+        job = self.get(job_id)
+        if job is None or not is_resumable(job["status"]):
+            return job
+        self.update(job_id, status=STATUS_PENDING, cancel_requested=0, error="")
+        self.client.rpush(QUEUE_KEY, job_id)
+        return self.get(job_id)
+
+    def requeue_stale(self) -> list:
+        """Put back jobs whose worker stopped sending heartbeats; returns their ids."""
+        requeued = []
+        cutoff = time.time() - self.stale_seconds
+        for job_id in self.client.lrange(PROCESSING_KEY, 0, -1):
+            job = self.get(job_id)
+            if job is not None and job["updated_at"] >= cutoff:
+                continue
+            # Only the worker that removes the entry requeues it. Clearing the
+            # owner makes a still running worker stop at its next check
+            if self.client.lrem(PROCESSING_KEY, 1, job_id) and job is not None:
+                self.update(job_id, status=STATUS_PENDING, owner="")
+                self.client.rpush(QUEUE_KEY, job_id)
+                requeued.append(job_id)
+        return requeued
+
+
+job_store = JobStore()
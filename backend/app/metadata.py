@@ -0,0 +1,271 @@
+"""
+Structured metadata stored next to each row's text. Two kinds are kept:
+
+- raw: the original row as JSONB, with column names
+- promoted columns: a few fields that have their own indexes
+
+Searches can filter on them. The filters run in the same WHERE clause as the
+source_tag, so they apply before the dense and sparse legs rank anything.
+
+Each promoted column is read from the first upload column in its list that
+the file has. Column names are compared in lowercase, ignoring everything but
+letters and digits:
+
+    state               physical_address_province_or_state, PopState, State
+    naics               primary_naics, NaicsCode, naics
+    agency              Department/Ind.Agency, agency, department
+    uei                 unique_entity_id, uei
+    cage                cage_code, cage
+    posted_date         PostedDate, posted_date
+    response_deadline   ResponseDeadLine, response_deadline
+
+METADATA_<FIELD>_COLUMNS (comma-separated) replaces a field's list, e.g.
+METADATA_STATE_COLUMNS=PopState,State.
+
+Filters (see FILTER_SQL) can be passed explicitly or read from the query text
+by extract_filters. Examples of what it reads: "in CA", "in Texas",
+"NAICS 423390", "UEI C111JJBMS328", "CAGE 6PA87", "posted after 2025-01-01",
+"due before 2025-03-31".
+"""
+import json
+import os
+import re
+from datetime import date, datetime
+
+PROMOTED_COLUMNS = ("state", "naics", "agency", "uei", "cage", "posted_date", "response_deadline")
+DATE_COLUMNS = ("posted_date", "response_deadline")
+
+DEFAULT_SOURCE_COLUMNS = {
+    "state": ["physical_address_province_or_state", "PopState", "State"],
+    "naics": ["primary_naics", "NaicsCode", "naics"],
+    "agency": ["Department/Ind.Agency", "agency", "department"],
+    "uei": ["unique_entity_id", "uei"],
+    "cage": ["cage_code", "cage"],
+    "posted_date": ["PostedDate", "posted_date"],
+    "response_deadline": ["ResponseDeadLine", "response_deadline"],
+}
+
+US_STATES = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR", "california": "CA", "colorado": "CO",
+    "connecticut": "CT", "delaware": "DE", "district of columbia": "DC", "florida": "FL", "georgia": "GA",
+    "hawaii": "HI", "idaho": "ID", "illinois": "IL", "indiana": "IN", "iowa": "IA", "kansas": "KS",
+    "kentucky": "KY", "louisiana": "LA", "maine": "ME", "maryland": "MD", "massachusetts": "MA",
+    "michigan": "MI", "minnesota": "MN", "mississippi": "MS", "missouri": "MO", "montana": "MT",
+    "nebraska": "NE", "nevada": "NV", "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM",
+    "new york": "NY", "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK",
+    "oregon": "OR", "pennsylvania": "PA", "puerto rico": "PR", "rhode island": "RI", "south carolina": "SC",
+    "south dakota": "SD", "tennessee": "TN", "texas": "TX", "utah": "UT", "vermont": "VT", "virginia": "VA",
+    "washington": "WA", "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+}
+STATE_CODES = set(US_STATES.values())
+
+# One predicate per filter; values are bound as :f_<name> (see filter_params)
+FILTER_SQL = {
+    "state": "state = :f_state",
+    "naics": "naics LIKE :f_naics",
+    "agency": "agency ILIKE :f_agency",
+    "uei": "uei = :f_uei",
+    "cage": "cage = :f_cage",
+    "posted_after": "posted_date >= :f_posted_after",
+    "posted_before": "posted_date <= :f_posted_before",
+    "deadline_after": "response_deadline >= :f_deadline_after",
+    "deadline_before": "response_deadline <= :f_deadline_before",
+    "columns": "raw @> CAST(:f_columns AS jsonb)",
+}
+
+NAICS_CODE = re.compile(r"\d{2,6}")
+ENTITY_ID = {"uei": re.compile(r"[A-Z0-9]{12}"), "cage": re.compile(r"[A-Z0-9]{5}")}
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%Y%m%d")
+
+QUERY_NAICS = re.compile(r"\bnaics(?:\s+code)?\s*[:#]?\s*(\d{2,6})\b", re.IGNORECASE)
+QUERY_UEI = re.compile(r"\buei\s*[:#]?\s*([a-z0-9]{12})\b", re.IGNORECASE)
+QUERY_CAGE = re.compile(r"\bcage(?:\s+code)?\s*[:#]?\s*([a-z0-9]{5})\b", re.IGNORECASE)
+# Two-letter codes only in capitals, so "in" or "or" are never read as states
+QUERY_STATE_CODE = re.compile(r"\b(?:in|from)\s+([A-Z]{2})\b")
+QUERY_STATE_NAME = re.compile(
+    r"\b(?:in|from)\s+(" + "|".join(sorted(US_STATES, key=len, reverse=True)) + r")\b", re.IGNORECASE
+)
+QUERY_DATE = re.compile(
+    r"\b(?:(posted|published|due|deadline|responses?\s+due)\s+)?(after|since|before|by)\s+(\d{4}-\d{2}-\d{2})\b",
+    re.IGNORECASE
+)
+
+
+def normalize_column_name(name) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+def source_columns(field: str) -> list:
+    configured = os.getenv(f"METADATA_{field.upper()}_COLUMNS")
+    if configured:
+        return [name.strip() for name in configured.split(",") if name.strip()]
+    return DEFAULT_SOURCE_COLUMNS[field]
+
+
+def promoted_sources(columns) -> dict:
+    """{promoted column: upload column} for the columns of one file."""
+    by_name = {}
+    for column in columns:
+        by_name.setdefault(normalize_column_name(column), column)
+    sources = {}
+    for field in PROMOTED_COLUMNS:
+        for candidate in source_columns(field):
+            column = by_name.get(normalize_column_name(candidate))
+            if column is not None:
+                sources[field] = column
+                break
+    return sources
+
+
+def parse_date(value: str):
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value[:10] if fmt == "%Y-%m-%d" else value.split()[0], fmt).date()
+        except (ValueError, IndexError):
+            continue
+    return None
+
+
+def normalize_state(value: str):
+    value = value.strip()
+    code = US_STATES.get(value.lower(), value.upper())
+    return code or None
+
+
+def normalize_value(field: str, value):
+    """The stored (and compared) form of a promoted value; None when it is not usable."""
+    if value is None:
+        return None
+    if isinstance(value, date):
+        return value if field in DATE_COLUMNS else None
+    value = str(value).strip()
+    if not value:
+        return None
+    if field in DATE_COLUMNS:
+        return parse_date(value)
+    if field == "state":
+        return normalize_state(value)
+    if field == "naics":
+        match = NAICS_CODE.match(value)
+        return match.group(0) if match else None
+    if field in ENTITY_ID:
+        return value.upper()
+    return value
+
+
+def row_record(raw: dict, sources: dict) -> dict:
+    """The metadata stored with one row: its raw columns and the promoted values."""
+    # jsonb rejects \u0000, like text columns reject NUL bytes
+    raw = {name: value.replace("\x00", "") for name, value in raw.items()}
+    record = {"raw": raw}
+    for field in PROMOTED_COLUMNS:
+        column = sources.get(field)
+        record[field] = normalize_value(field, raw.get(column)) if column is not None else None
+    return record
+
+
+def _filter_date(name: str, value):
+    parsed = value if isinstance(value, date) else parse_date(str(value))
+    if parsed is None:
+        raise ValueError(f"Invalid date for {name}: {value!r}")
+    return parsed
+
+
+def normalize_filters(filters: dict) -> dict:
+    """Validate search filters and bring them to their stored form; empty values are dropped."""
+    normalized = {}
+    for name, value in (filters or {}).items():
+        if name not in FILTER_SQL:
+            raise ValueError(f"Unknown filter: {name}")
+        if value is None or value == "" or value == {}:
+            continue
+        if name == "columns":
+            if not isinstance(value, dict) or not all(isinstance(v, str) for v in value.values()):
+                raise ValueError("columns must map column names to string values")
+            normalized[name] = {str(column): v.strip() for column, v in value.items()}
+        elif name.endswith(("_after", "_before")):
+            normalized[name] = _filter_date(name, value)
+        elif name == "naics":
+            value = str(value).strip()
+            if not NAICS_CODE.fullmatch(value):
+                raise ValueError(f"NAICS filter must be 2 to 6 digits: {value!r}")
+            normalized[name] = value
+        elif name in ENTITY_ID:
+            value = str(value).strip().upper()
+            if not ENTITY_ID[name].fullmatch(value):
+                raise ValueError(f"Invalid {name.upper()}: {value!r}")
+            normalized[name] = value
+        elif name == "state":
+            normalized[name] = normalize_state(str(value))
+        else:
+            normalized[name] = str(value).strip()
+    return normalized
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def filter_sql(names) -> str:
+    """AND-ed predicates for the given filter names, to append to a WHERE clause."""
+    return "".join(f"\n               AND {FILTER_SQL[name]}" for name in names)
+
+
+def filter_params(filters: dict) -> dict:
+    """Statement parameters for normalized filters."""
+    params = {}
+    for name, value in filters.items():
+        if name == "naics":
+            value = value + "%"  # a shorter code matches the whole sector
+        elif name == "agency":
+            value = f"%{_like_escape(value)}%"
+        elif name == "columns":
+            value = json.dumps(value, sort_keys=True)
+        params[f"f_{name}"] = value
+    return params
+
+
+def filters_key(filters: dict) -> str:
+    """Canonical text of normalized filters, for cache keys."""
+    return json.dumps(filters, sort_keys=True, default=str, separators=(",", ":"))
+
+
+def extract_filters(query: str) -> dict:
+    """Filters named in the query text (see the module docstring); normalized."""
+    filters = {}
+    match = QUERY_NAICS.search(query)
+    if match:
+        filters["naics"] = match.group(1)
+    match = QUERY_UEI.search(query)
+    if match:
+        filters["uei"] = match.group(1)
+    match = QUERY_CAGE.search(query)
+    if match:
+        filters["cage"] = match.group(1)
+
+    match = QUERY_STATE_NAME.search(query)
+    if match:
+        filters["state"] = US_STATES[match.group(1).lower()]
+    else:
+        for code in QUERY_STATE_CODE.findall(query):
+            if code in STATE_CODES:
+                filters["state"] = code
+                break
+
+    for field, direction, value in QUERY_DATE.findall(query):
+        prefix = "deadline" if field and field.lower() not in ("posted", "published") else "posted"
+        suffix = "after" if direction.lower() in ("after", "since") else "before"
+        filters[f"{prefix}_{suffix}"] = value
+    # Text that only looks like a filter (e.g. an impossible date) is ignored
+    return _valid_filters(filters)
+
+
+def _valid_filters(filters: dict) -> dict:
+    valid = {}
+    for name, value in filters.items():
+        try:
+            valid.update(normalize_filters({name: value}))
+        except ValueError:
+            continue
+    return valid
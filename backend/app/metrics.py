@@ -0,0 +1,198 @@
+"""
+In-process metrics in the Prometheus text format, without extra dependencies.
+
+- `stage(pipeline, name, timings)` times one step of the search or ingest
+  pipeline into the `pipeline_stage_seconds` histogram. If a timings dict is
+  given, the step's milliseconds are also added to it, which is how a search
+  response can carry its own breakdown.
+- Counters are incremented where things happen (result cache lookups, LLM
+  token usage). Values that already live elsewhere (embedding and semantic
+  cache stats, single-flight stats, DB pools) are read at scrape time by the
+  collectors registered with `register_collector`.
+
+Every process keeps its own numbers: each uvicorn worker serves its own
+`/metrics`, and ingestion workers can serve theirs with `serve(port)`.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def format_value(value) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(tuple(labels.get(name, "") for name in self.labelnames), 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(dict(zip(self.labelnames, key)))} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            series = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        series = self.series.get(tuple(labels.get(name, "") for name in self.labelnames))
+        return series[-1] if series else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                labels = dict(zip(self.labelnames, key))
+                for bound, value in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': format_value(bound)})} {value}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(series[-2])}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {series[-1]}")
+        return lines
+
+
+stage_seconds = Histogram(
+    "pipeline_stage_seconds", "Time spent in each search and ingest pipeline stage.", ("pipeline", "stage")
+)
+cache_requests = Counter(
+    "cache_requests_total", "Exact (result) and semantic cache lookups by outcome.", ("cache", "result")
+)
+search_requests = Counter(
+    "search_requests_total", "Searches by how they were answered.", ("endpoint", "outcome")
+)
+llm_tokens = Counter(
+    "llm_tokens_total", "Chat model tokens used, by model and kind (prompt or completion).", ("model", "kind")
+)
+llm_requests = Counter(
+    "llm_requests_total", "Chat model calls by pipeline step.", ("model", "step")
+)
+db_pool_events = Counter(
+    "db_pool_events_total", "DB pool connections opened (connect), handed out (checkout) and discarded (invalidate).",
+    ("engine", "event")
+)
+
+METRICS = [stage_seconds, cache_requests, search_requests, llm_tokens, llm_requests, db_pool_events]
+COLLECTORS = []
+
+
+def register_collector(collect):
+    """
+    Add a function that returns [(name, type, help, [(labels, value), ...]), ...]
+    with current values; it runs on every scrape.
+    """
+    COLLECTORS.append(collect)
+    return collect
+
+
+@contextmanager
+def stage(pipeline: str, name: str, timings: dict = None):
+    """Time the with-block into pipeline_stage_seconds, and into timings (ms) if given."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, pipeline=pipeline, stage=name)
+        if timings is not None:
+            timings[name] = round(timings.get(name, 0.0) + elapsed * 1000, 2)
+
+
+def record_llm_usage(message, step: str, usage: dict = None):
+    """
+    Count the token usage reported on a chat model response.
+
+    usage, if given, accumulates prompt_tokens, completion_tokens and
+    total_tokens for the current request.
+    """
+    meta = getattr(message, "response_metadata", None)
+    meta = meta if isinstance(meta, dict) else {}
+    model = meta.get("model_name") or "unknown"
+    token_usage = meta.get("token_usage") if isinstance(meta.get("token_usage"), dict) else {}
+    llm_requests.inc(model=model, step=step)
+    for kind in ("prompt", "completion"):
+        count = token_usage.get(f"{kind}_tokens")
+        count = count if isinstance(count, int) else 0
+        llm_tokens.inc(count, model=model, kind=kind)
+        if usage is not None:
+            usage[f"{kind}_tokens"] = usage.get(f"{kind}_tokens", 0) + count
+    if usage is not None:
+        usage["total_tokens"] = usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collect in COLLECTORS:
+        try:
+            families = collect()
+        except Exception as e:
+            print(f"⚠️ Metrics collector failed: {e}")
+            continue
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int):
+    """Serve /metrics from a background thread, for processes without the API (ingestion workers)."""
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
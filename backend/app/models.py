@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, TIMESTAMP,Text
+from sqlalchemy import Column, Integer, String, TIMESTAMP,Text, Computed, LargeBinary, Date
 from sqlalchemy.dialects.postgresql import TIMESTAMP as PG_TIMESTAMP
+from sqlalchemy.dialects.postgresql import TSVECTOR, JSONB
 from sqlalchemy.dialects.postgresql import VARCHAR
 from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
@@ -11,4 +12,17 @@ class UnifiedIndex(Base):
     id = Column(Integer, primary_key=True, index=True)
     source_tag = Column(String, nullable=False)      # e.g., db1, db2
     source_text = Column(Text, nullable=False)       # combined row
-    embedding = Column(Vector(1536), nullable=False) # pgvector
\ No newline at end of file
+    embedding = Column(Vector(1536), nullable=False) # pgvector
+    row_key = Column(Text)                           # upload's key column value, incremental ingest only
+    content_hash = Column(LargeBinary)               # sha256 of source_text
+    raw = Column(JSONB)                              # original row {column: value}, see metadata.py
+    state = Column(Text)                             # promoted, indexed metadata columns
+    naics = Column(Text)
+    agency = Column(Text)
+    uei = Column(Text)
+    cage = Column(Text)
+    posted_date = Column(Date)
+    response_deadline = Column(Date)
+    source_tsv = Column(                              # full-text vector, GIN indexed
+        TSVECTOR, Computed("to_tsvector('english', source_text)", persisted=True)
+    )
@@ -0,0 +1,415 @@
+"""
+Hybrid (dense + sparse) retrieval over unified_index in a single SQL statement.
+
+For every source_tag, the dense leg takes the nearest rows by cosine distance
+and the sparse leg the best ts_rank_cd matches on the stored, GIN-indexed
+source_tsv column, each through a per-tag ORDER BY ... LIMIT so the queries
+can still use their indexes. The two rankings are merged with reciprocal-rank fusion (RRF) in SQL, capped per
+source, and only the columns the response needs are returned.
+
+With DENSE_SEARCH_BACKEND=local, the dense leg is answered by the in-process
+index (vector_index.py) instead, and its ranked ids are passed into the same
+statement. Until that index has been synced, pgvector is used.
+
+With ANN_QUANTIZATION set (see ann.py), each pgvector dense branch takes
+ANN_RERANK_CANDIDATES rows from the quantized index and reranks them by exact
+cosine distance on the full-precision embedding.
+
+Structured filters (metadata.py) are added to the WHERE clause of every dense
+branch and of the sparse leg, next to the source_tag, so both legs only rank
+rows that match. Filtered searches always use pgvector, because the local index
+holds no metadata. A selective filter lets Postgres read the matching rows from
+a B-tree index and rank them exactly. With a broad filter, the ANN index may be
+read first, and then fewer than SEARCH_CANDIDATES_PER_LEG matches can come
+back; ANN_ITERATIVE_SCAN=relaxed_order keeps the scan going until enough match.
+
+hybrid_search_batch ranks many queries in one statement: the query vectors
+and keyword queries are passed as arrays, each leg runs once per query through
+a LATERAL join, and the fusion and per-source caps are partitioned by query.
+Large batches are split into statements of SEARCH_BATCH_STATEMENT_QUERIES.
+"""
+import asyncio
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+from sqlalchemy import text
+
+from ann import ann_config
+from metadata import filter_params, filter_sql
+
+SEARCH_SOURCE_TAGS = ["db1", "db2", "db3", "db4"]
+CANDIDATES_PER_LEG = int(os.getenv("SEARCH_CANDIDATES_PER_LEG", 20))
+RESULTS_PER_SOURCE = int(os.getenv("SEARCH_RESULTS_PER_SOURCE", 10))
+RRF_K = int(os.getenv("SEARCH_RRF_K", 60))
+DENSE_WEIGHT = float(os.getenv("SEARCH_DENSE_WEIGHT", 1.0))
+SPARSE_WEIGHT = float(os.getenv("SEARCH_SPARSE_WEIGHT", 1.0))
+BATCH_STATEMENT_QUERIES = int(os.getenv("SEARCH_BATCH_STATEMENT_QUERIES", 100))
+DENSE_SEARCH_BACKENDS = ("pgvector", "local")
+DENSE_SEARCH_BACKEND = os.getenv("DENSE_SEARCH_BACKEND", "pgvector")
+if DENSE_SEARCH_BACKEND not in DENSE_SEARCH_BACKENDS:
+    raise ValueError(f"Unsupported DENSE_SEARCH_BACKEND: {DENSE_SEARCH_BACKEND}")
+
+SearchResult = namedtuple("SearchResult", ["id", "source_tag", "source_text", "score"])
+
+DENSE_BRANCH_SQL = """
+            (SELECT id, source_tag, embedding <=> {query_vector} AS distance
+             FROM unified_index
+             WHERE source_tag = :tag_{i}{filters}
+             ORDER BY distance
+             LIMIT :candidates)"""
+
+QUERY_VECTOR_SQL = "CAST(CAST(:embedding AS text) AS vector)"
+
+# Two-stage branch: {first_pass} orders by the quantized index expression
+RERANK_BRANCH_SQL = """
+            (SELECT c.id, c.source_tag, c.embedding <=> {query_vector} AS distance
+             FROM (SELECT id, source_tag, embedding
+                   FROM unified_index
+                   WHERE source_tag = :tag_{i}{filters}
+                   ORDER BY {first_pass}
+                   LIMIT :rerank_candidates) c
+             ORDER BY distance
+             LIMIT :candidates)"""
+
+PGVECTOR_DENSE_SQL = """
+        SELECT d.id, d.source_tag,
+               ROW_NUMBER() OVER (PARTITION BY d.source_tag ORDER BY d.distance) AS rank
+        FROM ({dense_branches}
+        ) d"""
+
+# Dense ranks computed outside Postgres (vector_index.py), passed as arrays
+LOCAL_DENSE_SQL = """
+        SELECT d.id, d.source_tag, d.rank
+        FROM unnest(CAST(:dense_ids AS integer[]), CAST(:dense_tags AS text[]), CAST(:dense_ranks AS integer[]))
+             AS d(id, source_tag, rank)"""
+
+HYBRID_SEARCH_SQL = """
+    WITH tags AS (
+        SELECT unnest(CAST(:tags AS text[])) AS tag
+    ),
+    keywords AS (
+        SELECT to_tsquery('english', :kw) AS q
+    ),
+    dense AS ({dense}
+    ),
+    sparse AS (
+        SELECT s.id, s.source_tag,
+               ROW_NUMBER() OVER (PARTITION BY s.source_tag ORDER BY s.score DESC) AS rank
+        FROM tags
+        CROSS JOIN keywords
+        CROSS JOIN LATERAL (
+            SELECT id, source_tag, ts_rank_cd(source_tsv, keywords.q) AS score
+            FROM unified_index
+            WHERE source_tag = tags.tag
+              AND source_tsv @@ keywords.q{filters}
+            ORDER BY score DESC
+            LIMIT :candidates
+        ) s
+    ),
+    fused AS (
+        SELECT id, source_tag, SUM(weight / (:rrf_k + rank)) AS score
+        FROM (
+            SELECT id, source_tag, rank, CAST(:dense_weight AS float8) AS weight FROM dense
+            UNION ALL
+            SELECT id, source_tag, rank, CAST(:sparse_weight AS float8) AS weight FROM sparse
+        ) candidates
+        GROUP BY id, source_tag
+    ),
+    ranked AS (
+        SELECT id, source_tag, score,
+               ROW_NUMBER() OVER (PARTITION BY source_tag ORDER BY score DESC, id) AS source_rank
+        FROM fused
+    )
+    SELECT u.id, u.source_tag, u.source_text, r.score
+    FROM ranked r
+    JOIN unified_index u ON u.id = r.id
+    WHERE r.source_rank <= :per_source
+    ORDER BY r.score DESC, r.id
+    LIMIT :limit
+"""
+
+# Batched form of HYBRID_SEARCH_SQL: every row carries qi, the query's 1-based
+# position in :keywords (and :embeddings). The vectors are parsed once, here.
+BATCH_QUERY_VECTORS_SQL = """
+    query_vectors AS MATERIALIZED (
+        SELECT qi, CAST(embedding AS vector) AS embedding
+        FROM unnest(CAST(:embeddings AS text[])) WITH ORDINALITY AS q(embedding, qi)
+    ),"""
+
+# A tag's dense branch (dense_branch_sql), run once per query vector
+BATCH_DENSE_BRANCH_SQL = """
+            (SELECT q.qi, b.id, b.source_tag, b.distance
+             FROM query_vectors q
+             CROSS JOIN LATERAL {branch} b)"""
+
+BATCH_PGVECTOR_DENSE_SQL = """
+        SELECT d.qi, d.id, d.source_tag,
+               ROW_NUMBER() OVER (PARTITION BY d.qi, d.source_tag ORDER BY d.distance) AS rank
+        FROM ({dense_branches}
+        ) d"""
+
+BATCH_LOCAL_DENSE_SQL = """
+        SELECT d.qi, d.id, d.source_tag, d.rank
+        FROM unnest(CAST(:dense_qis AS integer[]), CAST(:dense_ids AS integer[]), CAST(:dense_tags AS text[]),
+                    CAST(:dense_ranks AS integer[]))
+             AS d(qi, id, source_tag, rank)"""
+
+HYBRID_SEARCH_BATCH_SQL = """
+    WITH tags AS (
+        SELECT unnest(CAST(:tags AS text[])) AS tag
+    ),
+    queries AS (
+        SELECT qi, to_tsquery('english', kw) AS q
+        FROM unnest(CAST(:keywords AS text[])) WITH ORDINALITY AS k(kw, qi)
+    ),{query_vectors}
+    dense AS ({dense}
+    ),
+    sparse AS (
+        SELECT s.qi, s.id, s.source_tag,
+               ROW_NUMBER() OVER (PARTITION BY s.qi, s.source_tag ORDER BY s.score DESC) AS rank
+        FROM queries
+        CROSS JOIN tags
+        CROSS JOIN LATERAL (
+            SELECT queries.qi, id, source_tag, ts_rank_cd(source_tsv, queries.q) AS score
+            FROM unified_index
+            WHERE source_tag = tags.tag
+              AND source_tsv @@ queries.q{filters}
+            ORDER BY score DESC
+            LIMIT :candidates
+        ) s
+    ),
+    fused AS (
+        SELECT qi, id, source_tag, SUM(weight / (:rrf_k + rank)) AS score
+        FROM (
+            SELECT qi, id, source_tag, rank, CAST(:dense_weight AS float8) AS weight FROM dense
+            UNION ALL
+            SELECT qi, id, source_tag, rank, CAST(:sparse_weight AS float8) AS weight FROM sparse
+        ) candidates
+        GROUP BY qi, id, source_tag
+    ),
+    ranked AS (
+        SELECT qi, id, source_tag, score,
+               ROW_NUMBER() OVER (PARTITION BY qi, source_tag ORDER BY score DESC, id) AS source_rank
+        FROM fused
+    ),
+    limited AS (
+        SELECT qi, id, source_tag, score,
+               ROW_NUMBER() OVER (PARTITION BY qi ORDER BY score DESC, id) AS query_rank
+        FROM ranked
+        WHERE source_rank <= :per_source
+    )
+    SELECT l.qi, u.id, u.source_tag, u.source_text, l.score
+    FROM limited l
+    JOIN unified_index u ON u.id = l.id
+    WHERE l.query_rank <= :limit
+    ORDER BY l.qi, l.score DESC, l.id
+"""
+
+
+def dense_branch_sql(i: int, config=None, filter_names=(), query_vector: str = QUERY_VECTOR_SQL) -> str:
+    # query_vector: SQL for the query embedding, a bound parameter unless a batch passes a column
+    config = config or ann_config
+    filters = filter_sql(filter_names)
+    if config.quantization == "none":
+        return DENSE_BRANCH_SQL.format(i=i, filters=filters, query_vector=query_vector)
+    return RERANK_BRANCH_SQL.format(i=i, filters=filters, query_vector=query_vector,
+                                    first_pass=config.index_distance(query_vector))
+
+
+@lru_cache(maxsize=64)
+def hybrid_search_statement(tag_count: int, local_dense: bool = False, filter_names: tuple = ()):
+    # filter_names: sorted names of the metadata filters in use
+    filters = filter_sql(filter_names)
+    if local_dense:
+        return text(HYBRID_SEARCH_SQL.format(dense=LOCAL_DENSE_SQL, filters=filters))
+    # One dense branch per tag: each compares source_tag to its own bound value,
+    # which reaches Postgres as a literal and can match a per-tag partial ANN index
+    branches = "\n            UNION ALL".join(dense_branch_sql(i, filter_names=filter_names) for i in range(tag_count))
+    return text(HYBRID_SEARCH_SQL.format(dense=PGVECTOR_DENSE_SQL.format(dense_branches=branches), filters=filters))
+
+
+@lru_cache(maxsize=64)
+def hybrid_search_batch_statement(tag_count: int, local_dense: bool = False, filter_names: tuple = ()):
+    filters = filter_sql(filter_names)
+    if local_dense:
+        return text(HYBRID_SEARCH_BATCH_SQL.format(query_vectors="", dense=BATCH_LOCAL_DENSE_SQL, filters=filters))
+    branches = "\n            UNION ALL".join(
+        BATCH_DENSE_BRANCH_SQL.format(branch=dense_branch_sql(i, filter_names=filter_names, query_vector="q.embedding"))
+        for i in range(tag_count)
+    )
+    return text(HYBRID_SEARCH_BATCH_SQL.format(
+        query_vectors=BATCH_QUERY_VECTORS_SQL, dense=BATCH_PGVECTOR_DENSE_SQL.format(dense_branches=branches),
+        filters=filters,
+    ))
+
+
+def format_vector(vec) -> str:
+    # pgvector text literal, e.g. '[0.1,0.2,...]'
+    return "[" + ",".join(repr(float(x)) for x in vec) + "]"
+
+
+def local_dense_params(hits: dict) -> dict:
+    """Statement parameters for {tag: [(id, score), ...]} hits from the local index, best first."""
+    ids, tags, ranks = [], [], []
+    for tag, tag_hits in hits.items():
+        for rank, (row_id, _) in enumerate(tag_hits, start=1):
+            ids.append(int(row_id))
+            tags.append(tag)
+            ranks.append(rank)
+    return {"dense_ids": ids, "dense_tags": tags, "dense_ranks": ranks}
+
+
+def local_dense_batch_params(hits: list) -> dict:
+    """local_dense_params for one {tag: hits} dict per query, numbered from 1 as qi."""
+    qis, ids, tags, ranks = [], [], [], []
+    for qi, query_hits in enumerate(hits, start=1):
+        params = local_dense_params(query_hits)
+        qis.extend([qi] * len(params["dense_ids"]))
+        ids.extend(params["dense_ids"])
+        tags.extend(params["dense_tags"])
+        ranks.extend(params["dense_ranks"])
+    return {"dense_qis": qis, "dense_ids": ids, "dense_tags": tags, "dense_ranks": ranks}
+
+
+def use_local_dense() -> bool:
+    if DENSE_SEARCH_BACKEND != "local":
+        return False
+    from vector_index import get_vector_index
+
+    return get_vector_index().ready()
+
+
+def pgvector_dense_params(tags) -> dict:
+    params = {f"tag_{i}": tag for i, tag in enumerate(tags)}
+    if ann_config.quantization != "none":
+        params["rerank_candidates"] = max(ann_config.rerank_candidates, CANDIDATES_PER_LEG)
+    return params
+
+
+def ranking_params(tags, limit: int, filters: dict = None) -> dict:
+    return {
+        "tags": tags,
+        "candidates": CANDIDATES_PER_LEG,
+        "rrf_k": RRF_K,
+        "dense_weight": DENSE_WEIGHT,
+        "sparse_weight": SPARSE_WEIGHT,
+        "per_source": RESULTS_PER_SOURCE,
+        "limit": limit,
+        **filter_params(filters or {}),
+    }
+
+
+def hybrid_search_params(query_embedding, keyword_query: str, limit: int, tags, dense_hits: dict = None,
+                         filters: dict = None) -> dict:
+    tags = list(tags or SEARCH_SOURCE_TAGS)
+    if dense_hits is not None:
+        dense = local_dense_params(dense_hits)
+    else:
+        dense = pgvector_dense_params(tags)
+        dense["embedding"] = format_vector(query_embedding)
+    return {**dense, "kw": keyword_query, **ranking_params(tags, limit, filters)}
+
+
+def hybrid_search_batch_params(query_embeddings, keyword_queries: list, limit: int, tags, dense_hits: list = None,
+                               filters: dict = None) -> dict:
+    tags = list(tags or SEARCH_SOURCE_TAGS)
+    if dense_hits is not None:
+        dense = local_dense_batch_params(dense_hits)
+    else:
+        dense = pgvector_dense_params(tags)
+        dense["embeddings"] = [format_vector(vec) for vec in query_embeddings]
+    return {**dense, "keywords": list(keyword_queries), **ranking_params(tags, limit, filters)}
+
+
+def group_batch_rows(rows, count: int) -> list:
+    """One list of SearchResult per query from (qi, id, source_tag, source_text, score) rows."""
+    results = [[] for _ in range(count)]
+    for qi, *row in rows:
+        results[qi - 1].append(SearchResult(*row))
+    return results
+
+
+def batch_slices(count: int) -> list:
+    return [(start, min(start + BATCH_STATEMENT_QUERIES, count)) for start in range(0, count, BATCH_STATEMENT_QUERIES)]
+
+
+def hybrid_search(db, query_embedding, keyword_query: str, limit: int = 5, tags=None, filters: dict = None) -> list:
+    """
+    Return up to limit SearchResult rows across all source tags, best fused score first.
+
+    Each source contributes at most RESULTS_PER_SOURCE rows; a row found by both
+    legs scores the sum of its weighted reciprocal ranks. filters are
+    normalized metadata filters (metadata.normalize_filters).
+    """
+    tags = list(tags or SEARCH_SOURCE_TAGS)
+    dense_hits = None
+    if not filters and use_local_dense():
+        from vector_index import get_vector_index
+
+        dense_hits = get_vector_index().search(query_embedding, tags, CANDIDATES_PER_LEG)
+    params = hybrid_search_params(query_embedding, keyword_query, limit, tags, dense_hits, filters)
+    statement = hybrid_search_statement(len(tags), dense_hits is not None, tuple(sorted(filters or {})))
+    rows = db.execute(statement, params).fetchall()
+    return [SearchResult(*row) for row in rows]
+
+
+async def hybrid_search_async(session, query_embedding, keyword_query: str, limit: int = 5, tags=None,
+                              filters: dict = None) -> list:
+    """hybrid_search on an AsyncSession."""
+    tags = list(tags or SEARCH_SOURCE_TAGS)
+    dense_hits = None
+    if not filters and use_local_dense():
+        from vector_index import get_vector_index
+
+        # NumPy releases the GIL for the matrix products
+        dense_hits = await asyncio.to_thread(get_vector_index().search, query_embedding, tags, CANDIDATES_PER_LEG)
+    params = hybrid_search_params(query_embedding, keyword_query, limit, tags, dense_hits, filters)
+    statement = hybrid_search_statement(len(tags), dense_hits is not None, tuple(sorted(filters or {})))
+    result = await session.execute(statement, params)
+    return [SearchResult(*row) for row in result.fetchall()]
+
+
+def hybrid_search_batch(db, query_embeddings, keyword_queries: list, limit: int = 5, tags=None,
+                        filters: dict = None) -> list:
+    """
+    hybrid_search for many queries sharing the same filters, in one statement
+    per SEARCH_BATCH_STATEMENT_QUERIES queries. Returns one list of
+    SearchResult per query, in input order.
+    """
+    tags = list(tags or SEARCH_SOURCE_TAGS)
+    local_dense = not filters and use_local_dense()
+    statement = hybrid_search_batch_statement(len(tags), local_dense, tuple(sorted(filters or {})))
+    results = []
+    for start, end in batch_slices(len(keyword_queries)):
+        dense_hits = None
+        if local_dense:
+            from vector_index import get_vector_index
+
+            dense_hits = get_vector_index().search_batch(query_embeddings[start:end], tags, CANDIDATES_PER_LEG)
+        params = hybrid_search_batch_params(query_embeddings[start:end], keyword_queries[start:end], limit, tags,
+                                            dense_hits, filters)
+        results.extend(group_batch_rows(db.execute(statement, params).fetchall(), end - start))
+    return results
+
+
+async def hybrid_search_batch_async(session, query_embeddings, keyword_queries: list, limit: int = 5, tags=None,
+                                    filters: dict = None) -> list:
+    """hybrid_search_batch on an AsyncSession."""
+    tags = list(tags or SEARCH_SOURCE_TAGS)
+    local_dense = not filters and use_local_dense()
+    statement = hybrid_search_batch_statement(len(tags), local_dense, tuple(sorted(filters or {})))
+    results = []
+    for start, end in batch_slices(len(keyword_queries)):
+        dense_hits = None
+        if local_dense:
+            from vector_index import get_vector_index
+
+            dense_hits = await asyncio.to_thread(
+                get_vector_index().search_batch, query_embeddings[start:end], tags, CANDIDATES_PER_LEG
+            )
+        params = hybrid_search_batch_params(query_embeddings[start:end], keyword_queries[start:end], limit, tags,
+                                            dense_hits, filters)
+        result = await session.execute(statement, params)
+        results.extend(group_batch_rows(result.fetchall(), end - start))
+    return results
@@ -1,22 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
 from sqlalchemy.orm import Session
-from langchain.schema import HumanMessage, SystemMessage
-from langchain.chat_models import ChatOpenAI
 from sqlalchemy import func, desc
 from cache import get_cached_result, set_cached_result
-import pandas as pd
-import io
 from collections import namedtuple
 from uuid import uuid4
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import func, desc,text
 from db import SessionLocal
 from models import UnifiedIndex
-from utils import generate_embedding, as_pgvector, keyword_boost_query, hybrid_score_sort
+from utils import generate_embedding, generate_embeddings, as_pgvector, keyword_boost_query, hybrid_score_sort
 import uuid
 from fastapi import BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from cache import redis_client
+from ingest import iter_row_chunks, serialize_rows, spool_upload, INGEST_MODES
+from bulk_loader import copy_rows
+from embedding_cache import embedding_cache
+from db import AsyncSessionLocal, all_pool_stats
+from sqlalchemy.ext.asyncio import AsyncSession
+from semantic_cache import semantic_cache
+from singleflight import search_flight
+from jobs import job_store, is_resumable, STATUS_PENDING
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, cache_requests, render as render_metrics, search_requests, stage, stage_seconds,
+)
+from search import (
+    run_search, run_search_batch, search_events, find_similar_result, remember_query, semantic_match_info,
+    resolve_filters, result_cache_key, track_queries, SEARCH_BATCH_MAX_QUERIES,
+)
+from suggestions import suggestion_index, SUGGEST_DEFAULT_RESULTS, SUGGEST_MAX_RESULTS
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import date
+import json
+import asyncio
+import os
+import time
+
+ALLOWED_EXTENSIONS = (".xlsx", ".xls", ".csv")
+SOURCE_TAGS = {"db1", "db2", "db3", "db4"}
 
 router = APIRouter()
 
@@ -27,6 +49,14 @@ def get_db():
     finally:
         db.close()
 
+def validate_upload(file: UploadFile, source_tag: str):
+    filename = (file.filename or "").lower().strip()
+    if not filename.endswith(ALLOWED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only CSV or Excel files are supported")
+
+    if source_tag not in SOURCE_TAGS:
+        raise HTTPException(status_code=400, detail="Invalid source_tag value")
+
 # this endpoint is the old one which does not use background tasks it can be removed
 @router.post("/upload-file/")
 async def upload_file(
@@ -34,55 +64,30 @@ async def upload_file(
     source_tag: str = Form(...),
     db: Session = Depends(get_db)
 ):
-    filename = file.filename.lower().strip()
-    if not filename.endswith((".xlsx", ".xls", ".csv")):
-        raise HTTPException(status_code=400, detail="Only CSV or Excel files are supported")
-
-    if source_tag not in {"db1", "db2", "db3", "db4"}:
-        raise HTTPException(status_code=400, detail="Invalid source_tag value")
+    validate_upload(file, source_tag)
 
+    # Parsed like a /files/ingest upload, so both store the same text (and content hash) for a row
+    path = await spool_upload(file)
     try:
-        contents = await file.read()
-        if filename.endswith(".csv"):
-            try:
-                df = pd.read_csv(io.StringIO(contents.decode("utf-8")))
-            except UnicodeDecodeError:
-                df = pd.read_csv(io.StringIO(contents.decode("cp1252")))
-        else:
-            df = pd.read_excel(io.BytesIO(contents), engine="openpyxl")
+        seen = set()
+        texts = []
+        for chunk in iter_row_chunks(path, file.filename):
+            texts.extend(serialize_rows(chunk, seen))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
+    finally:
+        os.remove(path)
 
-    df = df.dropna(how="all").drop_duplicates()
-    inserted = 0
-    records = []
-
-    for _, row in df.iterrows():
-        combined_text = " ".join(str(val).strip() for val in row if pd.notna(val)).strip()
-        if not combined_text or combined_text.lower() == "nan":
-            continue
-
-        try:
-            embedding = generate_embedding(combined_text)
-        except Exception as e:
-            print(f"⚠️ Skipping row due to embedding error: {e}")
-            continue
-
-        if not isinstance(embedding, list) or not all(isinstance(x, (float, int)) for x in embedding):
-            print(f"⚠️ Invalid embedding for row: {combined_text}")
-            continue
-
-        records.append(UnifiedIndex(
-            source_tag=source_tag,
-            source_text=combined_text[:10000],  # Truncate if needed
-            embedding=embedding
-        ))
-        inserted += 1
+    embed_stats = {"cached": 0, "embedded": 0}
+    try:
+        embeddings = generate_embeddings(texts, stats=embed_stats)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Embedding failed: {str(e)}")
 
     try:
-        if records:
-            db.bulk_save_objects(records)
-            db.commit()
+        # Truncate if needed
+        inserted_ids = copy_rows(db, source_tag, [combined_text[:10000] for combined_text in texts], embeddings)
+        inserted = len(inserted_ids)
     except Exception as db_err:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Database insert failed: {str(db_err)}")
@@ -90,258 +95,236 @@ async def upload_file(
     return {
         "status": "success",
         "inserted_rows": inserted,
+        "cached_embeddings": embed_stats["cached"],
         "source_tag": source_tag,
         "filename": file.filename
     }
 
 
-# Dictionary to track file upload status
-upload_status = {}  # Format: {upload_id: {status: str, inserted: int}}
-
 @router.post("/files/ingest")
 async def ingest_file(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     source_tag: str = Form(...),
-    db: Session = Depends(get_db)
+    mode: str = Form("append"),
+    key_column: str = Form(None)
 ):
-    upload_id = str(uuid4())
-    upload_status[upload_id] = {"status": "file upload pending", "inserted": 0}
+    validate_upload(file, source_tag)
+    if mode not in INGEST_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(INGEST_MODES)}")
+    if key_column and mode == "append":
+        raise HTTPException(status_code=400, detail="key_column needs the incremental or replace mode")
 
-    contents = await file.read()
-    background_tasks.add_task(process_upload_file, contents, file.filename, source_tag, upload_id, db)
+    # Spool to disk so the upload is never held in memory as one byte string;
+    # an ingestion worker (worker.py) picks the job up from the queue
+    path = await spool_upload(file)
+    upload_id = await asyncio.to_thread(job_store.create, path, file.filename, source_tag, mode, key_column)
 
-    return {"upload_id": upload_id, "status": "file upload pending"}
+    return {"upload_id": upload_id, "status": STATUS_PENDING}
 
 @router.get("/files/status/{upload_id}")
-async def get_upload_status(upload_id: str):
-    if upload_id not in upload_status:
+def get_upload_status(upload_id: str):
+    status_info = job_store.get(upload_id)
+    if status_info is None:
         print(f"[Status Check] Invalid upload_id: {upload_id}")
         raise HTTPException(status_code=404, detail="Invalid upload_id")
-    status_info = upload_status[upload_id]
-    print(f"[Status Check] ID={upload_id} -> {status_info}")
+    status_info.pop("path", None)
+    print(f"[Status Check] ID={upload_id} -> {status_info['status']}")
     return status_info
 
+@router.post("/files/status/{upload_id}/cancel")
+def cancel_upload(upload_id: str):
+    status_info = job_store.request_cancel(upload_id)
+    if status_info is None:
+        raise HTTPException(status_code=404, detail="Invalid upload_id")
+    status_info.pop("path", None)
+    return status_info
 
-def process_upload_file(contents, filename, source_tag, upload_id, db):
-    print(f"[Processing Start] ID={upload_id}, Source={source_tag}, File={filename}")
-    try:
-        # File decoding
-        if filename.endswith(".csv"):
-            try:
-                df = pd.read_csv(io.StringIO(contents.decode("utf-8")))
-            except UnicodeDecodeError:
-                df = pd.read_csv(io.StringIO(contents.decode("cp1252")))
-        else:
-            df = pd.read_excel(io.BytesIO(contents), engine="openpyxl")
-
-        print(f"[Processing] Parsed file with {len(df)} rows (raw)")
-
-        df = df.dropna(how="all").drop_duplicates()
-        print(f"[Processing] After cleaning: {len(df)} rows")
-
-        records = []
-        inserted = 0
-
-        for i, (_, row) in enumerate(df.iterrows()):
-            combined = " ".join(str(val).strip() for val in row if pd.notna(val)).strip()
-            if not combined or combined.lower() == "nan":
-                continue
-
-            try:
-                embedding = generate_embedding(combined)
-            except Exception as e:
-                print(f"[Row {i}] ⚠️ Embedding error: {e}")
-                continue
-
-            records.append(UnifiedIndex(
-                source_tag=source_tag,
-                source_text=combined[:10000],
-                embedding=embedding
-            ))
-            inserted += 1
-
-        if records:
-            db.bulk_save_objects(records)
-            db.commit()
-            print(f"[Processing Complete] ID={upload_id}, Inserted={inserted}")
-        else:
-            print(f"[Processing Complete] ID={upload_id}, No records to insert")
-
-        upload_status[upload_id] = {"status": "completed", "inserted": inserted}
+@router.post("/files/status/{upload_id}/resume")
+def resume_upload(upload_id: str):
+    status_info = job_store.get(upload_id)
+    if status_info is None:
+        raise HTTPException(status_code=404, detail="Invalid upload_id")
+    if not is_resumable(status_info["status"]):
+        raise HTTPException(status_code=409, detail=f"Upload is {status_info['status']}, not resumable")
+    status_info = job_store.resume(upload_id)
+    status_info.pop("path", None)
+    return status_info
 
-    except Exception as e:
-        error_msg = f"failed: {str(e)}"
-        print(f"[Processing Failed] ID={upload_id}, Error={error_msg}")
-        upload_status[upload_id] = {"status": error_msg, "inserted": 0}
 
 
+@router.get("/embedding-cache/stats")
+def get_embedding_cache_stats():
+    return embedding_cache.stats()
+
+
+@router.get("/semantic-cache/stats")
+def get_semantic_cache_stats():
+    return semantic_cache.stats()
+
+
+@router.get("/single-flight/stats")
+def get_single_flight_stats():
+    return search_flight.stats()
+
+
+@router.get("/db-pool/stats")
+def get_db_pool_stats():
+    return all_pool_stats()
+
+
+@router.get("/metrics")
+def get_metrics():
+    # Prometheus text format; counts are per process (see metrics.py)
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
 
 @router.get("/suggestions/")
-def get_cached_queries():
-    suggestions = list(redis_client.smembers("cached_queries"))
-    return {"suggestions": sorted(suggestions, key=str.lower)}
+def get_cached_queries(prefix: str = "", limit: int = Query(SUGGEST_DEFAULT_RESULTS, ge=1, le=SUGGEST_MAX_RESULTS)):
+    # Answered queries starting with prefix (case-insensitive), most popular first
+    with stage("suggestions", "lookup"):
+        return {"suggestions": suggestion_index.lookup(prefix, limit)}
     
 
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def search_filters(
+    query: str,
+    state: str = None,
+    naics: str = None,
+    agency: str = None,
+    uei: str = None,
+    cage: str = None,
+    posted_after: date = None,
+    posted_before: date = None,
+    deadline_after: date = None,
+    deadline_before: date = None,
+    columns: str = None,
+    extract_filters: bool = None,
+) -> dict:
+    # Metadata filters (see metadata.py); columns is a JSON object matched against the original row
+    filters = {
+        "state": state, "naics": naics, "agency": agency, "uei": uei, "cage": cage,
+        "posted_after": posted_after, "posted_before": posted_before,
+        "deadline_after": deadline_after, "deadline_before": deadline_before,
+    }
+    try:
+        if columns:
+            filters["columns"] = json.loads(columns)
+        return resolve_filters(query, filters, extract_filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {str(e)}")
+
 @router.post("/semantic-search/")
-def semantic_search(query: str, db: Session = Depends(get_db)):
+async def semantic_search(query: str, debug: bool = False, filters: dict = Depends(search_filters),
+                          db: AsyncSession = Depends(get_async_db)):
+    # debug=true adds per-stage milliseconds and LLM token usage to the response
+    start = time.perf_counter()
+    cache_key = result_cache_key(query, filters)
+    timings, usage = {}, {}
+
+    def respond(response: dict, outcome: str) -> dict:
+        search_requests.inc(endpoint="json", outcome=outcome)
+        stage_seconds.observe(time.perf_counter() - start, pipeline="search", stage="total")
+        if debug:
+            timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+            return {**response, "timings": timings, "usage": usage}
+        return response
+
     # Check cache
-    cached = get_cached_result(query)
-    if cached:
-        return {"cached": True, **eval(cached)}
-
-    query_embedding = generate_embedding(query)
-    keyword_query = keyword_boost_query(query)
-    all_results = []
-    for source_tag in ["db1", "db2", "db3", "db4"]:
-            dense_results = db.query(UnifiedIndex).filter(
-                UnifiedIndex.source_tag == source_tag
-            ).order_by(
-                UnifiedIndex.embedding.cosine_distance(query_embedding)
-            ).limit(20).all()
-
-            sparse_raw = db.execute(
-                text("""
-                    SELECT id, source_tag, source_text,
-                    ts_rank_cd(to_tsvector('english', source_text), to_tsquery('english', :kw)) AS score
-                    FROM unified_index
-                    WHERE source_tag = :tag AND to_tsvector('english', source_text) @@ to_tsquery('english', :kw)
-                    ORDER BY score DESC
-                    LIMIT 20
-                """),
-                {"tag": source_tag, "kw": keyword_query}
-            ).fetchall()
-
-            Row = namedtuple("Row", ["id", "source_tag", "source_text", "score"])
-            sparse_results = [Row(**dict(r._mapping)) for r in sparse_raw]
-
-            top_combined = hybrid_score_sort(dense_results, sparse_results)[:10]
-            all_results.extend(top_combined)
-
-    unique_results = {f"{r.source_tag}_{r.id}": r for r in all_results}.values()
-    top_results = list(unique_results)[:5]
-
-    source_index = {}
-    deduped_sources = []
-    numbered_chunks = []
-
-    for doc in top_results:
-        tag = doc.source_tag
-        if tag not in source_index:
-            source_index[tag] = len(source_index) + 1
-            deduped_sources.append(tag)
-        source_num = source_index[tag]
-        numbered_chunks.append(f"[{source_num}] {doc.source_text}")
-
-    retrieved_context = "\n\n".join(numbered_chunks)
-
-
-    # Chain: Step 1 - Extract relevant info
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0)
-
-    extraction_messages = [
-    SystemMessage(content=(
-                "You are a data extraction expert.\n"
-                "You will be given unstructured data rows extracted from Excel or CSV files. Your task is to extract rows that are semantically or contextually relevant to the user's query.\n"
-                "A row is considered relevant if it:\n"
-                "- Mentions related keywords, phrases, or entities from the query (even if worded differently)\n"
-                "- Refers to the same location, organization, dates, values, or contract types\n"
-                "- Involves similar activity or service types as the query\n\n"
-                "Return only the relevant rows in full. DO NOT rephrase or summarize. Preserve the original formatting.\n"
-                "If no match is found, return an empty response."
-            )),
-            HumanMessage(content=f"Query: {query}\n\nContext:\n{retrieved_context}")
-    ]
-
-
-    extracted_content = llm(extraction_messages).content.strip()
-
-        # Simplest one
-        # Chain: Step 2 - Format response
-        # formatting_messages = [
-        #     SystemMessage(content=(
-        #         "You are a formatter assistant. Take the extracted contract entries and structure them in clean markdown format."
-        #         "Use tables where appropriate. Be clear, direct, and structured."
-        #     )),
-        #     HumanMessage(content=f"Query: {query}\n\nExtracted Entries:\n{extracted_content}")
-        # ]
-
-        #Table form
-        # formatting_messages = [
-        #     SystemMessage(content=(
-        #         "You are a formatter assistant.\n"
-        #         "Your job is to take raw row-based data and format it cleanly in Markdown.\n\n"
-        #         "Instructions:\n"
-        #         "- Start with a heading: `# Results for <query>`\n"
-        #         "- For each row, use `## Entry <number>` as a subheading\n"
-        #         "- Use a table with two columns: `Field` and `Value`\n"
-        #         "- Keep original values; do not reword or summarize\n"
-        #         "- Output only valid Markdown"
-        #     )),
-        #     HumanMessage(content=f"Query: {query}\n\nExtracted Entries:\n{extracted_content}")
-        # ]
-
-    #Bullets form
-    # Bulleted Markdown formatter prompt detaileeddd
-    # formatting_messages = [
-    #     SystemMessage(content=(
-    #         "You are a Markdown formatting assistant.\n\n"
-    #         "Your task is to format raw data entries into clean, structured Markdown without changing or omitting any content.\n"
-    #         "You must not add explanations, paraphrase, or summarize.\n\n"
-    #         "**Formatting Instructions:**\n"
-    #         "1. For each entry, start with a level 2 heading in the form: `## Result <n>` (where `n` starts from 1).\n"
-    #         "2. Below each heading, list all fields using this bullet format:\n"
-    #         "   - **<Field Name>**: <Exact Value>\n"
-    #         "3. Do not add commentary, footnotes, or change the values.\n"
-    #         "4. Do not include any extra sections before or after the entries.\n"
-    #         "5. The output must be valid, clean Markdown."
-    #     )),
-    #     HumanMessage(content=(
-    #         f"Query:\n```\n{query}\n```\n\n"
-    #         "Extracted Entries (each entry separated by a blank line):\n```\n"
-    #         f"{extracted_content}\n```\n\n"
-    #         "Format according to the instructions above."
-    #     ))
-    # ]
-
-    formatting_messages = [
-        SystemMessage(content=(
-            "You are a Markdown formatting assistant.\n\n"
-            "Your task is to format extracted data entries into concise, clean Markdown.\n"
-            "Only include a few essential fields per entry — no long descriptions or detailed breakdowns.\n\n"
-            "**Formatting Rules:**\n"
-            "1. For each entry, start with a level 2 heading: `## Result <n>`.\n"
-            "2. List 5-7 key fields max, using this bullet format:\n"
-            "   - **<Field Name>**: <Value>\n"
-            "3. Only include short, high-signal fields such as Title, Agency, Date, NAICS, URL.\n"
-            "4. Avoid repeating boilerplate or long descriptions.\n"
-            "5. Output should be plain, valid Markdown with no added commentary."
-        )),
-        HumanMessage(content=(
-            f"Query:\n```\n{query}\n```\n\n"
-            "Extracted Entries:\n```\n"
-            f"{extracted_content}\n```\n\n"
-            "Now format crisply using the rules above."
-        ))
-    ]
-
-
-
-
-    structured_output = llm(formatting_messages).content.strip()
-
-    result = {
-            "query": query,
-            "gpt_response": structured_output,
-            "retrieved_context": retrieved_context,
-            "sources": deduped_sources
-        }
-
-    set_cached_result(query, result)
-    return {"cached": False, **result}
+    with stage("search", "cache_lookup", timings):
+        cached = await asyncio.to_thread(get_cached_result, cache_key)
+    cache_requests.inc(cache="result", result="miss" if cached is None else "hit")
+    if cached is not None:
+        if not filters:
+            await track_queries(query, stored=False)
+        return respond({"cached": True, **cached, "query": query}, "exact_cache")
+
+    async def answer():
+        # Then the closest previously answered query (it knows nothing of filters)
+        embed_stats = {"cached": 0}
+        if not filters:
+            similar, match = await find_similar_result(query, stats=embed_stats, timings=timings)
+            if similar is not None:
+                return {"cached": True, **similar, "query": query, "semantic_match": semantic_match_info(match)}
+
+        result = await run_search(db, query, stats=embed_stats, timings=timings, usage=usage, filters=filters)
+
+        with stage("search", "cache_store", timings):
+            await asyncio.to_thread(set_cached_result, cache_key, result)
+            if not filters:
+                await track_queries(query)
+                await remember_query(query)
+        return {"cached": False, "cached_embeddings": embed_stats["cached"], **result}
+
+    async def lead():
+        response = await answer()
+        # Shared with coalesced requests, which report the leader's stages and token usage in debug mode
+        return {**response, "leader": {"timings": dict(timings), "usage": dict(usage)}}
+
+    # Identical queries already running here or on another worker are awaited, not recomputed
+    waited = time.perf_counter()
+    response, shared = await search_flight.do(cache_key, lead)
+    leader = response.get("leader", {})
+    response = {name: value for name, value in response.items() if name != "leader"}
+    if shared:
+        timings.update({f"leader_{name}": ms for name, ms in leader.get("timings", {}).items()})
+        timings["coalesced_wait"] = round((time.perf_counter() - waited) * 1000, 2)
+        usage.update(leader.get("usage", {}))
+        return respond({**response, "query": query, "coalesced": True}, "coalesced")
+    return respond(response, "semantic_cache" if "semantic_match" in response else "computed")
 
     # except Exception as e:
     #     raise HTTPException(status_code=500, detail=f"Semantic Search LLM failed: {str(e)}")
 
+
+@router.post("/semantic-search/stream")
+async def semantic_search_stream(query: str, filters: dict = Depends(search_filters)):
+    # Sources first, then formatter tokens as they arrive (text/event-stream)
+    return StreamingResponse(
+        search_events(query, filters),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    # Metadata filters applied to every query, by the names search_filters takes
+    filters: Optional[dict] = None
+    extract_filters: Optional[bool] = None
+    # False: ranked matches only, no LLM calls
+    llm: bool = True
+
+
+@router.post("/semantic-search/batch")
+async def semantic_search_batch(request: BatchSearchRequest, debug: bool = False):
+    # Many queries in one request: one embeddings call, set-based retrieval, per-query cache
+    start = time.perf_counter()
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="At least one query is required")
+    if len(request.queries) > SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {SEARCH_BATCH_MAX_QUERIES} queries per batch")
+    if not all(query.strip() for query in request.queries):
+        raise HTTPException(status_code=400, detail="Queries must not be empty")
+    try:
+        filters = [resolve_filters(query, request.filters, request.extract_filters) for query in request.queries]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {str(e)}")
+
+    timings, embed_stats = {}, {"cached": 0}
+    results = await run_search_batch(request.queries, filters, llm=request.llm, stats=embed_stats, timings=timings)
+    stage_seconds.observe(time.perf_counter() - start, pipeline="search", stage="batch_total")
+
+    response = {
+        "results": results,
+        "cached": sum(1 for result in results if result.get("cached")),
+        "cached_embeddings": embed_stats["cached"],
+    }
+    if debug:
+        timings["total"] = round((time.perf_counter() - start) * 1000, 2)
+        response["timings"] = timings
+    return response
@@ -0,0 +1,493 @@
+"""
+Semantic search pipeline shared by the JSON and streaming endpoints:
+query embedding, hybrid retrieval, a token-budgeted context (context.py), then
+the LLM.
+
+SEARCH_LLM_MODE picks how the LLM is used:
+
+- two_step (default): one call extracts the relevant rows, a second formats
+  them as Markdown.
+- single: one call does both, which roughly halves LLM latency and cost.
+
+Searches can be narrowed with metadata filters (metadata.py), given
+explicitly or, with SEARCH_EXTRACT_FILTERS=true or extract_filters=true on the
+request, read from the query text. Filtered results are cached under the query
+plus its filters and never answered from the semantic cache, which matches on
+the query alone.
+
+run_search_batch answers many queries at once: cache lookups in one Redis
+round trip, one batched embeddings call and set-based retrieval
+(retrieval.hybrid_search_batch_async), then either the ranked matches as they
+are or the usual LLM answer per query, several at a time.
+"""
+import asyncio
+import json
+import os
+
+from cache import get_cached_result, get_cached_results, set_cached_result, set_cached_results
+from context import build_context
+from db import AsyncSessionLocal
+from metadata import extract_filters, filters_key, normalize_filters
+from metrics import cache_requests, record_llm_usage, search_requests, stage
+from retrieval import hybrid_search_async, hybrid_search_batch_async
+from semantic_cache import SEMANTIC_CACHE_ENABLED, semantic_cache
+from suggestions import suggestion_index
+from utils import generate_embedding_async, generate_embeddings, get_chat_llm, keyword_boost_query
+
+LLM_MODES = ("two_step", "single")
+SEARCH_LLM_MODE = os.getenv("SEARCH_LLM_MODE", "two_step")
+if SEARCH_LLM_MODE not in LLM_MODES:
+    raise ValueError(f"Unsupported SEARCH_LLM_MODE: {SEARCH_LLM_MODE}")
+SEARCH_EXTRACT_FILTERS = os.getenv("SEARCH_EXTRACT_FILTERS", "false").lower() in ("1", "true", "yes")
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", 500))
+SEARCH_BATCH_LLM_CONCURRENCY = int(os.getenv("SEARCH_BATCH_LLM_CONCURRENCY", 8))
+
+
+def resolve_filters(query: str, filters: dict = None, extract: bool = None) -> dict:
+    """
+    Normalized filters for a search: the given ones, plus those named in the
+    query when extraction is on (extract, else SEARCH_EXTRACT_FILTERS). Given
+    filters win. Raises ValueError for invalid ones.
+    """
+    resolved = {}
+    if SEARCH_EXTRACT_FILTERS if extract is None else extract:
+        resolved.update(extract_filters(query))
+    resolved.update(normalize_filters(filters))
+    return resolved
+
+
+def normalize_query(query: str) -> str:
+    # Queries differing only in case or whitespace share a cached answer and a single-flight computation
+    return " ".join(query.casefold().split())
+
+
+def result_cache_key(query: str, filters: dict = None) -> str:
+    # The normalized query alone for unfiltered searches
+    query = normalize_query(query)
+    return f"{query} [filters {filters_key(filters)}]" if filters else query
+
+
+def matches_cache_key(query: str, filters: dict = None) -> str:
+    # Ranked matches without an LLM answer (batch search with llm=false)
+    return f"{result_cache_key(query, filters)} [matches]"
+
+
+async def retrieve_context(db, query: str, stats: dict = None, timings: dict = None, usage: dict = None,
+                           filters: dict = None):
+    """
+    Return (retrieved_context, sources) for the top 5 hybrid matches of query.
+
+    usage, if given, gets the context's token count as context_tokens.
+    filters are normalized metadata filters (see resolve_filters).
+    """
+    with stage("search", "embed", timings):
+        query_embedding = await generate_embedding_async(query, stats=stats)
+    keyword_query = keyword_boost_query(query)
+
+    # Dense + sparse candidates for every source, fused in one round trip
+    with stage("search", "retrieval", timings):
+        top_results = await hybrid_search_async(db, query_embedding, keyword_query, limit=5, filters=filters)
+
+    with stage("search", "context", timings):
+        retrieved_context, sources, info = build_context(top_results)
+    if usage is not None:
+        usage["context_tokens"] = info["tokens"]
+    return retrieved_context, sources
+
+
+def build_extraction_messages(query: str, retrieved_context: str) -> list:
+    # langchain is imported on the first LLM call rather than at startup
+    from langchain.schema import HumanMessage, SystemMessage
+
+    # Chain: Step 1 - Extract relevant info
+    extraction_messages = [
+    SystemMessage(content=(
+                "You are a data extraction expert.\n"
+                "You will be given unstructured data rows extracted from Excel or CSV files. Your task is to extract rows that are semantically or contextually relevant to the user's query.\n"
+                "A row is considered relevant if it:\n"
+                "- Mentions related keywords, phrases, or entities from the query (even if worded differently)\n"
+                "- Refers to the same location, organization, dates, values, or contract types\n"
+                "- Involves similar activity or service types as the query\n\n"
+                "Return only the relevant rows in full. DO NOT rephrase or summarize. Preserve the original formatting.\n"
+                "If no match is found, return an empty response."
+            )),
+            HumanMessage(content=f"Query: {query}\n\nContext:\n{retrieved_context}")
+    ]
+    return extraction_messages
+
+
+def build_formatting_messages(query: str, extracted_content: str) -> list:
+    from langchain.schema import HumanMessage, SystemMessage
+
+    # Simplest one
+    # Chain: Step 2 - Format response
+    # formatting_messages = [
+    #     SystemMessage(content=(
+    #         "You are a formatter assistant. Take the extracted contract entries and structure them in clean markdown format."
+    #         "Use tables where appropriate. Be clear, direct, and structured."
+    #     )),
+    #     HumanMessage(content=f"Query: {query}\n\nExtracted Entries:\n{extracted_content}")
+    # ]
+
+    #Table form
+    # formatting_messages = [
+    #     SystemMessage(content=(
+    #         "You are a formatter assistant.\n"
+    #         "Your job is to take raw row-based data and format it cleanly in Markdown.\n\n"
+    #         "Instructions:\n"
+    #         "- Start with a heading: `# Results for <query>`\n"
+    #         "- For each row, use `## Entry <number>` as a subheading\n"
+    #         "- Use a table with two columns: `Field` and `Value`\n"
+    #         "- Keep original values; do not reword or summarize\n"
+    #         "- Output only valid Markdown"
+    #     )),
+    #     HumanMessage(content=f"Query: {query}\n\nExtracted Entries:\n{extracted_content}")
+    # ]
+
+    #Bullets form
+    # Bulleted Markdown formatter prompt detaileeddd
+    # formatting_messages = [
+    #     SystemMessage(content=(
+    #         "You are a Markdown formatting assistant.\n\n"
+    #         "Your task is to format raw data entries into clean, structured Markdown without changing or omitting any content.\n"
+    #         "You must not add explanations, paraphrase, or summarize.\n\n"
+    #         "**Formatting Instructions:**\n"
+    #         "1. For each entry, start with a level 2 heading in the form: `## Result <n>` (where `n` starts from 1).\n"
+    #         "2. Below each heading, list all fields using this bullet format:\n"
+    #         "   - **<Field Name>**: <Exact Value>\n"
+    #         "3. Do not add commentary, footnotes, or change the values.\n"
+    #         "4. Do not include any extra sections before or after the entries.\n"
+    #         "5. The output must be valid, clean Markdown."
+    #     )),
+    #     HumanMessage(content=(
+    #         f"Query:\n```\n{query}\n```\n\n"
+    #         "Extracted Entries (each entry separated by a blank line):\n```\n"
+    #         f"{extracted_content}\n```\n\n"
+    #         "Format according to the instructions above."
+    #     ))
+    # ]
+
+    formatting_messages = [
+        SystemMessage(content=(
+            "You are a Markdown formatting assistant.\n\n"
+            "Your task is to format extracted data entries into concise, clean Markdown.\n"
+            "Only include a few essential fields per entry — no long descriptions or detailed breakdowns.\n\n"
+            "**Formatting Rules:**\n"
+            "1. For each entry, start with a level 2 heading: `## Result <n>`.\n"
+            "2. List 5-7 key fields max, using this bullet format:\n"
+            "   - **<Field Name>**: <Value>\n"
+            "3. Only include short, high-signal fields such as Title, Agency, Date, NAICS, URL.\n"
+            "4. Avoid repeating boilerplate or long descriptions.\n"
+            "5. Output should be plain, valid Markdown with no added commentary."
+        )),
+        HumanMessage(content=(
+            f"Query:\n```\n{query}\n```\n\n"
+            "Extracted Entries:\n```\n"
+            f"{extracted_content}\n```\n\n"
+            "Now format crisply using the rules above."
+        ))
+    ]
+    return formatting_messages
+
+
+def build_answer_messages(query: str, retrieved_context: str) -> list:
+    from langchain.schema import HumanMessage, SystemMessage
+
+    # Single-call mode: the extraction and formatting instructions in one prompt
+    answer_messages = [
+        SystemMessage(content=(
+            "You are a data extraction and Markdown formatting assistant.\n"
+            "You will be given unstructured data rows extracted from Excel or CSV files. Select the rows that are semantically or contextually relevant to the user's query.\n"
+            "A row is considered relevant if it:\n"
+            "- Mentions related keywords, phrases, or entities from the query (even if worded differently)\n"
+            "- Refers to the same location, organization, dates, values, or contract types\n"
+            "- Involves similar activity or service types as the query\n\n"
+            "Format only the relevant rows as concise, clean Markdown:\n"
+            "1. For each row, start with a level 2 heading: `## Result <n>`.\n"
+            "2. List 5-7 key fields max, using this bullet format:\n"
+            "   - **<Field Name>**: <Value>\n"
+            "3. Only include short, high-signal fields such as Title, Agency, Date, NAICS, URL. Copy values exactly as they appear.\n"
+            "4. Avoid repeating boilerplate or long descriptions.\n"
+            "5. Output should be plain, valid Markdown with no added commentary.\n"
+            "If no row is relevant, return an empty response."
+        )),
+        HumanMessage(content=f"Query:\n```\n{query}\n```\n\nContext:\n{retrieved_context}")
+    ]
+    return answer_messages
+
+
+async def run_search(db, query: str, stats: dict = None, timings: dict = None, usage: dict = None,
+                     llm_mode: str = None, filters: dict = None) -> dict:
+    """
+    Retrieve context and run the LLM step(s); returns the cacheable result.
+
+    timings and usage, if given, collect per-stage milliseconds and token counts.
+    llm_mode overrides SEARCH_LLM_MODE. The result includes the filters used,
+    if any.
+    """
+    retrieved_context, sources = await retrieve_context(db, query, stats=stats, timings=timings, usage=usage,
+                                                        filters=filters)
+    return await answer_query(query, retrieved_context, sources, timings=timings, usage=usage, llm_mode=llm_mode,
+                              filters=filters)
+
+
+async def answer_query(query: str, retrieved_context: str, sources: list, timings: dict = None, usage: dict = None,
+                       llm_mode: str = None, filters: dict = None) -> dict:
+    """The LLM step(s) of run_search, on context that is already retrieved."""
+    llm = get_chat_llm()
+    if (llm_mode or SEARCH_LLM_MODE) == "single":
+        with stage("search", "llm_answer", timings):
+            formatted = await llm.ainvoke(build_answer_messages(query, retrieved_context))
+        record_llm_usage(formatted, "answer", usage)
+    else:
+        with stage("search", "llm_extract", timings):
+            extracted = await llm.ainvoke(build_extraction_messages(query, retrieved_context))
+        record_llm_usage(extracted, "extract", usage)
+        extracted_content = extracted.content.strip()
+
+        with stage("search", "llm_format", timings):
+            formatted = await llm.ainvoke(build_formatting_messages(query, extracted_content))
+        record_llm_usage(formatted, "format", usage)
+    structured_output = formatted.content.strip()
+
+    result = {
+        "query": query,
+        "gpt_response": structured_output,
+        "retrieved_context": retrieved_context,
+        "sources": sources
+    }
+    if filters:
+        result["filters"] = json.loads(filters_key(filters))
+    return result
+
+
+def match_list(results) -> list:
+    return [
+        {"id": doc.id, "source_tag": doc.source_tag, "score": float(doc.score), "source_text": doc.source_text}
+        for doc in results
+    ]
+
+
+async def run_search_batch(queries: list, filters: list, llm: bool = True, stats: dict = None,
+                           timings: dict = None) -> list:
+    """
+    Search many queries at once; returns one response per query, in input order.
+
+    filters holds each query's normalized filters (resolve_filters). With
+    llm=True a response is what /semantic-search/ returns and shares its cache
+    entries; with llm=False it is the query's ranked matches, cached apart. The
+    semantic cache is not consulted. Repeated queries are answered once. A
+    query whose LLM call fails gets an "error" instead of failing the batch.
+    """
+    cache_key_of = result_cache_key if llm else matches_cache_key
+    unique = {}
+    for query, query_filters in zip(queries, filters):
+        unique.setdefault(cache_key_of(query, query_filters), (query, query_filters))
+    keys = list(unique)
+
+    with stage("search", "batch_cache_lookup", timings):
+        cached = await asyncio.to_thread(get_cached_results, keys)
+    responses = {}
+    for key, result in zip(keys, cached):
+        cache_requests.inc(cache="result", result="miss" if result is None else "hit")
+        if result is not None:
+            search_requests.inc(endpoint="batch", outcome="exact_cache")
+            responses[key] = {"cached": True, **result, "query": unique[key][0]}
+    missing = [key for key in keys if key not in responses]
+    # Only answered, unfiltered queries are offered as suggestions
+    suggested = {key for key in keys if llm and not unique[key][1]}
+    await track_queries([unique[key][0] for key in responses if key in suggested], stored=False)
+
+    if missing:
+        with stage("search", "batch_embed", timings):
+            embeddings = await asyncio.to_thread(generate_embeddings, [unique[key][0] for key in missing], stats=stats)
+
+        # One statement per distinct filter set (a single one unless filters are read from the queries)
+        groups = {}
+        for i, key in enumerate(missing):
+            groups.setdefault(filters_key(unique[key][1]), []).append(i)
+        matches = {}
+        with stage("search", "batch_retrieval", timings):
+            async with AsyncSessionLocal() as db:
+                for positions in groups.values():
+                    group_filters = unique[missing[positions[0]]][1]
+                    found = await hybrid_search_batch_async(
+                        db, embeddings[positions], [keyword_boost_query(unique[missing[i]][0]) for i in positions],
+                        limit=5, filters=group_filters,
+                    )
+                    matches.update((missing[i], results) for i, results in zip(positions, found))
+
+        if llm:
+            computed = await answer_batch(missing, unique, matches, timings)
+        else:
+            computed = {}
+            for key in missing:
+                query, query_filters = unique[key]
+                computed[key] = {"query": query, "matches": match_list(matches[key])}
+                if query_filters:
+                    computed[key]["filters"] = json.loads(filters_key(query_filters))
+
+        stored = [(key, result) for key, result in computed.items() if "error" not in result]
+        with stage("search", "cache_store", timings):
+            await asyncio.to_thread(set_cached_results, stored)
+            answered = [unique[key][0] for key, _ in stored if key in suggested]
+            await track_queries(answered)
+            await asyncio.gather(*(remember_query(query) for query in answered))
+        for key, result in computed.items():
+            search_requests.inc(endpoint="batch", outcome="error" if "error" in result else "computed")
+            responses[key] = result if "error" in result else {"cached": False, **result}
+
+    # Variants of a query that share an answer each get it under their own wording
+    return [{**responses[cache_key_of(query, query_filters)], "query": query}
+            for query, query_filters in zip(queries, filters)]
+
+
+async def answer_batch(keys: list, unique: dict, matches: dict, timings: dict = None) -> dict:
+    """LLM answers for run_search_batch, SEARCH_BATCH_LLM_CONCURRENCY at a time."""
+    semaphore = asyncio.Semaphore(SEARCH_BATCH_LLM_CONCURRENCY)
+
+    async def answer(key):
+        query, query_filters = unique[key]
+        retrieved_context, sources, _ = build_context(matches[key])
+        async with semaphore:
+            try:
+                return await answer_query(query, retrieved_context, sources, filters=query_filters)
+            except Exception as e:
+                return {"query": query, "error": f"Semantic Search failed: {str(e)}"}
+
+    with stage("search", "batch_llm", timings):
+        answers = await asyncio.gather(*(answer(key) for key in keys))
+    return dict(zip(keys, answers))
+
+
+async def find_similar_result(query: str, stats: dict = None, timings: dict = None):
+    """
+    Return (result, match) for the closest previously answered query, or (None, None).
+
+    The query embedding computed here is kept by the embedding cache, so a miss
+    does not pay for it again in retrieval.
+    """
+    if not SEMANTIC_CACHE_ENABLED:
+        return None, None
+    with stage("search", "embed", timings):
+        embedding = await generate_embedding_async(query, stats=stats)
+    with stage("search", "semantic_lookup", timings):
+        match = await asyncio.to_thread(semantic_cache.lookup, embedding)
+        result = None
+        if match is not None:
+            result = await asyncio.to_thread(get_cached_result, match.query)
+            if result is None:
+                # The answer expired from the exact cache
+                await asyncio.to_thread(semantic_cache.discard, match.query)
+    cache_requests.inc(cache="semantic", result="miss" if result is None else "hit")
+    if result is None:
+        return None, None
+    return result, match
+
+
+async def track_queries(queries, stored: bool = True):
+    """Count answered queries for suggestions (see SuggestionIndex.record)."""
+    if queries:
+        await asyncio.to_thread(suggestion_index.record, queries, stored)
+
+
+async def remember_query(query: str):
+    """Make an answered query available to find_similar_result."""
+    if SEMANTIC_CACHE_ENABLED:
+        embedding = await generate_embedding_async(query)
+        await asyncio.to_thread(semantic_cache.add, query, embedding)
+
+
+def semantic_match_info(match) -> dict:
+    return {"query": match.query, "similarity": round(match.similarity, 4)}
+
+
+def sse_event(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+async def search_events(query: str, filters: dict = None):
+    """
+    Server-sent events for one search.
+
+    `sources` (sources + retrieved_context) is sent as soon as retrieval is done,
+    then one `token` event per formatter token, then `done` with the assembled
+    result, which is also what gets cached. Failures end the stream with `error`.
+    filters are normalized metadata filters (see resolve_filters).
+    """
+    try:
+        embed_stats = {"cached": 0}
+        match = None
+        cache_key = result_cache_key(query, filters)
+        with stage("search", "cache_lookup"):
+            result = await asyncio.to_thread(get_cached_result, cache_key)
+        cache_requests.inc(cache="result", result="miss" if result is None else "hit")
+        if result is None and not filters:
+            result, match = await find_similar_result(query, stats=embed_stats)
+        if result is not None:
+            search_requests.inc(endpoint="stream", outcome="semantic_cache" if match else "exact_cache")
+            if match is None and not filters:
+                await track_queries(query, stored=False)
+            extra = {"semantic_match": semantic_match_info(match)} if match else {}
+            yield sse_event("sources", {
+                "cached": True,
+                "query": query,
+                "sources": result.get("sources", []),
+                "retrieved_context": result.get("retrieved_context", ""),
+                **extra,
+            })
+            yield sse_event("token", {"text": result.get("gpt_response", "")})
+            yield sse_event("done", {"cached": True, **result, "query": query, **extra})
+            return
+
+        # The session is only needed for retrieval, release it before the LLM calls
+        async with AsyncSessionLocal() as db:
+            retrieved_context, sources = await retrieve_context(db, query, stats=embed_stats, filters=filters)
+
+        yield sse_event("sources", {
+            "cached": False,
+            "query": query,
+            "sources": sources,
+            "retrieved_context": retrieved_context,
+        })
+
+        llm = get_chat_llm()
+        if SEARCH_LLM_MODE == "single":
+            # Tokens stream from the only call, straight after retrieval
+            step, messages = "answer", build_answer_messages(query, retrieved_context)
+        else:
+            with stage("search", "llm_extract"):
+                extracted = await llm.ainvoke(build_extraction_messages(query, retrieved_context))
+            record_llm_usage(extracted, "extract")
+            step, messages = "format", build_formatting_messages(query, extracted.content.strip())
+
+        parts = []
+        message = None
+        # Includes the time the client takes to read the stream
+        with stage("search", f"llm_{step}"):
+            async for chunk in llm.astream(messages):
+                message = chunk if message is None else message + chunk
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield sse_event("token", {"text": chunk.content})
+        record_llm_usage(message, step)
+
+        result = {
+            "query": query,
+            "gpt_response": "".join(parts).strip(),
+            "retrieved_context": retrieved_context,
+            "sources": sources
+        }
+        if filters:
+            result["filters"] = json.loads(filters_key(filters))
+        with stage("search", "cache_store"):
+            await asyncio.to_thread(set_cached_result, cache_key, result)
+            if not filters:
+                await track_queries(query)
+                await remember_query(query)
+        search_requests.inc(endpoint="stream", outcome="computed")
+        yield sse_event("done", {"cached": False, "cached_embeddings": embed_stats["cached"], **result})
+
+    except Exception as e:
+        search_requests.inc(endpoint="stream", outcome="error")
+        yield sse_event("error", {"detail": f"Semantic Search failed: {str(e)}"})
@@ -0,0 +1,195 @@
+"""
+Semantic tier for the search result cache.
+
+The exact cache only answers repeats of the same query string. This tier keeps
+the embedding of every answered query and, for a new query, looks for the
+nearest cached one by cosine similarity. When it clears
+SEMANTIC_CACHE_THRESHOLD, that query's stored result is reused.
+
+Vectors live in an in-process matrix (brute-force dot product, which takes
+about a millisecond for a few thousand entries). They are mirrored to the
+Redis hash `semcache:queries` so every worker sees queries answered by the
+others. The answers themselves stay in the exact cache under `query:{query}`,
+so they expire with it, and a semantic entry whose answer is gone is dropped
+when it is next matched.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import redis
+
+from cache import redis_bytes_client
+from metrics import register_collector
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+SEMANTIC_CACHE_REFRESH_SECONDS = int(os.getenv("SEMANTIC_CACHE_REFRESH_SECONDS", 30))
+SEMANTIC_CACHE_KEY = "semcache:queries"
+SEMANTIC_CACHE_RETRY_SECONDS = 30
+
+SemanticMatch = namedtuple("SemanticMatch", ["query", "similarity"])
+
+
+def normalize(vec) -> np.ndarray:
+    vec = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class SemanticCache:
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 client=redis_bytes_client, refresh_seconds=SEMANTIC_CACHE_REFRESH_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.client = client
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        # Row i of matrix holds the unit vector of queries[i]; rows past size are unused capacity
+        self.matrix = None
+        self.queries = []
+        self.positions = {}
+        self.size = 0
+        self.refreshed_at = 0.0
+        self.redis_down_until = 0.0
+        self.counters = {"hits": 0, "misses": 0, "similarity_sum": 0.0}
+
+    def _redis_available(self):
+        return self.client is not None and time.monotonic() >= self.redis_down_until
+
+    def _redis_failed(self, err):
+        print(f"⚠️ Semantic cache Redis tier disabled for {SEMANTIC_CACHE_RETRY_SECONDS}s: {err}")
+        self.redis_down_until = time.monotonic() + SEMANTIC_CACHE_RETRY_SECONDS
+
+    def _insert(self, query: str, vec: np.ndarray):
+        # Caller holds the lock
+        if query in self.positions:
+            self.matrix[self.positions[query]] = vec
+            return
+        if self.matrix is None:
+            self.matrix = np.zeros((16, vec.shape[0]), dtype=np.float32)
+        elif self.size == self.matrix.shape[0]:
+            grown = np.zeros((self.size * 2, self.matrix.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.matrix[:self.size]
+            self.matrix = grown
+        self.matrix[self.size] = vec
+        self.queries.append(query)
+        self.positions[query] = self.size
+        self.size += 1
+
+    def _remove(self, query: str) -> bool:
+        # Caller holds the lock; moves the last row into the freed slot
+        pos = self.positions.pop(query, None)
+        if pos is None:
+            return False
+        last = self.size - 1
+        if pos != last:
+            moved = self.queries[last]
+            self.matrix[pos] = self.matrix[last]
+            self.queries[pos] = moved
+            self.positions[moved] = pos
+        self.queries.pop()
+        self.size -= 1
+        return True
+
+    def refresh(self, force=False):
+        """Reload the index from Redis so queries answered by other workers can match."""
+        if not force and time.monotonic() - self.refreshed_at < self.refresh_seconds:
+            return
+        self.refreshed_at = time.monotonic()
+        if not self._redis_available():
+            return
+        try:
+            entries = self.client.hgetall(SEMANTIC_CACHE_KEY)
+        except redis.RedisError as err:
+            self._redis_failed(err)
+            return
+        with self.lock:
+            for raw_query, raw_vec in entries.items():
+                query = raw_query.decode("utf-8") if isinstance(raw_query, bytes) else raw_query
+                if query not in self.positions:
+                    self._insert(query, np.frombuffer(raw_vec, dtype=np.float32))
+
+    def lookup(self, embedding):
+        """Return the closest cached query as a SemanticMatch if it clears the threshold, else None."""
+        self.refresh()
+        vec = normalize(embedding)
+        with self.lock:
+            if self.size:
+                scores = self.matrix[:self.size] @ vec
+                best = int(np.argmax(scores))
+                similarity = float(scores[best])
+                if similarity >= self.threshold:
+                    self.counters["hits"] += 1
+                    self.counters["similarity_sum"] += similarity
+                    return SemanticMatch(self.queries[best], similarity)
+            self.counters["misses"] += 1
+        return None
+
+    def add(self, query: str, embedding) -> None:
+        vec = normalize(embedding)
+        evicted = []
+        with self.lock:
+            self._insert(query, vec)
+            # Row 0 is the oldest entry unless removals have swapped rows into it
+            while self.size > self.max_entries:
+                oldest = self.queries[0]
+                self._remove(oldest)
+                evicted.append(oldest)
+
+        if not self._redis_available():
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hset(SEMANTIC_CACHE_KEY, query, vec.tobytes())
+            if evicted:
+                pipe.hdel(SEMANTIC_CACHE_KEY, *evicted)
+            pipe.execute()
+        except redis.RedisError as err:
+            self._redis_failed(err)
+
+    def discard(self, query: str) -> None:
+        """Forget a query whose cached answer has expired."""
+        with self.lock:
+            self._remove(query)
+        if not self._redis_available():
+            return
+        try:
+            self.client.hdel(SEMANTIC_CACHE_KEY, query)
+        except redis.RedisError as err:
+            self._redis_failed(err)
+
+    def stats(self) -> dict:
+        with self.lock:
+            hits, misses = self.counters["hits"], self.counters["misses"]
+            stats = {"hits": hits, "misses": misses, "entries": self.size, "threshold": self.threshold}
+            stats["mean_similarity"] = self.counters["similarity_sum"] / hits if hits else 0.0
+        stats["hit_rate"] = hits / (hits + misses) if hits + misses else 0.0
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self.matrix = None
+            self.queries = []
+            self.positions = {}
+            self.size = 0
+            self.refreshed_at = 0.0
+            self.counters = {"hits": 0, "misses": 0, "similarity_sum": 0.0}
+
+
+semantic_cache = SemanticCache()
+
+
+@register_collector
+def semantic_cache_metrics():
+    stats = semantic_cache.stats()
+    return [
+        ("semantic_cache_lookups_total", "counter", "Semantic cache lookups by outcome.", [
+            ({"result": "hit"}, stats["hits"]),
+            ({"result": "miss"}, stats["misses"]),
+        ]),
+        ("semantic_cache_entries", "gauge", "Answered queries held in the in-process matrix.", [({}, stats["entries"])]),
+    ]
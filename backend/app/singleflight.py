@@ -0,0 +1,186 @@
+"""
+Single-flight deduplication of identical searches.
+
+When many users send the same query at once, only one request per key runs
+the pipeline and the others wait for its result. Callers pass the result cache
+key (search.result_cache_key), which holds the normalized query (casefolded,
+whitespace collapsed), so requests share a computation exactly when they would
+share a cached answer:
+
+- Within a worker, callers for a query already in flight await the same
+  asyncio future.
+- Across uvicorn workers, the first worker takes a Redis lock
+  (`sf:lock:{key}`). When it finishes it stores the result under
+  `sf:result:{key}` for a short time and publishes on `sf:done:{key}`. Workers
+  that find the lock taken subscribe to that channel and read the stored
+  result when notified.
+
+If the leader fails, or the wait times out, a follower runs the computation
+itself. If the leader's request is cancelled (the client went away), its
+in-process followers are not: the first of them takes over as leader. Redis
+errors fall back to in-process deduplication only.
+"""
+import asyncio
+import hashlib
+import os
+
+import redis
+import redis.asyncio as aioredis
+
+from cache import REDIS_URL, encode_result, decode_result
+from metrics import register_collector
+
+SINGLEFLIGHT_LOCK_SECONDS = int(os.getenv("SINGLEFLIGHT_LOCK_SECONDS", 120))
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv("SINGLEFLIGHT_WAIT_SECONDS", 60))
+SINGLEFLIGHT_RESULT_TTL = int(os.getenv("SINGLEFLIGHT_RESULT_TTL", 30))
+KEY_PREFIX = "sf:"
+
+redis_async_client = aioredis.Redis.from_url(REDIS_URL, socket_connect_timeout=1)
+
+
+def flight_key(key: str) -> str:
+    # key is already normalized by result_cache_key; hashing it as is keeps flights and cache entries aligned
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class LeaderCancelled(Exception):
+    """Set on a shared future when its leader was cancelled, so followers retry instead of being cancelled too."""
+
+
+class SingleFlight:
+    def __init__(self, client=redis_async_client, lock_seconds=SINGLEFLIGHT_LOCK_SECONDS,
+                 wait_seconds=SINGLEFLIGHT_WAIT_SECONDS, result_ttl=SINGLEFLIGHT_RESULT_TTL):
+        self.client = client
+        self.lock_seconds = lock_seconds
+        self.wait_seconds = wait_seconds
+        self.result_ttl = result_ttl
+        self.inflight = {}
+        self.counters = {"leaders": 0, "local_waiters": 0, "remote_waiters": 0}
+
+    async def do(self, query: str, compute):
+        """
+        Await compute() at most once per query (a result cache key) across callers.
+
+        Returns (result, shared). shared is True when the result came from a
+        computation started by another caller.
+        """
+        key = flight_key(query)
+        waiting = False
+        while (future := self.inflight.get(key)) is not None:
+            if not waiting:
+                self.counters["local_waiters"] += 1
+                waiting = True
+            try:
+                return await asyncio.shield(future), True
+            except LeaderCancelled:
+                # The first follower to get here leads the next attempt, the others join it
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting on it; don't warn about unretrieved exceptions
+        future.add_done_callback(lambda f: f.exception())
+        self.inflight[key] = future
+        try:
+            result, shared = await self._run_across_workers(key, compute)
+        except asyncio.CancelledError:
+            self.inflight.pop(key, None)
+            future.set_exception(LeaderCancelled())
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(result)
+            return result, shared
+        finally:
+            if self.inflight.get(key) is future:
+                self.inflight.pop(key)
+
+    async def _run_across_workers(self, key: str, compute):
+        if self.client is None:
+            return await self._lead(key, None, compute), False
+        try:
+            lock = self.client.lock(f"{KEY_PREFIX}lock:{key}", timeout=self.lock_seconds)
+            acquired = await lock.acquire(blocking=False)
+        except redis.RedisError as err:
+            print(f"⚠️ Single-flight lock unavailable, computing locally: {err}")
+            return await self._lead(key, None, compute), False
+
+        if acquired:
+            return await self._lead(key, lock, compute), False
+
+        result = await self._wait_for_leader(key)
+        if result is not None:
+            self.counters["remote_waiters"] += 1
+            return result, True
+        return await self._lead(key, None, compute), False
+
+    async def _lead(self, key: str, lock, compute):
+        self.counters["leaders"] += 1
+        try:
+            result = await compute()
+        except Exception:
+            await self._finish(key, lock, None)
+            raise
+        await self._finish(key, lock, result)
+        return result
+
+    async def _finish(self, key: str, lock, result):
+        if lock is None:
+            return
+        try:
+            if result is not None:
+                await self.client.set(f"{KEY_PREFIX}result:{key}", encode_result(result), ex=self.result_ttl)
+            await self.client.publish(f"{KEY_PREFIX}done:{key}", b"done" if result is not None else b"failed")
+            await lock.release()
+        except redis.RedisError as err:
+            print(f"⚠️ Single-flight could not publish result: {err}")
+
+    async def _wait_for_leader(self, key: str):
+        """Wait for the worker holding the lock; returns its result or None."""
+        result_key = f"{KEY_PREFIX}result:{key}"
+        pubsub = self.client.pubsub()
+        try:
+            # Subscribe before checking, so a result published in between is not missed
+            await pubsub.subscribe(f"{KEY_PREFIX}done:{key}")
+            raw = await self.client.get(result_key)
+            if raw is None and await self.client.exists(f"{KEY_PREFIX}lock:{key}"):
+                if await self._next_message(pubsub) == b"done":
+                    raw = await self.client.get(result_key)
+            return decode_result(raw) if raw else None
+        except redis.RedisError as err:
+            print(f"⚠️ Single-flight wait failed, computing locally: {err}")
+            return None
+        finally:
+            try:
+                await pubsub.aclose()
+            except redis.RedisError:
+                pass
+
+    async def _next_message(self, pubsub):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_seconds
+        while (remaining := deadline - loop.time()) > 0:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message is not None:
+                return message["data"]
+        return None
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": len(self.inflight)}
+
+
+search_flight = SingleFlight()
+
+
+@register_collector
+def single_flight_metrics():
+    stats = search_flight.stats()
+    return [
+        ("single_flight_requests_total", "counter", "Searches by single-flight role.", [
+            ({"role": "leader"}, stats["leaders"]),
+            ({"role": "local_waiter"}, stats["local_waiters"]),
+            ({"role": "remote_waiter"}, stats["remote_waiters"]),
+        ]),
+        ("single_flight_in_flight", "gauge", "Distinct searches currently running.", [({}, stats["in_flight"])]),
+    ]
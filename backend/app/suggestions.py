@@ -0,0 +1,249 @@
+"""
+Query suggestions for the search box, looked up by prefix in Redis.
+
+Every answered query is kept in three sorted sets:
+
+- suggest:lex     every query with score 0, as "<normalized query>\\0<query>",
+                  so ZRANGEBYLEX finds the ones starting with a prefix
+- suggest:score   query -> popularity: how often it was answered or served
+                  from the result cache
+- suggest:expiry  query -> when its cached answer expires (unix time)
+
+Normalized means lowercase with runs of whitespace collapsed, so prefixes match
+regardless of case. A prefix of up to SUGGEST_TOP_PREFIX_CHARS characters
+matches too many queries to rank on every keystroke. Each such prefix has a
+suggest:top:<prefix> set instead, holding its SUGGEST_TOP_SIZE most popular
+queries, updated as queries are recorded. Longer prefixes read up to
+SUGGEST_SCAN_LIMIT matches from suggest:lex and rank them by popularity.
+
+A suggestion is only useful while its answer is cached. Queries past their
+expiry are left out of results and removed from all sets by prune(). prune()
+runs on the write path at most every SUGGEST_PRUNE_SECONDS, for up to
+SUGGEST_PRUNE_BATCH queries at a time. `python suggestions.py prune` removes
+all expired queries at once. Top sets that lost queries are then refilled
+from suggest:score, reading at most SUGGEST_REFILL_SCAN_LIMIT of the most
+popular queries.
+"""
+import os
+import threading
+import time
+
+import redis
+
+from cache import CACHE_TTL, redis_client
+
+LEX_KEY = "suggest:lex"
+SCORE_KEY = "suggest:score"
+EXPIRY_KEY = "suggest:expiry"
+TOP_KEY = "suggest:top:{}"
+SEPARATOR = "\x00"
+
+SUGGEST_DEFAULT_RESULTS = int(os.getenv("SUGGEST_DEFAULT_RESULTS", 10))
+SUGGEST_MAX_RESULTS = int(os.getenv("SUGGEST_MAX_RESULTS", 20))
+SUGGEST_TOP_PREFIX_CHARS = int(os.getenv("SUGGEST_TOP_PREFIX_CHARS", 3))
+SUGGEST_TOP_SIZE = int(os.getenv("SUGGEST_TOP_SIZE", 100))
+SUGGEST_SCAN_LIMIT = int(os.getenv("SUGGEST_SCAN_LIMIT", 500))
+SUGGEST_PRUNE_SECONDS = int(os.getenv("SUGGEST_PRUNE_SECONDS", 60))
+SUGGEST_PRUNE_BATCH = int(os.getenv("SUGGEST_PRUNE_BATCH", 1000))
+SUGGEST_REFILL_SCAN_LIMIT = int(os.getenv("SUGGEST_REFILL_SCAN_LIMIT", 10000))
+REFILL_PAGE = 1000
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def normalize_prefix(prefix: str) -> str:
+    normalized = normalize_query(prefix)
+    # A trailing space means the last word is complete: "ai " should not match "aircraft"
+    if normalized and prefix[-1:].isspace():
+        normalized += " "
+    return normalized
+
+
+def lex_member(query: str) -> str:
+    return f"{normalize_query(query)}{SEPARATOR}{query}"
+
+
+class SuggestionIndex:
+    def __init__(self, client=redis_client, ttl=CACHE_TTL, top_prefix_chars=SUGGEST_TOP_PREFIX_CHARS,
+                 top_size=SUGGEST_TOP_SIZE, scan_limit=SUGGEST_SCAN_LIMIT, prune_seconds=SUGGEST_PRUNE_SECONDS,
+                 prune_batch=SUGGEST_PRUNE_BATCH, refill_scan_limit=SUGGEST_REFILL_SCAN_LIMIT):
+        self.client = client
+        self.ttl = ttl
+        self.top_prefix_chars = top_prefix_chars
+        self.top_size = top_size
+        self.scan_limit = scan_limit
+        self.prune_seconds = prune_seconds
+        self.prune_batch = prune_batch
+        self.refill_scan_limit = refill_scan_limit
+        self.lock = threading.Lock()
+        self.pruned_at = 0.0
+
+    def top_prefixes(self, query: str) -> list:
+        normalized = normalize_query(query)
+        return [normalized[:size] for size in range(1, min(len(normalized), self.top_prefix_chars) + 1)]
+
+    def top_keys(self, query: str) -> list:
+        return [TOP_KEY.format(prefix) for prefix in self.top_prefixes(query)]
+
+    def record(self, queries, stored: bool = True, now: float = None):
+        """
+        Count answered queries (one string or a list) and index them.
+
+        stored=True means their answers were just cached, so they expire a
+        CACHE_TTL from now; for cache hits (stored=False) the expiry already
+        recorded is kept. Redis errors are logged, not raised: suggestions must
+        not fail a search.
+        """
+        queries = [queries] if isinstance(queries, str) else list(queries)
+        if not queries:
+            return
+        now = time.time() if now is None else now
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for query in queries:
+                pipe.zincrby(SCORE_KEY, 1, query)
+            scores = pipe.execute()
+
+            pipe = self.client.pipeline(transaction=False)
+            for query, score in zip(queries, scores):
+                pipe.zadd(LEX_KEY, {lex_member(query): 0})
+                pipe.zadd(EXPIRY_KEY, {query: now + self.ttl}, nx=not stored)
+                for key in self.top_keys(query):
+                    pipe.zadd(key, {query: score})
+                    pipe.zremrangebyrank(key, 0, -(self.top_size + 1))
+            pipe.execute()
+        except redis.RedisError as err:
+            print(f"⚠️ Could not record query suggestions: {err}")
+            return
+        self.maybe_prune(now)
+
+    def lookup(self, prefix: str = "", limit: int = SUGGEST_DEFAULT_RESULTS, now: float = None) -> list:
+        """Up to limit (at most SUGGEST_MAX_RESULTS) live queries starting with prefix, most popular first."""
+        limit = max(1, min(limit, SUGGEST_MAX_RESULTS))
+        now = time.time() if now is None else now
+        normalized = normalize_prefix(prefix or "")
+
+        if not normalized:
+            ranked = self.client.zrevrange(SCORE_KEY, 0, self.scan_limit - 1, withscores=True)
+        elif len(normalized) <= self.top_prefix_chars:
+            ranked = self.client.zrevrange(TOP_KEY.format(normalized), 0, -1, withscores=True)
+        else:
+            bound = b"[" + normalized.encode("utf-8")
+            # UTF-8 never contains 0xff, so this covers every member starting with the prefix
+            members = self.client.zrangebylex(LEX_KEY, bound, bound + b"\xff", start=0, num=self.scan_limit)
+            queries = [member.split(SEPARATOR, 1)[1] for member in members]
+            ranked = zip(queries, self.client.zmscore(SCORE_KEY, queries)) if queries else []
+
+        ranked = sorted(((query, score or 0) for query, score in ranked), key=lambda item: (-item[1], item[0].lower()))
+        if not ranked:
+            return []
+        expiry = self.client.zmscore(EXPIRY_KEY, [query for query, _ in ranked])
+        live = [query for (query, _), expires in zip(ranked, expiry) if expires is not None and expires > now]
+        return live[:limit]
+
+    def prune(self, now: float = None, batch: int = None) -> int:
+        """Remove up to batch queries whose cached answers have expired; returns how many."""
+        now = time.time() if now is None else now
+        expired = self.client.zrangebyscore(EXPIRY_KEY, "-inf", now, start=0, num=batch or self.prune_batch)
+        if not expired:
+            return 0
+        prefixes = {prefix for query in expired for prefix in self.top_prefixes(query)}
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrem(LEX_KEY, *[lex_member(query) for query in expired])
+        for query in expired:
+            for key in self.top_keys(query):
+                pipe.zrem(key, query)
+        pipe.zrem(SCORE_KEY, *expired)
+        pipe.zrem(EXPIRY_KEY, *expired)
+        pipe.execute()
+        self.refill_top(prefixes)
+        return len(expired)
+
+    def refill_top(self, prefixes):
+        """
+        Top up the top sets of prefixes that hold fewer than top_size queries,
+        from the most popular queries in suggest:score. Without this, a
+        prefix's list would keep shrinking as its queries expire.
+        """
+        prefixes = list(prefixes)
+        if not prefixes:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for prefix in prefixes:
+            pipe.zcard(TOP_KEY.format(prefix))
+        # The most popular queries of each such prefix; the ones it still has are among them
+        missing = {prefix: self.top_size for prefix, size in zip(prefixes, pipe.execute()) if size < self.top_size}
+        found = {prefix: {} for prefix in missing}
+
+        start = 0
+        while missing and start < self.refill_scan_limit:
+            page = self.client.zrevrange(SCORE_KEY, start, start + REFILL_PAGE - 1, withscores=True)
+            for query, score in page:
+                for prefix in self.top_prefixes(query):
+                    if prefix in missing:
+                        found[prefix][query] = score
+                        missing[prefix] -= 1
+                        if not missing[prefix]:
+                            del missing[prefix]
+            if len(page) < REFILL_PAGE:
+                break
+            start += REFILL_PAGE
+
+        pipe = self.client.pipeline(transaction=False)
+        for prefix, members in found.items():
+            if members:
+                # Merged, not replaced, so queries recorded meanwhile stay; then trimmed as in record()
+                key = TOP_KEY.format(prefix)
+                pipe.zadd(key, members)
+                pipe.zremrangebyrank(key, 0, -(self.top_size + 1))
+        pipe.execute()
+
+    def maybe_prune(self, now: float):
+        # One batch per SUGGEST_PRUNE_SECONDS per process keeps the write path cheap
+        with self.lock:
+            if now - self.pruned_at < self.prune_seconds:
+                return
+            self.pruned_at = now
+        try:
+            removed = self.prune(now)
+        except redis.RedisError as err:
+            print(f"⚠️ Could not prune query suggestions: {err}")
+            return
+        if removed:
+            print(f"[Suggestions] Pruned {removed} expired queries")
+
+    def prune_all(self) -> int:
+        removed = 0
+        while True:
+            count = self.prune()
+            removed += count
+            if count < self.prune_batch:
+                return removed
+
+    def stats(self, now: float = None) -> dict:
+        now = time.time() if now is None else now
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zcard(SCORE_KEY)
+        pipe.zcount(EXPIRY_KEY, "-inf", now)
+        queries, expired = pipe.execute()
+        return {"queries": queries, "expired": expired}
+
+
+suggestion_index = SuggestionIndex()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the query suggestion index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("prune", help="remove every query whose cached answer has expired")
+    sub.add_parser("stats", help="print the number of indexed and expired queries")
+    args = parser.parse_args()
+
+    if args.command == "prune":
+        print(f"[Suggestions] Pruned {suggestion_index.prune_all()} expired queries")
+    else:
+        print(suggestion_index.stats())
@@ -1,140 +1,240 @@
-from openai import OpenAI
-from crewai import Agent, Crew, Task
-# from crewai_tools import VectorSearchTool
-from langchain.chat_models import ChatOpenAI
-from crewai.tools import BaseTool
-from db import SessionLocal
-from models import UnifiedIndex
+from openai import OpenAI, AsyncOpenAI
+# crewai and langchain take seconds to import; the agentic RAG path lives in
+# agents.py and the chat model is imported on first use
 from dotenv import load_dotenv
 from sqlalchemy import cast, text, func
 from sqlalchemy import desc
 from pgvector.sqlalchemy import Vector
 from dotenv import load_dotenv
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from embedding_cache import embedding_cache, cache_key
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+import os
+import random
+import time
+import asyncio
 
 load_dotenv()
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Request packing limits for the embeddings endpoint (2048 inputs / ~300k tokens per call)
+EMBED_MAX_INPUTS = int(os.getenv("EMBED_MAX_INPUTS", 2048))
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", 300000))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 4))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 5))
+EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", 0.5))
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+@lru_cache(maxsize=None)
 def get_openai_client():
-    return OpenAI()
+    # One shared client so every request reuses the same HTTP connection pool.
+    # Retries are handled by embed_batch so backoff is not applied twice.
+    return OpenAI(max_retries=0)
+
+@lru_cache(maxsize=None)
+def get_async_openai_client():
+    # Shared async client (and its connection pool) for the request path
+    return AsyncOpenAI(max_retries=0)
+
+@lru_cache(maxsize=None)
+def get_chat_llm():
+    # One ChatOpenAI for every search request instead of one per request
+    from langchain.chat_models import ChatOpenAI
+    return ChatOpenAI(model_name="gpt-4o", temperature=0)
 
 # client = OpenAI()  # Uses OPENAI_API_KEY from .env
 MAX_CHARS = 10000  # Safe truncation limit
+TOKENIZER_THREADS = int(os.getenv("TOKENIZER_THREADS", min(8, os.cpu_count() or 1)))
 
-def chunk_text(text: str, max_tokens=800):
+@lru_cache(maxsize=1)
+def get_encoder():
     import tiktoken
-    enc = tiktoken.encoding_for_model("text-embedding-3-small")
-    tokens = enc.encode(text)
+    return tiktoken.encoding_for_model(EMBEDDING_MODEL)
 
+def split_tokens(enc, text: str, tokens: list, max_tokens: int):
+    if len(tokens) <= max_tokens:
+        # A single window decodes back to the text itself
+        return [(text, len(tokens))] if tokens else []
     chunks = []
     for i in range(0, len(tokens), max_tokens):
-        chunk = enc.decode(tokens[i:i + max_tokens])
-        chunks.append(chunk)
-
+        window = tokens[i:i + max_tokens]
+        chunks.append((enc.decode(window), len(window)))
     return chunks
 
+def token_chunks(text: str, max_tokens=800):
+    """Split text into (chunk, token_count) pairs of at most max_tokens tokens."""
+    enc = get_encoder()
+    return split_tokens(enc, text, enc.encode(text), max_tokens)
+
+def encode_texts(enc, texts: list) -> list:
+    # Same tokens as enc.encode(): without "<|" a text cannot contain a special
+    # token, so the cheaper encode_ordinary applies; the rest go through encode()
+    # and still raise on special tokens
+    if TOKENIZER_THREADS > 1 and len(texts) > 1:
+        encoded = enc.encode_ordinary_batch(texts, num_threads=TOKENIZER_THREADS)
+    else:
+        encoded = [enc.encode_ordinary(text) for text in texts]
+    for i, text in enumerate(texts):
+        if "<|" in text:
+            encoded[i] = enc.encode(text)
+    return encoded
+
+def token_chunks_batch(texts: list, max_tokens=800) -> list:
+    """token_chunks for many texts, each tokenized once with a shared encoder."""
+    enc = get_encoder()
+    return [split_tokens(enc, text, tokens, max_tokens) for text, tokens in zip(texts, encode_texts(enc, texts))]
 
-class PgVectorSearchTool(BaseTool):
-    name: str = "pgvector_search"
-    description: str = "Searches pgvector for semantically similar contract records."
-
-    def _run(self, query: str) -> str:
-        db = SessionLocal()
+def chunk_text(text: str, max_tokens=800):
+    return [chunk for chunk, _ in token_chunks(text, max_tokens)]
+
+
+def generate_embedding(text: str, stats: dict = None) -> list:
+    return generate_embeddings([text], stats=stats)[0].tolist()
+
+def pack_batches(token_counts, max_inputs=None, max_tokens=None):
+    """Group consecutive chunks into (start, end) slices that fit one embeddings request."""
+    max_inputs = max_inputs or EMBED_MAX_INPUTS
+    max_tokens = max_tokens or EMBED_MAX_BATCH_TOKENS
+
+    batches = []
+    start, batch_tokens = 0, 0
+    for i, count in enumerate(token_counts):
+        if i > start and (i - start >= max_inputs or batch_tokens + count > max_tokens):
+            batches.append((start, i))
+            start, batch_tokens = i, 0
+        batch_tokens += count
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+def embed_batch(client, chunks: list) -> list:
+    for attempt in range(EMBED_MAX_RETRIES + 1):
         try:
-            embedding = generate_embedding(query)
-            results = db.query(UnifiedIndex).order_by(
-                UnifiedIndex.embedding.cosine_distance(embedding)
-            ).limit(5).all()
+            response = client.embeddings.create(model=EMBEDDING_MODEL, input=chunks)
+            return [item.embedding for item in response.data]
+        except RETRYABLE_ERRORS:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            # Exponential backoff with jitter so concurrent batches don't retry in lockstep
+            delay = EMBED_BACKOFF_SECONDS * (2 ** attempt)
+            time.sleep(delay * (0.5 + random.random() / 2))
+
+def embed_uncached(texts: list, max_tokens=800) -> np.ndarray:
+    """
+    Embed many texts with as few API calls as possible, bypassing the cache.
+
+    Each text is split into chunks of at most max_tokens tokens, the chunks of all
+    texts are packed into requests up to the model's input and token limits, and
+    up to EMBED_CONCURRENCY requests run at once. A text's embedding is the mean of
+    its chunk embeddings. Returns a float32 array of shape (len(texts), dim).
+    """
+    owners, chunks, counts = [], [], []
+    for i, pieces in enumerate(token_chunks_batch(texts, max_tokens=max_tokens)):
+        if not pieces:
+            raise ValueError("Embedding input must not be empty")
+        for chunk, count in pieces:
+            owners.append(i)
+            chunks.append(chunk)
+            counts.append(count)
+
+    if not chunks:
+        return np.empty((0, 0), dtype=np.float32)
 
-            return "\n\n".join([r.source_text for r in results])
-        except Exception as e:
-            return f"Search error: {str(e)}"
-        finally:
-            db.close()
+    client = get_openai_client()
+    batches = pack_batches(counts)
 
-def generate_embedding(text: str) -> list:
-    from numpy import array, mean
+    if len(batches) == 1:
+        results = [embed_batch(client, chunks)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(EMBED_CONCURRENCY, len(batches))) as pool:
+            results = list(pool.map(lambda b: embed_batch(client, chunks[b[0]:b[1]]), batches))
 
-    if not isinstance(text, str):
-        raise ValueError("Embedding input must be a string")
+    vectors = np.asarray([vec for batch in results for vec in batch], dtype=np.float64)
 
-    client = get_openai_client()
-    chunks = chunk_text(text, max_tokens=800)
-    embeddings = []
+    # Average chunk embeddings per text (can use other strategies too)
+    sums = np.zeros((len(texts), vectors.shape[1]), dtype=np.float64)
+    np.add.at(sums, owners, vectors)
+    chunk_counts = np.bincount(owners, minlength=len(texts))
+    return (sums / chunk_counts[:, None]).astype(np.float32)
 
-    for chunk in chunks:
-        response = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=chunk
-        )
-        embeddings.append(response.data[0].embedding)
+async def embed_batch_async(client, chunks: list) -> list:
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            response = await client.embeddings.create(model=EMBEDDING_MODEL, input=chunks)
+            return [item.embedding for item in response.data]
+        except RETRYABLE_ERRORS:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            delay = EMBED_BACKOFF_SECONDS * (2 ** attempt)
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+async def generate_embedding_async(text: str, max_tokens=800, stats: dict = None) -> list:
+    """Async generate_embedding for the search path; same cache, one request for all chunks."""
+    if not isinstance(text, str):
+        raise ValueError("Embedding input must be a string")
 
-    # Average embeddings (can use other strategies too)
-    avg_embedding = mean(array(embeddings), axis=0)
-    return avg_embedding.tolist()
+    key = cache_key(f"{EMBEDDING_MODEL}:{max_tokens}", text)
+    vec = (await asyncio.to_thread(embedding_cache.get_many, [key]))[0]
+    cached = vec is not None
+
+    if not cached:
+        chunks = chunk_text(text, max_tokens=max_tokens)
+        if not chunks:
+            raise ValueError("Embedding input must not be empty")
+        vectors = await embed_batch_async(get_async_openai_client(), chunks)
+        vec = np.mean(np.asarray(vectors, dtype=np.float64), axis=0).astype(np.float32)
+        await asyncio.to_thread(embedding_cache.set_many, [key], [vec])
+
+    if stats is not None:
+        stats["cached"] = stats.get("cached", 0) + int(cached)
+        stats["embedded"] = stats.get("embedded", 0) + int(not cached)
+    return vec.tolist()
+
+def generate_embeddings(texts: list, max_tokens=800, stats: dict = None) -> np.ndarray:
+    """
+    Embed texts, serving repeats from the embedding cache and batching the rest.
+
+    Only texts missing from the cache (deduplicated by cache key) reach the API.
+    If stats is given, its "cached" and "embedded" counts are incremented.
+    Returns a float32 array of shape (len(texts), dim).
+    """
+    for text in texts:
+        if not isinstance(text, str):
+            raise ValueError("Embedding input must be a string")
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    model = f"{EMBEDDING_MODEL}:{max_tokens}"
+    keys = [cache_key(model, text) for text in texts]
+    found = embedding_cache.get_many(keys)
+
+    # One API embedding per distinct missing key
+    missing = {}
+    for i, vec in enumerate(found):
+        if vec is None:
+            missing.setdefault(keys[i], texts[i])
+
+    if missing:
+        fresh = embed_uncached(list(missing.values()), max_tokens=max_tokens)
+        embedding_cache.set_many(list(missing.keys()), fresh)
+        fresh_by_key = dict(zip(missing.keys(), fresh))
+        found = [fresh_by_key[key] if vec is None else vec for key, vec in zip(keys, found)]
+
+    if stats is not None:
+        stats["cached"] = stats.get("cached", 0) + len(texts) - len(missing)
+        stats["embedded"] = stats.get("embedded", 0) + len(missing)
+
+    return np.vstack(found).astype(np.float32, copy=False)
 
 def as_pgvector(vec: list):
     # Convert Python list to Postgres vector literal like: '[0.1, 0.2, ...]'::vector
     vec_str = str(vec).replace('[', "'[").replace(']', "]'")
     return cast(text(vec_str), Vector)
 
-vector_tool = PgVectorSearchTool()
-
-retrieval_agent = Agent(
-    role="Context-Aware Retriever",
-    goal="Precisely extract all passages from the provided context that are highly relevant to the user's query.",
-    backstory="You are highly skilled at searching structured and unstructured data to identify directly related information, avoiding irrelevant filler or vague references.",
-    tools=[vector_tool],
-    llm=ChatOpenAI(model_name="gpt-4o", temperature=0),
-    verbose=True
-)
-
-formatter_agent = Agent(
-    role="Response Structurer",
-    goal="Format extracted content into a clear and well-structured answer that is easy to read and directly informative.",
-    backstory="You format important data for business analysts. You never ask for more info—use only what is given to create helpful, markdown-formatted outputs.",
-    llm=ChatOpenAI(model_name="gpt-4o", temperature=0),
-    verbose=True
-)
-
-def run_dual_agent_rag(query: str, retrieved_context: str):
-    if len(retrieved_context) > 10000:
-        retrieved_context = retrieved_context[:10000]
-
-    extract_task = Task(
-        description=(
-            "Extract all key parts from the context that are relevant to the query. Do NOT include generic or unrelated content. "
-            "Avoid repeating the query. Be comprehensive but precise. Extract at least 3 concrete facts or excerpts. Do not ask for clarification."
-        ),
-        input=f"Query: {query}\n\nContext:\n{retrieved_context}",
-        expected_output="Extracted text that directly answers the query, without extra commentary.",
-        agent=retrieval_agent
-    )
-
-    format_task = Task(
-        description=(
-            "Take the extracted relevant information and format it into a structured, human-friendly output. "
-            "Use markdown formatting (tables or lists) where applicable. Do not ask follow-up questions. Never say 'please provide'."
-        ),
-        expected_output=(
-            "A clean, structured summary or table using the extracted content. No vague responses. "
-            "If nothing is relevant, return: 'No relevant information found in the context.'"
-        ),
-        agent=formatter_agent,
-        input_from=extract_task
-    )
-
-    crew = Crew(
-        agents=[retrieval_agent, formatter_agent],
-        tasks=[extract_task, format_task],
-        verbose=True,
-        process="sequential"
-    )
-
-    result = crew.kickoff()
-    if not hasattr(result, "output") or not result.output.strip():
-        return "⚠️ Retrieval agent returned no useful output."
-
-    return result.output
-
 def hybrid_score_sort(dense_results, sparse_results, boost=0.4):
     combined = {f"{r.id}_{r.source_tag}": {"dense": r, "score": 1.0} for r in dense_results}
     for r in sparse_results:
@@ -0,0 +1,508 @@
+"""
+Local dense search over a read-only copy of unified_index.embedding.
+
+Each source_tag is a partition with two memory-mapped files: the embeddings
+as an (n, 1536) float32 matrix (normalized, so cosine similarity is a dot
+product) and their row ids. A query scores a partition with NumPy matrix
+products over blocks of rows. Partitions of VECTOR_INDEX_IVF_MIN_ROWS or more
+rows get an IVF layer: rows are grouped under k-means centroids, and a query
+only scores the rows of its VECTOR_INDEX_IVF_PROBES nearest groups. Building
+it rewrites the partition with each group's rows stored contiguously, so a
+probe is one sequential slice of the file.
+
+The files are written by `sync` and only read by the API. Every uvicorn worker
+maps the same files, so the OS page cache holds one copy for all of them. The
+manifest (manifest.json) names each partition's files and row count, and is
+replaced atomically. Readers check it every VECTOR_INDEX_REFRESH_SECONDS.
+
+    python vector_index.py sync                 # add rows inserted since the last sync
+    python vector_index.py rebuild --tag db1    # re-read a partition (after updates or deletes)
+    python vector_index.py stats
+
+A sync adds the rows whose created_at is within VECTOR_INDEX_SYNC_LAG_SECONDS
+of the previous sync, or later, and skips ids it already has. The lag covers
+ingest transactions that commit after the sync that started before them.
+Updated and deleted rows need a rebuild; the ingestion worker runs one after
+jobs that update or delete rows. Until then, a deleted row is dropped when the
+hit is joined back to unified_index, and an updated row is found by its old
+embedding.
+"""
+import argparse
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from metrics import register_collector
+
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(tempfile.gettempdir(), "vector_index"))
+EMBEDDING_DIM = 1536
+VECTOR_INDEX_REFRESH_SECONDS = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", 5))
+VECTOR_INDEX_SYNC_LAG_SECONDS = int(os.getenv("VECTOR_INDEX_SYNC_LAG_SECONDS", 600))
+VECTOR_INDEX_IVF_MIN_ROWS = int(os.getenv("VECTOR_INDEX_IVF_MIN_ROWS", 200_000))
+VECTOR_INDEX_IVF_PROBES = int(os.getenv("VECTOR_INDEX_IVF_PROBES", 16))
+# Retrain the IVF layer once this fraction of a partition was added after it was built
+VECTOR_INDEX_IVF_RETRAIN = float(os.getenv("VECTOR_INDEX_IVF_RETRAIN", 0.2))
+BLOCK_ROWS = 32768  # rows scored per matrix product, bounds the temporary score matrix
+FLUSH_ROWS = 8192   # rows decoded from COPY before they are written out
+IVF_TRAIN_ROWS = 65536  # k-means sample size cap
+
+# COPY binary: signature, flags, header extension length
+COPY_HEADER_SIZE = 11 + 4 + 4
+
+
+def copy_row_dtype(dim: int) -> np.dtype:
+    # One row of COPY (SELECT id, embedding ...) TO STDOUT (FORMAT binary):
+    # field count, then each field's length and value (pgvector: dim, unused, floats)
+    return np.dtype([
+        ("fields", ">i2"), ("id_len", ">i4"), ("id", ">i4"), ("vec_len", ">i4"),
+        ("dim", ">u2"), ("unused", ">u2"), ("vec", ">f4", (dim,)),
+    ])
+
+
+class CopyVectorReader:
+    """
+    File-like sink for a binary COPY of (id, embedding) rows.
+
+    Rows have a fixed size, so they are decoded with NumPy a block at a time
+    and handed to on_rows(ids, vectors) every FLUSH_ROWS rows (and on close).
+    No vector is ever built as a Python list.
+    """
+
+    def __init__(self, on_rows, dim: int = EMBEDDING_DIM):
+        self.on_rows = on_rows
+        self.dim = dim
+        self.dtype = copy_row_dtype(dim)
+        self.buffer = bytearray()
+        self.header_read = False
+        self.pending = []
+        self.pending_rows = 0
+
+    def write(self, data):
+        self.buffer += data
+        if not self.header_read:
+            if len(self.buffer) < COPY_HEADER_SIZE:
+                return
+            if not self.buffer.startswith(b"PGCOPY\n\xff\r\n\x00"):
+                raise ValueError("Not a binary COPY stream")
+            del self.buffer[:COPY_HEADER_SIZE]
+            self.header_read = True
+        # The 2-byte trailer is shorter than a row, so it is never decoded
+        count = len(self.buffer) // self.dtype.itemsize
+        if count:
+            rows = np.frombuffer(bytes(self.buffer[:count * self.dtype.itemsize]), dtype=self.dtype)
+            del self.buffer[:count * self.dtype.itemsize]
+            if (rows["fields"] != 2).any() or (rows["dim"] != self.dim).any():
+                raise ValueError(f"Unexpected COPY row layout (want id and a {self.dim}-dim vector)")
+            self.pending.append(rows)
+            self.pending_rows += count
+            if self.pending_rows >= FLUSH_ROWS:
+                self.flush()
+
+    def flush(self):
+        if self.pending:
+            rows = np.concatenate(self.pending)
+            self.pending, self.pending_rows = [], 0
+            self.on_rows(rows["id"].astype(np.int64), rows["vec"].astype(np.float32))
+
+    def close(self):
+        self.flush()
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k(scores: np.ndarray, k: int):
+    """Return (indices, scores) of the k highest scores per row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64), np.empty((scores.shape[0], 0), dtype=np.float32)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+def assign_lists(vectors, centroids) -> np.ndarray:
+    labels = np.empty(len(vectors), dtype=np.int32)
+    # Bounds the (rows, lists) score matrix to ~64 MB
+    step = max(1, min(BLOCK_ROWS, (1 << 24) // len(centroids)))
+    for start in range(0, len(vectors), step):
+        block = np.asarray(vectors[start:start + step])
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def train_ivf(vectors, nlist: int, iterations: int = 10, seed: int = 0):
+    """
+    Spherical k-means on a sample of vectors.
+
+    Returns (centroids, order, offsets): order lists the row positions grouped
+    by list, and list l's rows are order[offsets[l]:offsets[l + 1]].
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), max(nlist * 32, 10_000), IVF_TRAIN_ROWS)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), size=sample_size, replace=False))])
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign_lists(sample, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=nlist)
+        sums = sample[rng.choice(len(sample), size=nlist)]  # an empty list restarts from a random vector
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        sums[filled] = np.add.reduceat(sample[order], starts, axis=0)
+        centroids = normalize(sums)
+
+    labels = assign_lists(vectors, centroids)
+    order = np.argsort(labels, kind="stable").astype(np.int32)
+    offsets = np.searchsorted(labels[order], np.arange(nlist + 1)).astype(np.int64)
+    return centroids, order, offsets
+
+
+def ivf_list_count(rows: int) -> int:
+    return max(1, int(np.sqrt(rows)))
+
+
+class Partition:
+    """One source_tag's memory-mapped vectors, ids and optional IVF layer."""
+
+    def __init__(self, index_dir: str, entry: dict, dim: int):
+        self.rows = entry["rows"]
+        self.file = entry["file"]
+        path = os.path.join(index_dir, entry["file"])
+        if self.rows:
+            self.vectors = np.memmap(f"{path}.vec", dtype=np.float32, mode="r", shape=(self.rows, dim))
+            self.ids = np.memmap(f"{path}.ids", dtype=np.int64, mode="r", shape=(self.rows,))
+        else:
+            self.vectors = np.empty((0, dim), dtype=np.float32)
+            self.ids = np.empty(0, dtype=np.int64)
+        self.ivf = None
+        ivf = entry.get("ivf")
+        if ivf:
+            # The first ivf["rows"] rows of the files are stored in list order
+            with np.load(os.path.join(index_dir, ivf["file"])) as data:
+                self.ivf = (data["centroids"], data["offsets"], ivf["rows"])
+
+    def search(self, queries: np.ndarray, k: int, probes: int = None):
+        """Return (ids, scores), each (len(queries), <=k), best first."""
+        if self.ivf is not None:
+            results = [self.search_ivf(query, k, probes or VECTOR_INDEX_IVF_PROBES) for query in queries]
+            width = max((len(ids) for ids, _ in results), default=0)
+            ids = np.full((len(queries), width), -1, dtype=np.int64)
+            scores = np.full((len(queries), width), -np.inf, dtype=np.float32)
+            for i, (row_ids, row_scores) in enumerate(results):
+                ids[i, :len(row_ids)] = row_ids
+                scores[i, :len(row_scores)] = row_scores
+            return ids, scores
+
+        best_pos = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.rows, BLOCK_ROWS):
+            scores = queries @ np.asarray(self.vectors[start:start + BLOCK_ROWS]).T
+            pos, scores = top_k(scores, k)
+            merged_pos = np.concatenate([best_pos, pos + start], axis=1)
+            idx, best_scores = top_k(np.concatenate([best_scores, scores], axis=1), k)
+            best_pos = np.take_along_axis(merged_pos, idx, axis=1)
+        return np.asarray(self.ids)[best_pos], best_scores
+
+    def search_ivf(self, query: np.ndarray, k: int, probes: int):
+        centroids, offsets, built_rows = self.ivf
+        probes = min(probes, len(centroids))
+        lists = np.sort(np.argpartition(-(centroids @ query), probes - 1)[:probes])
+        # Rows added after the IVF layer was built are always scanned
+        ranges = [(offsets[l], offsets[l + 1]) for l in lists] + [(built_rows, self.rows)]
+        positions = np.concatenate([np.arange(start, end) for start, end in ranges])
+        scores = np.concatenate([np.asarray(self.vectors[start:end]) @ query for start, end in ranges])
+        idx, best = top_k(scores[None, :], k)
+        return np.asarray(self.ids)[positions[idx[0]]], best[0]
+
+
+class VectorIndex:
+    """Reader for the files written by sync; safe to share between threads."""
+
+    def __init__(self, index_dir: str = VECTOR_INDEX_DIR, refresh_seconds: float = VECTOR_INDEX_REFRESH_SECONDS):
+        self.index_dir = index_dir
+        self.refresh_seconds = refresh_seconds
+        self.partitions = {}
+        self.manifest_version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        """Pick up a newer manifest; partitions whose files and row count did not change are kept."""
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.refresh_seconds:
+            return
+        with self.lock:
+            self.checked_at = now
+            path = os.path.join(self.index_dir, "manifest.json")
+            try:
+                version = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self.partitions, self.manifest_version = {}, None
+                return
+            if version == self.manifest_version and not force:
+                return
+            for attempt in range(3):
+                try:
+                    manifest = read_manifest(self.index_dir)
+                    partitions = {}
+                    for tag, entry in manifest["partitions"].items():
+                        current = self.partitions.get(tag)
+                        if current is not None and (current.file, current.rows) == (entry["file"], entry["rows"]) \
+                                and bool(current.ivf) == bool(entry.get("ivf")):
+                            partitions[tag] = current
+                        else:
+                            partitions[tag] = Partition(self.index_dir, entry, manifest["dim"])
+                    break
+                except FileNotFoundError:
+                    # A rebuild removed the files between reading the manifest and opening them
+                    if attempt == 2:
+                        raise
+            self.partitions, self.manifest_version = partitions, version
+
+    def ready(self) -> bool:
+        self.refresh()
+        return bool(self.partitions)
+
+    def search_batch(self, queries, tags, k: int) -> list:
+        """For each query: {tag: [(id, score), ...]} with up to k hits per tag, best first."""
+        self.refresh()
+        queries = normalize(np.atleast_2d(queries))
+        results = [{} for _ in range(len(queries))]
+        for tag in tags:
+            partition = self.partitions.get(tag)
+            if partition is None or not partition.rows:
+                for result in results:
+                    result[tag] = []
+                continue
+            ids, scores = partition.search(queries, k)
+            for result, row_ids, row_scores in zip(results, ids.tolist(), scores.tolist()):
+                result[tag] = [(row_id, score) for row_id, score in zip(row_ids, row_scores) if row_id >= 0]
+        return results
+
+    def search(self, query, tags, k: int) -> dict:
+        return self.search_batch([query], tags, k)[0]
+
+    def nearest(self, query, k: int, tags=None) -> list:
+        """Up to k (id, score) pairs over the given tags (default: all), best first."""
+        self.refresh()
+        hits = self.search(query, list(tags or self.partitions), k)
+        return sorted((hit for tag_hits in hits.values() for hit in tag_hits), key=lambda hit: -hit[1])[:k]
+
+    def stats(self) -> dict:
+        self.refresh()
+        return {tag: {"rows": p.rows, "ivf_lists": len(p.ivf[0]) if p.ivf else 0} for tag, p in self.partitions.items()}
+
+
+@lru_cache(maxsize=1)
+def get_vector_index() -> VectorIndex:
+    return VectorIndex()
+
+
+@register_collector
+def vector_index_metrics():
+    # Only processes that searched the local index have one
+    if not get_vector_index.cache_info().currsize:
+        return []
+    index = get_vector_index()
+    return [("vector_index_rows", "gauge", "Rows in the local dense index, by source_tag.",
+             [({"source_tag": tag}, partition.rows) for tag, partition in index.partitions.items()])]
+
+
+# Writing (sync / rebuild). One writer at a time, guarded by a lock file.
+
+def read_manifest(index_dir: str) -> dict:
+    try:
+        with open(os.path.join(index_dir, "manifest.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"dim": EMBEDDING_DIM, "next_file": 1, "partitions": {}}
+
+
+def write_manifest(index_dir: str, manifest: dict):
+    tmp = os.path.join(index_dir, f".manifest.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(index_dir, "manifest.json"))
+
+
+class PartitionWriter:
+    """Appends (ids, vectors) batches to a partition's files, skipping ids it already has."""
+
+    def __init__(self, index_dir: str, entry: dict, dim: int):
+        path = os.path.join(index_dir, entry["file"])
+        self.dim = dim
+        self.rows = entry["rows"]
+        self.known = np.sort(np.fromfile(f"{path}.ids", dtype=np.int64, count=self.rows)) if self.rows else None
+        self.vec_file = open(f"{path}.vec", "ab")
+        self.ids_file = open(f"{path}.ids", "ab")
+        # Drop anything past the committed row count (an interrupted sync)
+        self.vec_file.truncate(self.rows * dim * 4)
+        self.ids_file.truncate(self.rows * 8)
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray):
+        if self.known is not None:
+            new = ~np.isin(ids, self.known)
+            ids, vectors = ids[new], vectors[new]
+        if len(ids):
+            self.vec_file.write(normalize(vectors).tobytes())
+            self.ids_file.write(ids.astype(np.int64).tobytes())
+            self.rows += len(ids)
+
+    def close(self) -> int:
+        for f in (self.vec_file, self.ids_file):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        return self.rows
+
+
+def copy_vectors(connection, source_tag: str, since: str, sink: CopyVectorReader):
+    cursor = connection.cursor()
+    try:
+        condition = cursor.mogrify("source_tag = %s", (source_tag,)).decode()
+        if since:
+            condition += cursor.mogrify(" AND created_at >= CAST(%s AS timestamp) - %s * interval '1 second'",
+                                        (since, VECTOR_INDEX_SYNC_LAG_SECONDS)).decode()
+        cursor.copy_expert(
+            f"COPY (SELECT id, embedding FROM unified_index WHERE {condition} ORDER BY id) "
+            "TO STDOUT WITH (FORMAT binary)",
+            sink
+        )
+        sink.close()
+    finally:
+        cursor.close()
+
+
+def build_ivf(index_dir: str, manifest: dict, tag: str) -> list:
+    """
+    Train the IVF layer of a partition and rewrite its files in list order.
+
+    Updates the manifest entry (not yet written); returns the replaced files.
+    """
+    entry = manifest["partitions"][tag]
+    dim = manifest["dim"]
+    path = os.path.join(index_dir, entry["file"])
+    vectors = np.memmap(f"{path}.vec", dtype=np.float32, mode="r", shape=(entry["rows"], dim))
+    ids = np.memmap(f"{path}.ids", dtype=np.int64, mode="r", shape=(entry["rows"],))
+    centroids, order, offsets = train_ivf(vectors, ivf_list_count(entry["rows"]))
+
+    stem = f"p{manifest['next_file']}"
+    manifest["next_file"] += 1
+    with open(os.path.join(index_dir, f"{stem}.vec"), "wb") as vec_file, \
+            open(os.path.join(index_dir, f"{stem}.ids"), "wb") as ids_file:
+        for start in range(0, len(order), BLOCK_ROWS):
+            block = order[start:start + BLOCK_ROWS]
+            vec_file.write(np.asarray(vectors[block]).tobytes())
+            ids_file.write(np.asarray(ids[block]).tobytes())
+        for f in (vec_file, ids_file):
+            f.flush()
+            os.fsync(f.fileno())
+    name = f"{stem}.ivf.npz"
+    np.savez(os.path.join(index_dir, name), centroids=centroids, offsets=offsets)
+
+    replaced = [f"{entry['file']}.vec", f"{entry['file']}.ids"]
+    if entry.get("ivf"):
+        replaced.append(entry["ivf"]["file"])
+    entry.update(file=stem, ivf={"file": name, "rows": entry["rows"], "lists": len(centroids)})
+    return replaced
+
+
+def needs_ivf(entry: dict, ivf_min_rows: int) -> bool:
+    if entry["rows"] < ivf_min_rows:
+        return False
+    ivf = entry.get("ivf")
+    return ivf is None or entry["rows"] - ivf["rows"] > VECTOR_INDEX_IVF_RETRAIN * ivf["rows"]
+
+
+def sync(engine=None, tags=None, rebuild: bool = False, index_dir: str = VECTOR_INDEX_DIR,
+         ivf_min_rows: int = VECTOR_INDEX_IVF_MIN_ROWS) -> dict:
+    """
+    Bring the index up to date with unified_index; returns {tag: rows added}.
+
+    tags defaults to every source_tag in the table. With rebuild, the given
+    partitions are read again from scratch into new files.
+    """
+    if engine is None:
+        from db import engine
+
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = read_manifest(index_dir)
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT CAST(now() AS timestamp)::text")
+            started_at = cursor.fetchone()[0]
+            if tags is None:
+                cursor.execute("SELECT DISTINCT source_tag FROM unified_index")
+                tags = sorted(row[0] for row in cursor.fetchall())
+            cursor.close()
+            connection.rollback()
+
+            added, obsolete = {}, []
+            for tag in tags:
+                entry = manifest["partitions"].get(tag)
+                if entry is None or rebuild:
+                    if entry is not None:
+                        obsolete.extend([f"{entry['file']}.vec", f"{entry['file']}.ids"])
+                        if entry.get("ivf"):
+                            obsolete.append(entry["ivf"]["file"])
+                    entry = {"file": f"p{manifest['next_file']}", "rows": 0, "synced_at": None, "ivf": None}
+                    manifest["next_file"] += 1
+                entry = dict(entry)
+                writer = PartitionWriter(index_dir, entry, manifest["dim"])
+                before = writer.rows
+                try:
+                    copy_vectors(connection, tag, entry["synced_at"], CopyVectorReader(writer.append, manifest["dim"]))
+                    connection.rollback()
+                finally:
+                    entry["rows"] = writer.close()
+                entry["synced_at"] = started_at
+                added[tag] = entry["rows"] - before
+                manifest["partitions"][tag] = entry
+                if needs_ivf(entry, ivf_min_rows):
+                    obsolete.extend(build_ivf(index_dir, manifest, tag))
+                write_manifest(index_dir, manifest)
+        finally:
+            connection.close()
+
+    # Readers that still map the old files keep them until they refresh
+    for name in obsolete:
+        try:
+            os.remove(os.path.join(index_dir, name))
+        except FileNotFoundError:
+            pass
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local dense index for unified_index")
+    parser.add_argument("command", choices=["sync", "rebuild", "stats"])
+    parser.add_argument("--tag", action="append", help="source_tag to sync or rebuild (repeatable); default: all")
+    parser.add_argument("--dir", default=VECTOR_INDEX_DIR)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print(json.dumps(VectorIndex(args.dir).stats(), indent=2))
+        return
+    start = time.perf_counter()
+    added = sync(tags=args.tag, rebuild=args.command == "rebuild", index_dir=args.dir)
+    print(f"[VectorIndex] {args.command}: {added} in {time.perf_counter() - start:.1f}s ({args.dir})")
+
+
+if __name__ == "__main__":
+    main()
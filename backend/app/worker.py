@@ -0,0 +1,183 @@
+"""
+Ingestion worker pool: pulls upload jobs from the Redis queue (see jobs.py)
+and streams them into unified_index.
+
+    python worker.py --processes 4
+
+Every process claims one job at a time, opens its own database sessions and
+reports progress to the job record after each committed chunk. A heartbeat
+thread keeps the job alive in between. It stops between chunks when a cancel
+is requested, and stops without committing when the job was requeued to
+another worker (see jobs.py).
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+
+from jobs import (
+    job_store, COUNTER_FIELDS, FAILED_PREFIX, JOB_HEARTBEAT_SECONDS, STATUS_CANCELLED, STATUS_COMPLETED,
+    STATUS_PENDING,
+)
+
+WORKER_POLL_SECONDS = int(os.getenv("INGEST_WORKER_POLL_SECONDS", 5))
+# Worker process i serves Prometheus metrics on port + i; 0 disables it
+WORKER_METRICS_PORT = int(os.getenv("INGEST_WORKER_METRICS_PORT", 0))
+# Keep the local dense index (vector_index.py) in step with finished uploads;
+# on by default when search uses it
+VECTOR_INDEX_SYNC = os.getenv(
+    "VECTOR_INDEX_SYNC", "true" if os.getenv("DENSE_SEARCH_BACKEND") == "local" else "false"
+).lower() in ("1", "true", "yes")
+
+
+def sync_vector_index(source_tag: str, progress: dict):
+    from vector_index import sync
+
+    # Updated or deleted rows can't be patched into the files in place
+    rebuild = bool(progress.get("updated") or progress.get("deleted"))
+    try:
+        added = sync(tags=[source_tag], rebuild=rebuild)
+        print(f"[VectorIndex] {'Rebuilt' if rebuild else 'Synced'} {source_tag}: +{added.get(source_tag, 0)} rows")
+    except Exception as e:
+        # Search keeps working on the previous files; the next sync catches up
+        print(f"⚠️ Vector index sync failed for {source_tag}: {e}")
+
+
+def keep_alive(store, job_id: str, owner: str, done: threading.Event, lost: threading.Event,
+               interval: float = JOB_HEARTBEAT_SECONDS):
+    # Refresh updated_at until done is set, however long a chunk takes; sets lost once another worker owns the job
+    while not done.wait(interval):
+        try:
+            if not store.heartbeat(job_id, owner):
+                lost.set()
+                return
+        except Exception as e:
+            # A missed heartbeat is retried; the job is only requeued after INGEST_JOB_STALE_SECONDS
+            print(f"⚠️ Heartbeat failed for {job_id}: {e}")
+
+
+def run_job(job_id: str, store=job_store, heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS):
+    from ingest import ingest_file_stream
+
+    job = store.get(job_id)
+    if job is None or job["status"] != STATUS_PENDING:
+        # Cancelled while queued, or expired
+        store.release(job_id)
+        return
+
+    print(f"[Processing Start] ID={job_id}, Source={job['source_tag']}, File={job['filename']}, "
+          f"Offset={job['rows_read']}")
+    owner = store.start(job_id, job["attempts"] + 1)
+    done, lost = threading.Event(), threading.Event()
+    heartbeat = threading.Thread(target=keep_alive, args=(store, job_id, owner, done, lost, heartbeat_seconds),
+                                 daemon=True)
+    heartbeat.start()
+
+    def owned():
+        if not lost.is_set() and not store.owns(job_id, owner):
+            lost.set()
+        return not lost.is_set()
+
+    def report(progress):
+        print(f"[Processing] ID={job_id}, Chunk={progress['chunks']}, "
+              f"Rows read={progress['rows_read']}, Inserted={progress['inserted']}")
+        if not store.update_owned(job_id, owner, **progress):
+            lost.set()
+
+    finished = False
+    try:
+        progress, stopped = ingest_file_stream(
+            job["path"], job["filename"], job["source_tag"], on_progress=report,
+            # Jobs queued before a counter existed don't have it yet
+            progress={name: job.get(name, 0) for name in COUNTER_FIELDS},
+            should_stop=lambda: lost.is_set() or store.is_cancel_requested(job_id), is_owner=owned,
+            mode=job.get("mode", "append"), key_column=job.get("key_column") or None,
+        )
+        if lost.is_set():
+            print(f"[Processing Superseded] ID={job_id}: requeued to another worker, stopped")
+        elif stopped:
+            print(f"[Processing Cancelled] ID={job_id}, Rows read={progress['rows_read']}")
+            if not store.update_owned(job_id, owner, status=STATUS_CANCELLED, **progress):
+                lost.set()
+        else:
+            # A cancel requested after the last chunk is too late: the whole file is in
+            print(f"[Processing Complete] ID={job_id}, Inserted={progress['inserted']}")
+            finished = store.update_owned(job_id, owner, status=STATUS_COMPLETED, **progress)
+            if not finished:
+                lost.set()
+
+    except Exception as e:
+        # The spooled file is kept so the job can be resumed
+        error_msg = f"{FAILED_PREFIX}{str(e)}"
+        print(f"[Processing Failed] ID={job_id}, Error={error_msg}")
+        if not store.update_owned(job_id, owner, status=error_msg, error=str(e)):
+            lost.set()
+
+    finally:
+        done.set()
+        heartbeat.join()
+        # A requeued job's processing entry now belongs to the worker that took it over
+        if not lost.is_set():
+            store.release(job_id)
+
+    # The job stays completed whatever happens here; problems are only logged
+    if finished:
+        try:
+            os.remove(job["path"])
+        except OSError as e:
+            print(f"⚠️ Could not remove spooled file {job['path']}: {e}")
+        if VECTOR_INDEX_SYNC:
+            sync_vector_index(job["source_tag"], progress)
+
+
+def work_forever(store=job_store, poll_seconds=WORKER_POLL_SECONDS, metrics_port=0):
+    from db import engine
+
+    # Never reuse connections inherited from the parent process
+    engine.dispose(close=False)
+    if metrics_port:
+        from metrics import serve
+        serve(metrics_port)
+        print(f"[Worker] pid={os.getpid()} metrics on :{metrics_port}/metrics")
+    print(f"[Worker] pid={os.getpid()} waiting for jobs")
+    while True:
+        for job_id in store.requeue_stale():
+            print(f"[Worker] Re-queued stale job {job_id}")
+        job_id = store.claim(timeout=poll_seconds)
+        if job_id:
+            run_job(job_id, store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ingestion workers")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("INGEST_WORKERS", 2)))
+    parser.add_argument("--metrics-port", type=int, default=WORKER_METRICS_PORT)
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        work_forever(metrics_port=args.metrics_port)
+        return
+
+    def start(i):
+        port = args.metrics_port + i if args.metrics_port else 0
+        process = multiprocessing.Process(target=work_forever, kwargs={"metrics_port": port}, daemon=True)
+        process.start()
+        return process
+
+    processes = [start(i) for i in range(args.processes)]
+    try:
+        # Replace any worker that crashes
+        while True:
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    print(f"[Worker] pid={process.pid} exited with {process.exitcode}, restarting")
+                    processes[i] = start(i)
+            time.sleep(WORKER_POLL_SECONDS)
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
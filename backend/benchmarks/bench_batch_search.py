@@ -0,0 +1,103 @@
+"""
+Benchmark: N single /semantic-search/ calls vs one /semantic-search/batch call.
+
+Starts the stub OpenAI server and the API (as load_search.py does); Postgres
+and Redis must be reachable through DATABASE_URL / REDIS_URL, with some rows
+loaded (e.g. by run_benchmarks.py or seed.py). For each batch size N, these
+run on N distinct queries, with a fresh nonce each time so no result is cached:
+
+- singles, sequential: one request after another, as a script would
+- singles, concurrent: --users clients at once
+- batch, llm: one batch request with the LLM answer per query
+- batch, matches: one batch request with llm=false (ranked matches only)
+- batch, cached: the matches batch again, answered from the result cache
+
+    python benchmarks/bench_batch_search.py --sizes 10,100,500
+    python benchmarks/bench_batch_search.py --url http://127.0.0.1:8000 --sizes 100 --chat-latency 0
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.append(os.path.dirname(__file__))
+
+from load_search import QUERIES, start_api, wait_ready
+from stub_openai import start_stub_server
+
+
+def batch_queries(count: int, nonce: str) -> list:
+    return [f"{QUERIES[i % len(QUERIES)]} {i} {nonce}" for i in range(count)]
+
+
+async def run_singles(url: str, queries: list, users: int) -> float:
+    pending = iter(queries)
+
+    async def user(client):
+        for query in pending:
+            response = await client.post(f"{url}/semantic-search/", params={"query": query})
+            response.raise_for_status()
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(users)))
+        return time.perf_counter() - start
+
+
+def run_batch(url: str, queries: list, llm: bool):
+    """Returns (seconds, the response's stage timings in ms)."""
+    start = time.perf_counter()
+    response = httpx.post(f"{url}/semantic-search/batch", params={"debug": "true"},
+                          json={"queries": queries, "llm": llm}, timeout=600)
+    response.raise_for_status()
+    return time.perf_counter() - start, response.json()["timings"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch vs single semantic search throughput")
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")], default=[10, 100, 500])
+    parser.add_argument("--users", type=int, default=10, help="clients for the concurrent singles run")
+    parser.add_argument("--url", help="use an already running API instead of spawning one")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="stub seconds per embeddings request")
+    args = parser.parse_args()
+
+    server = process = None
+    url = args.url
+    if not url:
+        server, base_url = start_stub_server(request_latency=args.embed_latency, chat_latency=args.chat_latency)
+        process, url = start_api(base_url, args.port)
+
+    try:
+        wait_ready(url)
+        print(f"{'N':>6}  {'run':24}{'seconds':>10}{'queries/s':>12}  batch stages (ms)")
+        for size in args.sizes:
+            runs = [
+                ("singles, sequential", lambda q: (asyncio.run(run_singles(url, q, 1)), {})),
+                (f"singles, {args.users} concurrent", lambda q: (asyncio.run(run_singles(url, q, args.users)), {})),
+                ("batch, llm", lambda q: run_batch(url, q, llm=True)),
+                ("batch, matches", lambda q: run_batch(url, q, llm=False)),
+            ]
+            for name, run in runs:
+                queries = batch_queries(size, f"{name.split(',')[0]}-{time.time_ns()}")
+                seconds, timings = run(queries)
+                stages = " ".join(f"{stage}={ms:.0f}" for stage, ms in timings.items() if stage != "total")
+                print(f"{size:>6}  {name:24}{seconds:>10.2f}{size / seconds:>12.1f}  {stages}")
+                if name == "batch, matches":
+                    seconds, _ = run_batch(url, queries, llm=False)
+                    print(f"{size:>6}  {'batch, cached':24}{seconds:>10.2f}{size / seconds:>12.1f}")
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark: result cache encoding, old format vs the codec layer.
+
+The old format stored json.dumps(result) and read it back with eval(). Each
+configuration below encodes and decodes a realistic /semantic-search/ result
+built from the sample extract; no Redis needed:
+
+    python benchmarks/bench_cache_codec.py --iterations 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from cache import encode_result, decode_result, msgpack, zstandard
+
+DEFAULT_FILE = os.path.join(os.path.dirname(__file__), "../../UploadedFiles/first_1000_records.csv")
+
+
+def sample_result(path, rows):
+    from ingest import serialize_rows
+
+    try:
+        df = pd.read_csv(path, nrows=rows)
+    except UnicodeDecodeError:
+        df = pd.read_csv(path, nrows=rows, encoding="cp1252")
+    texts = serialize_rows(df)
+    context = "\n".join(f"[db{i % 4 + 1}] {text}" for i, text in enumerate(texts))
+    return {
+        "query": "AI contracts in California",
+        "sources": [f"db{i % 4 + 1}" for i in range(len(texts))],
+        "retrieved_context": context,
+        "gpt_response": "\n".join(f"- {text[:200]}" for text in texts),
+    }
+
+
+def time_it(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench(label, encode, decode, result, iterations):
+    raw = encode(result)
+    assert decode(raw) == result
+    encode_us = time_it(lambda: encode(result), iterations)
+    decode_us = time_it(lambda: decode(raw), iterations)
+    print(f"{label:<22} bytes={len(raw):>7} encode={encode_us:8.1f}us decode={decode_us:8.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Result cache codec micro-benchmark")
+    parser.add_argument("--file", default=DEFAULT_FILE)
+    parser.add_argument("--rows", type=int, default=5, help="retrieved rows in the cached result")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    result = sample_result(args.file, args.rows)
+    print(f"Result with {args.rows} retrieved rows, {args.iterations} iterations\n")
+
+    bench("legacy json + eval", json.dumps, eval, result, args.iterations)
+    codecs = ["json"] + (["msgpack"] if msgpack else [])
+    compressions = ["none", "zlib"] + (["zstd"] if zstandard else [])
+    for codec in codecs:
+        for compression in compressions:
+            bench(
+                f"{codec} + {compression}",
+                lambda r, c=codec, z=compression: encode_result(r, codec=c, compression=z, min_bytes=0),
+                decode_result, result, args.iterations
+            )
+    if not msgpack or not zstandard:
+        print("\n(install msgpack / zstandard to include those codecs)")
+
+
+if __name__ == "__main__":
+    main()
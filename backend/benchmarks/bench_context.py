@@ -0,0 +1,183 @@
+"""
+Benchmark: prompt tokens, LLM latency and answer equivalence of the search
+context and LLM modes on a fixed query set.
+
+Variants:
+
+- legacy: the top 5 rows in full (up to 10,000 chars each), extraction call
+  then formatting call (the pipeline before context.py)
+- budgeted: the token-budgeted context, same two calls
+- single: the token-budgeted context, one combined call (SEARCH_LLM_MODE=single)
+
+Rows come from the sample extracts in UploadedFiles/ (SAM entities as db1,
+contract opportunities as db2). For each query, the 5 rows sharing the most
+query terms are taken, so no database is needed. Without --live, only the
+first call's prompt tokens are counted (offline, tiktoken):
+
+    python benchmarks/bench_context.py
+    python benchmarks/bench_context.py --budget 2000 --chunk-tokens 800
+
+With --live, every variant runs against the chat model (OPENAI_API_KEY, or
+OPENAI_BASE_URL pointing at stub_openai.py for latency only). The report adds
+total tokens, latency and how close each variant's answer is to the legacy
+answer: the Jaccard overlap of the field values in the Markdown bullets, and
+whether the same number of results came back.
+
+    python benchmarks/bench_context.py --live --json context.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+sys.path.append(os.path.dirname(__file__))
+
+from corpus import load_sample
+from retrieval import SearchResult
+
+QUERIES = [
+    "AI contracts in California",
+    "construction suppliers in Texas",
+    "janitorial services for the navy",
+    "medical supplies veterans affairs",
+    "software engineering small business",
+    "brake assemblies for defense logistics",
+    "small business set-aside for facility maintenance",
+    "architecture and engineering firms in New Hampshire",
+    "solicitations with a response deadline in March 2025",
+    "telecommunications providers registered in Virginia",
+]
+VARIANTS = ("legacy", "budgeted", "single")
+WORD = re.compile(r"[a-z0-9]+")
+BULLET_VALUE = re.compile(r"^\s*[-*]\s*\*\*[^*]+\*\*\s*:?\s*(.+?)\s*$", re.MULTILINE)
+
+
+def sample_rows() -> list:
+    from ingest import MAX_STORED_CHARS, serialize_rows
+
+    rows = []
+    for tag, schema in (("db1", "sam"), ("db2", "opportunities")):
+        for text in serialize_rows(load_sample(schema)):
+            rows.append((tag, text[:MAX_STORED_CHARS], set(WORD.findall(text.lower()))))
+    return rows
+
+
+def top_rows(rows: list, query: str, limit: int = 5) -> list:
+    terms = set(WORD.findall(query.lower()))
+    scores = [len(terms & words) for _, _, words in rows]
+    best = sorted(range(len(rows)), key=lambda i: (-scores[i], i))[:limit]
+    return [SearchResult(i + 1, rows[i][0], rows[i][1], float(scores[i])) for i in best]
+
+
+def legacy_context(results: list):
+    # The pre-context.py assembly: every row in full, numbered per source
+    source_index = {}
+    chunks = []
+    for doc in results:
+        source_num = source_index.setdefault(doc.source_tag, len(source_index) + 1)
+        chunks.append(f"[{source_num}] {doc.source_text}")
+    return "\n\n".join(chunks)
+
+
+def message_tokens(messages: list) -> int:
+    from utils import get_encoder
+
+    enc = get_encoder()
+    # ~4 tokens of chat framing per message
+    return sum(len(enc.encode(message.content, disallowed_special=())) + 4 for message in messages)
+
+
+def first_call_messages(variant: str, query: str, context: str) -> list:
+    from search import build_answer_messages, build_extraction_messages
+
+    if variant == "single":
+        return build_answer_messages(query, context)
+    return build_extraction_messages(query, context)
+
+
+def answer_values(markdown: str) -> set:
+    return {value.strip("`").lower() for value in BULLET_VALUE.findall(markdown)}
+
+
+def result_count(markdown: str) -> int:
+    return len(re.findall(r"^##\s", markdown, re.MULTILINE))
+
+
+async def run_live(variant: str, query: str, context: str) -> dict:
+    from metrics import record_llm_usage
+    from search import build_formatting_messages
+    from utils import get_chat_llm
+
+    llm = get_chat_llm()
+    usage = {}
+    start = time.perf_counter()
+    reply = await llm.ainvoke(first_call_messages(variant, query, context))
+    record_llm_usage(reply, "first", usage)
+    if variant != "single":
+        reply = await llm.ainvoke(build_formatting_messages(query, reply.content.strip()))
+        record_llm_usage(reply, "format", usage)
+    return {"seconds": time.perf_counter() - start, "usage": usage, "answer": reply.content.strip()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search context and LLM mode benchmark")
+    parser.add_argument("--budget", type=int, help="CONTEXT_TOKEN_BUDGET (default: its env / 3000)")
+    parser.add_argument("--chunk-tokens", type=int, help="CONTEXT_CHUNK_TOKENS (default: its env / 1200)")
+    parser.add_argument("--live", action="store_true", help="call the chat model for latency and answers")
+    parser.add_argument("--json", help="also write per-query results to this file")
+    args = parser.parse_args()
+
+    from context import build_context
+
+    rows = sample_rows()
+    results = []
+    for query in QUERIES:
+        top = top_rows(rows, query)
+        budgeted, _, info = build_context(top, token_budget=args.budget, chunk_tokens=args.chunk_tokens)
+        contexts = {"legacy": legacy_context(top), "budgeted": budgeted, "single": budgeted}
+        entry = {"query": query, "truncated_rows": info["truncated"], "variants": {}}
+        for variant in VARIANTS:
+            entry["variants"][variant] = {
+                "context_chars": len(contexts[variant]),
+                "first_call_prompt_tokens": message_tokens(first_call_messages(variant, query, contexts[variant])),
+            }
+            if args.live:
+                entry["variants"][variant].update(asyncio.run(run_live(variant, query, contexts[variant])))
+        results.append(entry)
+
+    print(f"{len(QUERIES)} queries, 5 rows each\n")
+    print(f"{'variant':10}{'ctx chars':>11}{'call-1 tokens':>15}", end="")
+    print(f"{'total tokens':>14}{'p50 s':>8}{'p99 s':>8}{'calls':>7}{'value overlap':>15}{'same count':>12}"
+          if args.live else "")
+    for variant in VARIANTS:
+        stats = [entry["variants"][variant] for entry in results]
+        line = (f"{variant:10}{np.mean([s['context_chars'] for s in stats]):>11,.0f}"
+                f"{np.mean([s['first_call_prompt_tokens'] for s in stats]):>15,.0f}")
+        if args.live:
+            seconds = [s["seconds"] for s in stats]
+            overlap, same = [], []
+            for entry, s in zip(results, stats):
+                legacy = entry["variants"]["legacy"]["answer"]
+                values, legacy_values = answer_values(s["answer"]), answer_values(legacy)
+                union = values | legacy_values
+                overlap.append(len(values & legacy_values) / len(union) if union else 1.0)
+                same.append(result_count(s["answer"]) == result_count(legacy))
+            line += (f"{np.mean([s['usage'].get('total_tokens', 0) for s in stats]):>14,.0f}"
+                     f"{np.percentile(seconds, 50):>8.2f}{np.percentile(seconds, 99):>8.2f}"
+                     f"{1 if variant == 'single' else 2:>7}{np.mean(overlap):>15.2f}{np.mean(same):>12.0%}")
+        print(line)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: row-at-a-time vs batched embedding of an uploaded extract.
+
+Runs entirely against the local stub server, no OpenAI key needed:
+
+    python benchmarks/bench_embeddings.py --rows 1000
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+sys.path.append(os.path.dirname(__file__))
+
+from stub_openai import start_stub_server, StubOpenAIHandler
+
+DEFAULT_FILE = os.path.join(os.path.dirname(__file__), "../../UploadedFiles/first_1000_records.csv")
+
+
+def load_texts(path, rows):
+    from ingest import serialize_rows
+
+    try:
+        df = pd.read_csv(path)
+    except UnicodeDecodeError:
+        df = pd.read_csv(path, encoding="cp1252")
+    texts = serialize_rows(df)
+    while len(texts) < rows:
+        texts = texts + texts
+    return texts[:rows]
+
+
+def run(label, fn, texts):
+    from embedding_cache import embedding_cache
+
+    # Measure API throughput, not cache hits from the previous run
+    embedding_cache.clear()
+    embedding_cache.client = None
+    StubOpenAIHandler.request_count = 0
+    start = time.perf_counter()
+    fn(texts)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {len(texts):>6} rows  {elapsed:8.2f}s  "
+          f"{len(texts) / elapsed:10.1f} rows/s  {StubOpenAIHandler.request_count:>5} requests")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--file", default=DEFAULT_FILE)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--request-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(request_latency=args.request_latency)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-stub")
+
+    import utils
+
+    utils.get_openai_client.cache_clear()
+    texts = load_texts(args.file, args.rows)
+
+    before = run("per-row", lambda rows: [utils.generate_embedding(t) for t in rows], texts)
+    after = run("batched", utils.generate_embeddings, texts)
+    print(f"speedup      {before / after:.1f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Benchmark: hybrid search with structured metadata filters (metadata.py),
+from broad to highly selective, on a seeded corpus.
+
+Rows are seeded under the bench_db* tags with clustered embeddings and
+synthetic metadata. States are skewed (CA ~12%); there are 20 NAICS sectors
+of 50 codes each, posting dates over two years, and a unique CAGE code per
+row. For every filter case the report has:
+
+- matching: rows that pass the filter, as a share of the corpus
+- p50 / p99: latency of retrieval.hybrid_search with the filter applied
+  before ranking (both legs, all bench tags)
+- recall@k: the filtered dense leg's top k against exact cosine search over
+  the matching rows of each tag
+- post-filter yield: if the top k rows were found first and filtered after,
+  what share would be left (what search could do without the metadata columns)
+
+Needs Postgres (schema from database/db-init.sql or migration 005, reachable
+through DATABASE_URL):
+
+    python benchmarks/bench_filters.py --rows 200000
+    python benchmarks/bench_filters.py --rows 1000000 --iterative-scan relaxed_order --keep
+
+The embeddings are generated in memory (6 KB a row), so 1M rows needs ~8 GB.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+sys.path.append(os.path.dirname(__file__))
+
+from bench_ann import clustered_corpus
+from seed import BENCH_TAGS, clear_rows, percentiles, synthetic_rows
+
+STATES = ["CA", "TX", "FL", "NY", "VA", "MD", "IL", "PA", "OH", "GA", "WA", "NC", "CO", "AZ", "MA", "NH"]
+STATE_WEIGHTS = np.array([12, 9, 7, 7, 6, 6, 5, 5, 4, 4, 4, 4, 3, 3, 3, 1], dtype=float)
+SECTORS = ["11", "21", "22", "23", "31", "32", "33", "42", "44", "48", "51", "52", "53", "54", "56", "61", "62",
+           "71", "72", "81"]
+FIRST_DAY = date(2024, 1, 1)
+DAYS = 730
+
+
+def synthetic_metadata(count: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    sector = rng.integers(0, len(SECTORS), count)
+    return {
+        "state": np.array(STATES)[rng.choice(len(STATES), count, p=STATE_WEIGHTS / STATE_WEIGHTS.sum())],
+        "naics": np.array([f"{SECTORS[s]}{code:04d}" for s, code in zip(sector, rng.integers(0, 50, count) * 10 + 1000)]),
+        "posted_date": rng.integers(0, DAYS, count),
+        "cage": np.array([np.base_repr(i, 36).rjust(5, "0") for i in range(count)]),
+    }
+
+
+def records(meta: dict, rows) -> list:
+    return [
+        {
+            "raw": {"State": meta["state"][i], "NaicsCode": meta["naics"][i], "cage_code": meta["cage"][i]},
+            "state": meta["state"][i], "naics": meta["naics"][i], "agency": None, "uei": None,
+            "cage": meta["cage"][i], "posted_date": FIRST_DAY + timedelta(days=int(meta["posted_date"][i])),
+            "response_deadline": None,
+        }
+        for i in rows
+    ]
+
+
+def filter_cases(meta: dict) -> dict:
+    common_naics = meta["naics"][0]
+    return {
+        "none": {},
+        "state=CA": {"state": "CA"},
+        "naics sector 23": {"naics": "23"},
+        f"naics {common_naics}": {"naics": common_naics},
+        "state=TX + sector 54": {"state": "TX", "naics": "54"},
+        "posted in one month": {"posted_after": date(2025, 3, 1), "posted_before": date(2025, 3, 31)},
+        "cage (one row)": {"cage": meta["cage"][len(meta["cage"]) // 2]},
+    }
+
+
+def filter_mask(meta: dict, filters: dict):
+    mask = np.ones(len(meta["state"]), dtype=bool)
+    for name, value in filters.items():
+        if name == "state":
+            mask &= meta["state"] == value
+        elif name == "naics":
+            mask &= np.char.startswith(meta["naics"].astype(str), value)
+        elif name == "cage":
+            mask &= meta["cage"] == value
+        elif name == "posted_after":
+            mask &= meta["posted_date"] >= (value - FIRST_DAY).days
+        elif name == "posted_before":
+            mask &= meta["posted_date"] <= (value - FIRST_DAY).days
+    return mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metadata-filtered hybrid search benchmark")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=20, help="rows per tag, as SEARCH_CANDIDATES_PER_LEG")
+    parser.add_argument("--keyword", default="construction", help="sparse-leg query text")
+    parser.add_argument("--iterative-scan", default="off", choices=["off", "relaxed_order", "strict_order"])
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    args = parser.parse_args()
+
+    from sqlalchemy import text
+    from ann import AnnConfig, apply_session_settings
+    from bulk_loader import copy_rows
+    from db import SessionLocal
+    from metadata import filter_params, normalize_filters
+    from retrieval import dense_branch_sql, format_vector, hybrid_search
+    from utils import keyword_boost_query
+
+    corpus = clustered_corpus(args.rows + args.queries, args.dim)
+    vectors, queries = corpus[:args.rows], corpus[args.rows:]
+    meta = synthetic_metadata(args.rows)
+    tag_of = np.arange(args.rows) % len(BENCH_TAGS)
+    keyword_query = keyword_boost_query(args.keyword)
+
+    db = SessionLocal()
+    try:
+        clear_rows(db)
+        start = time.perf_counter()
+        ids = np.empty(args.rows, dtype=np.int64)
+        texts, _ = synthetic_rows(args.rows, dim=1)
+        for t, tag in enumerate(BENCH_TAGS):
+            rows = np.where(tag_of == t)[0]
+            ids[rows] = copy_rows(db, tag, [texts[i] for i in rows], vectors[rows], records=records(meta, rows))
+        db.execute(text("ANALYZE unified_index"))
+        db.commit()
+        print(f"Seeded {args.rows} rows in {time.perf_counter() - start:.1f}s")
+        apply_session_settings(db, AnnConfig(iterative_scan=args.iterative_scan))
+
+        print(f"\n{args.queries} queries, top {args.k} per tag, iterative scan {args.iterative_scan}\n")
+        print(f"{'filter':24}{'matching':>10}{'share':>8}{'p50 ms':>9}{'p99 ms':>9}"
+              f"{'recall@' + str(args.k):>11}{'post-filter yield':>19}")
+        for name, raw_filters in filter_cases(meta).items():
+            filters = normalize_filters(raw_filters)
+            mask = filter_mask(meta, filters)
+
+            samples = []
+            for query in queries:
+                began = time.perf_counter()
+                hybrid_search(db, query, keyword_query, limit=5, tags=BENCH_TAGS, filters=filters)
+                samples.append(time.perf_counter() - began)
+
+            # Dense leg alone, filtered and unfiltered, against exact search
+            filtered = text(f"SELECT b.id FROM {dense_branch_sql(0, filter_names=tuple(sorted(filters)))} b")
+            unfiltered = text(f"SELECT b.id FROM {dense_branch_sql(0)} b")
+            recalls, yields = [], []
+            for q, query in enumerate(queries):
+                t = q % len(BENCH_TAGS)
+                rows = np.where((tag_of == t) & mask)[0]
+                params = {"tag_0": BENCH_TAGS[t], "embedding": format_vector(query), "candidates": args.k,
+                          "rerank_candidates": args.k, **filter_params(filters)}
+                found = {row[0] for row in db.execute(filtered, params)}
+                truth = set(ids[rows[np.argsort(-(vectors[rows] @ query))[:args.k]]].tolist())
+                if truth:
+                    recalls.append(len(found & truth) / len(truth))
+                top = [row[0] for row in db.execute(unfiltered, params)]
+                yields.append(np.isin(top, ids[rows]).mean() if top else 0.0)
+
+            stats = percentiles(samples)
+            recall = f"{np.mean(recalls):.3f}" if recalls else "-"
+            print(f"{name:24}{int(mask.sum()):>10,}{mask.mean():>8.2%}{stats['p50_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+                  f"{recall:>11}{np.mean(yields):>19.2%}")
+    finally:
+        if not args.keep:
+            clear_rows(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
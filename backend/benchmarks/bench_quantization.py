@@ -0,0 +1,173 @@
+"""
+Benchmark: index size, dense-leg latency and recall@k of the ANN_QUANTIZATION
+modes (see ann.py): full-precision, halfvec, reduced dimensions and binary,
+each quantized first pass followed by the full-precision rerank.
+
+With Postgres (schema from database/db-init.sql, pgvector >= 0.7, reachable
+through DATABASE_URL), a clustered synthetic corpus is seeded under the
+bench_db* tags and, for every mode, the embedding index is rebuilt and the
+dense branch that hybrid search runs (retrieval.dense_branch_sql) is timed.
+Table and index sizes come from Postgres. The configured index layout is
+restored at the end, so use a benchmark database:
+
+    python benchmarks/bench_quantization.py --rows 100000
+    python benchmarks/bench_quantization.py --rows 100000 --mode halfvec --mode binary --rerank 40 80 160
+
+--local-only runs the same two stages exactly in NumPy. It isolates the
+recall lost to quantization from the recall lost to the ANN graph, and
+reports the bytes each mode stores per vector:
+
+    python benchmarks/bench_quantization.py --local-only --rows 100000
+
+Ground truth is exact cosine top-k per source_tag. Synthetic vectors have no
+Matryoshka structure, so the reduced mode scores lower here than on
+text-embedding-3 embeddings.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+sys.path.append(os.path.dirname(__file__))
+
+from ann import QUANTIZATION_MODES, AnnConfig
+from bench_ann import clustered_corpus
+from seed import BENCH_TAGS, clear_rows, percentiles
+
+
+def bytes_per_vector(mode: str, dim: int, reduced_dims: int) -> float:
+    return {"none": 4 * dim, "halfvec": 2 * dim, "reduced": 4 * reduced_dims, "binary": dim / 8}[mode]
+
+
+def first_pass(vectors, queries, mode: str, reduced_dims: int):
+    """Similarity of every query to every vector on the quantized representation (higher is closer)."""
+    if mode == "halfvec":
+        vectors, queries = vectors.astype(np.float16).astype(np.float32), queries.astype(np.float16).astype(np.float32)
+    elif mode == "reduced":
+        vectors, queries = vectors[:, :reduced_dims], queries[:, :reduced_dims]
+    elif mode == "binary":
+        # Hamming distance is (dim - <sign(x), sign(q)>) / 2, so the sign product ranks the same
+        return np.where(queries > 0, 1.0, -1.0).astype(np.float32) @ np.where(vectors > 0, 1.0, -1.0).astype(np.float32).T
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries @ vectors.T
+
+
+def two_stage(vectors, queries, mode: str, reduced_dims: int, candidates: int, k: int) -> list:
+    """Row positions of the top k after a first pass of candidates rows and an exact rerank."""
+    scores = first_pass(vectors, queries, mode, reduced_dims)
+    candidates = min(candidates, len(vectors))
+    found = []
+    for q, row in enumerate(scores):
+        pool = np.argpartition(-row, candidates - 1)[:candidates]
+        exact = vectors[pool] @ queries[q]
+        found.append(pool[np.argsort(-exact)[:k]])
+    return found
+
+
+def exact_top_k(vectors, queries, k: int) -> list:
+    return [np.argsort(-(vectors @ query))[:k] for query in queries]
+
+
+def recall(found: list, truth: list, k: int) -> float:
+    return float(np.mean([len(set(f.tolist()) & set(t.tolist())) / k for f, t in zip(found, truth)]))
+
+
+def run_local(args, vectors, tag_of, queries):
+    print(f"{'mode':10}{'rerank':>8}{'bytes/vec':>11}{'index MB':>10}{'ms/query':>10}{'recall@' + str(args.k):>11}")
+    truth = {t: exact_top_k(vectors[tag_of == t], queries, args.k) for t in range(len(BENCH_TAGS))}
+    for mode in args.mode or QUANTIZATION_MODES:
+        for candidates in ([args.k] if mode == "none" else args.rerank):
+            samples, recalls = [], []
+            for t in range(len(BENCH_TAGS)):
+                start = time.perf_counter()
+                found = two_stage(vectors[tag_of == t], queries, mode, args.reduced_dims, candidates, args.k)
+                samples.append((time.perf_counter() - start) / len(queries))
+                recalls.append(recall(found, truth[t], args.k))
+            size = bytes_per_vector(mode, args.dim, args.reduced_dims)
+            print(f"{mode:10}{candidates:>8}{size:>11,.0f}{size * len(vectors) / 1e6:>10,.1f}"
+                  f"{sum(samples) * 1000:>10.2f}{np.mean(recalls):>11.3f}")
+
+
+def run_database(args, vectors, tag_of, queries):
+    from sqlalchemy import text
+    from ann import ann_config, apply_session_settings, index_sizes, rebuild_indexes
+    from bulk_loader import copy_rows
+    from db import SessionLocal, engine
+    from retrieval import dense_branch_sql, format_vector
+
+    db = SessionLocal()
+    try:
+        clear_rows(db)
+        ids = np.empty(len(vectors), dtype=np.int64)
+        for t, tag in enumerate(BENCH_TAGS):
+            rows = np.where(tag_of == t)[0]
+            ids[rows] = copy_rows(db, tag, [f"synthetic row {i}" for i in rows], vectors[rows])
+        truth = {t: [ids[tag_of == t][top] for top in exact_top_k(vectors[tag_of == t], queries, args.k)]
+                 for t in range(len(BENCH_TAGS))}
+
+        print(f"{'mode':10}{'rerank':>8}{'build s':>9}{'table MB':>10}{'index MB':>10}"
+              f"{'p50 ms':>9}{'p99 ms':>9}{'recall@' + str(args.k):>11}")
+        for mode in args.mode or QUANTIZATION_MODES:
+            config = AnnConfig(quantization=mode, reduced_dims=args.reduced_dims, partial_tags=[])
+            start = time.perf_counter()
+            rebuild_indexes(engine, config)
+            build = time.perf_counter() - start
+            with engine.connect() as connection:
+                sizes = index_sizes(connection)
+            table_mb = sizes.pop("table") / 1e6
+            index_mb = sum(sizes.values()) / 1e6
+
+            statement = text(f"SELECT b.id FROM {dense_branch_sql(0, config)} b")
+            for candidates in ([args.k] if mode == "none" else args.rerank):
+                # HNSW stops after ef_search rows, so it must cover the rerank candidates
+                apply_session_settings(db, AnnConfig(ef_search=max(ann_config.ef_search, candidates)))
+                samples, recalls = [], []
+                for q, query in enumerate(queries):
+                    t = q % len(BENCH_TAGS)
+                    params = {"tag_0": BENCH_TAGS[t], "embedding": format_vector(query),
+                              "candidates": args.k, "rerank_candidates": candidates}
+                    began = time.perf_counter()
+                    found = np.array([row[0] for row in db.execute(statement, params)])
+                    samples.append(time.perf_counter() - began)
+                    recalls.append(recall([found], [truth[t][q]], args.k))
+                stats = percentiles(samples)
+                print(f"{mode:10}{candidates:>8}{build:>9.1f}{table_mb:>10,.1f}{index_mb:>10,.1f}"
+                      f"{stats['p50_ms']:>9.2f}{stats['p99_ms']:>9.2f}{np.mean(recalls):>11.3f}")
+    finally:
+        if not args.keep:
+            clear_rows(db)
+        db.close()
+        print("[ANN] Restoring the configured index layout")
+        rebuild_indexes(engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized embedding index benchmark")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--mode", action="append", choices=QUANTIZATION_MODES, help="repeatable; default: all")
+    parser.add_argument("--reduced-dims", type=int, default=512)
+    parser.add_argument("--rerank", type=int, nargs="+", default=[40, 80, 160],
+                        help="first-pass candidates per source_tag to rerank (ANN_RERANK_CANDIDATES)")
+    parser.add_argument("--local-only", action="store_true", help="no Postgres: exact two-stage search in NumPy")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    args = parser.parse_args()
+
+    corpus = clustered_corpus(args.rows + args.queries, args.dim)
+    vectors, queries = corpus[:args.rows], corpus[args.rows:]
+    tag_of = np.arange(args.rows) % len(BENCH_TAGS)
+    print(f"{args.rows} rows over {len(BENCH_TAGS)} tags, {args.queries} queries, top {args.k} per tag\n")
+    if args.local_only:
+        run_local(args, vectors, tag_of, queries)
+    else:
+        run_database(args, vectors, tag_of, queries)
+
+
+if __name__ == "__main__":
+    main()
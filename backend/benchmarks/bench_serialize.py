@@ -0,0 +1,107 @@
+"""
+Benchmark: row serialization and tokenization before embedding.
+
+Compares the original per-row path with the current one and checks that both
+produce identical texts and token chunks:
+
+- original: dropna(how="all").drop_duplicates(), then df.iterrows() with
+  str(val).strip() per cell, then tiktoken looked up and run once per text
+- current: serialize_rows (cleaning and serialization in one pass over the
+  values), then token_chunks_batch
+
+The synthetic file resamples rows of the wide SAM extract (122 columns) and
+makes each one unique:
+
+    python benchmarks/bench_serialize.py --rows 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+DEFAULT_FILE = os.path.join(os.path.dirname(__file__), "../../UploadedFiles/first_1000_records.csv")
+
+
+def synthetic_frame(path, rows, seed=0):
+    sample = pd.read_csv(path, dtype=str)
+    rng = np.random.default_rng(seed)
+    df = sample.iloc[rng.integers(0, len(sample), size=rows)].reset_index(drop=True)
+    df[df.columns[0]] = df[df.columns[0]].fillna("") + pd.Series(np.arange(rows)).astype(str)
+    return df
+
+
+def iterrows_texts(df):
+    texts = []
+    for _, row in df.iterrows():
+        combined = " ".join(str(val).strip() for val in row if pd.notna(val)).strip()
+        if not combined or combined.lower() == "nan":
+            continue
+        texts.append(combined)
+    return texts
+
+
+def per_text_token_chunks(text, max_tokens=800):
+    import tiktoken
+    from utils import EMBEDDING_MODEL
+
+    enc = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+    tokens = enc.encode(text)
+    return [(enc.decode(tokens[i:i + max_tokens]), len(tokens[i:i + max_tokens]))
+            for i in range(0, len(tokens), max_tokens)]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Row serialization benchmark")
+    parser.add_argument("--file", default=DEFAULT_FILE)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--chunksize", type=int, default=500, help="ingest chunk size the stages run on")
+    args = parser.parse_args()
+
+    from ingest import serialize_rows
+    from utils import token_chunks_batch
+
+    df = synthetic_frame(args.file, args.rows)
+    print(f"{len(df)} rows x {df.shape[1]} columns, chunks of {args.chunksize}\n")
+    chunks = [df.iloc[i:i + args.chunksize] for i in range(0, len(df), args.chunksize)]
+
+    def run(serialize, tokenize):
+        texts, pieces, times = [], [], [0.0, 0.0]
+        for chunk in chunks:
+            chunk_texts, elapsed = timed(serialize, chunk)
+            times[0] += elapsed
+            chunk_pieces, elapsed = timed(tokenize, chunk_texts)
+            times[1] += elapsed
+            texts += chunk_texts
+            pieces += chunk_pieces
+        return texts, pieces, times
+
+    old_texts, old_pieces, old_times = run(
+        lambda chunk: iterrows_texts(chunk.dropna(how="all").drop_duplicates()),
+        lambda texts: [per_text_token_chunks(text) for text in texts],
+    )
+    new_texts, new_pieces, new_times = run(serialize_rows, token_chunks_batch)
+    assert old_texts == new_texts, "serialized texts differ"
+    assert old_pieces == new_pieces, "token chunks differ"
+
+    old_time, new_time = sum(old_times), sum(new_times)
+    print(f"{'':10}{'serialize':>11}{'tokenize':>11}{'total':>9}{'rows/s':>10}")
+    for label, (serialize, tokenize) in (("original", old_times), ("current", new_times)):
+        print(f"{label:10}{serialize:10.2f}s{tokenize:10.2f}s{serialize + tokenize:8.2f}s"
+              f"{len(df) / (serialize + tokenize):10.0f}")
+    print(f"speedup   serialize {old_times[0] / new_times[0]:.1f}x, tokenize {old_times[1] / new_times[1]:.1f}x")
+    print(f"          total {old_time / new_time:.1f}x (outputs identical)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: cold import time of the backend modules.
+
+Each module is imported in a fresh interpreter with `python -X importtime`,
+which is what every uvicorn worker, ingestion worker and test run pays at
+startup. Reports the median wall time, the slowest third-party packages it loads and
+whether the heavy agent/LLM frameworks were pulled in:
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --module main --max-seconds 4 --json startup.json
+
+With --max-seconds the exit code is 1 when a module's median exceeds the limit,
+so the script can run as a startup regression check.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../app"))
+HEAVY_MODULES = ("crewai", "langchain", "langchain_core", "litellm")
+
+# Prints the top-level modules that ended up loaded, so heavy imports can be reported
+PROBE = "import sys; import {module}; print(' '.join(sorted({{m.split('.')[0] for m in sys.modules}})))"
+
+
+def parse_importtime(stderr: str) -> list:
+    """Return (cumulative_us, module) for each line of -X importtime output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # One separator space, then two spaces of indent per nesting level
+        entries.append((int(cumulative), name[1:].rstrip()))
+    return entries
+
+
+def import_once(module: str, python: str):
+    env = {"OPENAI_API_KEY": "sk-bench", **os.environ}
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-c", PROBE.format(module=module)],
+        cwd=APP_DIR, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    loaded = set(proc.stdout.split())
+    return elapsed, parse_importtime(proc.stderr), loaded
+
+
+def profile(module: str, runs: int, top: int, python: str) -> dict:
+    times, entries, loaded = [], [], set()
+    for _ in range(runs):
+        elapsed, entries, loaded = import_once(module, python)
+        times.append(elapsed)
+
+    # Third-party packages by cumulative time (a package that imports another includes its time)
+    local = {name[:-3] for name in os.listdir(APP_DIR) if name.endswith(".py")}
+    packages = [(us, name.strip()) for us, name in entries
+                if "." not in name.strip() and name.strip() not in local and name.strip() != module]
+    slowest = sorted(packages, reverse=True)[:top]
+    return {
+        "module": module,
+        "median_seconds": round(statistics.median(times), 3),
+        "min_seconds": round(min(times), 3),
+        "slowest_imports": [{"module": name, "seconds": round(us / 1e6, 3)} for us, name in slowest],
+        "heavy_modules": sorted(loaded.intersection(HEAVY_MODULES)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup import-time benchmark")
+    parser.add_argument("--module", action="append", help="module to import (repeatable); default: main, worker, agents")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="slowest third-party packages to list")
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--max-seconds", type=float, help="fail if any module's median import time exceeds this")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    modules = args.module or ["main", "worker", "agents"]
+    results = []
+    for module in modules:
+        result = profile(module, args.runs, args.top, args.python)
+        results.append(result)
+        heavy = ", ".join(result["heavy_modules"]) or "none"
+        print(f"import {module}: median {result['median_seconds']:.2f}s, min {result['min_seconds']:.2f}s "
+              f"over {args.runs} runs; heavy frameworks loaded: {heavy}")
+        for entry in result["slowest_imports"]:
+            print(f"    {entry['seconds']:7.3f}s  {entry['module']}")
+        print()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.max_seconds is not None:
+        slow = [r["module"] for r in results if r["median_seconds"] > args.max_seconds]
+        if slow:
+            print(f"❌ Slower than {args.max_seconds}s: {', '.join(slow)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: /suggestions/ lookups with 1M stored queries, the old set vs the
+prefix index (suggestions.py).
+
+The old endpoint read the whole `cached_queries` set (SMEMBERS) and sorted it
+in Python on every keystroke. The prefix index answers from the per-prefix
+top lists (short prefixes) or a bounded ZRANGEBYLEX scan (longer ones).
+Synthetic queries are a few words from the benchmark vocabulary plus a
+number. Their popularity is Zipf-distributed: popular queries are recorded
+again, as repeat searches would be.
+
+Needs Redis. Use a database with nothing else in it, because the suggest:*
+keys are deleted at the end:
+
+    python benchmarks/bench_suggestions.py --redis-url redis://localhost:6379/15 --queries 1000000
+    python benchmarks/bench_suggestions.py --redis-url redis://localhost:6379/15 --queries 1000000 --skip-legacy
+
+Reports seeding throughput, Redis memory, and lookup latency per prefix length.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+sys.path.append(os.path.dirname(__file__))
+
+from seed import WORDS, percentiles
+
+LEGACY_KEY = "bench:cached_queries"
+BATCH = 10_000
+
+
+def synthetic_queries(count: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    words = np.array(WORDS)
+    lengths = rng.integers(2, 5, count)
+    return [" ".join(rng.choice(words, size=size)) + f" {i}" for i, size in enumerate(lengths)]
+
+
+def used_memory(client) -> int:
+    return int(client.info("memory")["used_memory"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query suggestion lookup benchmark")
+    parser.add_argument("--redis-url", required=True, help="a Redis database reserved for benchmarks")
+    parser.add_argument("--queries", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=500, help="lookups per prefix length")
+    parser.add_argument("--limit", type=int, default=8)
+    parser.add_argument("--zipf", type=float, default=1.3, help="popularity skew of the repeat searches")
+    parser.add_argument("--skip-legacy", action="store_true", help="do not time the SMEMBERS + sort endpoint")
+    args = parser.parse_args()
+
+    import redis
+    from suggestions import SuggestionIndex
+
+    client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    index = SuggestionIndex(client=client, prune_seconds=10 ** 9)
+    queries = synthetic_queries(args.queries)
+    rng = np.random.default_rng(1)
+
+    try:
+        before = used_memory(client)
+        start = time.perf_counter()
+        for offset in range(0, len(queries), BATCH):
+            index.record(queries[offset:offset + BATCH])
+        # Repeat searches: rank r is searched again ~ r^-zipf times as often
+        repeats = rng.zipf(args.zipf, size=len(queries) // 2) - 1
+        repeats = [queries[r] for r in repeats if r < len(queries)]
+        for offset in range(0, len(repeats), BATCH):
+            index.record(repeats[offset:offset + BATCH], stored=False)
+        seeded = time.perf_counter() - start
+        print(f"Recorded {len(queries):,} queries + {len(repeats):,} repeats in {seeded:.1f}s "
+              f"({(len(queries) + len(repeats)) / seeded:,.0f}/s), "
+              f"index memory {(used_memory(client) - before) / 1e6:,.0f} MB")
+
+        if not args.skip_legacy:
+            before = used_memory(client)
+            for offset in range(0, len(queries), BATCH):
+                client.sadd(LEGACY_KEY, *queries[offset:offset + BATCH])
+            print(f"Old cached_queries set: {(used_memory(client) - before) / 1e6:,.0f} MB")
+
+        print(f"\n{'prefix chars':>12}{'p50 ms':>10}{'p99 ms':>10}{'results':>9}  run")
+        for chars in (1, 2, 3, 4, 6, 10):
+            prefixes = [queries[i][:chars] for i in rng.integers(0, len(queries), args.lookups)]
+            samples, found = [], 0
+            for prefix in prefixes:
+                began = time.perf_counter()
+                found += len(index.lookup(prefix, args.limit))
+                samples.append(time.perf_counter() - began)
+            stats = percentiles(samples)
+            print(f"{chars:>12}{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}{found / len(prefixes):>9.1f}  prefix index")
+
+        if not args.skip_legacy:
+            samples = []
+            for _ in range(min(args.lookups, 20)):
+                began = time.perf_counter()
+                sorted(client.smembers(LEGACY_KEY), key=str.lower)
+                samples.append(time.perf_counter() - began)
+            stats = percentiles(samples)
+            print(f"{'any':>12}{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}{len(queries):>9}  old SMEMBERS + sort")
+
+        # Expire one prune batch and time its removal
+        client.zadd("suggest:expiry", {query: 0 for query in queries[:BATCH]}, xx=True)
+        start = time.perf_counter()
+        removed = index.prune(now=1, batch=BATCH)
+        print(f"\nPruned {removed:,} expired queries in {(time.perf_counter() - start) * 1000:.0f} ms")
+    finally:
+        keys = list(client.scan_iter("suggest:*", count=10_000))
+        for offset in range(0, len(keys), BATCH):
+            client.delete(*keys[offset:offset + BATCH])
+        client.delete(LEGACY_KEY)
+
+
+if __name__ == "__main__":
+    main()
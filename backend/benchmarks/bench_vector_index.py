@@ -0,0 +1,204 @@
+"""
+Benchmark: the dense leg on pgvector vs the local memory-mapped index
+(vector_index.py), brute force and IVF, at 100k and 1M rows.
+
+For each size, clustered synthetic embeddings (real embeddings are not
+uniformly spread, and IVF depends on that) are spread over the bench_db*
+tags. Each query asks every tag for its top --k rows, as the dense leg of
+hybrid search does. Recall@k is measured against exact (brute-force) search.
+
+With Postgres (schema from database/db-init.sql, reachable through
+DATABASE_URL), the rows are seeded with COPY, the local index is built from
+the table with vector_index.sync, and pgvector's HNSW index is timed too:
+
+    python benchmarks/bench_vector_index.py --rows 100000 --rows 1000000
+
+--local-only skips Postgres and writes the index files directly:
+
+    python benchmarks/bench_vector_index.py --local-only --rows 100000
+
+1M rows at 1536 dims is a 6 GB file. Brute force reads all of it per batch, so
+it is only fast when the page cache can hold the file.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+sys.path.append(os.path.dirname(__file__))
+
+from seed import BENCH_TAGS, clear_rows, percentiles
+
+CHUNK_ROWS = 20_000
+
+
+def clustered_vectors(count: int, dim: int, seed: int, clusters: int = 2000, spread: float = 0.6):
+    """Yield (offset, vectors) chunks drawn around a fixed set of random centers."""
+    centers = np.random.default_rng(12345).standard_normal((clusters, dim)).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    for offset in range(0, count, CHUNK_ROWS):
+        size = min(CHUNK_ROWS, count - offset)
+        noise = rng.standard_normal((size, dim)).astype(np.float32) * spread
+        yield offset, centers[rng.integers(0, clusters, size)] + noise
+
+
+def query_vectors(count: int, dim: int):
+    # Perturbed copies of corpus-like vectors: near some rows, like real queries
+    _, vectors = next(clustered_vectors(count, dim, seed=999))
+    return vectors
+
+
+def build_local(index_dir: str, rows: int, dim: int, ivf_min_rows: int) -> float:
+    from vector_index import PartitionWriter, build_ivf, needs_ivf, write_manifest
+
+    start = time.perf_counter()
+    manifest = {"dim": dim, "next_file": len(BENCH_TAGS) + 1, "partitions": {}}
+    writers = {}
+    for i, tag in enumerate(BENCH_TAGS):
+        entry = {"file": f"p{i + 1}", "rows": 0, "synced_at": None, "ivf": None}
+        manifest["partitions"][tag] = entry
+        writers[tag] = PartitionWriter(index_dir, entry, dim)
+    for offset, vectors in clustered_vectors(rows, dim, seed=0):
+        ids = np.arange(offset + 1, offset + len(vectors) + 1)
+        for i, tag in enumerate(BENCH_TAGS):
+            writers[tag].append(ids[i::len(BENCH_TAGS)], vectors[i::len(BENCH_TAGS)])
+    for tag, writer in writers.items():
+        manifest["partitions"][tag]["rows"] = writer.close()
+        if needs_ivf(manifest["partitions"][tag], ivf_min_rows):
+            for name in build_ivf(index_dir, manifest, tag):
+                os.remove(os.path.join(index_dir, name))
+    write_manifest(index_dir, manifest)
+    return time.perf_counter() - start
+
+
+def seed_database(db, rows: int, dim: int):
+    from bulk_loader import copy_rows
+    from seed import synthetic_rows
+
+    start = time.perf_counter()
+    for offset, vectors in clustered_vectors(rows, dim, seed=0):
+        texts, _ = synthetic_rows(len(vectors), dim=1, seed=offset)
+        for i, tag in enumerate(BENCH_TAGS):
+            copy_rows(db, tag, texts[i::len(BENCH_TAGS)], vectors[i::len(BENCH_TAGS)])
+    print(f"  seeded {rows} rows in {time.perf_counter() - start:.1f}s")
+
+
+def time_local(index, queries, k: int, ivf: bool, batch: int):
+    saved = {}
+    if not ivf:
+        # Exact search: hide the IVF layers
+        for tag, partition in index.partitions.items():
+            saved[tag], partition.ivf = partition.ivf, None
+    try:
+        samples, results = [], []
+        for start in range(0, len(queries), batch):
+            chunk = queries[start:start + batch]
+            began = time.perf_counter()
+            results.extend(index.search_batch(chunk, BENCH_TAGS, k))
+            samples.extend([(time.perf_counter() - began) / len(chunk)] * len(chunk))
+    finally:
+        for tag, layer in saved.items():
+            index.partitions[tag].ivf = layer
+    return samples, [{tag: [row_id for row_id, _ in hits] for tag, hits in result.items()} for result in results]
+
+
+def time_pgvector(db, queries, k: int):
+    from sqlalchemy import text
+    from retrieval import format_vector
+
+    statement = text(
+        "SELECT id FROM unified_index WHERE source_tag = :tag "
+        "ORDER BY embedding <=> CAST(CAST(:embedding AS text) AS vector) LIMIT :k"
+    )
+    samples, results = [], []
+    for query in queries:
+        embedding = format_vector(query)
+        began = time.perf_counter()
+        result = {tag: [row[0] for row in db.execute(statement, {"tag": tag, "embedding": embedding, "k": k})]
+                  for tag in BENCH_TAGS}
+        samples.append(time.perf_counter() - began)
+        results.append(result)
+    return samples, results
+
+
+def recall(results, exact, k: int) -> float:
+    found = [len(set(result[tag]) & set(truth[tag])) / max(1, min(k, len(truth[tag])))
+             for result, truth in zip(results, exact) for tag in BENCH_TAGS]
+    return float(np.mean(found))
+
+
+def report(name: str, samples, results, exact, k: int):
+    stats = percentiles(samples)
+    print(f"  {name:24}p50 {stats['p50_ms']:8.2f} ms   p99 {stats['p99_ms']:8.2f} ms   "
+          f"recall@{k} {recall(results, exact, k):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pgvector vs local dense index benchmark")
+    parser.add_argument("--rows", type=int, action="append", help="corpus size (repeatable); default: 100k and 1M")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=20, help="rows per tag, as SEARCH_CANDIDATES_PER_LEG")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--batch", type=int, default=16, help="queries per batched local search")
+    parser.add_argument("--ivf-min-rows", type=int, default=50_000, help="partitions this large get an IVF layer")
+    parser.add_argument("--probes", type=int, help="IVF lists scanned per query (VECTOR_INDEX_IVF_PROBES)")
+    parser.add_argument("--local-only", action="store_true", help="no Postgres: write the index files directly")
+    parser.add_argument("--dir", help="index directory (default: a temporary one, removed at the end)")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    args = parser.parse_args()
+
+    import vector_index
+    from vector_index import VectorIndex
+
+    if args.probes:
+        vector_index.VECTOR_INDEX_IVF_PROBES = args.probes
+    queries = query_vectors(args.queries, args.dim)
+    for rows in args.rows or [100_000, 1_000_000]:
+        index_dir = args.dir or tempfile.mkdtemp(prefix="bench_vector_index_")
+        print(f"\n{rows} rows over {len(BENCH_TAGS)} tags, {args.queries} queries, top {args.k} per tag")
+        db = None
+        try:
+            if args.local_only:
+                print(f"  index written in {build_local(index_dir, rows, args.dim, args.ivf_min_rows):.1f}s")
+            else:
+                from db import SessionLocal, engine
+                from vector_index import sync
+
+                db = SessionLocal()
+                clear_rows(db)
+                seed_database(db, rows, args.dim)
+                start = time.perf_counter()
+                sync(engine, tags=BENCH_TAGS, rebuild=True, index_dir=index_dir, ivf_min_rows=args.ivf_min_rows)
+                print(f"  local index synced from Postgres in {time.perf_counter() - start:.1f}s")
+
+            size_mb = sum(os.path.getsize(os.path.join(index_dir, name)) for name in os.listdir(index_dir)) / 1e6
+            print(f"  index files: {size_mb:,.0f} MB")
+            index = VectorIndex(index_dir, refresh_seconds=3600)
+            index.refresh(force=True)
+
+            exact_samples, exact = time_local(index, queries, args.k, ivf=False, batch=1)
+            report("local brute force", exact_samples, exact, exact, args.k)
+            samples, results = time_local(index, queries, args.k, ivf=False, batch=args.batch)
+            report(f"local brute, batch {args.batch}", samples, results, exact, args.k)
+            if any(partition.ivf for partition in index.partitions.values()):
+                samples, results = time_local(index, queries, args.k, ivf=True, batch=1)
+                report("local IVF", samples, results, exact, args.k)
+            if db is not None:
+                samples, results = time_pgvector(db, queries, args.k)
+                report("pgvector (HNSW)", samples, results, exact, args.k)
+        finally:
+            if db is not None:
+                if not args.keep:
+                    clear_rows(db)
+                db.close()
+            if not args.dir:
+                shutil.rmtree(index_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Synthetic upload files modeled on the sample extracts in UploadedFiles/.
+
+Each column is resampled independently from the same column of the sample
+(SAM entity extract: 122 columns; contract opportunities: 47 columns), so
+value lengths, vocabulary and empty-cell rates match the real files while
+every row is a new combination. The first column (the entity / notice id) is
+replaced with a unique id, so no two rows are duplicates:
+
+    python benchmarks/corpus.py --schema sam --size 100k --out /tmp/sam_100k.csv
+    python benchmarks/corpus.py --schema opportunities --rows 25000 --out /tmp/opps.csv
+
+Rows are generated and written in chunks, so 1M-row files do not need 1M rows
+in memory.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+UPLOADS_DIR = os.path.join(os.path.dirname(__file__), "../../UploadedFiles")
+SCHEMAS = {
+    "sam": "first_1000_records.csv",
+    "opportunities": "ContractOpportunities_first1000(in).csv",
+}
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def load_sample(schema: str) -> pd.DataFrame:
+    path = os.path.join(UPLOADS_DIR, SCHEMAS[schema])
+    try:
+        return pd.read_csv(path, dtype=str)
+    except UnicodeDecodeError:
+        return pd.read_csv(path, dtype=str, encoding="cp1252")
+
+
+def synthetic_chunks(schema: str, rows: int, seed: int = 0, chunksize: int = 50_000):
+    """Yield DataFrames with the sample's columns, rows rows in total."""
+    sample = load_sample(schema)
+    columns = {name: sample[name].to_numpy(dtype=object) for name in sample.columns}
+    id_column = sample.columns[0]
+    rng = np.random.default_rng(seed)
+
+    for start in range(0, rows, chunksize):
+        size = min(chunksize, rows - start)
+        chunk = {name: values[rng.integers(0, len(values), size=size)] for name, values in columns.items()}
+        chunk[id_column] = np.array([f"SYN{i:09d}" for i in range(start, start + size)], dtype=object)
+        yield pd.DataFrame(chunk, columns=sample.columns)
+
+
+def write_corpus(schema: str, rows: int, path: str, seed: int = 0) -> str:
+    """Write a synthetic CSV of rows rows to path; returns path."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for i, chunk in enumerate(synthetic_chunks(schema, rows, seed=seed)):
+            chunk.to_csv(f, index=False, header=i == 0)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic upload file")
+    parser.add_argument("--schema", choices=sorted(SCHEMAS), default="sam")
+    parser.add_argument("--size", choices=sorted(SIZES), help="preset row count")
+    parser.add_argument("--rows", type=int, help="explicit row count (overrides --size)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    rows = args.rows or SIZES[args.size or "10k"]
+    start = time.perf_counter()
+    write_corpus(args.schema, rows, args.out, seed=args.seed)
+    size_mb = os.path.getsize(args.out) / 1e6
+    print(f"Wrote {rows} {args.schema} rows ({size_mb:.1f} MB) to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
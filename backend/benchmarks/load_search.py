@@ -0,0 +1,188 @@
+"""
+Load test: concurrent /semantic-search/ requests against local stubs.
+
+Starts the stub OpenAI server, launches the API with uvicorn pointed at it and
+fires requests from --users concurrent clients. Postgres and Redis must be
+reachable through DATABASE_URL / REDIS_URL (e.g. `docker compose up -d postgres redis`).
+
+    python benchmarks/load_search.py --users 50 --requests 1000
+
+Use --url to load an already running server instead (its OPENAI_BASE_URL must
+point at a stub, see stub_openai.py). Every request uses a distinct query so the
+result cache is not hit, unless --repeat is given.
+
+--pool-sizes runs the same load once per search pool size (SEARCH_DB_POOL_SIZE,
+with --max-overflow extra connections) and prints throughput, latency and how
+many Postgres connections each run opened:
+
+    python benchmarks/load_search.py --users 100 --requests 2000 --pool-sizes 5,10,20,40 --max-overflow 0
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import re
+import time
+
+import httpx
+
+sys.path.append(os.path.dirname(__file__))
+
+from seed import percentiles
+from stub_openai import start_stub_server
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../app"))
+QUERIES = [
+    "AI contracts in California",
+    "construction suppliers in Texas",
+    "janitorial services for the navy",
+    "medical supplies veterans affairs",
+    "software engineering small business",
+]
+
+
+async def run_load(url, users, total, repeat, nonce="", debug=False):
+    """
+    Send total searches from users concurrent clients.
+
+    Returns (elapsed, latency samples, status counts, per-request stage timings).
+    nonce is appended to every query so separate runs don't hit each other's
+    cached results; debug=True asks the API for its per-stage timings.
+    """
+    samples, statuses, timings = [], {}, []
+    counter = iter(range(total))
+
+    async def user(client):
+        for i in counter:
+            query = QUERIES[i % len(QUERIES)] if repeat else f"{QUERIES[i % len(QUERIES)]} {i}"
+            params = {"query": f"{query} {nonce}".strip()}
+            if debug:
+                params["debug"] = "true"
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/semantic-search/", params=params)
+                status = response.status_code
+                if debug and status == 200:
+                    timings.append(response.json().get("timings", {}))
+            except httpx.HTTPError as err:
+                status = type(err).__name__
+            samples.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(users)))
+        elapsed = time.perf_counter() - start
+    return elapsed, samples, statuses, timings
+
+
+def wait_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{url}/docs", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"API at {url} did not become ready")
+
+
+def start_api(base_url, port, workers=1, env=None):
+    """
+    Launch the API with uvicorn, its OpenAI client pointed at base_url; returns (process, url).
+
+    env adds or overrides environment variables, e.g. the DB pool settings.
+    """
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-stub"),
+               **(env or {}))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=APP_DIR, env=env
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def pool_connects(url, engine="async") -> int:
+    """Connections the API's pool has opened so far, from /metrics (single worker only)."""
+    body = httpx.get(f"{url}/metrics", timeout=10).text
+    match = re.search(rf'^db_pool_events_total{{engine="{engine}",event="connect"}} (\S+)$', body, re.MULTILINE)
+    return int(float(match.group(1))) if match else 0
+
+
+def sweep_pool_sizes(base_url, args):
+    """One API process and one load run per pool size; returns a list of result dicts."""
+    results = []
+    for size in args.pool_sizes:
+        env = {"SEARCH_DB_POOL_SIZE": str(size), "SEARCH_DB_MAX_OVERFLOW": str(args.max_overflow)}
+        process, url = start_api(base_url, args.port, args.workers, env=env)
+        try:
+            wait_ready(url)
+            elapsed, samples, statuses, _ = asyncio.run(
+                run_load(url, args.users, args.requests, args.repeat, nonce=f"pool{size}-{time.time_ns()}")
+            )
+            stats = percentiles(samples)
+            results.append({"pool_size": size, "max_overflow": args.max_overflow, "rps": args.requests / elapsed,
+                            **stats, "connects": pool_connects(url), "statuses": statuses})
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(f"\nusers={args.users} requests={args.requests} workers={args.workers}")
+    print(f"{'pool':>6}{'overflow':>10}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'connects':>10}  statuses")
+    for r in results:
+        print(f"{r['pool_size']:>6}{r['max_overflow']:>10}{r['rps']:>10.1f}{r['p50_ms']:>10.0f}"
+              f"{r['p99_ms']:>10.0f}{r['connects']:>10}  {r['statuses']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent semantic search load test")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--url", help="load an already running API instead of spawning one")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--repeat", action="store_true", help="cycle a few queries (exercises the cache)")
+    parser.add_argument("--pool-sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        help="comma-separated search pool sizes to compare, e.g. 5,10,20")
+    parser.add_argument("--max-overflow", type=int, default=0, help="SEARCH_DB_MAX_OVERFLOW for --pool-sizes")
+    args = parser.parse_args()
+
+    if args.pool_sizes:
+        if args.url:
+            parser.error("--pool-sizes starts its own API processes; drop --url")
+        server, base_url = start_stub_server(chat_latency=args.chat_latency)
+        try:
+            sweep_pool_sizes(base_url, args)
+        finally:
+            server.shutdown()
+        return
+
+    server = process = None
+    url = args.url
+    if not url:
+        server, base_url = start_stub_server(chat_latency=args.chat_latency)
+        process, url = start_api(base_url, args.port, args.workers)
+
+    try:
+        wait_ready(url)
+        elapsed, samples, statuses, _ = asyncio.run(run_load(url, args.users, args.requests, args.repeat))
+        stats = percentiles(samples)
+        print(f"users={args.users} requests={args.requests} elapsed={elapsed:.1f}s "
+              f"rps={args.requests / elapsed:.1f} p50={stats['p50_ms']:.0f}ms p99={stats['p99_ms']:.0f}ms "
+              f"statuses={statuses}")
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Replay a query log through the semantic result cache.
+
+Offline mode embeds every query in the log and replays it through an
+in-process SemanticCache at several thresholds. It reports the hit rate and
+mean similarity at each one, and lists the matched pairs at --show so false
+positives can be checked by eye. Real embeddings are needed for paraphrases to
+match (OPENAI_API_KEY), so the stub server only exercises exact repeats:
+
+    python benchmarks/replay_semantic_cache.py --log queries.txt --thresholds 0.9,0.93,0.95,0.97
+
+Live mode replays the log against a running API and measures what hits
+actually save, (mean miss latency - mean hit latency) x hits:
+
+    python benchmarks/replay_semantic_cache.py --log queries.txt --url http://localhost:8000
+
+The log holds one query per line. Without --log, a small built-in log of
+paraphrased queries is used.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+sys.path.append(os.path.dirname(__file__))
+
+from seed import percentiles
+
+SAMPLE_LOG = [
+    "AI contracts in California",
+    "AI contracts in CA",
+    "ai contract california",
+    "artificial intelligence contracts california",
+    "construction suppliers in Texas",
+    "Texas construction suppliers",
+    "janitorial services for the navy",
+    "navy janitorial services",
+    "medical supplies veterans affairs",
+    "VA medical supplies",
+    "software engineering small business",
+    "small business software engineering",
+    "construction suppliers in Virginia",
+    "AI contracts in California",
+]
+
+
+def load_log(path):
+    if not path:
+        return list(SAMPLE_LOG)
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def replay_offline(queries, thresholds, show):
+    from semantic_cache import SemanticCache
+    from utils import generate_embeddings
+
+    start = time.perf_counter()
+    embeddings = generate_embeddings(queries)
+    print(f"Embedded {len(queries)} queries in {time.perf_counter() - start:.1f}s\n")
+
+    for threshold in thresholds:
+        cache = SemanticCache(threshold=threshold, client=None)
+        exact, pairs = set(), []
+        lookup_times = []
+        for query, embedding in zip(queries, embeddings):
+            if query in exact:
+                continue  # answered by the exact-match tier
+            t0 = time.perf_counter()
+            match = cache.lookup(embedding)
+            lookup_times.append(time.perf_counter() - t0)
+            if match:
+                pairs.append((query, match))
+            else:
+                cache.add(query, embedding)
+                exact.add(query)
+        stats = cache.stats()
+        exact_hits = len(queries) - len(lookup_times)
+        print(f"threshold={threshold:.3f} exact_hits={exact_hits} semantic_hits={stats['hits']} "
+              f"misses={stats['misses']} hit_rate={(exact_hits + stats['hits']) / len(queries):.1%} "
+              f"mean_similarity={stats['mean_similarity']:.4f} "
+              f"lookup_p50={percentiles(lookup_times)['p50_ms']:.3f}ms")
+        if threshold == show:
+            for query, match in pairs:
+                print(f"    {match.similarity:.4f}  {query!r} -> {match.query!r}")
+
+
+async def replay_live(url, queries):
+    hits, misses, similarities = [], [], []
+    async with httpx.AsyncClient(timeout=120) as client:
+        for query in queries:
+            start = time.perf_counter()
+            response = await client.post(f"{url}/semantic-search/", params={"query": query})
+            elapsed = time.perf_counter() - start
+            data = response.json()
+            if data.get("cached"):
+                hits.append(elapsed)
+                if "semantic_match" in data:
+                    similarities.append(data["semantic_match"]["similarity"])
+                    print(f"    {data['semantic_match']['similarity']:.4f}  {query!r} -> "
+                          f"{data['semantic_match']['query']!r}")
+            else:
+                misses.append(elapsed)
+
+    print(f"\nqueries={len(queries)} hits={len(hits)} (semantic {len(similarities)}) misses={len(misses)} "
+          f"hit_rate={len(hits) / len(queries):.1%}")
+    if hits and misses:
+        hit_ms, miss_ms = percentiles(hits)["mean_ms"], percentiles(misses)["mean_ms"]
+        print(f"mean hit={hit_ms:.0f}ms mean miss={miss_ms:.0f}ms "
+              f"latency saved={(miss_ms - hit_ms) * len(hits) / 1000:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Semantic cache replay benchmark")
+    parser.add_argument("--log", help="query log, one query per line")
+    parser.add_argument("--thresholds", default="0.90,0.93,0.95,0.97")
+    parser.add_argument("--show", type=float, default=0.95, help="print matched pairs at this threshold")
+    parser.add_argument("--url", help="replay against a running API instead")
+    args = parser.parse_args()
+
+    queries = load_log(args.log)
+    if args.url:
+        asyncio.run(replay_live(args.url, queries))
+    else:
+        thresholds = [float(t) for t in args.thresholds.split(",")]
+        replay_offline(queries, thresholds, args.show)
+
+
+if __name__ == "__main__":
+    main()
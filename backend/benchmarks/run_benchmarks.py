@@ -0,0 +1,274 @@
+"""
+Benchmark suite: ingest and search scenarios against the stub OpenAI server,
+with JSON results that can be compared between commits.
+
+Needs Postgres (schema from database/db-init.sql) and Redis, reachable through
+DATABASE_URL / REDIS_URL, e.g. `docker compose up -d postgres redis`. Use a
+scratch database: the ingest scenario writes into --source-tag, and only the
+rows it inserted are deleted afterwards (unless --keep).
+
+    python benchmarks/run_benchmarks.py --size 10k --out results-$(git rev-parse --short HEAD).json
+    python benchmarks/run_benchmarks.py --scenario cold_search --scenario concurrent_search --users 100
+    python benchmarks/run_benchmarks.py compare results-old.json results-new.json
+
+Scenarios:
+
+- ingest: a synthetic --schema/--size file (see corpus.py) through
+  ingest_file_stream, in this process. Reports rows/s, per-stage seconds and
+  embedding API usage.
+- cold_search: one client, every query new (nothing cached).
+- warm_search: one client repeating a few queries that were answered once
+  beforehand, so requests are served from the result cache.
+- concurrent_search: --users clients, every query new.
+
+Search scenarios run the API under uvicorn and ask it for per-request stage
+timings (debug=true); --search-pool-size sets its search DB pool size
+(load_search.py --pool-sizes compares several). Token totals and an estimated
+cost at the --*-price rates come from the stub's usage counters.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+sys.path.append(os.path.dirname(__file__))
+
+from corpus import SCHEMAS, SIZES, write_corpus
+from load_search import QUERIES, run_load, start_api, wait_ready
+from seed import percentiles
+from stub_openai import StubOpenAIHandler, start_stub_server
+
+SCENARIOS = ("ingest", "cold_search", "warm_search", "concurrent_search")
+# Higher is better for these; for everything else (latencies, seconds, tokens) lower is better
+HIGHER_IS_BETTER = ("rows_per_second", "rps")
+
+
+def git_revision() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def stub_usage(args) -> dict:
+    usage = dict(StubOpenAIHandler.usage)
+    usage["estimated_cost_usd"] = round(
+        usage["embedding_tokens"] * args.embedding_price / 1e6
+        + usage["prompt_tokens"] * args.prompt_price / 1e6
+        + usage["completion_tokens"] * args.completion_price / 1e6, 6
+    )
+    return usage
+
+
+def stage_totals(pipeline: str) -> dict:
+    from metrics import stage_seconds
+
+    return {key[1]: series[-2] for key, series in stage_seconds.series.items() if key[0] == pipeline}
+
+
+def run_ingest(args) -> dict:
+    from sqlalchemy import text
+    from db import SessionLocal
+    from ingest import ingest_file_stream
+
+    corpus = args.corpus
+    if not corpus:
+        corpus = os.path.join(tempfile.gettempdir(), f"bench_{args.schema}_{args.size}.csv")
+        if not os.path.exists(corpus):
+            print(f"Generating {SIZES[args.size]} {args.schema} rows into {corpus}")
+            write_corpus(args.schema, SIZES[args.size], corpus)
+
+    db = SessionLocal()
+    try:
+        last_id = db.execute(text("SELECT coalesce(max(id), 0) FROM unified_index")).scalar()
+    finally:
+        db.close()
+
+    StubOpenAIHandler.reset_counters()
+    stages_before = stage_totals("ingest")
+    start = time.perf_counter()
+    progress, _ = ingest_file_stream(corpus, os.path.basename(corpus), args.source_tag, chunksize=args.chunksize)
+    elapsed = time.perf_counter() - start
+    stages = {name: round(total - stages_before.get(name, 0.0), 3) for name, total in stage_totals("ingest").items()}
+
+    if not args.keep:
+        db = SessionLocal()
+        try:
+            db.execute(text("DELETE FROM unified_index WHERE source_tag = :tag AND id > :last_id"),
+                       {"tag": args.source_tag, "last_id": last_id})
+            db.commit()
+        finally:
+            db.close()
+
+    return {
+        "corpus": os.path.basename(corpus),
+        "rows_read": progress["rows_read"],
+        "inserted": progress["inserted"],
+        "cached_embeddings": progress["cached_embeddings"],
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(progress["rows_read"] / elapsed, 1),
+        "stage_seconds": stages,
+        "usage": stub_usage(args),
+    }
+
+
+def summarize_search(elapsed, samples, statuses, timings, args) -> dict:
+    stages = {}
+    for name in sorted({name for entry in timings for name in entry}):
+        values = [entry[name] for entry in timings if name in entry]
+        stages[name] = {"p50_ms": round(float(np.percentile(values, 50)), 2),
+                        "p99_ms": round(float(np.percentile(values, 99)), 2)}
+    return {
+        "requests": len(samples),
+        "seconds": round(elapsed, 3),
+        "rps": round(len(samples) / elapsed, 2),
+        **{name: round(value, 2) for name, value in percentiles(samples).items()},
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "stage_ms": stages,
+        "usage": stub_usage(args),
+    }
+
+
+def run_search_scenario(name, url, args) -> dict:
+    # A per-run suffix keeps queries from hitting results cached by earlier runs
+    nonce = f"run{time.time_ns()}"
+    if name == "warm_search":
+        asyncio.run(run_load(url, 1, len(QUERIES), True, nonce=nonce))
+        StubOpenAIHandler.reset_counters()
+        result = asyncio.run(run_load(url, 1, args.requests, True, nonce=nonce, debug=True))
+    elif name == "cold_search":
+        StubOpenAIHandler.reset_counters()
+        result = asyncio.run(run_load(url, 1, args.requests, False, nonce=nonce, debug=True))
+    else:
+        StubOpenAIHandler.reset_counters()
+        result = asyncio.run(run_load(url, args.users, args.concurrent_requests, False, nonce=nonce, debug=True))
+    return summarize_search(*result, args)
+
+
+def run_suite(args) -> dict:
+    server, base_url = start_stub_server(
+        request_latency=args.request_latency, input_latency=args.input_latency, chat_latency=args.chat_latency,
+        token_latency=args.token_latency, completion_tokens=args.completion_tokens
+    )
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-stub")
+
+    scenarios = args.scenario or list(SCENARIOS)
+    results = {}
+    process = None
+    try:
+        if "ingest" in scenarios:
+            print("▶ ingest")
+            results["ingest"] = run_ingest(args)
+        search = [name for name in scenarios if name != "ingest"]
+        if search:
+            env = {"SEARCH_DB_POOL_SIZE": str(args.search_pool_size)} if args.search_pool_size else None
+            process, url = start_api(base_url, args.port, args.workers, env=env)
+            wait_ready(url)
+            for name in search:
+                print(f"▶ {name}")
+                results[name] = run_search_scenario(name, url, args)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        server.shutdown()
+
+    return {
+        **git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {name: value for name, value in vars(args).items() if name not in ("command", "out")},
+        "scenarios": results,
+    }
+
+
+def flatten(values: dict, prefix: str = "") -> dict:
+    flat = {}
+    for name, value in values.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"old {old.get('commit', '?')[:10]}  ->  new {new.get('commit', '?')[:10]}\n")
+
+    for scenario in sorted(set(old["scenarios"]) & set(new["scenarios"])):
+        before, after = flatten(old["scenarios"][scenario]), flatten(new["scenarios"][scenario])
+        print(scenario)
+        for name in sorted(set(before) & set(after)):
+            if name.startswith("statuses.") or before[name] == after[name] == 0:
+                continue
+            change = (after[name] - before[name]) / before[name] * 100 if before[name] else float("inf")
+            better = (change > 0) == name.endswith(HIGHER_IS_BETTER)
+            marker = "" if abs(change) < 5 else (" ✅" if better else " ⚠️")
+            print(f"  {name:45}{before[name]:>14,.2f}{after[name]:>14,.2f}{change:>+9.1f}%{marker}")
+        print()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+        parser.add_argument("command")
+        parser.add_argument("old")
+        parser.add_argument("new")
+        args = parser.parse_args()
+        compare(args.old, args.new)
+        return
+
+    parser = argparse.ArgumentParser(description="Ingest and search benchmark suite")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="repeatable; default: all")
+    parser.add_argument("--out", help="write the JSON results here")
+    # Ingest
+    parser.add_argument("--schema", choices=sorted(SCHEMAS), default="sam")
+    parser.add_argument("--size", choices=sorted(SIZES), default="10k")
+    parser.add_argument("--corpus", help="ingest this file instead of a generated one")
+    parser.add_argument("--source-tag", default="db1")
+    parser.add_argument("--chunksize", type=int)
+    parser.add_argument("--keep", action="store_true", help="keep the ingested rows")
+    # Search
+    parser.add_argument("--requests", type=int, default=50, help="requests for cold and warm search")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrent-requests", type=int, default=500)
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--search-pool-size", type=int, help="SEARCH_DB_POOL_SIZE for the API (default: its env)")
+    # Stub OpenAI latency and pricing (USD per 1M tokens)
+    parser.add_argument("--request-latency", type=float, default=0.05)
+    parser.add_argument("--input-latency", type=float, default=0.0005)
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--completion-tokens", type=int, default=150)
+    parser.add_argument("--embedding-price", type=float, default=0.02)
+    parser.add_argument("--prompt-price", type=float, default=2.50)
+    parser.add_argument("--completion-price", type=float, default=10.00)
+    args = parser.parse_args()
+
+    results = run_suite(args)
+    print(json.dumps(results["scenarios"], indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
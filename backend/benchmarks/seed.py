@@ -0,0 +1,67 @@
+"""
+Helpers for seeding unified_index with synthetic rows for database benchmarks.
+
+Seeded rows use their own source tags (bench_db1..bench_db4) so they can be
+removed afterwards without touching real data.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+BENCH_TAGS = ["bench_db1", "bench_db2", "bench_db3", "bench_db4"]
+
+WORDS = (
+    "construction software engineering services supplies medical janitorial logistics "
+    "consulting research security training maintenance aircraft vehicle fuel furniture "
+    "california texas virginia maryland florida navy army airforce veterans smallbusiness "
+    "contract solicitation award agency office department naics psc cage uei"
+).split()
+
+
+def percentiles(samples: list) -> dict:
+    arr = np.asarray(samples) * 1000
+    return {"p50_ms": float(np.percentile(arr, 50)), "p99_ms": float(np.percentile(arr, 99)),
+            "mean_ms": float(arr.mean())}
+
+
+def synthetic_rows(count: int, dim: int = 1536, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    words = np.array(WORDS)
+    texts = [" ".join(rng.choice(words, size=24)) + f" record {i}" for i in range(count)]
+    embeddings = rng.standard_normal((count, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return texts, embeddings
+
+
+def seed_rows(db, count: int, dim: int = 1536, seed: int = 0, batch_size: int = 5000) -> int:
+    """Insert count synthetic rows spread evenly over BENCH_TAGS."""
+    from bulk_loader import copy_rows
+
+    start = time.perf_counter()
+    inserted = 0
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        texts, embeddings = synthetic_rows(size, dim=dim, seed=seed + offset)
+        for i, tag in enumerate(BENCH_TAGS):
+            inserted += len(copy_rows(db, tag, texts[i::len(BENCH_TAGS)], embeddings[i::len(BENCH_TAGS)]))
+    print(f"Seeded {inserted} rows in {time.perf_counter() - start:.1f}s")
+    return inserted
+
+
+def clear_rows(db):
+    from sqlalchemy import text
+
+    db.execute(text("DELETE FROM unified_index WHERE source_tag = ANY(:tags)"), {"tags": BENCH_TAGS})
+    db.commit()
+
+
+def random_queries(count: int, dim: int = 1536, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    keywords = [" & ".join(f"{w}:*" for w in rng.choice(WORDS, size=2, replace=False)) for _ in range(count)]
+    return list(zip(vectors, keywords))
@@ -0,0 +1,170 @@
+"""
+Local stand-in for the OpenAI embeddings and chat completions endpoints,
+used by the benchmarks and load tests.
+
+Start it in-process with `start_stub_server()` and point the OpenAI client at it
+through OPENAI_BASE_URL. Vectors are deterministic (seeded from a hash of the
+input) so repeated runs produce identical results.
+
+Latency is modelled per request, per embedding input and per chat completion
+token (time to first token plus generation time). Token counts are estimated
+at 4 characters per token, reported in each response's `usage` and totalled
+in `StubOpenAIHandler.usage`, so benchmarks can also report what a run would
+have cost.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBEDDING_DIM = 1536
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dim)
+    return (vec / np.linalg.norm(vec)).tolist()
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def fake_completion(prompt: str, completion_tokens: int = 0) -> str:
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+    answer = f"## Result 1\n- **Title**: Stub answer {digest}\n- **Agency**: Stub Agency"
+    # Pad to roughly completion_tokens tokens
+    filler = completion_tokens - estimate_tokens(answer)
+    if filler > 0:
+        answer += "\n- **Notes**: " + " ".join(["filler"] * (filler * 4 // 7))
+    return answer
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    # Seconds added per request and per input, to mimic network + model time
+    request_latency = 0.05
+    input_latency = 0.0005
+    chat_latency = 0.5
+    # Seconds per generated token, and the answer length in tokens
+    token_latency = 0.0
+    completion_tokens = 0
+    request_count = 0
+    usage = {"embedding_requests": 0, "embedding_inputs": 0, "embedding_tokens": 0,
+             "chat_requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    lock = threading.Lock()
+
+    @classmethod
+    def reset_counters(cls):
+        with cls.lock:
+            cls.request_count = 0
+            for name in cls.usage:
+                cls.usage[name] = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        with StubOpenAIHandler.lock:
+            StubOpenAIHandler.request_count += 1
+
+        if self.path.endswith("/embeddings"):
+            inputs = payload.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            tokens = sum(estimate_tokens(text) for text in inputs)
+            with StubOpenAIHandler.lock:
+                StubOpenAIHandler.usage["embedding_requests"] += 1
+                StubOpenAIHandler.usage["embedding_inputs"] += len(inputs)
+                StubOpenAIHandler.usage["embedding_tokens"] += tokens
+            time.sleep(self.request_latency + self.input_latency * len(inputs))
+            self._send_json({
+                "object": "list",
+                "model": payload.get("model"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(text)}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+        elif self.path.endswith("/chat/completions"):
+            messages = payload.get("messages", [{}])
+            prompt = "\n".join(message.get("content", "") for message in messages)
+            content = fake_completion(messages[-1].get("content", ""), self.completion_tokens)
+            prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(content)
+            with StubOpenAIHandler.lock:
+                StubOpenAIHandler.usage["chat_requests"] += 1
+                StubOpenAIHandler.usage["prompt_tokens"] += prompt_tokens
+                StubOpenAIHandler.usage["completion_tokens"] += completion_tokens
+            time.sleep(self.chat_latency + self.token_latency * completion_tokens)
+            self._send_json({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+
+def start_stub_server(host="127.0.0.1", port=0, request_latency=None, input_latency=None, chat_latency=None,
+                      token_latency=None, completion_tokens=None):
+    """Run the stub server on a daemon thread and return (server, base_url)."""
+    if request_latency is not None:
+        StubOpenAIHandler.request_latency = request_latency
+    if input_latency is not None:
+        StubOpenAIHandler.input_latency = input_latency
+    if chat_latency is not None:
+        StubOpenAIHandler.chat_latency = chat_latency
+    if token_latency is not None:
+        StubOpenAIHandler.token_latency = token_latency
+    if completion_tokens is not None:
+        StubOpenAIHandler.completion_tokens = completion_tokens
+
+    server = ThreadingHTTPServer((host, port), StubOpenAIHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the stub OpenAI server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--request-latency", type=float, default=0.05)
+    parser.add_argument("--input-latency", type=float, default=0.0005)
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="seconds to first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per generated token")
+    parser.add_argument("--completion-tokens", type=int, default=0, help="pad answers to about this many tokens")
+    args = parser.parse_args()
+
+    server, url = start_stub_server(
+        port=args.port, request_latency=args.request_latency, input_latency=args.input_latency,
+        chat_latency=args.chat_latency, token_latency=args.token_latency, completion_tokens=args.completion_tokens
+    )
+    print(f"Stub OpenAI server listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
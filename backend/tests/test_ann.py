@@ -0,0 +1,88 @@
+import sys
+import os
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from ann import AnnConfig, index_definitions, rebuild_indexes, session_settings
+
+# ✅ Test: HNSW layout with per-source partial indexes
+def test_hnsw_index_definitions():
+    config = AnnConfig(index_type="hnsw", m=24, ef_construction=100, partial_tags=["db1", "db2"])
+    ddl = index_definitions(config)
+
+    assert list(ddl) == ["unified_idx_embedding", "unified_idx_embedding_db1", "unified_idx_embedding_db2"]
+    assert "USING hnsw" in ddl["unified_idx_embedding"]
+    assert "m = 24, ef_construction = 100" in ddl["unified_idx_embedding"]
+    assert ddl["unified_idx_embedding_db2"].endswith("WHERE source_tag = 'db2'")
+
+# ✅ Test: IVFFlat lists follow the row count unless set explicitly
+def test_ivfflat_lists_from_row_count():
+    assert AnnConfig(index_type="ivfflat").ivfflat_lists(50_000) == 50
+    assert AnnConfig(index_type="ivfflat").ivfflat_lists(4_000_000) == 2000
+    assert AnnConfig(index_type="ivfflat", lists=7).ivfflat_lists(50_000) == 7
+    assert "lists = 50" in index_definitions(AnnConfig(index_type="ivfflat"), row_count=50_000)["unified_idx_embedding"]
+
+# ✅ Test: query-time settings include iterative scans only when enabled
+def test_session_settings():
+    assert session_settings(AnnConfig(ef_search=80, probes=4)) == [
+        "SET hnsw.ef_search = 80",
+        "SET ivfflat.probes = 4",
+    ]
+    assert "SET hnsw.iterative_scan = relaxed_order" in session_settings(AnnConfig(iterative_scan="relaxed_order"))
+
+# ✅ Test: invalid settings are rejected
+def test_invalid_config():
+    with pytest.raises(ValueError):
+        AnnConfig(index_type="flat")
+    with pytest.raises(ValueError):
+        index_definitions(AnnConfig(partial_tags=["db1'; DROP TABLE x; --"]))
+
+# ✅ Test: quantized modes index an expression of the full embedding with the matching operator class
+def test_quantized_index_definitions():
+    halfvec = index_definitions(AnnConfig(quantization="halfvec"))["unified_idx_embedding"]
+    assert "USING hnsw ((embedding::halfvec(1536)) halfvec_cosine_ops)" in halfvec
+    reduced = index_definitions(AnnConfig(quantization="reduced", reduced_dims=256, partial_tags=["db1"]))
+    assert "((subvector(embedding, 1, 256)::vector(256)) vector_cosine_ops)" in reduced["unified_idx_embedding_db1"]
+    binary = index_definitions(AnnConfig(index_type="ivfflat", quantization="binary"), row_count=50_000)
+    assert "USING ivfflat ((binary_quantize(embedding)::bit(1536)) bit_hamming_ops)" in binary["unified_idx_embedding"]
+
+# ✅ Test: the query-side distance repeats the indexed expression
+def test_index_distance():
+    assert AnnConfig().index_distance("q") == "embedding <=> q"
+    assert AnnConfig(quantization="binary").index_distance("q") == (
+        "(binary_quantize(embedding)::bit(1536)) <~> binary_quantize(q)"
+    )
+    assert AnnConfig(quantization="reduced", reduced_dims=512).index_distance("q").endswith("<=> subvector(q, 1, 512)")
+    with pytest.raises(ValueError):
+        AnnConfig(quantization="pq")
+    with pytest.raises(ValueError):
+        AnnConfig(quantization="reduced", reduced_dims=2048)
+
+# ✅ Test: new indexes are built under temporary names before the old ones are dropped
+def test_rebuild_keeps_old_index_until_new_is_built():
+    from unittest.mock import MagicMock
+
+    executed = []
+
+    def execute(statement, params=None):
+        sql = str(statement)
+        executed.append(sql)
+        result = MagicMock()
+        result.scalar.return_value = 1000
+        result.fetchall.return_value = [("unified_idx_embedding",), ("unified_idx_embedding_db9_rebuild",)]
+        return result
+
+    engine = MagicMock()
+    connection = engine.connect.return_value.execution_options.return_value.__enter__.return_value
+    connection.execute.side_effect = execute
+    rebuild_indexes(engine, AnnConfig(index_type="hnsw"))
+
+    ddl = [sql for sql in executed if not sql.startswith("SELECT")]
+    assert ddl[0] == "DROP INDEX CONCURRENTLY IF EXISTS unified_idx_embedding_db9_rebuild"
+    assert ddl[1].startswith("CREATE INDEX CONCURRENTLY unified_idx_embedding_rebuild ON")
+    assert ddl[2:] == [
+        "DROP INDEX CONCURRENTLY IF EXISTS unified_idx_embedding",
+        "ALTER INDEX unified_idx_embedding_rebuild RENAME TO unified_idx_embedding",
+        "ANALYZE unified_index",
+    ]
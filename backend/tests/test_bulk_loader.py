@@ -0,0 +1,95 @@
+import sys
+import os
+import struct
+import numpy as np
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from bulk_loader import (
+    encode_vector, encode_copy_rows, copy_rows, content_hash, find_existing, delete_rows_except, COPY_HEADER
+)
+
+# ✅ Test: vectors use pgvector's binary layout (dim, unused, big-endian float32)
+def test_encode_vector_binary_format():
+    encoded = encode_vector([1.0, -2.5, 0.25])
+    assert encoded[:4] == struct.pack(">HH", 3, 0)
+    assert np.frombuffer(encoded[4:], dtype=">f4").tolist() == [1.0, -2.5, 0.25]
+
+# ✅ Test: COPY payload contains a header, one 6-field tuple per row and the trailer
+def test_encode_copy_rows_layout():
+    payload = encode_copy_rows([7], "db1", ["Acme\x00 Corp"], [[0.5, 0.5]]).getvalue()
+    assert payload.startswith(COPY_HEADER)
+    assert payload.endswith(struct.pack(">h", -1))
+
+    body = payload[len(COPY_HEADER):-2]
+    assert struct.unpack(">h", body[:2])[0] == 6
+    assert struct.unpack(">ii", body[2:10]) == (4, 7)
+    assert b"db1" in body and b"Acme Corp" in body
+    # No key: row_key is NULL, followed by the 32-byte content hash of the stored text
+    assert body[-36:] == struct.pack(">i", 32) + content_hash("Acme Corp")
+    assert body[-40:-36] == struct.pack(">i", -1)
+
+# ✅ Test: the content hash matches Postgres' sha256(convert_to(source_text, 'UTF8'))
+def test_content_hash_of_stored_text():
+    import hashlib
+    assert content_hash("Acme\x00 Corp") == hashlib.sha256("Acme Corp".encode("utf-8")).digest()
+
+# ✅ Test: keyed lookups map row_key to (id, hash); content lookups map hash to the oldest id
+def test_find_existing():
+    db = MagicMock()
+    db.execute.return_value.fetchall.return_value = [("UEI1", 5, memoryview(b"h1"))]
+    assert find_existing(db, "db1", keys=["UEI1", "UEI2"]) == {"UEI1": (5, b"h1")}
+    assert "row_key = ANY" in str(db.execute.call_args[0][0])
+
+    db.execute.return_value.fetchall.return_value = [(memoryview(b"h2"), 9, memoryview(b"h2"))]
+    assert find_existing(db, "db1", hashes=[b"h2"]) == {b"h2": (9, b"h2")}
+    assert "GROUP BY content_hash" in str(db.execute.call_args[0][0])
+    assert "row_key IS NULL" not in str(db.execute.call_args[0][0])
+
+    find_existing(db, "db1", hashes=[b"h2"], unkeyed=True)
+    assert "AND row_key IS NULL GROUP BY" in str(db.execute.call_args[0][0])
+
+# ✅ Test: replace mode deletes everything of the source except the kept ids, in one commit
+def test_delete_rows_except():
+    db = MagicMock()
+    cursor = db.connection.return_value.connection.cursor.return_value
+    cursor.rowcount = 3
+
+    assert delete_rows_except(db, "db1", {1, 2}) == 3
+    assert sorted(cursor.copy_expert.call_args[0][1].getvalue().split()) == ["1", "2"]
+    assert cursor.execute.call_args[0][1] == ("db1",)
+    db.commit.assert_called_once()
+
+# ✅ Test: copy_rows commits once per batch and returns the reserved ids in order
+def test_copy_rows_commits_per_batch():
+    db = MagicMock()
+    cursor = db.connection.return_value.connection.cursor.return_value
+    cursor.fetchall.side_effect = [[(1,), (2,)], [(3,)]]
+
+    ids = copy_rows(db, "db2", ["a", "b", "c"], np.zeros((3, 4), dtype=np.float32), batch_size=2)
+
+    assert ids == [1, 2, 3]
+    assert cursor.copy_expert.call_count == 2
+    assert "FORMAT binary" in cursor.copy_expert.call_args[0][0]
+    assert db.commit.call_count == 2
+
+    db.reset_mock()
+    cursor.fetchall.side_effect = [[(4,), (5,)], [(6,)]]
+    copy_rows(db, "db2", ["a", "b", "c"], np.zeros((3, 4), dtype=np.float32), batch_size=2, commit=False)
+    db.commit.assert_not_called()
+
+# ✅ Test: with records, each tuple also carries the raw row as jsonb and the promoted columns
+def test_encode_copy_rows_with_metadata():
+    from datetime import date
+    from bulk_loader import copy_columns, encode_metadata
+
+    record = {"raw": {"State": "TX"}, "state": "TX", "posted_date": date(2000, 1, 31)}
+    payload = encode_copy_rows([7], "db1", ["Acme"], [[0.5]], records=[record]).getvalue()
+    body = payload[len(COPY_HEADER):-2]
+    assert struct.unpack(">h", body[:2])[0] == len(copy_columns([record])) == 14
+    assert struct.pack(">i", 15) + b'\x01{"State":"TX"}' in body
+
+    fields = encode_metadata(record)
+    assert fields[1] == b"TX" and fields[2] is None
+    assert fields[6] == struct.pack(">i", 30)
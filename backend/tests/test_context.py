@@ -0,0 +1,49 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from context import build_context, strip_boilerplate
+from retrieval import SearchResult
+from utils import get_encoder
+
+BOILERPLATE = "Quotes must be submitted electronically through the portal listed in this notice."
+
+def result(i, tag, text):
+    return SearchResult(i, tag, text, 1.0 / i)
+
+# ✅ Test: repeated prose sentences are kept once; repeated names and codes are kept everywhere
+def test_strip_boilerplate():
+    texts = [
+        f"BRAKE ASSEMBLY DLA LAND AND MARITIME 336340 Line 0001 Qty 22. {BOILERPLATE} DibbsBSM@dla.mil",
+        f"VALVE, GATE DLA LAND AND MARITIME 332911 Line 0001 Qty 4. {BOILERPLATE} DibbsBSM@dla.mil",
+    ]
+    first, second = strip_boilerplate(texts)
+    assert BOILERPLATE in first
+    assert BOILERPLATE not in second
+    assert second == "VALVE, GATE DLA LAND AND MARITIME 332911 Line 0001 Qty 4. DibbsBSM@dla.mil"
+
+# ✅ Test: rows are numbered per source and the context stays within the token budget
+def test_build_context_budget():
+    enc = get_encoder()
+    rows = [result(1, "db1", "ACME CORP " * 300), result(2, "db2", "Relevant contract for AI"),
+            result(3, "db1", "BETA LLC " * 300)]
+    context, sources, info = build_context(rows, token_budget=500, chunk_tokens=300)
+
+    chunks = context.split("\n\n")
+    assert chunks[0].startswith("[1] ACME CORP") and chunks[0].endswith(" …")
+    assert chunks[1] == "[2] Relevant contract for AI"
+    assert chunks[2].startswith("[1] BETA LLC")
+    assert sources == ["db1", "db2"]
+    assert info["chunks"] == 3 and info["truncated"] == 2
+    assert info["tokens"] <= 500
+    assert len(enc.encode(context)) <= 500 + 20  # plus the [n] markers and separators
+
+# ✅ Test: a row that no longer fits is skipped, a short lower-ranked one still goes in
+def test_build_context_skips_rows_that_do_not_fit():
+    rows = [result(1, "db1", "ACME CORP " * 300), result(2, "db2", "BETA LLC " * 300),
+            result(3, "db3", "Short row")]
+    context, sources, info = build_context(rows, token_budget=620, chunk_tokens=600)
+    assert sources == ["db1", "db3"]
+    assert context.endswith("[2] Short row")
+    assert info["chunks"] == 2
@@ -0,0 +1,81 @@
+import sys
+import os
+import json
+import subprocess
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+from fastapi.testclient import TestClient
+from main import app
+from db import asyncpg_connect_args, install_pool_events, pool_stats, DB_PREPARED_STATEMENT_CACHE_SIZE
+from metrics import db_pool_events
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../app"))
+client = TestClient(app)
+
+def engine_settings(env):
+    # db.py reads its settings at import time, so check them in a fresh interpreter
+    probe = (
+        "import json, db; pool = db.async_engine.sync_engine.pool; "
+        "print(json.dumps({'async_host': db.async_engine.url.host, 'search_host': db.search_engine.url.host, "
+        "'sync_host': db.engine.url.host, 'sync_size': db.engine.pool.size(), 'search_size': pool.size(), "
+        "'search_overflow': pool._max_overflow, 'recycle': pool._recycle, 'pre_ping': pool._pre_ping, "
+        "'pools': sorted(db.all_pool_stats())}))"
+    )
+    proc = subprocess.run([sys.executable, "-c", probe], cwd=APP_DIR, env={**os.environ, **env},
+                          capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+# ✅ Test: pool size, overflow, recycle and pre-ping come from the environment
+def test_pool_settings_from_env():
+    settings = engine_settings({"DB_POOL_SIZE": "7", "SEARCH_DB_POOL_SIZE": "20", "SEARCH_DB_MAX_OVERFLOW": "0",
+                                "DB_POOL_RECYCLE": "600", "DB_POOL_PRE_PING": "false"})
+    assert settings["sync_size"] == 7
+    assert settings["search_size"] == 20
+    assert settings["search_overflow"] == 0
+    assert settings["recycle"] == 600
+    assert settings["pre_ping"] is False
+
+# ✅ Test: SEARCH_DATABASE_URL routes the search engines to the replica, not the primary
+def test_search_traffic_uses_replica():
+    settings = engine_settings({"DATABASE_URL": "postgresql://u:p@primary:5432/unified_db",
+                                "SEARCH_DATABASE_URL": "postgresql://u:p@replica:5432/unified_db"})
+    assert settings["sync_host"] == "primary"
+    assert settings["async_host"] == "replica"
+    assert settings["search_host"] == "replica"
+    assert settings["pools"] == ["async", "search_sync", "sync"]
+
+    settings = engine_settings({"DATABASE_URL": "postgresql://u:p@primary:5432/unified_db"})
+    assert settings["async_host"] == settings["search_host"] == "primary"
+    assert settings["pools"] == ["async", "sync"]
+
+# ✅ Test: asyncpg gets the prepared statement cache and custom plans; other drivers get nothing
+def test_asyncpg_connect_args():
+    args = asyncpg_connect_args("postgresql+asyncpg://u:p@db/unified_db")
+    assert args["prepared_statement_cache_size"] == DB_PREPARED_STATEMENT_CACHE_SIZE
+    assert args["server_settings"] == {"plan_cache_mode": "force_custom_plan"}
+    assert asyncpg_connect_args("postgresql://u:p@db/unified_db") == {}
+
+# ✅ Test: pool events are counted, and a reused connection is not a new connect
+def test_pool_events_and_stats(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool, pool_size=2, max_overflow=1)
+    install_pool_events(engine, "test")
+    for _ in range(3):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    assert db_pool_events.get(engine="test", event="connect") == 1
+    assert db_pool_events.get(engine="test", event="checkout") == 3
+
+    with engine.connect():
+        stats = pool_stats(engine.pool)
+    assert stats == {"size": 2, "checked_in": 0, "checked_out": 1, "overflow": 0, "max_overflow": 1}
+
+# ✅ Test: /db-pool/stats reports every engine's pool
+def test_db_pool_stats_endpoint():
+    response = client.get("/db-pool/stats")
+    assert response.status_code == 200
+    assert response.json()["sync"]["size"] >= 1
+    assert "async" in response.json()
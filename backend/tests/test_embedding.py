@@ -1,12 +1,22 @@
 import sys
 import os
 import pytest
-from unittest.mock import patch, MagicMock
+import asyncio
+from unittest.mock import patch, MagicMock, AsyncMock
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
 
-from utils import chunk_text, generate_embedding, PgVectorSearchTool
+from utils import chunk_text, token_chunks, token_chunks_batch, get_encoder, generate_embedding, generate_embeddings, generate_embedding_async, pack_batches
+from embedding_cache import embedding_cache
+
+@pytest.fixture(autouse=True)
+def empty_embedding_cache():
+    # Keep vectors from one test's mock out of the next test
+    embedding_cache.clear()
+    embedding_cache.client = None
+    yield
+    embedding_cache.clear()
 
 # ✅ Test: chunk_text properly splits text
 def test_chunk_text_splits_text():
@@ -16,6 +26,19 @@ def test_chunk_text_splits_text():
     assert all(isinstance(chunk, str) for chunk in chunks)
     assert len(chunks) > 1
 
+# ✅ Test: batch tokenization gives the same chunks as token-by-token windows
+def test_token_chunks_batch_matches_windows():
+    texts = ["Hello world. " * 100, "Acme Corp Austin TX", "Café ünïcode " * 40, ""]
+    enc = get_encoder()
+    for text, pieces in zip(texts, token_chunks_batch(texts, max_tokens=50)):
+        tokens = enc.encode(text)
+        expected = [(enc.decode(tokens[i:i + 50]), len(tokens[i:i + 50])) for i in range(0, len(tokens), 50)]
+        assert pieces == expected == token_chunks(text, max_tokens=50)
+
+    # Special tokens are still rejected like enc.encode() does
+    with pytest.raises(ValueError):
+        token_chunks_batch(["plain", "text <|endoftext|>"])
+
 # ✅ Test: generate_embedding returns mock 1536-length vector
 @patch("utils.get_openai_client")
 def test_generate_embedding_mocks_openai(mock_client):
@@ -28,10 +51,49 @@ def test_generate_embedding_mocks_openai(mock_client):
     assert len(result) == 1536
     assert all(isinstance(x, float) for x in result)
 
+# ✅ Test: pack_batches respects both the input and token limits
+def test_pack_batches_limits():
+    assert pack_batches([100] * 5, max_inputs=2, max_tokens=10000) == [(0, 2), (2, 4), (4, 5)]
+    assert pack_batches([400, 400, 400], max_inputs=10, max_tokens=800) == [(0, 2), (2, 3)]
+    assert pack_batches([], max_inputs=10, max_tokens=800) == []
+
+# ✅ Test: generate_embeddings sends many rows per request and keeps row order
+@patch("utils.get_openai_client")
+def test_generate_embeddings_batches_rows(mock_client):
+    def fake_create(model, input):
+        response = MagicMock()
+        response.data = [MagicMock(embedding=[float(len(chunk))] * 1536) for chunk in input]
+        return response
+
+    mock_client.return_value.embeddings.create.side_effect = fake_create
+
+    texts = ["a", "bb bb", "ccc ccc ccc"]
+    result = generate_embeddings(texts)
+    assert result.shape == (3, 1536)
+    assert mock_client.return_value.embeddings.create.call_count == 1
+    assert [row[0] for row in result] == [len(t) for t in texts]
+
+# ✅ Test: async embedding goes through the shared async client once, then the cache
+@patch("utils.get_async_openai_client")
+def test_generate_embedding_async(mock_client):
+    mock_response = MagicMock()
+    mock_response.data = [MagicMock(embedding=[0.2] * 1536)]
+    mock_client.return_value.embeddings.create = AsyncMock(return_value=mock_response)
+
+    stats = {}
+    first = asyncio.run(generate_embedding_async("Async query", stats=stats))
+    second = asyncio.run(generate_embedding_async("Async query", stats=stats))
+
+    assert len(first) == 1536 and first == second
+    assert mock_client.return_value.embeddings.create.await_count == 1
+    assert stats == {"cached": 1, "embedded": 1}
+
 # ✅ Test: PgVectorSearchTool._run returns mocked DB result
-@patch("utils.SessionLocal")
-@patch("utils.generate_embedding", return_value=[0.1] * 1536)
+@patch("agents.search_sessions")
+@patch("agents.generate_embedding", return_value=[0.1] * 1536)
 def test_pgvector_search_tool_run(mock_embed, mock_db):
+    from agents import PgVectorSearchTool
+
     mock_row = MagicMock()
     mock_row.source_text = "Relevant result from DB"
     mock_db.return_value.query().order_by().limit().all.return_value = [mock_row]
@@ -0,0 +1,65 @@
+import sys
+import os
+import numpy as np
+import pytest
+import redis
+from unittest.mock import patch, MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from embedding_cache import EmbeddingCache, cache_key, embedding_cache
+from utils import generate_embeddings
+
+# ✅ Test: keys ignore whitespace differences but not the model
+def test_cache_key_normalizes_text():
+    assert cache_key("m", "Acme  Corp\n") == cache_key("m", "Acme Corp")
+    assert cache_key("m", "Acme Corp") != cache_key("other", "Acme Corp")
+
+# ✅ Test: LRU tier evicts the least recently used vector
+def test_lru_eviction():
+    cache = EmbeddingCache(max_size=2, client=None)
+    cache.set_many(["a", "b"], [[1.0], [2.0]])
+    cache.get_many(["a"])
+    cache.set_many(["c"], [[3.0]])
+
+    found = cache.get_many(["a", "b", "c"])
+    assert found[1] is None
+    assert found[0].tolist() == [1.0] and found[2].tolist() == [3.0]
+
+# ✅ Test: Redis tier stores float32 bytes with the TTL and serves them back
+def test_redis_tier_round_trip():
+    client = MagicMock()
+    cache = EmbeddingCache(max_size=10, ttl=60, client=client)
+    cache.set_many(["k"], [[0.5, 0.25]])
+
+    pipe = client.pipeline.return_value
+    pipe.setex.assert_called_once_with("k", 60, np.array([0.5, 0.25], dtype=np.float32).tobytes())
+
+    cache.clear()
+    client.mget.return_value = [np.array([0.5, 0.25], dtype=np.float32).tobytes()]
+    assert cache.get_many(["k"])[0].tolist() == [0.5, 0.25]
+    assert cache.stats()["redis_hits"] == 1
+
+# ✅ Test: Redis errors count as misses instead of failing the call
+def test_redis_errors_are_misses():
+    client = MagicMock()
+    client.mget.side_effect = redis.ConnectionError("down")
+    cache = EmbeddingCache(client=client)
+
+    assert cache.get_many(["k"]) == [None]
+    assert cache.stats()["misses"] == 1
+
+# ✅ Test: generate_embeddings only sends uncached texts to the API and reports hits
+@patch("utils.embed_uncached", side_effect=lambda texts, max_tokens=800: np.ones((len(texts), 4), dtype=np.float32))
+def test_generate_embeddings_uses_cache(mock_embed):
+    embedding_cache.clear()
+    embedding_cache.client = None
+
+    generate_embeddings(["alpha"])
+    stats = {}
+    result = generate_embeddings(["alpha", "beta", "beta"], stats=stats)
+
+    assert result.shape == (3, 4)
+    assert mock_embed.call_args_list[1][0][0] == ["beta"]
+    assert stats == {"cached": 2, "embedded": 1}
+    embedding_cache.clear()
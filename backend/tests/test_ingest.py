@@ -0,0 +1,293 @@
+import sys
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from unittest.mock import patch, MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from ingest import (
+    iter_row_chunks, ingest_file_stream, clean_rows, serialize_rows, ingest_changed_texts, serialize_records
+)
+from bulk_loader import content_hash
+
+def iterrows_texts(df):
+    # Reference: the original row-by-row serialization
+    texts = []
+    for _, row in df.iterrows():
+        combined = " ".join(str(val).strip() for val in row if pd.notna(val)).strip()
+        if not combined or combined.lower() == "nan":
+            continue
+        texts.append(combined)
+    return texts
+
+CSV_ROWS = "name,city\nAlice,Austin\nBob,Boston\nAlice,Austin\nCarol,Chicago\nDan,Denver\n"
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "upload.csv"
+    path.write_text(CSV_ROWS, encoding="utf-8")
+    return str(path)
+
+# ✅ Test: CSV is read in fixed-size row chunks
+def test_iter_row_chunks_csv(csv_path):
+    chunks = list(iter_row_chunks(csv_path, "upload.csv", chunksize=2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+
+# ✅ Test: non-UTF-8 CSV falls back to cp1252
+def test_iter_row_chunks_cp1252(tmp_path):
+    path = tmp_path / "legacy.csv"
+    path.write_bytes("name\nCaf\xe9 Ltd\n".encode("cp1252"))
+    chunks = list(iter_row_chunks(str(path), "legacy.csv", chunksize=10))
+    assert serialize_rows(chunks[0]) == ["Café Ltd"]
+
+# ✅ Test: XLSX is streamed through openpyxl read-only mode
+def test_iter_row_chunks_xlsx(tmp_path):
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["name", "city"])
+    for i in range(5):
+        sheet.append([f"Vendor {i}", "Austin"])
+    path = str(tmp_path / "upload.xlsx")
+    workbook.save(path)
+
+    chunks = list(iter_row_chunks(path, "upload.xlsx", chunksize=2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert serialize_rows(chunks[0])[0] == "Vendor 0 Austin"
+
+# ✅ Test: an XLSX row serializes the same whatever the other rows of its chunk hold
+def test_iter_row_chunks_xlsx_types_do_not_depend_on_chunk(tmp_path):
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["id", "name"])
+    for row in [(1, "x"), (None, "y"), (1, "x"), (2, "z")]:
+        sheet.append(row)
+    path = str(tmp_path / "upload.xlsx")
+    workbook.save(path)
+
+    # The first chunk's id column has a blank (float if inferred), the second's does not
+    first, second = [serialize_rows(chunk) for chunk in iter_row_chunks(path, "upload.xlsx", chunksize=2)]
+    assert first == ["1 x", "y"] and second == ["1 x", "2 z"]
+    assert content_hash(first[0]) == content_hash(second[0])
+
+# ✅ Test: duplicates are dropped across chunk boundaries
+def test_clean_rows_across_chunks():
+    seen = set()
+    first = clean_rows(pd.DataFrame({"a": ["x", "y", "x", None]}), seen)
+    second = clean_rows(pd.DataFrame({"a": ["y", "z"]}), seen)
+    assert list(first["a"]) == ["x", "y"]
+    assert list(second["a"]) == ["z"]
+
+# ✅ Test: every chunk is embedded and committed on its own, with progress reported
+@patch("ingest.SessionLocal")
+@patch("ingest.copy_rows", side_effect=lambda db, tag, texts, embeddings, records=None, commit=True: list(range(len(texts))))
+@patch("ingest.generate_embeddings", side_effect=lambda texts, stats=None: np.zeros((len(texts), 1536), dtype=np.float32))
+def test_ingest_file_stream_commits_per_chunk(mock_embed, mock_copy, mock_session, csv_path):
+    progress_updates = []
+    result, stopped = ingest_file_stream(csv_path, "upload.csv", "db1", on_progress=progress_updates.append,
+                                         chunksize=2)
+
+    assert result == {"chunks": 3, "rows_read": 5, "rows_processed": 4, "embedded": 0, "inserted": 4,
+                      "updated": 0, "unchanged": 0, "deleted": 0, "cached_embeddings": 0}
+    assert not stopped
+    assert [p["chunks"] for p in progress_updates] == [1, 2, 3]
+    assert mock_copy.call_count == 3
+    assert mock_embed.call_count == 3
+    # One transaction per chunk: copy_rows leaves it open, the stream commits it
+    assert all(call[1]["commit"] is False for call in mock_copy.call_args_list)
+    assert mock_session.return_value.commit.call_count == 3
+
+# ✅ Test: a resumed run skips committed rows but still drops duplicates of them
+@patch("ingest.SessionLocal")
+@patch("ingest.copy_rows", side_effect=lambda db, tag, texts, embeddings, records=None, commit=True: list(range(len(texts))))
+@patch("ingest.generate_embeddings", side_effect=lambda texts, stats=None: np.zeros((len(texts), 1536), dtype=np.float32))
+def test_ingest_file_stream_resumes_from_offset(mock_embed, mock_copy, mock_session, csv_path):
+    earlier = {"chunks": 1, "rows_read": 2, "rows_processed": 2, "embedded": 2, "inserted": 2, "cached_embeddings": 0}
+    result, _ = ingest_file_stream(csv_path, "upload.csv", "db1", chunksize=3, progress=earlier)
+
+    # Rows 3-5 are read; the repeated "Alice,Austin" row is dropped
+    inserted_texts = [text for call in mock_copy.call_args_list for text in call[0][2]]
+    assert inserted_texts == ["Carol Chicago", "Dan Denver"]
+    assert result["rows_read"] == 5 and result["inserted"] == 4 and result["chunks"] == 3
+
+# ✅ Test: should_stop ends the run between chunks
+@patch("ingest.SessionLocal")
+@patch("ingest.copy_rows", side_effect=lambda db, tag, texts, embeddings, records=None, commit=True: list(range(len(texts))))
+@patch("ingest.generate_embeddings", side_effect=lambda texts, stats=None: np.zeros((len(texts), 1536), dtype=np.float32))
+def test_ingest_file_stream_stops(mock_embed, mock_copy, mock_session, csv_path):
+    progress_updates = []
+    result, stopped = ingest_file_stream(csv_path, "upload.csv", "db1", on_progress=progress_updates.append,
+                                         chunksize=2, should_stop=lambda: len(progress_updates) >= 1)
+    assert stopped and result["chunks"] == 1 and result["rows_read"] == 2
+    assert mock_copy.call_count == 1
+
+# ✅ Test: a chunk is rolled back, not committed, once the job belongs to another worker
+@patch("ingest.SessionLocal")
+@patch("ingest.copy_rows", side_effect=lambda db, tag, texts, embeddings, records=None, commit=True: list(range(len(texts))))
+@patch("ingest.generate_embeddings", side_effect=lambda texts, stats=None: np.zeros((len(texts), 1536), dtype=np.float32))
+def test_ingest_file_stream_stops_when_not_owner(mock_embed, mock_copy, mock_session, csv_path):
+    owner_checks = iter([True, False])
+    result, stopped = ingest_file_stream(csv_path, "upload.csv", "db1", chunksize=2,
+                                         is_owner=lambda: next(owner_checks))
+
+    assert stopped and result["chunks"] == 1 and result["rows_read"] == 2 and result["inserted"] == 2
+    assert mock_session.return_value.commit.call_count == 1
+    assert mock_session.return_value.rollback.call_count == 1
+
+# ✅ Test: vectorized serialization matches iterrows() output on mixed and numeric frames
+@pytest.mark.parametrize("df", [
+    pd.DataFrame({
+        "name": [" Acme ", None, "nan", "  ", "Beta"],
+        "amount": [1.5, np.nan, 2.0, 1e20, 0.1 + 0.2],
+        "count": [1, 2, 3, 4, 5],
+        "date": pd.to_datetime(["2024-01-01", None, "2024-03-01", "2024-04-01", "2024-05-01"]),
+        "flag": [True, False, None, True, False],
+    }),
+    pd.DataFrame({"a": [1, 2, 3], "b": [0.5, np.nan, 2.25]}),
+    pd.DataFrame({"a": [None, " x ", "nan"], "b": [None, "", None]}, dtype=object),
+    pd.DataFrame({"a": pd.to_datetime(["2024-01-01", None])}),
+    pd.DataFrame({"a": []}),
+])
+def test_serialize_rows_matches_iterrows(df):
+    expected = iterrows_texts(df.dropna(how="all").drop_duplicates())
+    assert serialize_rows(df) == expected
+    assert serialize_records(df)[1] == expected
+
+# ✅ Test: the wide sample extract serializes identically
+def test_serialize_rows_matches_iterrows_on_sample():
+    path = os.path.join(os.path.dirname(__file__), "../../UploadedFiles/first_1000_records.csv")
+    df = pd.read_csv(path, dtype=str, nrows=200)
+    cleaned = iterrows_texts(df.dropna(how="all").drop_duplicates())
+    assert serialize_rows(df) == serialize_records(df)[1] == cleaned
+
+# ✅ Test: cleaning matches dropna(how="all").drop_duplicates(), nulls comparing equal
+def test_clean_rows_matches_pandas():
+    df = pd.DataFrame({
+        "a": ["x", "x", None, None, "y", "x", 1, 1.0],
+        "b": [np.nan, None, None, None, "z", np.nan, 2, 2],
+    }, dtype=object)
+    expected = df.dropna(how="all").drop_duplicates()
+    pd.testing.assert_frame_equal(clean_rows(df), expected)
+    assert serialize_rows(df) == iterrows_texts(expected)
+
+def embed_stub(texts, stats=None):
+    return np.zeros((len(texts), 1536), dtype=np.float32)
+
+# ✅ Test: keyed rows are classified as new, changed or unchanged against the stored hashes
+@patch("ingest.update_rows", side_effect=lambda db, ids, texts, embeddings, records=None, commit=True: len(ids))
+@patch("ingest.copy_rows", side_effect=lambda db, tag, texts, embeddings, keys=None, records=None, commit=True: [100 + i for i in range(len(texts))])
+@patch("ingest.find_existing")
+@patch("ingest.generate_embeddings", side_effect=embed_stub)
+def test_ingest_changed_texts_by_key(mock_embed, mock_find, mock_copy, mock_update):
+    mock_find.return_value = {"U1": (1, content_hash("U1 Acme")), "U2": (2, content_hash("U2 Beta"))}
+    keep_ids = set()
+    counts = ingest_changed_texts(MagicMock(), ["U1 Acme", "U2 Beta Corp", "U3 Gamma", "U3 Gamma"], "db1",
+                                  keys=["U1", "U2", "U3", "U3"], keep_ids=keep_ids)
+
+    assert counts == {"inserted": 1, "updated": 1, "unchanged": 1}
+    assert mock_embed.call_args[0][0] == ["U3 Gamma", "U2 Beta Corp"]
+    assert mock_copy.call_args[1]["keys"] == ["U3"]
+    assert mock_update.call_args[0][1] == [2]
+    assert keep_ids == {1, 2, 100}
+
+# ✅ Test: rows stored without a key are matched on content once and take over the key
+@patch("ingest.set_row_keys")
+@patch("ingest.update_rows", return_value=0)
+@patch("ingest.copy_rows", side_effect=lambda db, tag, texts, embeddings, keys=None, records=None, commit=True: [100 + i for i in range(len(texts))])
+@patch("ingest.find_existing")
+@patch("ingest.generate_embeddings", side_effect=embed_stub)
+def test_ingest_changed_texts_adopts_unkeyed_rows(mock_embed, mock_find, mock_copy, mock_update, mock_set_keys):
+    stored = {"U1": (1, content_hash("U1 Acme"))}
+    unkeyed_rows = {content_hash("U2 Beta"): (7, content_hash("U2 Beta"))}
+    mock_find.side_effect = lambda db, tag, keys=None, hashes=None, unkeyed=False: stored if keys else unkeyed_rows
+    keep_ids = set()
+    counts = ingest_changed_texts(MagicMock(), ["U1 Acme", "U2 Beta", "U2 Beta", "U3 Gamma"], "db1",
+                                  keys=["U1", "U2", "U2b", "U3"], keep_ids=keep_ids)
+
+    assert counts == {"inserted": 2, "updated": 0, "unchanged": 2}
+    assert mock_find.call_args[1] == {"hashes": [content_hash("U2 Beta"), content_hash("U2 Beta"),
+                                                 content_hash("U3 Gamma")], "unkeyed": True}
+    assert mock_set_keys.call_args[0][1:] == ([7], ["U2"])
+    assert mock_copy.call_args[1]["keys"] == ["U2b", "U3"]
+    assert keep_ids == {1, 7, 100, 101}
+
+# ✅ Test: without keys, rows already stored with the same content are skipped
+@patch("ingest.update_rows", return_value=0)
+@patch("ingest.copy_rows", side_effect=lambda db, tag, texts, embeddings, keys=None, records=None, commit=True: [100 + i for i in range(len(texts))])
+@patch("ingest.find_existing")
+@patch("ingest.generate_embeddings", side_effect=embed_stub)
+def test_ingest_changed_texts_by_content(mock_embed, mock_find, mock_copy, mock_update):
+    mock_find.return_value = {content_hash("Acme"): (1, content_hash("Acme"))}
+    counts = ingest_changed_texts(MagicMock(), ["Acme", "Beta"], "db1")
+
+    assert counts == {"inserted": 1, "updated": 0, "unchanged": 1}
+    assert mock_find.call_args[1]["hashes"] == [content_hash("Acme"), content_hash("Beta")]
+    assert mock_copy.call_args[0][2] == ["Beta"] and mock_copy.call_args[1]["keys"] is None
+
+# ✅ Test: replace mode deletes the source's rows that the file no longer contains
+@patch("ingest.delete_rows_except", return_value=2)
+@patch("ingest.SessionLocal")
+@patch("ingest.ingest_changed_texts")
+def test_ingest_file_stream_replace(mock_changed, mock_session, mock_delete, csv_path):
+    def changed(db, texts, source_tag, keys=None, stats=None, identities=None, keep_ids=None, records=None):
+        keep_ids.update(range(len(keep_ids), len(keep_ids) + len(texts)))
+        return {"inserted": 0, "updated": 1, "unchanged": len(texts) - 1}
+    mock_changed.side_effect = changed
+
+    earlier = {"chunks": 1, "rows_read": 2}
+    result, _ = ingest_file_stream(csv_path, "upload.csv", "db1", chunksize=2, progress=earlier, mode="replace",
+                                   key_column="name")
+
+    # Replace runs always read the whole file
+    assert result["rows_read"] == 5 and result["chunks"] == 3
+    assert mock_changed.call_args_list[0][1]["keys"] == ["Alice", "Bob"]
+    assert result["updated"] == 3 and result["unchanged"] == 1 and result["deleted"] == 2
+    assert mock_delete.call_args[0][1:] == ("db1", {0, 1, 2, 3})
+
+# ✅ Test: a stopped replace run deletes nothing
+@patch("ingest.delete_rows_except")
+@patch("ingest.SessionLocal")
+@patch("ingest.ingest_changed_texts", return_value={"inserted": 2, "updated": 0, "unchanged": 0})
+def test_ingest_file_stream_replace_stopped(mock_changed, mock_session, mock_delete, csv_path):
+    result, stopped = ingest_file_stream(csv_path, "upload.csv", "db1", chunksize=2, mode="replace",
+                                         should_stop=lambda: mock_changed.call_count >= 1)
+    assert stopped and result["chunks"] == 1 and result["deleted"] == 0
+    mock_delete.assert_not_called()
+    with pytest.raises(ValueError):
+        ingest_file_stream(csv_path, "upload.csv", "db1", mode="upsert")
+
+# ✅ Test: records carry each text's key, raw row and promoted columns, in text order; missing keys are None
+def test_serialize_records():
+    df = pd.DataFrame({"uei": [" U1 ", None, " U1 ", "U3", None], "State": ["Texas", None, "Texas", "ca", None],
+                       "name": ["Acme", None, "Acme", " Gamma ", "Dallas"]})
+    keys, texts, records = serialize_records(df, key_column="uei")
+    assert keys == ["U1", "U3", None]
+    assert texts == ["U1 Texas Acme", "U3 ca Gamma", "Dallas"]
+    assert [record["raw"] for record in records] == [
+        {"uei": "U1", "State": "Texas", "name": "Acme"}, {"uei": "U3", "State": "ca", "name": "Gamma"},
+        {"name": "Dallas"},
+    ]
+    assert [record["state"] for record in records] == ["TX", "CA", None]
+    assert serialize_records(df)[0] is None
+    with pytest.raises(ValueError):
+        serialize_records(df, key_column="cage")
+
+# ✅ Test: unchanged rows get their missing metadata without being re-embedded
+@patch("ingest.fill_metadata")
+@patch("ingest.update_rows", return_value=0)
+@patch("ingest.copy_rows", side_effect=lambda db, tag, texts, embeddings, keys=None, records=None, commit=True: [100 + i for i in range(len(texts))])
+@patch("ingest.find_existing")
+@patch("ingest.generate_embeddings", side_effect=embed_stub)
+def test_ingest_changed_texts_fills_metadata(mock_embed, mock_find, mock_copy, mock_update, mock_fill):
+    mock_find.return_value = {content_hash("Acme"): (1, content_hash("Acme"))}
+    records = [{"raw": {"name": "Acme"}}, {"raw": {"name": "Beta"}}]
+    ingest_changed_texts(MagicMock(), ["Acme", "Beta"], "db1", records=records)
+
+    assert mock_fill.call_args[0][1:] == ([1], [records[0]])
+    assert mock_copy.call_args[1]["records"] == [records[1]]
+    assert mock_embed.call_args[0][0] == ["Beta"]
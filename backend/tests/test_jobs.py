@@ -0,0 +1,161 @@
+import sys
+import os
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from jobs import JobStore, QUEUE_KEY, PROCESSING_KEY, STATUS_PENDING, STATUS_CANCELLED, STATUS_COMPLETED
+from worker import run_job, keep_alive
+
+
+def stored_job(**fields):
+    job = {"upload_id": "job-1", "status": STATUS_PENDING, "path": "/spool/ingest_1.csv", "filename": "a.csv",
+           "source_tag": "db1", "created_at": "1.0", "updated_at": str(time.time()), "cancel_requested": "0",
+           "attempts": "0", "error": "", "chunks": "0", "rows_read": "0", "rows_processed": "0", "embedded": "0",
+           "cached_embeddings": "0", "inserted": "0"}
+    job.update({name: str(value) for name, value in fields.items()})
+    return job
+
+# ✅ Test: a new job is stored with zeroed counters and queued
+def test_create_queues_job():
+    client = MagicMock()
+    store = JobStore(client=client)
+    job_id = store.create("/spool/ingest_1.csv", "a.csv", "db1")
+
+    pipe = client.pipeline.return_value
+    mapping = pipe.hset.call_args[1]["mapping"]
+    assert mapping["status"] == STATUS_PENDING and mapping["rows_read"] == 0
+    pipe.rpush.assert_called_once_with(QUEUE_KEY, job_id)
+
+# ✅ Test: counters come back as numbers
+def test_get_converts_counters():
+    client = MagicMock()
+    client.hgetall.return_value = stored_job(inserted=7)
+    job = JobStore(client=client).get("job-1")
+    assert job["inserted"] == 7 and isinstance(job["updated_at"], float)
+
+    client.hgetall.return_value = {}
+    assert JobStore(client=client).get("missing") is None
+
+# ✅ Test: cancelling a queued job takes it off the queue immediately
+def test_cancel_queued_job():
+    client = MagicMock()
+    client.hgetall.return_value = stored_job()
+    JobStore(client=client).request_cancel("job-1")
+
+    client.lrem.assert_called_once_with(QUEUE_KEY, 0, "job-1")
+    assert client.pipeline.return_value.hset.call_args[1]["mapping"]["status"] == STATUS_CANCELLED
+
+# ✅ Test: jobs without a recent heartbeat are put back on the queue once
+def test_requeue_stale():
+    client = MagicMock()
+    client.lrange.return_value = ["stale", "fresh"]
+    client.hgetall.side_effect = lambda key: (
+        stored_job(updated_at=0) if key == "job:stale" else stored_job(updated_at=time.time())
+    )
+    client.lrem.return_value = 1
+
+    assert JobStore(client=client, stale_seconds=60).requeue_stale() == ["stale"]
+    client.lrem.assert_called_once_with(PROCESSING_KEY, 1, "stale")
+    client.rpush.assert_called_once_with(QUEUE_KEY, "stale")
+    # The owner is cleared, so the presumed-dead worker can no longer update the job
+    assert client.pipeline.return_value.hset.call_args[1]["mapping"]["owner"] == ""
+
+# ✅ Test: owned updates go through a script that checks the owner token
+def test_update_owned():
+    client = MagicMock()
+    client.eval.return_value = 0
+    store = JobStore(client=client, ttl=60)
+
+    assert store.update_owned("job-1", "token-a", inserted=5) is False
+    args = client.eval.call_args[0]
+    assert args[1:5] == (1, "job:job-1", "token-a", 60)
+    assert args[5:7] == ("inserted", 5) and args[7] == "updated_at"
+
+    owner = store.start("job-1", attempts=2)
+    mapping = client.pipeline.return_value.hset.call_args[1]["mapping"]
+    assert mapping["owner"] == owner and mapping["attempts"] == 2
+
+# ✅ Test: heartbeats continue until the job is done, and stop once the owner changed
+def test_keep_alive():
+    import threading
+
+    store = MagicMock()
+    store.heartbeat.side_effect = [True, True, False]
+    done, lost = threading.Event(), threading.Event()
+    keep_alive(store, "job-1", "token-a", done, lost, interval=0.001)
+
+    assert store.heartbeat.call_count == 3
+    assert lost.is_set()
+
+# ✅ Test: the worker resumes from the stored offset, reports progress and completes the job
+@patch("ingest.ingest_file_stream")
+def test_run_job_completes(mock_stream, tmp_path):
+    path = tmp_path / "ingest_1.csv"
+    path.write_text("a\n1\n")
+    store = MagicMock()
+    store.get.return_value = {**JobStore(client=MagicMock(hgetall=MagicMock(return_value=stored_job(
+        rows_read=500, inserted=480, chunks=1)))).get("job-1"), "path": str(path)}
+    store.is_cancel_requested.return_value = False
+    mock_stream.return_value = ({"chunks": 2, "rows_read": 900, "rows_processed": 880, "embedded": 880,
+                                 "inserted": 860, "cached_embeddings": 0}, False)
+
+    run_job("job-1", store)
+
+    assert mock_stream.call_args[1]["progress"]["rows_read"] == 500
+    final = store.update_owned.call_args_list[-1]
+    assert final[0] == ("job-1", store.start.return_value)
+    assert final[1]["status"] == STATUS_COMPLETED and final[1]["inserted"] == 860
+    store.release.assert_called_once_with("job-1")
+    assert not path.exists()
+
+# ✅ Test: a cancel request ends the job as cancelled and keeps the file for resume
+@patch("ingest.ingest_file_stream", return_value=({"chunks": 1, "rows_read": 500}, True))
+def test_run_job_cancelled(mock_stream, tmp_path):
+    path = tmp_path / "ingest_1.csv"
+    path.write_text("a\n1\n")
+    store = MagicMock()
+    store.get.return_value = {**JobStore(client=MagicMock(hgetall=MagicMock(return_value=stored_job()))).get("job-1"),
+                              "path": str(path)}
+    store.is_cancel_requested.return_value = True
+
+    run_job("job-1", store)
+
+    assert store.update_owned.call_args_list[-1][1]["status"] == STATUS_CANCELLED
+    assert path.exists()
+
+# ✅ Test: a cancel that arrives after the last chunk, or a failed cleanup, leaves the job completed
+@patch("worker.sync_vector_index")
+@patch("worker.VECTOR_INDEX_SYNC", True)
+@patch("ingest.ingest_file_stream", return_value=({"chunks": 1, "rows_read": 500, "inserted": 500}, False))
+def test_run_job_completes_despite_late_cancel(mock_stream, mock_sync, tmp_path):
+    store = MagicMock()
+    store.get.return_value = {**JobStore(client=MagicMock(hgetall=MagicMock(return_value=stored_job()))).get("job-1"),
+                              "path": str(tmp_path / "already_removed.csv")}
+    store.is_cancel_requested.return_value = True
+
+    run_job("job-1", store)
+
+    assert [call[1]["status"] for call in store.update_owned.call_args_list] == [STATUS_COMPLETED]
+    store.release.assert_called_once_with("job-1")
+    mock_sync.assert_called_once()
+
+# ✅ Test: a worker whose job was requeued elsewhere stops without touching the job or its file
+@patch("ingest.ingest_file_stream")
+def test_run_job_superseded(mock_stream, tmp_path):
+    path = tmp_path / "ingest_1.csv"
+    path.write_text("a\n1\n")
+    store = MagicMock()
+    store.get.return_value = {**JobStore(client=MagicMock(hgetall=MagicMock(return_value=stored_job()))).get("job-1"),
+                              "path": str(path)}
+    store.owns.return_value = False
+    # The stream checks ownership before committing, finds it lost and stops
+    mock_stream.side_effect = lambda *args, **kwargs: ({"chunks": 0, "rows_read": 0}, not kwargs["is_owner"]())
+
+    run_job("job-1", store)
+
+    store.update_owned.assert_not_called()
+    store.release.assert_not_called()
+    assert path.exists()
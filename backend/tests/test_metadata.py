@@ -0,0 +1,65 @@
+import sys
+import os
+from datetime import date
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from metadata import (
+    promoted_sources, row_record, normalize_filters, filter_params, filter_sql, extract_filters, filters_key
+)
+
+# ✅ Test: promoted columns are found by normalized name in both sample schemas
+def test_promoted_sources():
+    sam = promoted_sources(["unique_entity_id", "cage_code", "physical_address_province_or_state", "primary_naics"])
+    assert sam == {"state": "physical_address_province_or_state", "naics": "primary_naics",
+                   "uei": "unique_entity_id", "cage": "cage_code"}
+    opportunities = promoted_sources(["Department/Ind.Agency", "PostedDate", "NaicsCode", "PopState", "State"])
+    assert opportunities["agency"] == "Department/Ind.Agency"
+    assert opportunities["state"] == "PopState"
+    assert opportunities["posted_date"] == "PostedDate"
+
+# ✅ Test: METADATA_<FIELD>_COLUMNS replaces a field's source columns
+def test_promoted_sources_from_env(monkeypatch):
+    monkeypatch.setenv("METADATA_STATE_COLUMNS", "State")
+    assert promoted_sources(["PopState", "State"])["state"] == "State"
+
+# ✅ Test: promoted values are normalized; unusable ones are stored as NULL
+def test_row_record():
+    sources = {"state": "st", "naics": "code", "posted_date": "posted", "response_deadline": "due", "uei": "uei"}
+    record = row_record({"st": "Texas", "code": "238350N", "posted": "1/30/2025", "due": "46:15.1",
+                         "uei": "c111jjbms328", "note": "a\x00b"}, sources)
+    assert record["state"] == "TX" and record["naics"] == "238350" and record["uei"] == "C111JJBMS328"
+    assert record["posted_date"] == date(2025, 1, 30) and record["response_deadline"] is None
+    assert record["agency"] is None and record["cage"] is None
+    assert record["raw"]["note"] == "ab"
+
+# ✅ Test: filters are validated and turned into predicates and bound values
+def test_filters_to_sql():
+    filters = normalize_filters({"state": "california", "naics": "23", "agency": "100%_navy", "cage": None,
+                                 "posted_after": "2025-01-01", "columns": {"Type": "Award Notice"}})
+    assert filters["state"] == "CA" and filters["posted_after"] == date(2025, 1, 1) and "cage" not in filters
+
+    params = filter_params(filters)
+    assert params["f_naics"] == "23%"
+    assert params["f_agency"] == "%100\\%\\_navy%"
+    assert params["f_columns"] == '{"Type": "Award Notice"}'
+    assert filter_sql(["state", "naics"]).split("AND")[1:] == [" state = :f_state\n               ", " naics LIKE :f_naics"]
+    assert filters_key({"state": "CA", "posted_after": date(2025, 1, 1)}) == '{"posted_after":"2025-01-01","state":"CA"}'
+
+    for bad in ({"naics": "23a"}, {"uei": "short"}, {"posted_before": "tomorrow"}, {"color": "red"}):
+        with pytest.raises(ValueError):
+            normalize_filters(bad)
+
+# ✅ Test: filters named in the query text
+@pytest.mark.parametrize("query, expected", [
+    ("construction suppliers in CA under NAICS 423390", {"state": "CA", "naics": "423390"}),
+    ("janitorial services in New Hampshire", {"state": "NH"}),
+    ("CAGE 6PA87 or uei c111jjbms328", {"cage": "6PA87", "uei": "C111JJBMS328"}),
+    ("solicitations posted after 2025-01-01 due before 2025-03-31",
+     {"posted_after": date(2025, 1, 1), "deadline_before": date(2025, 3, 31)}),
+    ("AI contracts in or near the capital", {}),
+    ("awards since 2025-02-30", {}),
+])
+def test_extract_filters(query, expected):
+    assert extract_filters(query) == expected
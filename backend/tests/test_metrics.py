@@ -0,0 +1,92 @@
+import sys
+import os
+from unittest.mock import patch, MagicMock, AsyncMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from fastapi.testclient import TestClient
+from main import app
+from metrics import Counter, Histogram, stage, stage_seconds, record_llm_usage, llm_tokens, render
+from semantic_cache import SemanticCache
+from singleflight import SingleFlight
+
+client = TestClient(app)
+
+# ✅ Test: a stage is observed in the histogram and added to the timings dict
+def test_stage_records_histogram_and_timings():
+    before = stage_seconds.count(pipeline="test", stage="step")
+    timings = {}
+    with stage("test", "step", timings):
+        pass
+    with stage("test", "step", timings):
+        pass
+    assert stage_seconds.count(pipeline="test", stage="step") == before + 2
+    assert list(timings) == ["step"] and timings["step"] >= 0
+
+# ✅ Test: counters and histograms render in the Prometheus text format
+def test_render_text_format():
+    counter = Counter("demo_total", "Demo counter.", ("kind",))
+    counter.inc(kind='a"b')
+    counter.inc(2, kind='a"b')
+    assert counter.render()[-1] == 'demo_total{kind="a\\"b"} 3.0'
+
+    histogram = Histogram("demo_seconds", "Demo histogram.", buckets=(0.1, 1.0))
+    histogram.observe(0.5)
+    lines = histogram.render()
+    assert 'demo_seconds_bucket{le="0.1"} 0' in lines
+    assert 'demo_seconds_bucket{le="1.0"} 1' in lines
+    assert 'demo_seconds_bucket{le="+Inf"} 1' in lines
+    assert "demo_seconds_count 1" in lines
+
+# ✅ Test: token usage is read from the chat model's response metadata
+def test_record_llm_usage():
+    message = MagicMock(response_metadata={"model_name": "gpt-4o-test",
+                                           "token_usage": {"prompt_tokens": 120, "completion_tokens": 30}})
+    usage = {}
+    record_llm_usage(message, "extract", usage)
+    record_llm_usage(message, "format", usage)
+    assert usage == {"prompt_tokens": 240, "completion_tokens": 60, "total_tokens": 300}
+    assert llm_tokens.get(model="gpt-4o-test", kind="prompt") == 240
+
+    # Responses without metadata count the call only
+    record_llm_usage(MagicMock(content="x"), "extract")
+
+# ✅ Test: /metrics exposes stage histograms, cache counters and pool gauges
+def test_metrics_endpoint():
+    with stage("search", "embed"):
+        pass
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'pipeline_stage_seconds_count{pipeline="search",stage="embed"}' in body
+    assert "# TYPE embedding_cache_lookups_total counter" in body
+    assert 'db_pool_size{engine="sync"}' in body
+
+# ✅ Test: debug=true adds per-stage timings and token usage to a computed search
+@patch("search.generate_embedding_async", new_callable=AsyncMock, return_value=[0.1] * 1536)
+@patch("search.get_chat_llm")
+@patch("routes.get_cached_result", return_value=None)
+@patch("routes.set_cached_result", return_value=None)
+@patch("routes.AsyncSessionLocal")
+def test_semantic_search_debug_timings(mock_db, mock_cache_set, mock_cache_get, mock_llm, mock_embed):
+    mock_session = MagicMock()
+    mock_session.execute = AsyncMock(return_value=MagicMock())
+    mock_session.execute.return_value.fetchall.return_value = [(1, "db1", "Relevant contract for AI", 0.032)]
+    mock_db.return_value.__aenter__.return_value = mock_session
+    reply = MagicMock(content="## Result 1", response_metadata={
+        "model_name": "gpt-4o", "token_usage": {"prompt_tokens": 50, "completion_tokens": 10}})
+    mock_llm.return_value.ainvoke = AsyncMock(return_value=reply)
+
+    def search(**params):
+        # Fresh caches, so every request runs the whole pipeline
+        with patch("search.semantic_cache", SemanticCache(client=None)), \
+                patch("routes.search_flight", SingleFlight(client=None)):
+            return client.post("/semantic-search/", params={"query": "AI contract", **params}).json()
+
+    assert "timings" not in search()
+    debug = search(debug="true")
+    assert debug["cached"] is False
+    assert {"cache_lookup", "embed", "semantic_lookup", "retrieval", "context", "llm_extract", "llm_format", "cache_store",
+            "total"} <= set(debug["timings"])
+    assert debug["usage"] == {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120, "context_tokens": 5}
@@ -1,38 +1,96 @@
 import sys
 import os
 import json
+import zlib
 import pytest
 from unittest.mock import patch, MagicMock
 
 # Adjust path to import your app module
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
 
-from cache import get_cached_result, set_cached_result, CACHE_TTL
+from cache import (
+    get_cached_result, set_cached_result, encode_result, decode_result,
+    CACHE_TTL, CACHE_MAGIC, CACHE_FORMAT_VERSION
+)
 
 @patch("cache.redis_client")
-def test_set_cached_result(mock_redis):
-    mock_setex = MagicMock()
-    mock_sadd = MagicMock()
-    mock_redis.setex = mock_setex
-    mock_redis.sadd = mock_sadd
-
+@patch("cache.redis_bytes_client")
+def test_set_cached_result(mock_bytes_redis, mock_redis):
     query = "ai"
     data = {"foo": "bar"}
 
     set_cached_result(query, data)
 
     key = f"query:{query}"
-    expected_data = json.dumps(data)
-
-    mock_redis.setex.assert_called_once_with(key, CACHE_TTL, expected_data)
-    mock_redis.sadd.assert_called_once_with("cached_queries", query)
+    mock_bytes_redis.setex.assert_called_once_with(key, CACHE_TTL, encode_result(data))
+    mock_redis.sadd.assert_not_called()  # suggestions are tracked by suggestions.py
 
-@patch("cache.redis_client")
+@patch("cache.redis_bytes_client")
 def test_get_cached_result(mock_redis):
     query = "ai"
-    expected_value = '{"result": "mocked"}'
-    mock_redis.get.return_value = expected_value
+    mock_redis.get.return_value = encode_result({"result": "mocked"})
 
     result = get_cached_result(query)
-    assert result == expected_value
+    assert result == {"result": "mocked"}
     mock_redis.get.assert_called_once_with(f"query:{query}")
+
+# ✅ Test: entries in the old plain JSON format read back as misses
+@patch("cache.redis_bytes_client")
+def test_get_cached_result_legacy_entry(mock_redis):
+    mock_redis.get.return_value = b'{"result": "mocked"}'
+    assert get_cached_result("ai") is None
+
+    mock_redis.get.return_value = None
+    assert get_cached_result("ai") is None
+
+# ✅ Test: small payloads are stored uncompressed, large ones compressed
+def test_encode_result_compression_threshold():
+    small = encode_result({"q": "ai"}, codec="json", compression="zlib", min_bytes=1024)
+    assert small[:2] == CACHE_MAGIC and small[2] == CACHE_FORMAT_VERSION
+    assert json.loads(small[4:]) == {"q": "ai"}
+
+    large_data = {"gpt_response": "Acme Corp, California, AI services. " * 200}
+    large = encode_result(large_data, codec="json", compression="zlib", min_bytes=1024)
+    assert len(large) < len(json.dumps(large_data))
+    assert json.loads(zlib.decompress(large[4:])) == large_data
+    assert decode_result(large) == large_data
+
+# ✅ Test: a different format version or unknown bytes are rejected without raising
+def test_decode_result_rejects_other_versions():
+    raw = encode_result({"foo": "bar"})
+    assert decode_result(raw) == {"foo": "bar"}
+    assert decode_result(raw[:2] + bytes([CACHE_FORMAT_VERSION + 1]) + raw[3:]) is None
+    assert decode_result(CACHE_MAGIC + bytes([CACHE_FORMAT_VERSION, 0x01]) + b"garbage") is None
+
+# ✅ Test: a corrupt zstd entry is a cache miss rather than an error
+def test_decode_result_drops_corrupt_zstd_payload():
+    class ZstdError(Exception):
+        pass
+
+    fake_zstandard = MagicMock()
+    fake_zstandard.ZstdError = ZstdError
+    fake_zstandard.ZstdDecompressor.return_value.decompress.side_effect = ZstdError("corrupt frame")
+    raw = CACHE_MAGIC + bytes([CACHE_FORMAT_VERSION, 0x02]) + b"\x28\xb5\x2f\xfd-truncated"
+    with patch("cache.zstandard", fake_zstandard):
+        assert decode_result(raw) is None
+
+# ✅ Test: a corrupt msgpack entry is a cache miss rather than an error
+def test_decode_result_drops_corrupt_msgpack_payload():
+    class UnpackException(Exception):
+        pass
+
+    fake_msgpack = MagicMock()
+    fake_msgpack.exceptions.UnpackException = UnpackException
+    fake_msgpack.unpackb.side_effect = UnpackException("truncated")
+    raw = CACHE_MAGIC + bytes([CACHE_FORMAT_VERSION, 0x10]) + b"\x92\x01"
+    with patch("cache.msgpack", fake_msgpack):
+        assert decode_result(raw) is None
+
+# ✅ Test: unavailable optional codecs fall back to json/zlib
+@patch("cache.msgpack", None)
+@patch("cache.zstandard", None)
+def test_encode_result_falls_back_without_optional_codecs():
+    data = {"sources": ["Acme"] * 500}
+    raw = encode_result(data, codec="msgpack", compression="zstd", min_bytes=0)
+    assert raw[3] == 0x01  # json + zlib
+    assert decode_result(raw) == data
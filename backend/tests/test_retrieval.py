@@ -0,0 +1,135 @@
+import sys
+import os
+from unittest.mock import MagicMock, patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from ann import AnnConfig
+from retrieval import (
+    format_vector, hybrid_search, hybrid_search_batch, hybrid_search_statement, CANDIDATES_PER_LEG, SEARCH_SOURCE_TAGS,
+)
+
+# ✅ Test: query vectors are sent as pgvector text literals
+def test_format_vector():
+    assert format_vector([0.5, 1, -2.25]) == "[0.5,1.0,-2.25]"
+
+# ✅ Test: hybrid_search runs one statement for all sources and returns only the needed columns
+def test_hybrid_search_single_statement():
+    db = MagicMock()
+    db.execute.return_value.fetchall.return_value = [
+        (3, "db2", "Acme Corp Austin TX", 0.0325),
+        (9, "db1", "Beta LLC Dallas TX", 0.0164),
+    ]
+
+    results = hybrid_search(db, [0.1, 0.2], "acme:*", limit=5)
+
+    assert db.execute.call_count == 1
+    params = db.execute.call_args[0][1]
+    assert params["tags"] == SEARCH_SOURCE_TAGS
+    assert [params[f"tag_{i}"] for i in range(len(SEARCH_SOURCE_TAGS))] == SEARCH_SOURCE_TAGS
+    assert params["embedding"] == "[0.1,0.2]"
+    assert params["limit"] == 5
+    assert results[0].source_tag == "db2" and results[0].source_text == "Acme Corp Austin TX"
+    assert results[1].score == 0.0164
+
+# ✅ Test: with the local backend, dense ranks come from the vector index and pgvector is not queried
+@patch("retrieval.DENSE_SEARCH_BACKEND", "local")
+def test_hybrid_search_local_dense():
+    index = MagicMock()
+    index.ready.return_value = True
+    index.search.return_value = {"db1": [(9, 0.91), (4, 0.85)], "db2": [(3, 0.88)]}
+    db = MagicMock()
+    db.execute.return_value.fetchall.return_value = [(3, "db2", "Acme Corp Austin TX", 0.0325)]
+
+    with patch("vector_index.get_vector_index", return_value=index):
+        results = hybrid_search(db, [0.1, 0.2], "acme:*", limit=5, tags=["db1", "db2"])
+
+    index.search.assert_called_once_with([0.1, 0.2], ["db1", "db2"], CANDIDATES_PER_LEG)
+    statement, params = db.execute.call_args[0]
+    assert "unnest(CAST(:dense_ids" in str(statement) and "<=>" not in str(statement)
+    assert params["dense_ids"] == [9, 4, 3]
+    assert params["dense_tags"] == ["db1", "db1", "db2"]
+    assert params["dense_ranks"] == [1, 2, 1]
+    assert "embedding" not in params
+    assert results[0].id == 3
+
+# ✅ Test: with a quantized index, each dense branch reranks the index's candidates on the full embedding
+def test_hybrid_search_quantized_rerank():
+    db = MagicMock()
+    db.execute.return_value.fetchall.return_value = []
+    hybrid_search_statement.cache_clear()
+    try:
+        with patch("retrieval.ann_config", AnnConfig(quantization="halfvec", rerank_candidates=60)):
+            hybrid_search(db, [0.1, 0.2], "acme:*", limit=5, tags=["db1", "db2"])
+    finally:
+        hybrid_search_statement.cache_clear()
+
+    statement, params = db.execute.call_args[0]
+    sql = str(statement)
+    assert sql.count("ORDER BY (embedding::halfvec(1536)) <=> CAST(CAST(CAST(:embedding AS text) AS vector) AS halfvec(1536))") == 2
+    assert sql.count("c.embedding <=> CAST(CAST(:embedding AS text) AS vector) AS distance") == 2
+    assert params["rerank_candidates"] == 60
+    assert params["candidates"] == CANDIDATES_PER_LEG
+
+# ✅ Test: metadata filters narrow both legs before ranking, and bypass the local dense index
+@patch("retrieval.DENSE_SEARCH_BACKEND", "local")
+def test_hybrid_search_filters():
+    from datetime import date
+
+    index = MagicMock()
+    index.ready.return_value = True
+    db = MagicMock()
+    db.execute.return_value.fetchall.return_value = []
+
+    with patch("vector_index.get_vector_index", return_value=index):
+        hybrid_search(db, [0.1, 0.2], "construction:*", limit=5, tags=["db1", "db2"],
+                      filters={"state": "CA", "posted_after": date(2025, 1, 1)})
+
+    index.search.assert_not_called()
+    statement, params = db.execute.call_args[0]
+    sql = str(statement)
+    assert sql.count("AND posted_date >= :f_posted_after") == 3
+    assert sql.count("AND state = :f_state") == 3
+    assert params["f_state"] == "CA" and params["f_posted_after"] == date(2025, 1, 1)
+
+# ✅ Test: a batch is ranked in one statement per chunk of queries, and rows come back grouped per query
+@patch("retrieval.BATCH_STATEMENT_QUERIES", 2)
+def test_hybrid_search_batch():
+    db = MagicMock()
+    db.execute.return_value.fetchall.side_effect = [
+        [(1, 3, "db2", "Acme Corp Austin TX", 0.0325), (2, 9, "db1", "Beta LLC Dallas TX", 0.0164)],
+        [],
+    ]
+
+    results = hybrid_search_batch(db, [[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]], ["acme:*", "beta:*", "gamma:*"],
+                                  limit=5, tags=["db1", "db2"])
+
+    assert db.execute.call_count == 2
+    statement, params = db.execute.call_args_list[0][0]
+    sql = str(statement)
+    assert sql.count("CROSS JOIN LATERAL") == 3  # a dense branch per tag, and the sparse leg
+    assert "embedding <=> q.embedding AS distance" in sql
+    assert params["embeddings"] == ["[0.1,0.2]", "[0.3,0.4]"]
+    assert params["keywords"] == ["acme:*", "beta:*"]
+    assert params["tag_0"] == "db1" and params["tag_1"] == "db2"
+    assert db.execute.call_args_list[1][0][1]["keywords"] == ["gamma:*"]
+    assert [[doc.id for doc in found] for found in results] == [[3], [9], []]
+
+# ✅ Test: with the local backend, a batch searches the vector index once per chunk
+@patch("retrieval.DENSE_SEARCH_BACKEND", "local")
+def test_hybrid_search_batch_local_dense():
+    index = MagicMock()
+    index.ready.return_value = True
+    index.search_batch.return_value = [{"db1": [(9, 0.91)]}, {"db1": [(4, 0.85), (9, 0.80)]}]
+    db = MagicMock()
+    db.execute.return_value.fetchall.return_value = []
+
+    with patch("vector_index.get_vector_index", return_value=index):
+        hybrid_search_batch(db, [[0.1, 0.2], [0.3, 0.4]], ["acme:*", "beta:*"], tags=["db1"])
+
+    index.search_batch.assert_called_once()
+    statement, params = db.execute.call_args[0]
+    assert "<=>" not in str(statement)
+    assert params["dense_qis"] == [1, 2, 2]
+    assert params["dense_ids"] == [9, 4, 9]
+    assert params["dense_ranks"] == [1, 1, 2]
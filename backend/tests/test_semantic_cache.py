@@ -0,0 +1,66 @@
+import sys
+import os
+import numpy as np
+import pytest
+import redis
+from unittest.mock import MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from semantic_cache import SemanticCache, SEMANTIC_CACHE_KEY
+
+# ✅ Test: a close paraphrase matches above the threshold, an unrelated query does not
+def test_lookup_threshold():
+    cache = SemanticCache(threshold=0.9, client=None)
+    cache.add("AI contracts in CA", [1.0, 0.0, 0.0])
+
+    match = cache.lookup([0.95, 0.1, 0.0])
+    assert match.query == "AI contracts in CA"
+    assert match.similarity > 0.9
+
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["hit_rate"] == 0.5
+
+# ✅ Test: the index grows past its initial capacity and evicts beyond max_entries
+def test_growth_and_eviction():
+    cache = SemanticCache(threshold=0.99, max_entries=20, client=None)
+    vectors = np.eye(32, dtype=np.float32)
+    for i in range(25):
+        cache.add(f"q{i}", vectors[i])
+
+    assert cache.stats()["entries"] == 20
+    assert cache.lookup(vectors[0]) is None
+    assert cache.lookup(vectors[24]).query == "q24"
+
+# ✅ Test: discarded queries no longer match, and the remaining rows stay consistent
+def test_discard():
+    cache = SemanticCache(threshold=0.99, client=None)
+    cache.add("a", [1.0, 0.0])
+    cache.add("b", [0.0, 1.0])
+    cache.discard("a")
+
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.lookup([0.0, 1.0]).query == "b"
+
+# ✅ Test: entries written by other workers are loaded from Redis on refresh
+def test_refresh_from_redis():
+    client = MagicMock()
+    client.hgetall.return_value = {b"remote query": np.array([0.0, 1.0], dtype=np.float32).tobytes()}
+    cache = SemanticCache(threshold=0.99, client=client, refresh_seconds=0)
+
+    assert cache.lookup([0.0, 1.0]).query == "remote query"
+    client.hgetall.assert_called_with(SEMANTIC_CACHE_KEY)
+
+    cache.add("local", [1.0, 0.0])
+    client.pipeline.return_value.hset.assert_called_once()
+
+# ✅ Test: Redis errors leave the in-process index working
+def test_redis_errors_are_ignored():
+    client = MagicMock()
+    client.hgetall.side_effect = redis.ConnectionError("down")
+    client.pipeline.return_value.execute.side_effect = redis.ConnectionError("down")
+    cache = SemanticCache(threshold=0.99, client=client, refresh_seconds=0)
+
+    cache.add("a", [1.0, 0.0])
+    assert cache.lookup([1.0, 0.0]).query == "a"
@@ -1,6 +1,8 @@
 import sys
 import os
-from unittest.mock import patch, MagicMock
+import json
+import asyncio
+from unittest.mock import patch, MagicMock, AsyncMock
 import pytest
 
 # ✅ Patch sys.path to locate `app` folder for module imports
@@ -8,25 +10,40 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app"
 
 from fastapi.testclient import TestClient
 from main import app
+from semantic_cache import SemanticCache
+from singleflight import SingleFlight
 
 client = TestClient(app)
 
-@patch("routes.generate_embedding", return_value=[0.1] * 1536)
-@patch("routes.ChatOpenAI")
+
+@pytest.fixture(autouse=True)
+def fresh_semantic_cache():
+    # In-process only, so tests never reach Redis
+    cache = SemanticCache(threshold=0.95, client=None)
+    with patch("search.semantic_cache", cache), patch("routes.search_flight", SingleFlight(client=None)):
+        yield cache
+
+
+@pytest.fixture(autouse=True)
+def suggestions():
+    index = MagicMock()
+    with patch("search.suggestion_index", index), patch("routes.suggestion_index", index):
+        yield index
+
+@patch("search.generate_embedding_async", new_callable=AsyncMock, return_value=[0.1] * 1536)
+@patch("search.get_chat_llm")
 @patch("routes.get_cached_result", return_value=None)
 @patch("routes.set_cached_result", return_value=None)
-@patch("routes.SessionLocal")
-def test_semantic_search_valid(mock_db, mock_cache_set, mock_cache_get, mock_llm, mock_embed):
-    dummy_record = MagicMock()
-    dummy_record.id = 1
-    dummy_record.source_tag = "db1"
-    dummy_record.source_text = "Relevant contract for AI"
+@patch("routes.AsyncSessionLocal")
+def test_semantic_search_valid(mock_db, mock_cache_set, mock_cache_get, mock_llm, mock_embed, suggestions):
+    dummy_record = (1, "db1", "Relevant contract for AI", 0.032)
 
     mock_session = MagicMock()
-    mock_session.query().filter().order_by().limit().all.return_value = [dummy_record]
-    mock_db.return_value = mock_session
+    mock_session.execute = AsyncMock(return_value=MagicMock())
+    mock_session.execute.return_value.fetchall.return_value = [dummy_record]
+    mock_db.return_value.__aenter__.return_value = mock_session
 
-    mock_llm.return_value.return_value.content.strip.return_value = "## Result 1\n- **Field**: Value"
+    mock_llm.return_value.ainvoke = AsyncMock(return_value=MagicMock(content="## Result 1\n- **Field**: Value"))
 
     response = client.post("/semantic-search/", params={"query": "AI contract"})
     assert response.status_code == 200
@@ -36,11 +53,295 @@ def test_semantic_search_valid(mock_db, mock_cache_set, mock_cache_get, mock_llm
     assert "gpt_response" in json_data
     assert "retrieved_context" in json_data
     assert "sources" in json_data
+    assert json_data["retrieved_context"] == "[1] Relevant contract for AI"
+    assert json_data["sources"] == ["db1"]
+    assert mock_session.execute.call_count == 1
+    assert mock_llm.return_value.ainvoke.call_count == 2
+    suggestions.record.assert_called_once_with("AI contract", True)
+
+
+# ✅ Test: concurrent identical requests share one pipeline run
+@patch("search.generate_embedding_async", new_callable=AsyncMock, return_value=[0.1] * 1536)
+@patch("search.get_chat_llm")
+@patch("routes.get_cached_result", return_value=None)
+@patch("routes.set_cached_result", return_value=None)
+@patch("routes.AsyncSessionLocal")
+def test_semantic_search_coalesces_concurrent_requests(mock_db, mock_cache_set, mock_cache_get, mock_llm, mock_embed):
+    import httpx
+
+    mock_session = MagicMock()
+    mock_session.execute = AsyncMock(return_value=MagicMock())
+    mock_session.execute.return_value.fetchall.return_value = [(1, "db1", "Relevant contract for AI", 0.032)]
+    mock_db.return_value.__aenter__.return_value = mock_session
+
+    async def slow_llm(messages):
+        await asyncio.sleep(0.05)
+        return MagicMock(content="## Result 1")
+
+    mock_llm.return_value.ainvoke = AsyncMock(side_effect=slow_llm)
+
+    async def fire(n):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            return await asyncio.gather(*(
+                async_client.post("/semantic-search/", params={"query": "AI contract", "debug": "true"})
+                for _ in range(n)
+            ))
+
+    responses = asyncio.run(fire(10))
+    bodies = [response.json() for response in responses]
+    assert all(response.status_code == 200 for response in responses)
+    assert all(body["gpt_response"] == "## Result 1" for body in bodies)
+    assert sum(1 for body in bodies if body.get("coalesced")) == 9
+    # Followers report how long they waited and the leader's stages
+    follower = next(body for body in bodies if body.get("coalesced"))
+    assert "coalesced_wait" in follower["timings"] and "leader_llm_format" in follower["timings"]
+    assert all("leader" not in body for body in bodies)
+    # One extraction + one formatting call in total
+    assert mock_llm.return_value.ainvoke.call_count == 2
+    assert mock_session.execute.call_count == 1
+    mock_cache_set.assert_called_once()
+
+
+# ✅ Test: queries differing only in case and whitespace share one pipeline run and one cache entry
+@patch("search.generate_embedding_async", new_callable=AsyncMock, return_value=[0.1] * 1536)
+@patch("search.get_chat_llm")
+@patch("routes.get_cached_result", return_value=None)
+@patch("routes.set_cached_result", return_value=None)
+@patch("routes.AsyncSessionLocal")
+def test_semantic_search_coalesces_query_variants(mock_db, mock_cache_set, mock_cache_get, mock_llm, mock_embed):
+    import httpx
+
+    mock_session = MagicMock()
+    mock_session.execute = AsyncMock(return_value=MagicMock())
+    mock_session.execute.return_value.fetchall.return_value = [(1, "db1", "Relevant contract for AI", 0.032)]
+    mock_db.return_value.__aenter__.return_value = mock_session
+
+    async def slow_llm(messages):
+        await asyncio.sleep(0.05)
+        return MagicMock(content="## Result 1")
+
+    mock_llm.return_value.ainvoke = AsyncMock(side_effect=slow_llm)
+    variants = ["AI contracts", "ai  contracts", " Ai Contracts\n", "AI\tCONTRACTS"]
+
+    async def fire():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            return await asyncio.gather(*(
+                async_client.post("/semantic-search/", params={"query": query}) for query in variants
+            ))
+
+    bodies = [response.json() for response in asyncio.run(fire())]
+    assert [body["query"] for body in bodies] == variants
+    assert sum(1 for body in bodies if body.get("coalesced")) == 3
+    assert mock_session.execute.call_count == 1
+    assert mock_llm.return_value.ainvoke.call_count == 2
+    assert [call[0][0] for call in mock_cache_get.call_args_list] == ["ai contracts"] * 4
+    mock_cache_set.assert_called_once()
+
+
+# ✅ Test: a near-duplicate query is answered from the semantic cache with its similarity
+@patch("search.generate_embedding_async", new_callable=AsyncMock, return_value=[0.1] * 1536)
+@patch("search.get_chat_llm")
+@patch("search.get_cached_result")
+@patch("routes.get_cached_result", return_value=None)
+@patch("routes.AsyncSessionLocal")
+def test_semantic_search_similar_query_hit(mock_db, mock_exact_get, mock_similar_get, mock_llm, mock_embed,
+                                           fresh_semantic_cache):
+    stored = {"query": "AI contracts in California", "gpt_response": "## Result 1",
+              "retrieved_context": "[1] Relevant contract for AI", "sources": ["db1"]}
+    fresh_semantic_cache.add("AI contracts in California", [0.1] * 1536)
+    mock_similar_get.return_value = stored
+
+    response = client.post("/semantic-search/", params={"query": "ai contract california"})
+    assert response.status_code == 200
+    json_data = response.json()
+    assert json_data["cached"] is True
+    assert json_data["query"] == "ai contract california"
+    assert json_data["gpt_response"] == "## Result 1"
+    assert json_data["semantic_match"]["query"] == "AI contracts in California"
+    assert json_data["semantic_match"]["similarity"] == pytest.approx(1.0)
+    mock_similar_get.assert_called_once_with("AI contracts in California")
+    mock_llm.return_value.ainvoke.assert_not_called()
+    mock_db.return_value.__aenter__.return_value.execute.assert_not_called()
+
+
+@patch("search.generate_embedding_async", new_callable=AsyncMock, return_value=[0.1] * 1536)
+@patch("search.get_chat_llm")
+@patch("search.get_cached_result", return_value=None)
+@patch("search.set_cached_result", return_value=None)
+@patch("search.AsyncSessionLocal")
+def test_semantic_search_stream(mock_db, mock_cache_set, mock_cache_get, mock_llm, mock_embed, fresh_semantic_cache):
+    mock_session = MagicMock()
+    mock_session.execute = AsyncMock(return_value=MagicMock())
+    mock_session.execute.return_value.fetchall.return_value = [(1, "db1", "Relevant contract for AI", 0.032)]
+    mock_db.return_value.__aenter__.return_value = mock_session
+
+    async def fake_stream(messages):
+        for token in ["## Result 1", "\n- **Field**", ": Value"]:
+            yield MagicMock(content=token)
+
+    mock_llm.return_value.ainvoke = AsyncMock(return_value=MagicMock(content="Relevant contract for AI"))
+    mock_llm.return_value.astream = fake_stream
+
+    response = client.post("/semantic-search/stream", params={"query": "AI contract"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    names = [name for name, _ in events]
+    assert names == ["sources", "token", "token", "token", "done"]
+    assert events[0][1]["sources"] == ["db1"]
+    assert events[0][1]["retrieved_context"] == "[1] Relevant contract for AI"
+    assert events[-1][1]["gpt_response"] == "## Result 1\n- **Field**: Value"
+    mock_cache_set.assert_called_once()
+    assert mock_cache_set.call_args[0][1]["gpt_response"] == events[-1][1]["gpt_response"]
+    assert fresh_semantic_cache.stats()["entries"] == 1
 
 
-@patch("routes.redis_client.smembers", return_value={"cache1", "cache2"})
-def test_get_cached_queries(mock_redis):
-    response = client.get("/suggestions/")
+def test_get_cached_queries(suggestions):
+    suggestions.lookup.return_value = ["cache1", "cache2"]
+    response = client.get("/suggestions/", params={"prefix": "cac", "limit": 5})
     assert response.status_code == 200
     json_data = response.json()
     assert json_data["suggestions"] == ["cache1", "cache2"]
+    suggestions.lookup.assert_called_once_with("cac", 5)
+
+    assert client.get("/suggestions/", params={"limit": 1000}).status_code == 422
+
+
+# ✅ Test: single-call mode answers with one LLM call and no extraction step
+@patch("search.generate_embedding_async", new_callable=AsyncMock, return_value=[0.1] * 1536)
+@patch("search.get_chat_llm")
+@patch("routes.get_cached_result", return_value=None)
+@patch("routes.set_cached_result", return_value=None)
+@patch("routes.AsyncSessionLocal")
+@patch("search.SEARCH_LLM_MODE", "single")
+def test_semantic_search_single_call(mock_db, mock_cache_set, mock_cache_get, mock_llm, mock_embed):
+    mock_session = MagicMock()
+    mock_session.execute = AsyncMock(return_value=MagicMock())
+    mock_session.execute.return_value.fetchall.return_value = [(1, "db1", "Relevant contract for AI", 0.032)]
+    mock_db.return_value.__aenter__.return_value = mock_session
+    mock_llm.return_value.ainvoke = AsyncMock(return_value=MagicMock(content="## Result 1\n- **Field**: Value"))
+
+    response = client.post("/semantic-search/", params={"query": "AI contract", "debug": "true"})
+    assert response.status_code == 200
+    json_data = response.json()
+    assert json_data["gpt_response"] == "## Result 1\n- **Field**: Value"
+    assert "llm_answer" in json_data["timings"]
+    assert "llm_extract" not in json_data["timings"]
+    assert mock_llm.return_value.ainvoke.call_count == 1
+    prompt = mock_llm.return_value.ainvoke.call_args[0][0][1].content
+    assert "[1] Relevant contract for AI" in prompt
+
+
+# ✅ Test: filters reach retrieval, are cached under their own key and skip the semantic cache
+@patch("search.generate_embedding_async", new_callable=AsyncMock, return_value=[0.1] * 1536)
+@patch("search.get_chat_llm")
+@patch("routes.get_cached_result", return_value=None)
+@patch("routes.set_cached_result", return_value=None)
+@patch("routes.AsyncSessionLocal")
+def test_semantic_search_filters(mock_db, mock_cache_set, mock_cache_get, mock_llm, mock_embed, fresh_semantic_cache,
+                                 suggestions):
+    mock_session = MagicMock()
+    mock_session.execute = AsyncMock(return_value=MagicMock())
+    mock_session.execute.return_value.fetchall.return_value = [(1, "db1", "Acme Supply Fresno CA 423390", 0.032)]
+    mock_db.return_value.__aenter__.return_value = mock_session
+    mock_llm.return_value.ainvoke = AsyncMock(return_value=MagicMock(content="## Result 1"))
+
+    response = client.post("/semantic-search/", params={
+        "query": "construction suppliers in CA under NAICS 423390", "extract_filters": "true", "naics": "4233"
+    })
+    assert response.status_code == 200
+    assert response.json()["filters"] == {"naics": "4233", "state": "CA"}
+
+    params = mock_session.execute.call_args[0][1]
+    assert params["f_naics"] == "4233%" and params["f_state"] == "CA"
+    key, _ = mock_cache_set.call_args[0]
+    assert key == 'construction suppliers in ca under naics 423390 [filters {"naics":"4233","state":"CA"}]'
+    suggestions.record.assert_not_called()
+    assert fresh_semantic_cache.stats()["entries"] == 0
+
+    response = client.post("/semantic-search/", params={"query": "AI contract", "uei": "not-a-uei"})
+    assert response.status_code == 400
+
+
+# ✅ Test: batch search without the LLM embeds the uncached queries together and ranks them in one statement
+@patch("search.generate_embeddings")
+@patch("search.get_chat_llm")
+@patch("search.get_cached_results")
+@patch("search.set_cached_results", return_value=None)
+@patch("search.AsyncSessionLocal")
+def test_semantic_search_batch_matches(mock_db, mock_cache_set, mock_cache_get, mock_llm, mock_embed):
+    import numpy as np
+
+    mock_embed.return_value = np.zeros((2, 1536), dtype=np.float32)
+    mock_cache_get.return_value = [None, {"query": "beta llc", "matches": []}, None]
+    mock_session = MagicMock()
+    mock_session.execute = AsyncMock(return_value=MagicMock())
+    mock_session.execute.return_value.fetchall.return_value = [
+        (1, 3, "db2", "Acme Corp Austin TX", 0.0325),
+        (2, 7, "db1", "Gamma Inc Reno NV", 0.0161),
+    ]
+    mock_db.return_value.__aenter__.return_value = mock_session
+
+    response = client.post("/semantic-search/batch", json={
+        "queries": ["acme corp", "beta llc", "gamma inc", "acme corp"], "llm": False
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert [result["query"] for result in body["results"]] == ["acme corp", "beta llc", "gamma inc", "acme corp"]
+    assert body["results"][0]["matches"][0]["id"] == 3 and body["results"][0]["cached"] is False
+    assert body["results"][1]["cached"] is True
+    assert body["results"][2]["matches"][0]["source_text"] == "Gamma Inc Reno NV"
+    assert body["cached"] == 1
+
+    assert mock_cache_get.call_args[0][0] == ["acme corp [matches]", "beta llc [matches]", "gamma inc [matches]"]
+    assert mock_embed.call_args[0][0] == ["acme corp", "gamma inc"]
+    assert mock_session.execute.call_count == 1
+    assert mock_session.execute.call_args[0][1]["keywords"] == ["acme:* & corp:*", "gamma:* & inc:*"]
+    mock_llm.assert_not_called()
+    assert [key for key, _ in mock_cache_set.call_args[0][0]] == ["acme corp [matches]", "gamma inc [matches]"]
+
+
+# ✅ Test: batch search with the LLM answers each query like /semantic-search/ and shares its cache keys
+@patch("search.generate_embedding_async", new_callable=AsyncMock, return_value=[0.1] * 1536)
+@patch("search.generate_embeddings")
+@patch("search.get_chat_llm")
+@patch("search.get_cached_results")
+@patch("search.set_cached_results", return_value=None)
+@patch("search.AsyncSessionLocal")
+def test_semantic_search_batch_llm(mock_db, mock_cache_set, mock_cache_get, mock_llm, mock_embed, mock_embed_one,
+                                   fresh_semantic_cache, suggestions):
+    import numpy as np
+
+    mock_embed.return_value = np.zeros((2, 1536), dtype=np.float32)
+    mock_cache_get.return_value = [None, None]
+    mock_session = MagicMock()
+    mock_session.execute = AsyncMock(return_value=MagicMock())
+    mock_session.execute.return_value.fetchall.return_value = [(1, 3, "db2", "Acme Corp Austin TX", 0.0325)]
+    mock_db.return_value.__aenter__.return_value = mock_session
+    mock_llm.return_value.ainvoke = AsyncMock(return_value=MagicMock(content="## Result 1"))
+
+    response = client.post("/semantic-search/batch", json={"queries": ["acme corp", "gamma inc"]})
+    assert response.status_code == 200
+    first, second = response.json()["results"]
+    assert first["gpt_response"] == "## Result 1" and first["sources"] == ["db2"]
+    assert second["sources"] == []
+
+    assert mock_cache_get.call_args[0][0] == ["acme corp", "gamma inc"]
+    assert [key for key, _ in mock_cache_set.call_args[0][0]] == ["acme corp", "gamma inc"]
+    suggestions.record.assert_called_once_with(["acme corp", "gamma inc"], True)
+    assert fresh_semantic_cache.stats()["entries"] == 2
+
+
+# ✅ Test: batch requests are validated before any work
+def test_semantic_search_batch_invalid():
+    assert client.post("/semantic-search/batch", json={"queries": []}).status_code == 400
+    assert client.post("/semantic-search/batch", json={"queries": ["acme", " "]}).status_code == 400
+    assert client.post("/semantic-search/batch", json={"queries": ["acme"], "filters": {"uei": "bad"}}).status_code == 400
+    with patch("routes.SEARCH_BATCH_MAX_QUERIES", 2):
+        assert client.post("/semantic-search/batch", json={"queries": ["a1", "b2", "c3"]}).status_code == 400
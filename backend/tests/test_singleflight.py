@@ -0,0 +1,126 @@
+import sys
+import os
+import asyncio
+import pytest
+import redis
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from cache import encode_result
+from singleflight import SingleFlight, flight_key
+
+
+def redis_mock(acquired):
+    client = MagicMock()
+    lock = MagicMock()
+    lock.acquire = AsyncMock(return_value=acquired)
+    lock.release = AsyncMock()
+    client.lock.return_value = lock
+    client.set = AsyncMock()
+    client.publish = AsyncMock()
+    client.get = AsyncMock(return_value=None)
+    client.exists = AsyncMock(return_value=1)
+    pubsub = MagicMock()
+    pubsub.subscribe = AsyncMock()
+    pubsub.get_message = AsyncMock(return_value=None)
+    pubsub.aclose = AsyncMock()
+    client.pubsub.return_value = pubsub
+    return client
+
+# ✅ Test: flights follow the result cache key, which ignores case and whitespace but not filters
+def test_flight_key_matches_cache_key():
+    from search import result_cache_key
+    assert flight_key(result_cache_key("AI  Contract\n")) == flight_key(result_cache_key("ai contract"))
+    assert flight_key(result_cache_key("ai contract")) != flight_key(result_cache_key("ai contracts"))
+    assert flight_key(result_cache_key("ai contract")) != flight_key(result_cache_key("ai contract", {"state": "TX"}))
+
+# ✅ Test: cancelling the leader's request does not cancel its followers; one of them takes over
+def test_leader_cancelled_follower_takes_over():
+    flight = SingleFlight(client=None)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"answer": 42}
+
+    async def run():
+        leader = asyncio.create_task(flight.do("q", compute))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(flight.do("q", compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results
+
+    results = asyncio.run(run())
+    assert all(result == {"answer": 42} for result, _ in results)
+    assert [shared for _, shared in results].count(True) == 2
+    assert len(calls) == 2
+    assert flight.stats()["in_flight"] == 0
+
+# ✅ Test: in-process callers share one computation, errors reach every caller
+def test_in_process_coalescing():
+    flight = SingleFlight(client=None)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("llm down")
+
+    async def run():
+        results = await asyncio.gather(*(flight.do("q", compute) for _ in range(5)))
+        errors = await asyncio.gather(*(flight.do("q", failing) for _ in range(3)), return_exceptions=True)
+        return results, errors
+
+    results, errors = asyncio.run(run())
+    assert len(calls) == 1
+    assert [shared for _, shared in results].count(True) == 4
+    assert all(result == {"answer": 42} for result, _ in results)
+    assert all(isinstance(err, RuntimeError) for err in errors)
+
+# ✅ Test: the lock holder stores the result, notifies waiters and releases the lock
+def test_leader_publishes_result():
+    client = redis_mock(acquired=True)
+    flight = SingleFlight(client=client, result_ttl=30)
+    compute = AsyncMock(return_value={"answer": 1})
+
+    result, shared = asyncio.run(flight.do("q", compute))
+    assert result == {"answer": 1} and shared is False
+    key = flight_key("q")
+    client.set.assert_awaited_once_with(f"sf:result:{key}", encode_result({"answer": 1}), ex=30)
+    client.publish.assert_awaited_once_with(f"sf:done:{key}", b"done")
+    client.lock.return_value.release.assert_awaited_once()
+
+# ✅ Test: another worker's result is used once it is announced
+def test_follower_waits_for_remote_leader():
+    client = redis_mock(acquired=False)
+    client.get.side_effect = [None, encode_result({"answer": 2})]
+    client.pubsub.return_value.get_message.return_value = {"type": "message", "data": b"done"}
+    flight = SingleFlight(client=client)
+    compute = AsyncMock()
+
+    result, shared = asyncio.run(flight.do("q", compute))
+    assert result == {"answer": 2} and shared is True
+    compute.assert_not_awaited()
+
+# ✅ Test: a failed remote leader or an unreachable Redis means computing locally
+def test_follower_computes_when_leader_fails():
+    client = redis_mock(acquired=False)
+    client.pubsub.return_value.get_message.return_value = {"type": "message", "data": b"failed"}
+    flight = SingleFlight(client=client)
+    compute = AsyncMock(return_value={"answer": 3})
+    assert asyncio.run(flight.do("q", compute)) == ({"answer": 3}, False)
+
+    client = redis_mock(acquired=False)
+    client.lock.return_value.acquire.side_effect = redis.ConnectionError("down")
+    flight = SingleFlight(client=client)
+    assert asyncio.run(flight.do("q", compute)) == ({"answer": 3}, False)
@@ -0,0 +1,19 @@
+import sys
+import os
+import subprocess
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../app"))
+
+def loaded_modules(module):
+    # A fresh interpreter, since this test process may already have imported everything
+    probe = f"import sys; import {module}; print(' '.join({{m.split('.')[0] for m in sys.modules}}))"
+    env = {"OPENAI_API_KEY": "sk-test", **os.environ}
+    proc = subprocess.run([sys.executable, "-c", probe], cwd=APP_DIR, env=env, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    return set(proc.stdout.split())
+
+# ✅ Test: starting the API or a worker does not import the agent and LLM frameworks
+def test_startup_skips_agent_frameworks():
+    for module in ("main", "worker"):
+        loaded = loaded_modules(module)
+        assert not loaded & {"crewai", "langchain", "langchain_core", "litellm"}, module
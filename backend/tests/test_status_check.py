@@ -6,22 +6,48 @@ from fastapi.testclient import TestClient
 # 👇 Ensure import from `app` when you're inside `backend/tests/`
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
 
+from unittest.mock import patch
+
 from main import app
-from routes import upload_status  # Make sure upload_status is not inside a function
 
 client = TestClient(app)
 
-def test_get_upload_status_valid():
+@patch("routes.job_store")
+def test_get_upload_status_valid(mock_jobs):
     mock_upload_id = "test-id-123"
-    upload_status[mock_upload_id] = {"status": "file upload pending", "inserted": 5}
+    mock_jobs.get.return_value = {"status": "file upload pending", "inserted": 5, "path": "/tmp/ingest_x.csv"}
 
     response = client.get(f"/files/status/{mock_upload_id}")
     assert response.status_code == 200
     data = response.json()
     assert data["status"] == "file upload pending"
     assert data["inserted"] == 5
+    assert "path" not in data
+    mock_jobs.get.assert_called_once_with(mock_upload_id)
 
-def test_get_upload_status_invalid():
+@patch("routes.job_store")
+def test_get_upload_status_invalid(mock_jobs):
+    mock_jobs.get.return_value = None
     response = client.get("/files/status/nonexistent-id-456")
     assert response.status_code == 404
     assert response.json()["detail"] == "Invalid upload_id"
+
+# ✅ Test: only cancelled or failed uploads can be resumed
+@patch("routes.job_store")
+def test_resume_upload(mock_jobs):
+    mock_jobs.get.return_value = {"status": "completed", "inserted": 5}
+    response = client.post("/files/status/test-id-123/resume")
+    assert response.status_code == 409
+
+    mock_jobs.get.return_value = {"status": "cancelled", "rows_read": 500}
+    mock_jobs.resume.return_value = {"status": "file upload pending", "rows_read": 500}
+    response = client.post("/files/status/test-id-123/resume")
+    assert response.status_code == 200
+    assert response.json() == {"status": "file upload pending", "rows_read": 500}
+
+# ✅ Test: cancelling an unknown upload is a 404
+@patch("routes.job_store")
+def test_cancel_upload_invalid(mock_jobs):
+    mock_jobs.request_cancel.return_value = None
+    response = client.post("/files/status/nonexistent-id-456/cancel")
+    assert response.status_code == 404
@@ -0,0 +1,134 @@
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from suggestions import SuggestionIndex, normalize_prefix, LEX_KEY, SCORE_KEY
+
+
+class SortedSets:
+    """The sorted-set commands SuggestionIndex uses, in memory."""
+
+    def __init__(self):
+        self.sets = {}
+
+    def pipeline(self, transaction=False):
+        return Pipeline(self)
+
+    def _set(self, key):
+        return self.sets.setdefault(key, {})
+
+    def _ordered(self, key, reverse=False):
+        return sorted(self._set(key).items(), key=lambda item: (item[1], item[0]), reverse=reverse)
+
+    def zincrby(self, key, amount, member):
+        values = self._set(key)
+        values[member] = values.get(member, 0) + amount
+        return values[member]
+
+    def zadd(self, key, mapping, nx=False):
+        values = self._set(key)
+        for member, score in mapping.items():
+            if not (nx and member in values):
+                values[member] = score
+
+    def zremrangebyrank(self, key, start, end):
+        ordered = self._ordered(key)
+        for member, _ in ordered[start:len(ordered) + end + 1]:
+            del self.sets[key][member]
+
+    def zrevrange(self, key, start, end, withscores=False):
+        ordered = self._ordered(key, reverse=True)
+        return ordered[start:None if end == -1 else end + 1]
+
+    def zrangebylex(self, key, low, high, start=0, num=None):
+        low, high = low[1:].decode(), high[1:].decode("utf-8", "ignore")
+        members = sorted(m for m in self._set(key) if m >= low and m[:len(high)] <= high)
+        return members[start:start + num]
+
+    def zmscore(self, key, members):
+        return [self._set(key).get(member) for member in members]
+
+    def zrangebyscore(self, key, low, high, start=0, num=None):
+        return [member for member, score in self._ordered(key) if score <= high][start:start + num]
+
+    def zrem(self, key, *members):
+        for member in members:
+            self._set(key).pop(member, None)
+
+    def zcard(self, key):
+        return len(self._set(key))
+
+    def zcount(self, key, low, high):
+        return sum(1 for score in self._set(key).values() if score <= high)
+
+
+class Pipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+def make_index(**kwargs):
+    return SuggestionIndex(client=SortedSets(), ttl=3600, prune_seconds=10 ** 9, **kwargs)
+
+
+# ✅ Test: prefixes match case-insensitively and results are ranked by popularity
+def test_lookup_ranks_by_popularity():
+    index = make_index(top_prefix_chars=2)
+    index.record(["AI contracts", "aircraft parts", "Army logistics"], now=0)
+    index.record(["aircraft parts", "aircraft parts", "ai  contracts"], now=0)
+
+    assert index.lookup("AI", now=1) == ["aircraft parts", "ai  contracts", "AI contracts"]
+    assert index.lookup("air", now=1) == ["aircraft parts"]  # read from the lex index
+    assert index.lookup("ai ", now=1) == ["ai  contracts", "AI contracts"]
+    assert index.lookup("a", limit=1, now=1) == ["aircraft parts"]
+    assert index.lookup("", now=1)[0] == "aircraft parts"
+    assert index.lookup("navy", now=1) == []
+
+# ✅ Test: short-prefix lists keep only the most popular queries
+def test_top_lists_are_bounded():
+    index = make_index(top_prefix_chars=1, top_size=2)
+    index.record(["ab", "ac", "ad"], now=0)
+    index.record(["ad", "ad", "ac"], now=0)
+
+    assert index.client.zcard("suggest:top:a") == 2
+    assert index.lookup("a", now=1) == ["ad", "ac"]
+
+# ✅ Test: queries whose answers expired are hidden, then pruned from every set
+def test_expired_queries_are_pruned():
+    index = make_index()
+    index.record("old query", now=0)
+    index.record("new query", now=3000)
+    index.record("old query", stored=False, now=3500)  # a cache hit does not extend the answer's lifetime
+
+    assert index.lookup("", now=4000) == ["new query"]
+    assert index.prune(now=4000) == 1
+    assert index.client.zmscore(SCORE_KEY, ["old query"]) == [None]
+    assert index.client.zcard(LEX_KEY) == 1
+    assert index.client.zcard("suggest:top:o") == 0
+    assert index.stats(now=4000) == {"queries": 1, "expired": 0}
+
+# ✅ Test: top lists that lose queries to pruning are refilled from the popularity set
+def test_prune_refills_top_lists():
+    index = make_index(top_prefix_chars=1, top_size=2)
+    index.record(["ab", "ab", "ab", "ac", "ac", "ac"], now=0)
+    index.record(["ad", "ae", "ae", "bd"], now=3000)
+    assert index.lookup("a", now=1) == ["ab", "ac"]
+
+    assert index.prune(now=4000) == 2
+    assert index.lookup("a", now=4000) == ["ae", "ad"]
+    assert index.client.zcard("suggest:top:a") == 2
+    assert index.lookup("b", now=4000) == ["bd"]
+
+# ✅ Test: a trailing space marks a complete word
+def test_normalize_prefix():
+    assert normalize_prefix("  AI   Contr") == "ai contr"
+    assert normalize_prefix("AI ") == "ai "
+    assert normalize_prefix("   ") == ""
@@ -12,9 +12,12 @@ from main import app
 
 client = TestClient(app)
 
-@patch("app.routes.generate_embedding", return_value=[0.1] * 1536)
-@patch("app.routes.process_upload_file", return_value=None)
-def test_ingest_file(mock_process, mock_embed):
+@patch("routes.job_store")
+def test_ingest_file(mock_jobs, tmp_path, monkeypatch):
+    monkeypatch.setattr("ingest.INGEST_SPOOL_DIR", str(tmp_path))
+    mock_jobs.create.return_value = "job-1"
+    mock_jobs.get.return_value = {"status": "file upload pending", "inserted": 0}
+
     dummy_csv = "name,email\nAlice,alice@example.com\nBob,bob@example.com"
     files = {
         "file": ("dummy.csv", io.BytesIO(dummy_csv.encode("utf-8")), "text/csv")
@@ -24,15 +27,50 @@ def test_ingest_file(mock_process, mock_embed):
     response = client.post("/files/ingest", files=files, data=data)
     assert response.status_code == 200
     json_data = response.json()
-    assert "upload_id" in json_data
+    assert json_data["upload_id"] == "job-1"
     assert json_data["status"] == "file upload pending"
 
+    # The spooled file is queued for the workers
+    path, filename, source_tag, mode, key_column = mock_jobs.create.call_args[0]
+    assert open(path, encoding="utf-8").read() == dummy_csv
+    assert (filename, source_tag, mode, key_column) == ("dummy.csv", "db1", "append", None)
+
     # Check status endpoint
     upload_id = json_data["upload_id"]
     status_resp = client.get(f"/files/status/{upload_id}")
     assert status_resp.status_code == 200
     assert "status" in status_resp.json()
 
+# ✅ Test: the legacy endpoint reads values as text, like the ingestion workers, and removes its spooled copy
+@patch("routes.copy_rows", side_effect=lambda db, tag, texts, embeddings: list(range(len(texts))))
+@patch("routes.generate_embeddings", side_effect=lambda texts, stats=None: [[0.0]] * len(texts))
+def test_upload_file_reads_values_as_text(mock_embed, mock_copy, tmp_path, monkeypatch):
+    monkeypatch.setattr("ingest.INGEST_SPOOL_DIR", str(tmp_path))
+    dummy_csv = "zip,amount\n02134,1.50\n02134,1.50\n90210,\n"
+    files = {"file": ("dummy.csv", io.BytesIO(dummy_csv.encode("utf-8")), "text/csv")}
+
+    response = client.post("/upload-file/", files=files, data={"source_tag": "db1"})
+
+    assert response.status_code == 200
+    assert response.json()["inserted_rows"] == 2
+    assert mock_copy.call_args[0][2] == ["02134 1.50", "90210"]
+    assert list(tmp_path.iterdir()) == []
+
+# ✅ Test: the ingest mode is validated, and a key column needs an incremental mode
+@patch("routes.job_store")
+def test_ingest_file_modes(mock_jobs, tmp_path, monkeypatch):
+    monkeypatch.setattr("ingest.INGEST_SPOOL_DIR", str(tmp_path))
+    mock_jobs.create.return_value = "job-1"
+
+    def post(**data):
+        files = {"file": ("dummy.csv", io.BytesIO(b"uei,name\nU1,Acme"), "text/csv")}
+        return client.post("/files/ingest", files=files, data={"source_tag": "db1", **data})
+
+    assert post(mode="replace", key_column="uei").status_code == 200
+    assert mock_jobs.create.call_args[0][3:] == ("replace", "uei")
+    assert post(mode="upsert").status_code == 400
+    assert post(key_column="uei").status_code == 400
+
 def test_invalid_file_type():
     dummy_txt = "Just some text content"
     files = {
@@ -0,0 +1,101 @@
+import sys
+import os
+import struct
+from unittest.mock import patch
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../app")))
+
+from bulk_loader import encode_copy_tuples, encode_vector
+from vector_index import (
+    CopyVectorReader, PartitionWriter, VectorIndex, build_ivf, normalize, read_manifest, write_manifest,
+)
+
+DIM = 8
+
+def random_vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+def write_partition(index_dir, tag, ids, vectors, manifest=None):
+    manifest = manifest or {**read_manifest(str(index_dir)), "dim": DIM}
+    entry = manifest["partitions"].get(tag) or {"file": f"p{manifest['next_file']}", "rows": 0,
+                                                "synced_at": None, "ivf": None}
+    manifest["next_file"] += 1
+    writer = PartitionWriter(str(index_dir), entry, DIM)
+    writer.append(np.asarray(ids, dtype=np.int64), vectors)
+    entry["rows"] = writer.close()
+    manifest["partitions"][tag] = entry
+    write_manifest(str(index_dir), manifest)
+    return manifest
+
+def brute_force(vectors, ids, query, k):
+    scores = normalize(vectors) @ normalize(query)
+    return [int(ids[i]) for i in np.argsort(-scores)[:k]]
+
+# ✅ Test: a binary COPY of (id, embedding) is decoded without per-row parsing, whatever the chunking
+def test_copy_reader_decodes_binary_copy():
+    vectors = random_vectors(20)
+    payload = encode_copy_tuples(
+        (struct.pack(">i", row_id), encode_vector(vec)) for row_id, vec in zip(range(100, 120), vectors)
+    ).getvalue()
+    batches = []
+    reader = CopyVectorReader(lambda ids, vecs: batches.append((ids, vecs)), dim=DIM)
+    for start in range(0, len(payload), 7):
+        reader.write(payload[start:start + 7])
+    reader.close()
+
+    ids = np.concatenate([ids for ids, _ in batches])
+    assert ids.tolist() == list(range(100, 120))
+    np.testing.assert_allclose(np.concatenate([vecs for _, vecs in batches]), vectors)
+
+# ✅ Test: search matches brute force per source_tag, skips unknown tags and ids already indexed
+def test_search_matches_brute_force(tmp_path):
+    vectors, ids = random_vectors(500), np.arange(1, 501) * 2
+    manifest = write_partition(tmp_path, "db1", ids[:300], vectors[:300])
+    # An overlapping sync window: the first 50 rows come again and are skipped
+    write_partition(tmp_path, "db1", ids[250:], vectors[250:], manifest)
+    index = VectorIndex(str(tmp_path), refresh_seconds=0)
+
+    query = random_vectors(1, seed=7)[0]
+    hits = index.search(query, ["db1", "db9"], 10)
+    assert index.stats()["db1"]["rows"] == 500
+    assert [row_id for row_id, _ in hits["db1"]] == brute_force(vectors, ids, query, 10)
+    assert hits["db9"] == []
+    assert [row_id for row_id, _ in index.nearest(query, 3)] == brute_force(vectors, ids, query, 3)
+
+# ✅ Test: with an IVF layer, rows added after it was built are still searched
+def test_ivf_search_includes_new_rows(tmp_path):
+    rng = np.random.default_rng(3)
+    centers = random_vectors(8, seed=1) * 4
+    vectors = (centers[rng.integers(0, 8, 2000)] + rng.standard_normal((2000, DIM))).astype(np.float32)
+    ids = np.arange(1, 2001)
+    manifest = write_partition(tmp_path, "db1", ids[:1900], vectors[:1900])
+    build_ivf(str(tmp_path), manifest, "db1")
+    write_partition(tmp_path, "db1", ids[1900:], vectors[1900:], manifest)
+    index = VectorIndex(str(tmp_path), refresh_seconds=0)
+    assert index.stats()["db1"]["ivf_lists"] == 43
+
+    for row in (5, 1950):
+        hits = index.search(vectors[row], ["db1"], 5)["db1"]
+        assert hits[0][0] == ids[row]
+
+# ✅ Test: readers pick up a newer manifest, and report nothing before the first sync
+def test_refresh_picks_up_new_rows(tmp_path):
+    index = VectorIndex(str(tmp_path), refresh_seconds=0)
+    assert not index.ready()
+    vectors = random_vectors(10)
+    manifest = write_partition(tmp_path, "db1", range(1, 6), vectors[:5])
+    assert index.ready() and index.stats()["db1"]["rows"] == 5
+    write_partition(tmp_path, "db1", range(6, 11), vectors[5:], manifest)
+    assert index.search(vectors[8], ["db1"], 1)["db1"][0][0] == 9
+
+# ✅ Test: the worker rebuilds the partition after updates or deletes, and syncs otherwise
+@patch("vector_index.sync", return_value={"db1": 3})
+def test_worker_syncs_vector_index(mock_sync):
+    from worker import sync_vector_index
+
+    sync_vector_index("db1", {"inserted": 3, "updated": 0, "deleted": 0})
+    mock_sync.assert_called_with(tags=["db1"], rebuild=False)
+    sync_vector_index("db1", {"inserted": 0, "updated": 2, "deleted": 0})
+    mock_sync.assert_called_with(tags=["db1"], rebuild=True)
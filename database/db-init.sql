@@ -1,5 +1,7 @@
 -- Enable pgvector extension
 CREATE EXTENSION IF NOT EXISTS vector;
+-- Trigram indexes for substring filters on agency
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Drop old table if needed (for dev environments only)
 DROP TABLE IF EXISTS unified_index;
@@ -10,10 +12,46 @@ CREATE TABLE unified_index (
     source_tag TEXT NOT NULL,
     source_text TEXT NOT NULL,
     embedding VECTOR(1536) NOT NULL,
-    created_at TIMESTAMP DEFAULT NOW()
+    created_at TIMESTAMP DEFAULT NOW(),
+    -- Set by incremental ingest: the upload's key column, and sha256 of source_text
+    row_key TEXT,
+    content_hash BYTEA,
+    -- The original row (column -> value) and promoted metadata, see backend/app/metadata.py
+    raw JSONB,
+    state TEXT,
+    naics TEXT,
+    agency TEXT,
+    uei TEXT,
+    cage TEXT,
+    posted_date DATE,
+    response_deadline DATE,
+    -- Full-text vector maintained by Postgres on every insert/update
+    source_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', source_text)) STORED
 );
 
--- Create vector index
+-- Create vector index (HNSW builds incrementally, so it is valid on an empty table;
+-- use `python ann.py rebuild` to switch to IVFFlat or add per-source partial indexes)
 CREATE INDEX unified_idx_embedding
-ON unified_index USING ivfflat (embedding vector_cosine_ops)
-WITH (lists = 100);
+ON unified_index USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+
+-- Full-text index for the sparse retrieval leg
+CREATE INDEX unified_idx_source_tsv
+ON unified_index USING GIN (source_tsv);
+
+-- Lookups for incremental ingest (new / changed / unchanged rows)
+CREATE INDEX unified_idx_content_hash
+ON unified_index (source_tag, content_hash);
+
+CREATE UNIQUE INDEX unified_idx_row_key
+ON unified_index (source_tag, row_key) WHERE row_key IS NOT NULL;
+
+-- Structured search filters, applied with the source_tag before ranking
+CREATE INDEX unified_idx_state ON unified_index (source_tag, state);
+CREATE INDEX unified_idx_naics ON unified_index (source_tag, naics text_pattern_ops);
+CREATE INDEX unified_idx_uei ON unified_index (uei);
+CREATE INDEX unified_idx_cage ON unified_index (cage);
+CREATE INDEX unified_idx_posted_date ON unified_index (source_tag, posted_date);
+CREATE INDEX unified_idx_response_deadline ON unified_index (source_tag, response_deadline);
+CREATE INDEX unified_idx_agency ON unified_index USING GIN (agency gin_trgm_ops);
+CREATE INDEX unified_idx_raw ON unified_index USING GIN (raw jsonb_path_ops);
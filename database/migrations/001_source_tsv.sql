@@ -0,0 +1,13 @@
+-- Adds the stored full-text column and its GIN index to an existing unified_index.
+-- Adding a STORED generated column rewrites the table, which backfills every
+-- existing row. Run outside a transaction block (CREATE INDEX CONCURRENTLY):
+--   psql "$DATABASE_URL" -f database/migrations/001_source_tsv.sql
+
+ALTER TABLE unified_index
+    ADD COLUMN IF NOT EXISTS source_tsv TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('english', source_text)) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS unified_idx_source_tsv
+ON unified_index USING GIN (source_tsv);
+
+ANALYZE unified_index;
@@ -0,0 +1,14 @@
+-- Replaces the IVFFlat index that db-init.sql used to build on an empty table
+-- (its centroids were computed from no data) with an HNSW index.
+-- Run outside a transaction block (CREATE INDEX CONCURRENTLY):
+--   psql "$DATABASE_URL" -f database/migrations/002_hnsw_index.sql
+-- Other layouts (IVFFlat sized to the data, per-source partial indexes) can be
+-- built with `python ann.py rebuild` from backend/app.
+
+DROP INDEX CONCURRENTLY IF EXISTS unified_idx_embedding;
+
+CREATE INDEX CONCURRENTLY unified_idx_embedding
+ON unified_index USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+
+ANALYZE unified_index;
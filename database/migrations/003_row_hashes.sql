@@ -0,0 +1,21 @@
+-- Adds the columns used by incremental ingest (mode=incremental / replace):
+-- row_key holds the upload's key column, content_hash the sha256 of source_text.
+-- Existing rows get their content_hash backfilled, so re-uploading a file that
+-- was ingested before skips its unchanged rows. Run outside a transaction block
+-- (CREATE INDEX CONCURRENTLY):
+--   psql "$DATABASE_URL" -f database/migrations/003_row_hashes.sql
+
+ALTER TABLE unified_index ADD COLUMN IF NOT EXISTS row_key TEXT;
+ALTER TABLE unified_index ADD COLUMN IF NOT EXISTS content_hash BYTEA;
+
+UPDATE unified_index
+SET content_hash = sha256(convert_to(source_text, 'UTF8'))
+WHERE content_hash IS NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS unified_idx_content_hash
+ON unified_index (source_tag, content_hash);
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS unified_idx_row_key
+ON unified_index (source_tag, row_key) WHERE row_key IS NOT NULL;
+
+ANALYZE unified_index;
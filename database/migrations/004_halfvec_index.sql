@@ -0,0 +1,16 @@
+-- Rebuilds the embedding index on a float16 (halfvec) copy of the embedding:
+-- half the index size, with results reranked on the full-precision column.
+-- Needs pgvector >= 0.7. Start the API with ANN_QUANTIZATION=halfvec
+-- afterwards, or searches will not use the index.
+-- Run outside a transaction block (CREATE INDEX CONCURRENTLY):
+--   psql "$DATABASE_URL" -f database/migrations/004_halfvec_index.sql
+-- Other modes (reduced, binary) can be built with
+-- `python ann.py rebuild --quantization <mode>` from backend/app.
+
+DROP INDEX CONCURRENTLY IF EXISTS unified_idx_embedding;
+
+CREATE INDEX CONCURRENTLY unified_idx_embedding
+ON unified_index USING hnsw ((embedding::halfvec(1536)) halfvec_cosine_ops)
+WITH (m = 16, ef_construction = 64);
+
+ANALYZE unified_index;
@@ -0,0 +1,30 @@
+-- Adds the raw row (JSONB) and the promoted metadata columns used by search
+-- filters (see backend/app/metadata.py), with their indexes.
+-- Existing rows have no column names to rebuild them from. They get their
+-- metadata when their file is uploaded again with mode=incremental or
+-- mode=replace: unchanged rows are filled in without being re-embedded.
+-- Run outside a transaction block (CREATE INDEX CONCURRENTLY):
+--   psql "$DATABASE_URL" -f database/migrations/005_metadata_columns.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE unified_index
+    ADD COLUMN IF NOT EXISTS raw JSONB,
+    ADD COLUMN IF NOT EXISTS state TEXT,
+    ADD COLUMN IF NOT EXISTS naics TEXT,
+    ADD COLUMN IF NOT EXISTS agency TEXT,
+    ADD COLUMN IF NOT EXISTS uei TEXT,
+    ADD COLUMN IF NOT EXISTS cage TEXT,
+    ADD COLUMN IF NOT EXISTS posted_date DATE,
+    ADD COLUMN IF NOT EXISTS response_deadline DATE;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS unified_idx_state ON unified_index (source_tag, state);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS unified_idx_naics ON unified_index (source_tag, naics text_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS unified_idx_uei ON unified_index (uei);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS unified_idx_cage ON unified_index (cage);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS unified_idx_posted_date ON unified_index (source_tag, posted_date);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS unified_idx_response_deadline ON unified_index (source_tag, response_deadline);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS unified_idx_agency ON unified_index USING GIN (agency gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS unified_idx_raw ON unified_index USING GIN (raw jsonb_path_ops);
+
+ANALYZE unified_index;
@@ -25,8 +25,56 @@ export const semanticSearch = async (query) => {
   return res.data;
 };
 
+/**
+ * Stream a semantic search over server-sent events.
+ * Calls onSources({ sources, retrieved_context, cached }) once retrieval is done,
+ * onToken(text) for every formatter token and resolves with the final result.
+ * @param {string} query - The search string.
+ */
+export const streamSemanticSearch = async (query, { onSources, onToken } = {}) => {
+  const params = new URLSearchParams({ query });
+  const res = await fetch(`${API_BASE_URL}/semantic-search/stream?${params.toString()}`, {
+    method: 'POST',
+    headers: { Accept: 'text/event-stream' },
+  });
+  if (!res.ok || !res.body) {
+    throw new Error(`Semantic search stream failed with status ${res.status}`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result = null;
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line: "event: <name>\ndata: <json>\n\n"
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      const event = block.match(/^event: (.*)$/m)?.[1];
+      const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] || '{}');
+
+      if (event === 'sources') onSources?.(data);
+      else if (event === 'token') onToken?.(data.text);
+      else if (event === 'done') result = data;
+      else if (event === 'error') throw new Error(data.detail);
+    }
+  }
+
+  if (!result) {
+    throw new Error('Semantic search stream ended before completion');
+  }
+  return result;
+};
 
-export const getSuggestions = async () => {
-  const res = await axios.get(`${API_BASE_URL}/suggestions/`);
+// Answered queries starting with prefix, most popular first (at most limit)
+export const getSuggestions = async (prefix = '', { limit = 8, signal } = {}) => {
+  const res = await axios.get(`${API_BASE_URL}/suggestions/`, { params: { prefix, limit }, signal });
   return res.data.suggestions || [];
 };
@@ -2,6 +2,8 @@ import React, { useState, useEffect } from 'react';
 import { Search, Play } from 'lucide-react';
 import { getSuggestions } from '../api'; 
 
+const SUGGESTION_DELAY_MS = 150;
+
 
 
 
@@ -19,24 +21,29 @@ const SearchBar = ({ onSearch }) => {
     setIsLoading(false);
   };
 
-  // 🔁 Fetch suggestions every time the query changes
+  // 🔁 Fetch suggestions for the typed prefix once typing pauses; a newer keystroke cancels the older request
   useEffect(() => {
-    const fetchSuggestions = async () => {
-      if (!query.trim()) return;
+    if (!query.trim()) {
+      setSuggestions([]);
+      return undefined;
+    }
 
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
       try {
-        const data = await getSuggestions(); // Fetch suggestions from Redis
-        const filtered = data.filter((item) =>
-          item.toLowerCase().includes(query.toLowerCase())
-        );
-        setSuggestions(filtered);
-        setShowSuggestions(true);
+        const data = await getSuggestions(query, { signal: controller.signal }); // Prefix lookup in Redis
+        setSuggestions(data);
       } catch (err) {
-        console.error('Failed to load suggestions:', err);
+        if (!controller.signal.aborted) {
+          console.error('Failed to load suggestions:', err);
+        }
       }
-    };
+    }, SUGGESTION_DELAY_MS);
 
-    fetchSuggestions();
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
   }, [query]);
 
 
@@ -79,9 +86,7 @@ const SearchBar = ({ onSearch }) => {
 
         {showSuggestions && (
           <div className="absolute w-full mt-2 bg-white rounded-lg shadow-lg z-[100] max-h-60 overflow-y-auto">
-            {suggestions.filter((s) =>
-              s.toLowerCase().includes(query.toLowerCase())
-            ).map((suggestion, idx) => (
+            {suggestions.map((suggestion, idx) => (
               <div
                 key={idx}
                 onClick={() => handleSuggestionClick(suggestion)}
@@ -1,5 +1,6 @@
 import { render, screen, fireEvent, waitFor } from '@testing-library/react';
 import SearchBar from './SearchBar';
+import { getSuggestions } from '../api';
 import { vi } from 'vitest';
 
 // ✅ Mock getSuggestions API
@@ -61,4 +62,19 @@ describe('SearchBar Component', () => {
       expect(mockSearch).toHaveBeenCalledTimes(1);
     });
   });
+
+  test('requests suggestions for the typed prefix once typing pauses', async () => {
+    getSuggestions.mockClear();
+    render(<SearchBar onSearch={vi.fn()} />);
+
+    const input = screen.getByPlaceholderText(/search/i);
+    fireEvent.change(input, { target: { value: 'R' } });
+    fireEvent.change(input, { target: { value: 'Ra' } });
+    fireEvent.change(input, { target: { value: 'Ray' } });
+
+    await waitFor(() => {
+      expect(getSuggestions).toHaveBeenCalledTimes(1);
+    });
+    expect(getSuggestions.mock.calls[0][0]).toBe('Ray');
+  });
 });
@@ -2,7 +2,7 @@ import React, { useState } from 'react';
 import SearchBar from '../components/SearchBar';
 import ResultsTable from '../components/ResultsTable';
 import Loader from '../components/Loader'; // Make sure this matches your actual spinner component name
-import { semanticSearch } from '../api';
+import { streamSemanticSearch } from '../api';
 import ErrorModal from '../components/ErrorModal';
 
 const defaultResults = [
@@ -27,9 +27,26 @@ const handleSearch = async (query) => {
   setShowResults(false);
 
   try {
-    const response = await semanticSearch(query);
+    // Render sources as soon as retrieval finishes, then append formatter tokens
+    const response = await streamSemanticSearch(query, {
+      onSources: (data) => {
+        setResults([
+          {
+            id: 1,
+            title: '',
+            sources: data.sources || [],
+            cached: data.cached || false
+          },
+        ]);
+        setLoading(false);
+        setShowResults(true);
+      },
+      onToken: (text) => {
+        setResults((prev) => prev.map((result) => ({ ...result, title: result.title + text })));
+      },
+    });
 
-    // Use the response directly, whether cached or not
+    // Use the final assembled response, whether cached or not
     const formatted = [
       {
         id: 1,
@@ -43,7 +60,7 @@ const handleSearch = async (query) => {
   } catch (error) {
     console.error('Semantic search failed:', error);
 
-    if (error.code === 'ERR_NETWORK') {
+    if (error.code === 'ERR_NETWORK' || error instanceof TypeError) {
       setErrorType('network');
     } else if (error.message?.includes("quota")) {
       setErrorType("openaiQuota");
@@ -30,8 +30,10 @@ vi.mock('../components/ErrorModal', () => ({
 }));
 
 vi.mock('../api', async () => ({
-  semanticSearch: vi.fn(async (query) => {
+  streamSemanticSearch: vi.fn(async (query, { onSources, onToken } = {}) => {
     if (query === 'error') throw new Error('Test error');
+    onSources?.({ sources: ['db1'], retrieved_context: '', cached: false });
+    onToken?.(`Mocked result for ${query}`);
     return {
       gpt_response: `Mocked result for ${query}`,
       sources: ['db1'],
@@ -40,7 +42,7 @@ vi.mock('../api', async () => ({
   }),
 }));
 
-import { semanticSearch } from '../api';
+import { streamSemanticSearch } from '../api';
 
 describe('Home Page Component', () => {
   test('renders heading and search bar', () => {
@@ -56,7 +58,7 @@ describe('Home Page Component', () => {
     await waitFor(() => {
       expect(screen.getByTestId('mock-results')).toHaveTextContent('1 results');
     });
-    expect(semanticSearch).toHaveBeenCalledWith('AI contract');
+    expect(streamSemanticSearch).toHaveBeenCalledWith('AI contract', expect.any(Object));
   });
 
   test('shows error modal on API failure', async () => {